@@ -0,0 +1,38 @@
+import pytest
+from eth_account import Account
+
+from x402.clients.base import x402Client
+from x402.requirements import PaymentRequirementsCache
+
+RESOURCE = "https://example.com/paid"
+
+
+@pytest.fixture(scope="session")
+def client():
+    return x402Client(Account.create())
+
+
+@pytest.fixture
+def requirements_cache():
+    return PaymentRequirementsCache(
+        price="$0.001",
+        pay_to_address="0x1111111111111111111111111111111111111111",
+        network="base-sepolia",
+        description="Benchmark resource",
+        mime_type="application/json",
+    )
+
+
+@pytest.fixture
+def requirements_entry(requirements_cache):
+    return requirements_cache.get(None, RESOURCE, "GET")
+
+
+@pytest.fixture
+def requirements(requirements_entry):
+    return requirements_entry.requirements[0]
+
+
+@pytest.fixture
+def payment_header(client, requirements):
+    return client.create_payment_header(requirements, 1)
@@ -0,0 +1,295 @@
+"""End-to-end load harness for the paid request path.
+
+Drives the FastAPI and Flask payment middlewares in-process, through ASGI and
+WSGI, against a stub facilitator and reports throughput, latency percentiles
+and allocations.
+
+Usage:
+    python benchmarks/harness.py --framework fastapi --concurrency 64 --requests 5000
+    python benchmarks/harness.py --framework flask --facilitator-latency 0.005 --trace-allocations
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Literal, Optional
+
+import httpx
+from eth_account import Account
+from fastapi import FastAPI
+from flask import Flask
+
+from x402.clients.base import x402Client
+from x402.fastapi.middleware import PaymentMiddleware, require_payment
+from x402.flask.middleware import PaymentMiddleware as FlaskPaymentMiddleware
+from x402.types import (
+    PaymentPayload,
+    PaymentRequirements,
+    SettleResponse,
+    VerifyResponse,
+)
+
+Framework = Literal["fastapi", "fastapi-asgi", "flask"]
+
+PAY_TO = "0x1111111111111111111111111111111111111111"
+PATH = "/paid"
+
+
+class StubFacilitator:
+    """Facilitator accepting every payment after an optional simulated delay."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {"verify": 0, "settle": 0}
+
+    async def verify(
+        self, payment: PaymentPayload, payment_requirements: PaymentRequirements
+    ) -> VerifyResponse:
+        self.calls["verify"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return VerifyResponse(
+            is_valid=True,
+            invalid_reason=None,
+            payer=payment.payload.authorization.from_,
+        )
+
+    async def settle(
+        self, payment: PaymentPayload, payment_requirements: PaymentRequirements
+    ) -> SettleResponse:
+        self.calls["settle"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return SettleResponse(
+            success=True,
+            transaction="0x" + "ab" * 32,
+            network=payment.network,
+            payer=payment.payload.authorization.from_,
+        )
+
+
+def middleware_options(facilitator: Any) -> dict[str, Any]:
+    return {
+        "price": "$0.001",
+        "pay_to_address": PAY_TO,
+        "path": PATH,
+        "network": "base-sepolia",
+        "facilitator": facilitator,
+    }
+
+
+def build_fastapi_app(facilitator: Any, asgi: bool = False) -> FastAPI:
+    """FastAPI app with one paid route, gated by `require_payment` or, with
+    `asgi`, by the pure ASGI `PaymentMiddleware`"""
+    app = FastAPI()
+
+    @app.get(PATH)
+    async def paid():
+        return {"ok": True}
+
+    if asgi:
+        app.add_middleware(PaymentMiddleware, **middleware_options(facilitator))
+    else:
+        app.middleware("http")(require_payment(**middleware_options(facilitator)))
+    return app
+
+
+def build_flask_app(facilitator: Any) -> Flask:
+    """Flask app with one paid route"""
+    app = Flask(__name__)
+
+    @app.route(PATH)
+    def paid():
+        return {"ok": True}
+
+    FlaskPaymentMiddleware(app).add(**middleware_options(facilitator))
+    return app
+
+
+def payment_header(accepts: list[dict[str, Any]]) -> str:
+    """Sign a payment for the first accepted requirements with a fresh account"""
+    requirements = PaymentRequirements(**accepts[0])
+    return x402Client(Account.create()).create_payment_header(requirements, 1)
+
+
+@dataclass
+class BenchmarkResult:
+    framework: str
+    concurrency: int
+    seconds: float
+    latencies: list[float]
+    peak_memory: Optional[int] = None
+    top_allocations: list[str] = field(default_factory=list)
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def rps(self) -> float:
+        return self.requests / self.seconds
+
+    def percentile(self, p: int) -> float:
+        """Latency percentile in seconds, p between 1 and 99"""
+        if len(self.latencies) < 2:
+            return self.latencies[0]
+        return statistics.quantiles(self.latencies, n=100)[p - 1]
+
+    def report(self) -> str:
+        lines = [
+            f"{self.framework}: {self.requests} requests, concurrency {self.concurrency}",
+            f"  throughput  {self.rps:10.1f} req/s",
+            f"  p50         {self.percentile(50) * 1000:10.3f} ms",
+            f"  p99         {self.percentile(99) * 1000:10.3f} ms",
+        ]
+        if self.peak_memory is not None:
+            lines.append(f"  peak memory {self.peak_memory / 1024:10.1f} KiB")
+            lines.extend(f"    {line}" for line in self.top_allocations)
+        return "\n".join(lines)
+
+
+async def _drive_asgi(
+    app: Any, requests: int, concurrency: int, ready: Callable[[], None]
+) -> list[float]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark"
+    ) as client:
+        accepts = (await client.get(PATH)).json()["accepts"]
+        headers = {"X-PAYMENT": payment_header(accepts)}
+        # Warm up lazy imports and caches before measuring
+        await client.get(PATH, headers=headers)
+        ready()
+        remaining = iter(range(requests))
+        latencies: list[float] = []
+
+        async def worker():
+            for _ in remaining:
+                start = time.perf_counter()
+                response = await client.get(PATH, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise RuntimeError(f"Unexpected response: {response.text}")
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def _drive_wsgi(
+    app: Flask, requests: int, concurrency: int, ready: Callable[[], None]
+) -> list[float]:
+    accepts = app.test_client().get(PATH).get_json()["accepts"]
+    headers = {"X-PAYMENT": payment_header(accepts)}
+    app.test_client().get(PATH, headers=headers)
+    ready()
+    remaining = iter(range(requests))
+    latencies: list[float] = []
+
+    def worker():
+        client = app.test_client()
+        for _ in remaining:
+            start = time.perf_counter()
+            response = client.get(PATH, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"Unexpected response: {response.text}")
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return latencies
+
+
+def run(
+    framework: Framework = "fastapi",
+    requests: int = 1000,
+    concurrency: int = 16,
+    facilitator_latency: float = 0.0,
+    trace_allocations: bool = False,
+) -> BenchmarkResult:
+    """Send `requests` paid requests with `concurrency` concurrent clients.
+
+    Args:
+        framework: "fastapi" (require_payment), "fastapi-asgi"
+            (PaymentMiddleware) or "flask"
+        requests: Number of paid requests to send
+        concurrency: Number of concurrent clients (tasks for ASGI, threads
+            for WSGI)
+        facilitator_latency: Simulated delay of each verify and settle call
+        trace_allocations: Track allocations with tracemalloc, which slows
+            requests down considerably
+
+    Returns:
+        BenchmarkResult with per-request latencies
+    """
+    facilitator = StubFacilitator(facilitator_latency)
+    if framework == "flask":
+        app: Any = build_flask_app(facilitator)
+    else:
+        app = build_fastapi_app(facilitator, asgi=framework == "fastapi-asgi")
+
+    snapshot: list[tracemalloc.Snapshot] = []
+    start = 0.0
+
+    def ready():
+        nonlocal start
+        if trace_allocations:
+            tracemalloc.start()
+            snapshot.append(tracemalloc.take_snapshot())
+        start = time.perf_counter()
+
+    if framework == "flask":
+        latencies = _drive_wsgi(app, requests, concurrency, ready)
+    else:
+        latencies = asyncio.run(_drive_asgi(app, requests, concurrency, ready))
+    seconds = time.perf_counter() - start
+
+    result = BenchmarkResult(framework, concurrency, seconds, latencies)
+    if trace_allocations:
+        _, result.peak_memory = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().compare_to(snapshot[0], "lineno")
+        result.top_allocations = [str(stat) for stat in stats[:5]]
+        tracemalloc.stop()
+    return result
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--framework",
+        choices=["fastapi", "fastapi-asgi", "flask", "all"],
+        default="all",
+    )
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--facilitator-latency",
+        type=float,
+        default=0.0,
+        help="Simulated seconds per verify/settle call",
+    )
+    parser.add_argument("--trace-allocations", action="store_true")
+    args = parser.parse_args(argv)
+
+    frameworks = (
+        ["fastapi", "fastapi-asgi", "flask"]
+        if args.framework == "all"
+        else [args.framework]
+    )
+    for framework in frameworks:
+        result = run(
+            framework,
+            args.requests,
+            args.concurrency,
+            args.facilitator_latency,
+            args.trace_allocations,
+        )
+        print(result.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import pytest
+
+from harness import run
+
+
+@pytest.mark.parametrize("framework", ["fastapi", "fastapi-asgi", "flask"])
+def test_paid_requests(framework):
+    result = run(framework, requests=200, concurrency=8)
+    print(result.report())
+
+    assert result.requests == 200
+    assert result.percentile(50) <= result.percentile(99)
+
+
+def test_trace_allocations():
+    result = run("fastapi-asgi", requests=20, concurrency=2, trace_allocations=True)
+
+    assert result.peak_memory
+    assert result.top_allocations
@@ -0,0 +1,24 @@
+"""Cold-start import time of the package entry points, each measured in a
+fresh interpreter."""
+
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "x402",
+        "x402.clients",
+        "x402.clients.httpx",
+        "x402.fastapi.middleware",
+        "x402.flask.middleware",
+    ],
+)
+def test_import_time(benchmark, module):
+    def cold_import():
+        subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+
+    benchmark.pedantic(cold_import, rounds=5, warmup_rounds=1)
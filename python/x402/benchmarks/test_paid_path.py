@@ -0,0 +1,102 @@
+"""Microbenchmarks for the individual steps of the paid request path.
+
+Run with `pytest benchmarks`; see pytest-benchmark's options for comparing
+runs (`--benchmark-autosave`, `--benchmark-compare`).
+"""
+
+import json
+
+import pytest
+
+from x402.common import settlement_header
+from x402.encoding import base64_decode_bytes
+from x402.path import path_is_match
+from x402.paywall import get_paywall_html
+from x402.pricing import clear_price_cache, compile_price
+from x402.requirements import PaymentRequirementsCache, PaymentRequirementsEntry
+from x402.types import PaymentPayload, SettleResponse
+
+from conftest import RESOURCE
+
+
+def test_decode_payment_header(benchmark, payment_header):
+    def decode():
+        return PaymentPayload(**json.loads(base64_decode_bytes(payment_header)))
+
+    assert benchmark(decode).scheme == "exact"
+
+
+def test_sign_payment_header(benchmark, client, requirements):
+    benchmark(client.create_payment_header, requirements, 1)
+
+
+def test_build_requirements(benchmark):
+    def build():
+        cache = PaymentRequirementsCache(
+            price="$0.001",
+            pay_to_address="0x1111111111111111111111111111111111111111",
+            network="base-sepolia",
+        )
+        return cache.get(None, RESOURCE, "GET")
+
+    benchmark(build)
+
+
+def test_cached_requirements(benchmark, requirements_cache):
+    requirements_cache.get(None, RESOURCE, "GET")
+    benchmark(requirements_cache.get, None, RESOURCE, "GET")
+
+
+def test_compile_price_uncached(benchmark):
+    def compile_uncached():
+        clear_price_cache()
+        return compile_price("$0.001", "base-sepolia")
+
+    assert benchmark(compile_uncached).max_amount_required == "1000"
+
+
+@pytest.mark.parametrize(
+    "pattern,request_path",
+    [
+        ("/paid", "/paid"),
+        ("/api/*/paid", "/api/v1/paid"),
+        ("regex:^/api/v\\d+/paid$", "/api/v1/paid"),
+        (["/free", "/other", "/paid"], "/paid"),
+    ],
+    ids=["exact", "glob", "regex", "list"],
+)
+def test_path_match(benchmark, pattern, request_path):
+    assert benchmark(path_is_match, pattern, request_path)
+
+
+def test_render_402_json_cached(benchmark, requirements_entry):
+    benchmark(requirements_entry.json_body, "No X-PAYMENT header provided")
+
+
+def test_render_402_json_uncached(benchmark, requirements_entry):
+    requirements = requirements_entry.requirements
+
+    def render():
+        return PaymentRequirementsEntry(requirements).json_body(
+            "No X-PAYMENT header provided"
+        )
+
+    benchmark(render)
+
+
+def test_render_402_paywall(benchmark, requirements_entry):
+    benchmark(
+        get_paywall_html,
+        "No X-PAYMENT header provided",
+        requirements_entry.requirements,
+    )
+
+
+def test_settlement_header(benchmark):
+    response = SettleResponse(
+        success=True,
+        transaction="0x" + "ab" * 32,
+        network="base-sepolia",
+        payer="0x" + "2" * 40,
+    )
+    benchmark(settlement_header, response)
@@ -1,2 +1,51 @@
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from x402.clients.base import x402Client
+    from x402.facilitator import FacilitatorClient, FacilitatorConfig
+    from x402.types import PaymentPayload, PaymentRequirements
+
+# Submodules and common names are imported on first access (PEP 562), so
+# `import x402` stays cheap and each entry point only pays for what it uses
+_LAZY_EXPORTS = {
+    "x402Client": "x402.clients.base",
+    "FacilitatorClient": "x402.facilitator",
+    "FacilitatorConfig": "x402.facilitator",
+    "PaymentPayload": "x402.types",
+    "PaymentRequirements": "x402.types",
+}
+
+__all__ = [
+    "hello",
+    "x402Client",
+    "FacilitatorClient",
+    "FacilitatorConfig",
+    "PaymentPayload",
+    "PaymentRequirements",
+]
+
+
 def hello() -> str:
     return "Hello from x402!"
+
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY_EXPORTS.get(name)
+    if module is not None:
+        value = getattr(importlib.import_module(module), name)
+    else:
+        try:
+            value = importlib.import_module(f"{__name__}.{name}")
+        except ModuleNotFoundError as e:
+            if e.name != f"{__name__}.{name}":
+                raise
+            raise AttributeError(
+                f"module {__name__!r} has no attribute {name!r}"
+            ) from None
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *__all__])
@@ -0,0 +1,279 @@
+"""Admission control in front of payment verification.
+
+Every X-PAYMENT header that decodes costs a facilitator `/verify` call, so
+the middlewares can throttle attempts before verifying them:
+
+- token buckets keyed by payer address (`authorization.from`) and by client
+  IP address
+- a limit on concurrent verifications
+
+Rejected requests get a 429 with a Retry-After header right away, without
+waiting for capacity.
+
+Buckets live in a `BucketBackend`. `MemoryBackend` keeps them in-process in
+lock-sharded LRU maps. `SQLiteBackend` keeps them in a SQLite database so all
+workers of a multi-process server on one host share their limits.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Literal, NamedTuple, Optional, Protocol
+
+from typing_extensions import TypedDict
+
+from x402 import instrumentation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARDS = 16
+DEFAULT_MAX_KEYS = 100_000
+# Full buckets are deleted from SQLite every this many calls to `take`
+SQLITE_PRUNE_INTERVAL = 1000
+
+AdmissionReason = Literal["payer", "ip", "concurrency"]
+
+
+class BucketBackend(Protocol):
+    """Storage for token buckets."""
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        """Take a token from the bucket for `key`.
+
+        Returns 0 if a token was taken, otherwise the seconds until one is
+        available.
+        """
+        ...
+
+
+def _refill(
+    tokens: float, updated: float, rate: float, burst: float, now: float
+) -> float:
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBackend:
+    """In-process token buckets, sharded by key to keep lock contention low.
+
+    Each shard is an LRU map, so at most `max_keys` buckets are kept. An
+    evicted bucket starts over full.
+
+    Args:
+        shards: Number of independently locked shards
+        max_keys: Maximum number of buckets over all shards
+    """
+
+    def __init__(self, shards: int = DEFAULT_SHARDS, max_keys: int = DEFAULT_MAX_KEYS):
+        if shards <= 0:
+            raise ValueError("shards must be positive")
+        self._max_keys_per_shard = max(1, max_keys // shards)
+        self._shards = [
+            (threading.Lock(), OrderedDict[str, tuple[float, float]]())
+            for _ in range(shards)
+        ]
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        lock, buckets = self._shards[hash(key) % len(self._shards)]
+        with lock:
+            state = buckets.get(key)
+            if state is None:
+                tokens = burst
+            else:
+                tokens = _refill(*state, rate, burst, now)
+                buckets.move_to_end(key)
+            if tokens >= 1:
+                buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate
+            if len(buckets) > self._max_keys_per_shard:
+                buckets.popitem(last=False)
+        return wait
+
+
+class SQLiteBackend:
+    """Token buckets in a SQLite database shared by the processes of a server.
+
+    Each `take` is one short write transaction. Buckets that have refilled
+    completely are equivalent to missing ones and are pruned periodically.
+
+    Args:
+        path: Database file, on a local filesystem all workers can access
+        timeout: Seconds to wait for another process' transaction
+    """
+
+    def __init__(self, path: str, timeout: float = 1.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._calls = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, and new ones after a fork
+        pid = os.getpid()
+        cached = getattr(self._local, "connection", None)
+        if cached is not None and cached[0] == pid:
+            return cached[1]
+        connection = sqlite3.connect(
+            self.path, timeout=self.timeout, isolation_level=None
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS x402_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+            "updated REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+        self._local.connection = (pid, connection)
+        return connection
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated FROM x402_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens = burst if row is None else _refill(*row, rate, burst, now)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if tokens >= 1:
+                tokens -= 1
+            connection.execute(
+                "INSERT OR REPLACE INTO x402_buckets VALUES (?, ?, ?, ?)",
+                (key, tokens, now, now + (burst - tokens) / rate),
+            )
+            self._calls += 1
+            if self._calls % SQLITE_PRUNE_INTERVAL == 0:
+                connection.execute("DELETE FROM x402_buckets WHERE full_at < ?", (now,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class AdmissionConfig(TypedDict, total=False):
+    """Configuration for admission control.
+
+    Rates are in requests per second and bursts in requests. Leave a limit
+    out to disable it.
+
+    Attributes:
+        payer_rate: Sustained verifications per payer address
+        payer_burst: Verifications a payer can make at once, defaults to
+            max(1, payer_rate)
+        ip_rate: Sustained verifications per client IP address
+        ip_burst: Verifications an IP address can make at once, defaults to
+            max(1, ip_rate)
+        max_concurrent_verifies: Verifications in flight at once
+        backend: A BucketBackend, defaults to a new MemoryBackend
+    """
+
+    payer_rate: float
+    payer_burst: float
+    ip_rate: float
+    ip_burst: float
+    max_concurrent_verifies: int
+    # A BucketBackend, typed as Any so pydantic's validate_call accepts it
+    backend: Any
+
+
+class AdmissionRejection(NamedTuple):
+    reason: AdmissionReason
+    retry_after: float
+
+    @property
+    def retry_after_header(self) -> str:
+        """The Retry-After header value, in whole seconds"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class AdmissionController:
+    """Applies an AdmissionConfig to payment attempts.
+
+    Usage:
+        rejection = controller.admit(payer, ip)
+        if rejection is not None:
+            return 429 with Retry-After: rejection.retry_after_header
+        try:
+            verify...
+        finally:
+            controller.release()
+
+    Backend errors admit the request, so a broken shared store does not stop
+    payments.
+
+    Args:
+        config: Admission configuration
+        clock: Returns the current time in seconds
+    """
+
+    def __init__(
+        self,
+        config: AdmissionConfig,
+        clock: Callable[[], float] = time.time,
+    ):
+        for key in ("payer_rate", "ip_rate"):
+            if key in config and config[key] <= 0:
+                raise ValueError(f"{key} must be positive")
+        limit = config.get("max_concurrent_verifies")
+        if limit is not None and limit <= 0:
+            raise ValueError("max_concurrent_verifies must be positive")
+
+        self.payer_rate = config.get("payer_rate")
+        self.payer_burst = config.get("payer_burst", max(1.0, self.payer_rate or 0))
+        self.ip_rate = config.get("ip_rate")
+        self.ip_burst = config.get("ip_burst", max(1.0, self.ip_rate or 0))
+        self.max_concurrent_verifies = limit
+        self.backend: BucketBackend = config.get("backend") or MemoryBackend()
+        self.clock = clock
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def admit(
+        self, payer: Optional[str], ip: Optional[str]
+    ) -> Optional[AdmissionRejection]:
+        """Admit a verification, or return why it is rejected.
+
+        An admitted verification holds a concurrency slot until `release`.
+        """
+        if self.max_concurrent_verifies is not None:
+            with self._lock:
+                if self.in_flight >= self.max_concurrent_verifies:
+                    return self._reject("concurrency", 1.0)
+                self.in_flight += 1
+
+        now = self.clock()
+        checks = (
+            ("ip", ip, self.ip_rate, self.ip_burst),
+            ("payer", payer and payer.lower(), self.payer_rate, self.payer_burst),
+        )
+        for reason, key, rate, burst in checks:
+            if rate is None or not key:
+                continue
+            try:
+                wait = self.backend.take(f"{reason}:{key}", rate, burst, now)
+            except Exception as e:
+                logger.warning(f"Admission backend failed, admitting request: {e}")
+                continue
+            if wait > 0:
+                self.release()
+                return self._reject(reason, wait)  # type: ignore[arg-type]
+        return None
+
+    def release(self) -> None:
+        """Free the concurrency slot of an admitted verification"""
+        if self.max_concurrent_verifies is not None:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _reject(
+        self, reason: AdmissionReason, retry_after: float
+    ) -> AdmissionRejection:
+        instrumentation.count("x402.admission.rejected", reason=reason)
+        return AdmissionRejection(reason, retry_after)
@@ -0,0 +1,609 @@
+"""Deferred, batched settlement of verified payments.
+
+For sub-cent prices the `/settle` round trip dominates the cost of a paid
+request. With aggregation the middlewares verify each payment, append it to
+a local ledger and serve the request right away. A scheduler thread then
+settles the recorded authorizations in batches:
+
+- as soon as `batch_size` payments are pending,
+- when the oldest payment has waited `max_delay` seconds, or
+- when a payment gets within `settle_margin` seconds of its `validBefore`,
+
+always taking the payments with the earliest deadlines first.
+
+The ledger is an append-only file of JSON lines, one per process, in the
+configured directory. Without a directory pending payments are only kept
+in memory and are lost if the process exits before settling them. Appends
+are group committed: the request path only writes to the page cache and a
+committer thread fsyncs every `commit_interval` seconds, so a crashed
+process loses nothing and a power loss at most the last interval. Payments
+left in the ledger of a dead process are adopted by the next process of
+the server that records one.
+
+The facilitator settles one authorization per call, so a batch is a set of
+concurrent `/settle` calls made off the request path. Each authorization
+is still its own transfer on chain.
+
+Until it settles, a payer can reuse an authorization or spend the funds
+elsewhere. Reuse is only detected within the process that recorded the
+payment: each worker of a multi-process server keeps its own pending set,
+so the same authorization can be served once per worker before its batch
+settles. Only one of those settlements succeeds. Spent funds likewise make
+the settlement fail and are logged. Only use aggregation for prices where
+that risk is acceptable.
+"""
+
+import asyncio
+import glob
+import heapq
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, NamedTuple, Optional
+
+from typing_extensions import TypedDict
+
+from x402 import instrumentation
+from x402.schemes import settled_amount
+from x402.types import PaymentPayload, PaymentRequirements, SettleResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_DELAY = 30.0
+DEFAULT_SETTLE_MARGIN = 10.0
+DEFAULT_COMMIT_INTERVAL = 0.05
+DEFAULT_MAX_CONCURRENT_SETTLES = 8
+# Seconds to wait before retrying settlements the facilitator failed to make
+RETRY_DELAY = 1.0
+# The ledger is rewritten once it holds this many records more than pending
+# payments
+COMPACT_THRESHOLD = 10_000
+
+
+class AggregationConfig(TypedDict, total=False):
+    """Configuration for deferred, batched settlement.
+
+    Attributes:
+        directory: Directory for the ledger files, on a local filesystem all
+            processes of the server can access. Pending payments are kept in
+            memory only if not set.
+        batch_size: Pending payments that trigger a batch, and the maximum
+            size of a batch
+        max_delay: Seconds a payment waits at most before settling
+        settle_margin: Seconds before `validBefore` by which a payment is
+            settled
+        commit_interval: Seconds between fsyncs of the ledger
+        max_concurrent_settles: Concurrent `/settle` calls within a batch
+    """
+
+    directory: str
+    batch_size: int
+    max_delay: float
+    settle_margin: float
+    commit_interval: float
+    max_concurrent_settles: int
+
+
+class PendingPayment(NamedTuple):
+    """A verified payment waiting to be settled."""
+
+    id: str
+    payment: PaymentPayload
+    requirements: PaymentRequirements
+    deadline: float
+    recorded_at: float
+
+    @property
+    def valid_before(self) -> int:
+        return int(self.payment.payload.authorization.valid_before)
+
+
+def payment_id(payment: PaymentPayload) -> str:
+    """Identify a payment by its authorization nonce"""
+    authorization = payment.payload.authorization
+    return f"{payment.network}:{authorization.from_.lower()}:{authorization.nonce}"
+
+
+def _encode(record: dict[str, Any]) -> bytes:
+    return json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def _added_record(pending: PendingPayment) -> bytes:
+    return _encode(
+        {
+            "op": "add",
+            "id": pending.id,
+            "payment": pending.payment.model_dump(by_alias=True),
+            "requirements": pending.requirements.model_dump(by_alias=True),
+            "deadline": pending.deadline,
+            "recorded_at": pending.recorded_at,
+        }
+    )
+
+
+def read_ledger(path: str) -> list[PendingPayment]:
+    """Return the payments of a ledger file that were not settled.
+
+    A record torn by a crash in the middle of a write is skipped.
+    """
+    pending: dict[str, PendingPayment] = {}
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if record["op"] == "add":
+                    pending[record["id"]] = PendingPayment(
+                        record["id"],
+                        PaymentPayload(**record["payment"]),
+                        PaymentRequirements(**record["requirements"]),
+                        record["deadline"],
+                        record["recorded_at"],
+                    )
+                else:
+                    pending.pop(record["id"], None)
+            except (ValueError, KeyError, TypeError):
+                logger.warning(f"Skipping unreadable record in payment ledger {path}")
+    return list(pending.values())
+
+
+class PaymentLedger:
+    """Append-only, group-committed log of pending payments.
+
+    The file is locked while open, so other processes can tell whether its
+    owner is still alive.
+
+    Args:
+        path: Ledger file
+        commit_interval: Seconds between fsyncs
+    """
+
+    def __init__(self, path: str, commit_interval: float = DEFAULT_COMMIT_INTERVAL):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.records = 0
+        self._lock = threading.Lock()
+        # Held while syncing, so a rewrite does not swap the file under fsync
+        self._sync_lock = threading.Lock()
+        self._dirty = False
+        self._closed = threading.Event()
+        self._fd = _open_locked(path)
+        self._committer = threading.Thread(
+            target=self._commit_loop, name="x402-ledger-commit", daemon=True
+        )
+        self._committer.start()
+
+    def append(self, data: bytes) -> None:
+        """Write records without waiting for them to reach the disk"""
+        with self._lock:
+            _write_all(self._fd, data)
+            self.records += data.count(b"\n")
+            self._dirty = True
+
+    def commit(self) -> None:
+        """Flush appended records to the disk"""
+        with self._sync_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                fd = self._fd
+            os.fsync(fd)
+
+    def size(self) -> int:
+        """Bytes appended so far"""
+        with self._lock:
+            return os.lseek(self._fd, 0, os.SEEK_END)
+
+    def rewrite(self, pending: list[PendingPayment], since: int) -> None:
+        """Replace the ledger with the records of the pending payments.
+
+        `pending` is the state of the ledger when it had `since` bytes, the
+        records appended after that are copied to the new file. Appends only
+        wait for that copy and the swap of the files.
+        """
+        temporary = f"{self.path}.tmp"
+        with self._sync_lock:
+            fd = _open_locked(temporary, truncate=True)
+            try:
+                _write_all(fd, b"".join(_added_record(p) for p in pending))
+                os.fsync(fd)
+                with self._lock:
+                    appended = _read_from(self._fd, since)
+                    _write_all(fd, appended)
+                    os.replace(temporary, self.path)
+                    previous, self._fd = self._fd, fd
+                    self.records = len(pending) + appended.count(b"\n")
+                    self._dirty = bool(appended)
+            except BaseException:
+                os.close(fd)
+                raise
+            os.close(previous)
+            _sync_directory(self.path)
+
+    def close(self) -> None:
+        self._closed.set()
+        self._committer.join()
+        self.commit()
+        with self._lock:
+            os.close(self._fd)
+
+    def _commit_loop(self) -> None:
+        while not self._closed.wait(self.commit_interval):
+            try:
+                self.commit()
+            except OSError:
+                logger.exception("Failed to sync the payment ledger")
+
+
+def _open_locked(path: str, truncate: bool = False) -> int:
+    """Open a file for appending and lock it, raising BlockingIOError if
+    another process holds the lock"""
+    import fcntl
+
+    flags = os.O_RDWR | os.O_CREAT | os.O_APPEND
+    fd = os.open(path, flags | os.O_TRUNC if truncate else flags, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+def _read_from(fd: int, offset: int) -> bytes:
+    chunks = []
+    while chunk := os.pread(fd, 65536, offset):
+        chunks.append(chunk)
+        offset += len(chunk)
+    return b"".join(chunks)
+
+
+def _sync_directory(path: str) -> None:
+    """Make a rename of `path` durable"""
+    fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class PaymentAggregator:
+    """Records verified payments and settles them in deadline order.
+
+    Thread-safe. The ledger and the scheduler thread start with the first
+    recorded payment, in the process that records it.
+
+    Args:
+        config: Aggregation configuration
+        facilitator: Object with an async `settle` method
+        route: Route label for instrumentation
+        clock: Returns the current time in seconds
+        on_settling: Called with each payment taken for settlement, after
+            which `record` rejects it
+    """
+
+    def __init__(
+        self,
+        config: AggregationConfig,
+        facilitator: Any,
+        route: str = "",
+        clock: Callable[[], float] = time.time,
+        on_settling: Optional[Callable[[PaymentPayload], None]] = None,
+    ):
+        self.directory = config.get("directory")
+        self.batch_size = config.get("batch_size", DEFAULT_BATCH_SIZE)
+        self.max_delay = config.get("max_delay", DEFAULT_MAX_DELAY)
+        self.settle_margin = config.get("settle_margin", DEFAULT_SETTLE_MARGIN)
+        self.commit_interval = config.get("commit_interval", DEFAULT_COMMIT_INTERVAL)
+        self.max_concurrent_settles = config.get(
+            "max_concurrent_settles", DEFAULT_MAX_CONCURRENT_SETTLES
+        )
+        if self.batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        if self.max_concurrent_settles <= 0:
+            raise ValueError("max_concurrent_settles must be positive")
+        self.facilitator = facilitator
+        self.route = route
+        self.clock = clock
+        self.on_settling = on_settling
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # State inherited across a fork belongs to the parent
+            self._lock = threading.Lock()
+            self._wakeup = threading.Condition(self._lock)
+            self._pending: dict[str, PendingPayment] = {}
+            self._in_flight: set[str] = set()
+            # Payment ids by deadline and by age, skipped once settled
+            self._by_deadline: list[tuple[float, str]] = []
+            self._by_age: deque[tuple[float, str]] = deque()
+            self._closed = False
+            self._compacting = False
+
+            self._ledger: Optional[PaymentLedger] = None
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+                # Unique per aggregator, several routes can share a directory
+                name = f"ledger-{os.getpid()}-{secrets.token_hex(4)}.log"
+                path = os.path.join(self.directory, name)
+                self._ledger = PaymentLedger(path, self.commit_interval)
+                self._adopt_orphans()
+            self._scheduler = threading.Thread(
+                target=self._schedule_loop, name="x402-aggregation", daemon=True
+            )
+            self._scheduler.start()
+            self._pid = os.getpid()
+
+    def _append(self, data: bytes) -> None:
+        if self._ledger is not None and data:
+            self._ledger.append(data)
+
+    def _adopt_orphans(self) -> None:
+        """Take over the pending payments of ledgers whose process died"""
+        assert self._ledger is not None and self.directory
+        for path in glob.glob(os.path.join(self.directory, "ledger-*.log")):
+            if path == self._ledger.path:
+                continue
+            try:
+                fd = _open_locked(path)
+            except (BlockingIOError, FileNotFoundError):
+                # Its process is alive, or another process adopted it
+                continue
+            try:
+                adopted = read_ledger(path)
+                if adopted:
+                    self._ledger.append(b"".join(_added_record(p) for p in adopted))
+                    self._ledger.commit()
+                for pending in adopted:
+                    self._push(pending)
+                os.unlink(path)
+                logger.info(f"Adopted {len(adopted)} pending payments from {path}")
+            finally:
+                os.close(fd)
+
+    def _push(self, pending: PendingPayment) -> None:
+        self._pending[pending.id] = pending
+        heapq.heappush(self._by_deadline, (pending.deadline, pending.id))
+        self._by_age.append((pending.recorded_at, pending.id))
+
+    def record(
+        self,
+        payment: PaymentPayload,
+        requirements: PaymentRequirements,
+        replace: bool = False,
+    ) -> bool:
+        """Record a verified payment for later settlement.
+
+        Returns False, without recording it, if the same authorization is
+        already pending, or with `replace` if it is already settling.
+
+        Args:
+            replace: Replace the requirements of a pending payment, e.g. to
+                update the amount an upto authorization settles. The payment
+                recorded first is kept.
+        """
+        self._ensure_started()
+        now = self.clock()
+        key = payment_id(payment)
+        deadline = int(payment.payload.authorization.valid_before) - self.settle_margin
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            previous = self._pending.get(key)
+            if previous is not None:
+                if not replace:
+                    return False
+                # Keep its place in the queues
+                pending = previous._replace(requirements=requirements)
+                self._append(_added_record(pending))
+                self._pending[key] = pending
+                return True
+            pending = PendingPayment(key, payment, requirements, deadline, now)
+            self._append(_added_record(pending))
+            self._push(pending)
+            # Wake the scheduler if the batch is full or the payment is due first
+            if len(self._pending) >= self.batch_size or self._by_deadline[0][1] == key:
+                self._wakeup.notify()
+        return True
+
+    def cancel(self, payment: PaymentPayload) -> bool:
+        """Drop a recorded payment whose request failed.
+
+        Returns False if it is already settling.
+        """
+        self._ensure_started()
+        key = payment_id(payment)
+        with self._lock:
+            if self._pending.pop(key, None) is None:
+                return False
+            self._append(_encode({"op": "done", "id": key}))
+        return True
+
+    @property
+    def pending_count(self) -> int:
+        if self._pid != os.getpid():
+            return 0
+        with self._lock:
+            return len(self._pending)
+
+    def settle_all(self) -> None:
+        """Settle every pending payment now, e.g. before shutting down.
+
+        Runs its own event loop, use `settle_all_async` from async code.
+        """
+        if self._pid != os.getpid():
+            return
+        asyncio.run(self.settle_all_async())
+
+    async def settle_all_async(self) -> None:
+        """Settle every pending payment now on the running event loop"""
+        if self._pid != os.getpid():
+            return
+        while True:
+            with self._lock:
+                batch = self._take_batch(float("inf"))
+            if not batch:
+                return
+            await self._settle_batch(batch)
+
+    def close(self) -> None:
+        """Stop the scheduler and sync the ledger, leaving pending payments
+        to the next process"""
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        self._scheduler.join()
+        if self._ledger is not None:
+            self._ledger.close()
+        self._pid = None
+
+    def _next_due(self) -> float:
+        """When the next batch is due, called with the lock held"""
+        if len(self._pending) >= self.batch_size:
+            return 0.0
+        # Drop settled and cancelled payments from the front of the queues
+        while self._by_deadline and self._by_deadline[0][1] not in self._pending:
+            heapq.heappop(self._by_deadline)
+        while self._by_age and self._by_age[0][1] not in self._pending:
+            self._by_age.popleft()
+        due = float("inf")
+        if self._by_deadline:
+            due = self._by_deadline[0][0]
+        if self._by_age:
+            due = min(due, self._by_age[0][0] + self.max_delay)
+        return due
+
+    def _take_batch(self, now: float) -> list[PendingPayment]:
+        """Take the payments with the earliest deadlines if a batch is due,
+        called with the lock held"""
+        if self._next_due() > now:
+            return []
+        batch: list[PendingPayment] = []
+        while self._by_deadline and len(batch) < self.batch_size:
+            _, key = heapq.heappop(self._by_deadline)
+            pending = self._pending.pop(key, None)
+            if pending is not None:
+                self._in_flight.add(key)
+                batch.append(pending)
+                if self.on_settling is not None:
+                    self.on_settling(pending.payment)
+        return batch
+
+    def _schedule_loop(self) -> None:
+        while True:
+            with self._lock:
+                while True:
+                    if self._closed:
+                        return
+                    now = self.clock()
+                    batch = self._take_batch(now)
+                    if batch:
+                        break
+                    due = self._next_due()
+                    self._wakeup.wait(None if due == float("inf") else due - now)
+            try:
+                retry = asyncio.run(self._settle_batch(batch))
+            except Exception:
+                logger.exception("Settling a batch of payments failed")
+                retry = True
+            if retry:
+                time.sleep(RETRY_DELAY)
+
+    async def _settle_batch(self, batch: list[PendingPayment]) -> bool:
+        """Settle a batch, returning whether some settlements should be
+        retried"""
+        instrumentation.count("x402.aggregation.batch", len(batch), route=self.route)
+        semaphore = asyncio.Semaphore(self.max_concurrent_settles)
+
+        async def settle(pending: PendingPayment) -> Optional[SettleResponse]:
+            async with semaphore:
+                try:
+                    return await self._settle(pending)
+                except Exception as e:
+                    logger.warning(f"Settle of payment {pending.id} failed: {e}")
+                    return None
+
+        results = await asyncio.gather(*(settle(p) for p in batch))
+
+        done: list[str] = []
+        retry: list[PendingPayment] = []
+        for pending, settle_response in zip(batch, results):
+            if settle_response is not None:
+                if not settle_response.success:
+                    logger.warning(
+                        f"Settle of payment {pending.id} failed: {settle_response.error_reason}"
+                    )
+                done.append(pending.id)
+            elif pending.valid_before > self.clock():
+                retry.append(pending)
+            else:
+                logger.error(f"Payment {pending.id} expired before it could settle")
+                done.append(pending.id)
+
+        ledger = self._ledger
+        snapshot: Optional[tuple[list[PendingPayment], int]] = None
+        with self._lock:
+            self._append(b"".join(_encode({"op": "done", "id": key}) for key in done))
+            for pending in batch:
+                self._in_flight.discard(pending.id)
+            for pending in retry:
+                self._push(pending)
+            if (
+                ledger is not None
+                and not self._compacting
+                and ledger.records > len(self._pending) + COMPACT_THRESHOLD
+            ):
+                self._compacting = True
+                snapshot = (list(self._pending.values()), ledger.size())
+        # Rewrite outside the lock so `record` is not held up by the fsync
+        if ledger is not None and snapshot is not None:
+            try:
+                await asyncio.to_thread(ledger.rewrite, *snapshot)
+            finally:
+                with self._lock:
+                    self._compacting = False
+        return bool(retry)
+
+    async def _settle(self, pending: PendingPayment) -> SettleResponse:
+        payment, requirements = pending.payment, pending.requirements
+        outcome, reason = "error", None
+        try:
+            with instrumentation.span(
+                "x402.settle", route=self.route, network=payment.network
+            ) as span:
+                settle_response = await self.facilitator.settle(payment, requirements)
+                span.set_attribute("success", settle_response.success)
+            outcome = "success" if settle_response.success else "failure"
+            reason = settle_response.error_reason
+            if settle_response.success:
+                instrumentation.count(
+                    "x402.revenue",
+                    settled_amount(payment, requirements),
+                    route=self.route,
+                    network=payment.network,
+                    asset=requirements.asset,
+                )
+            return settle_response
+        finally:
+            instrumentation.count(
+                "x402.settle.result", route=self.route, outcome=outcome, reason=reason
+            )
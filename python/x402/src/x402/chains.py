@@ -1,3 +1,35 @@
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Iterable, Iterator, Mapping, Optional, Union
+
+_ADDRESS_RE = re.compile(r"(0x)?[0-9a-fA-F]{40}")
+
+
+def to_checksum_address(address: str) -> str:
+    """EIP-55 checksum an address.
+
+    Equivalent to `eth_utils.to_checksum_address` for hex strings, without
+    importing eth_utils, which dominates `import x402` time.
+
+    Raises:
+        ValueError: If the address is not 20 hex encoded bytes
+    """
+    if not isinstance(address, str) or not _ADDRESS_RE.fullmatch(address):
+        raise ValueError(f"Invalid address: {address!r}")
+
+    from eth_hash.auto import keccak
+
+    lower = address[-40:].lower()
+    digest = keccak(lower.encode("ascii")).hex()
+    return "0x" + "".join(
+        char.upper() if int(nibble, 16) >= 8 else char
+        for char, nibble in zip(lower, digest)
+    )
+
+
 NETWORK_TO_ID = {
     "base-sepolia": "84532",
     "base": "8453",
@@ -10,14 +42,7 @@ def get_chain_id(network: str) -> str:
     """Get the chain ID for a given network
     Supports string encoded chain IDs and human readable networks
     """
-    try:
-        int(network)
-        return network
-    except ValueError:
-        pass
-    if network not in NETWORK_TO_ID:
-        raise ValueError(f"Unsupported network: {network}")
-    return NETWORK_TO_ID[network]
+    return _registry.chain_id(network)
 
 
 KNOWN_TOKENS = {
@@ -60,33 +85,252 @@ KNOWN_TOKENS = {
 }
 
 
+@dataclass(frozen=True)
+class TokenInfo:
+    """Metadata for a token deployed on a given chain.
+
+    Attributes:
+        chain_id: String encoded chain ID the token lives on
+        address: Checksummed contract address
+        symbol: Lowercase human readable token type, e.g. "usdc"
+        name: EIP-712 domain name, exactly what `name()` returns on the contract
+        decimals: Number of decimals used by the token
+        version: EIP-712 domain version
+    """
+
+    chain_id: str
+    address: str
+    symbol: str
+    name: str
+    decimals: int
+    version: str
+
+    @classmethod
+    def from_dict(
+        cls, chain_id: Union[str, int], token: Mapping[str, Any]
+    ) -> "TokenInfo":
+        """Build a TokenInfo from a `KNOWN_TOKENS` style entry."""
+        try:
+            return cls(
+                chain_id=str(chain_id),
+                address=to_checksum_address(token["address"]),
+                symbol=str(token["human_name"]).lower(),
+                name=token["name"],
+                decimals=int(token["decimals"]),
+                version=str(token["version"]),
+            )
+        except KeyError as e:
+            raise ValueError(
+                f"Token entry for chain {chain_id} is missing field {e}"
+            ) from e
+
+
+class TokenRegistry:
+    """Immutable index of known tokens and networks.
+
+    Tokens are indexed by (chain_id, checksummed address) and (chain_id, symbol)
+    so lookups are O(1) regardless of how many tokens a chain has. Registries
+    are never mutated in place; `with_tokens` and `with_networks` return a new
+    registry, which makes it safe to share one between threads.
+    """
+
+    def __init__(
+        self,
+        tokens: Iterable[TokenInfo] = (),
+        networks: Optional[Mapping[str, Union[str, int]]] = None,
+    ):
+        by_address: dict[tuple[str, str], TokenInfo] = {}
+        by_symbol: dict[tuple[str, str], TokenInfo] = {}
+        for token in tokens:
+            by_address[(token.chain_id, token.address)] = token
+            # The first token registered for a symbol is the default for that chain
+            by_symbol.setdefault((token.chain_id, token.symbol), token)
+
+        self._by_address = MappingProxyType(by_address)
+        self._by_symbol = MappingProxyType(by_symbol)
+        self._networks = MappingProxyType(
+            {name: str(chain_id) for name, chain_id in (networks or {}).items()}
+        )
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "TokenRegistry":
+        """Build a registry from a mapping shaped like
+
+            {"networks": {"base": "8453"}, "tokens": {"8453": [{...}, ...]}}
+
+        where each token entry has the same fields as `KNOWN_TOKENS`.
+        """
+        tokens = [
+            TokenInfo.from_dict(chain_id, token)
+            for chain_id, entries in data.get("tokens", {}).items()
+            for token in entries
+        ]
+        return cls(tokens, data.get("networks", {}))
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> "TokenRegistry":
+        """Load a registry from a JSON or TOML file (see `from_dict` for the layout)."""
+        path = Path(path)
+        if path.suffix == ".toml":
+            try:
+                import tomllib  # type: ignore[import-not-found]
+            except ImportError:  # Python < 3.11
+                try:
+                    import tomli as tomllib  # type: ignore[no-redef]
+                except ImportError as e:
+                    raise ImportError(
+                        "Loading TOML token registries on Python < 3.11 requires `tomli`"
+                    ) from e
+            with path.open("rb") as f:
+                data = tomllib.load(f)
+        else:
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        return cls.from_dict(data)
+
+    def with_tokens(self, *tokens: TokenInfo) -> "TokenRegistry":
+        """Return a new registry with the given tokens added (or replaced)."""
+        return TokenRegistry([*self, *tokens], self._networks)
+
+    def with_networks(self, networks: Mapping[str, Union[str, int]]) -> "TokenRegistry":
+        """Return a new registry with the given network name to chain ID mappings added."""
+        return TokenRegistry(self, {**self._networks, **networks})
+
+    def merge(self, other: "TokenRegistry") -> "TokenRegistry":
+        """Return a new registry containing both registries, preferring `other` on conflicts."""
+        return self.with_networks(other.networks).with_tokens(*other)
+
+    @property
+    def networks(self) -> Mapping[str, str]:
+        return self._networks
+
+    def chain_id(self, network: str) -> str:
+        """Get the string encoded chain ID for a network name or chain ID"""
+        chain_id = self._networks.get(network)
+        if chain_id is not None:
+            return chain_id
+        try:
+            int(network)
+            return network
+        except ValueError:
+            pass
+        raise ValueError(f"Unsupported network: {network}")
+
+    def find(self, chain_id: Union[str, int], address: str) -> Optional[TokenInfo]:
+        """Look up a token by contract address, returning None if it is unknown."""
+        chain_id = str(chain_id)
+        token = self._by_address.get((chain_id, address))
+        if token is not None:
+            return token
+        # Fall back to normalizing the address, e.g. lowercase input
+        try:
+            return self._by_address.get((chain_id, to_checksum_address(address)))
+        except ValueError:
+            return None
+
+    def get(self, chain_id: Union[str, int], address: str) -> TokenInfo:
+        """Look up a token by contract address.
+
+        Raises:
+            ValueError: If the token is not registered for the chain
+        """
+        token = self.find(chain_id, address)
+        if token is None:
+            raise ValueError(
+                f"Token not found for chain {chain_id} and address {address}"
+            )
+        return token
+
+    def get_by_symbol(self, chain_id: Union[str, int], symbol: str) -> TokenInfo:
+        """Look up the default token for a chain by its human readable symbol.
+
+        Raises:
+            ValueError: If no token with that symbol is registered for the chain
+        """
+        token = self._by_symbol.get((str(chain_id), symbol.lower()))
+        if token is None:
+            raise ValueError(f"Token type '{symbol}' not found for chain {chain_id}")
+        return token
+
+    def __iter__(self) -> Iterator[TokenInfo]:
+        return iter(self._by_address.values())
+
+    def __len__(self) -> int:
+        return len(self._by_address)
+
+
+DEFAULT_TOKEN_REGISTRY = TokenRegistry.from_dict(
+    {"networks": NETWORK_TO_ID, "tokens": KNOWN_TOKENS}
+)
+
+_registry = DEFAULT_TOKEN_REGISTRY
+
+
+def get_token_registry() -> TokenRegistry:
+    """Get the token registry used by the lookup helpers in this module"""
+    return _registry
+
+
+def set_token_registry(registry: TokenRegistry) -> None:
+    """Replace the token registry used by the lookup helpers in this module"""
+    global _registry
+    _registry = registry
+
+
+def register_token(
+    chain_id: Union[str, int],
+    address: str,
+    name: str,
+    decimals: int,
+    version: str,
+    symbol: str,
+) -> TokenInfo:
+    """Register a custom token so it can be used for pricing and signing"""
+    token = TokenInfo.from_dict(
+        chain_id,
+        {
+            "human_name": symbol,
+            "address": address,
+            "name": name,
+            "decimals": decimals,
+            "version": version,
+        },
+    )
+    set_token_registry(_registry.with_tokens(token))
+    return token
+
+
+def register_network(network: str, chain_id: Union[str, int]) -> None:
+    """Register a custom network name for chain ID lookups"""
+    set_token_registry(_registry.with_networks({network: chain_id}))
+
+
+def load_token_registry(path: Union[str, Path]) -> TokenRegistry:
+    """Merge tokens and networks from a JSON or TOML file into the active registry"""
+    set_token_registry(_registry.merge(TokenRegistry.from_file(path)))
+    return _registry
+
+
+def get_token_info(chain_id: Union[str, int], address: str) -> TokenInfo:
+    """Get the token metadata for a given chain and address"""
+    return _registry.get(chain_id, address)
+
+
 def get_token_name(chain_id: str, address: str) -> str:
     """Get the token name for a given chain and address"""
-    for token in KNOWN_TOKENS[chain_id]:
-        if token["address"] == address:
-            return token["name"]
-    raise ValueError(f"Token not found for chain {chain_id} and address {address}")
+    return _registry.get(chain_id, address).name
 
 
 def get_token_version(chain_id: str, address: str) -> str:
     """Get the token version for a given chain and address"""
-    for token in KNOWN_TOKENS[chain_id]:
-        if token["address"] == address:
-            return token["version"]
-    raise ValueError(f"Token not found for chain {chain_id} and address {address}")
+    return _registry.get(chain_id, address).version
 
 
 def get_token_decimals(chain_id: str, address: str) -> int:
     """Get the token decimals for a given chain and address"""
-    for token in KNOWN_TOKENS[chain_id]:
-        if token["address"] == address:
-            return token["decimals"]
-    raise ValueError(f"Token not found for chain {chain_id} and address {address}")
+    return _registry.get(chain_id, address).decimals
 
 
 def get_default_token_address(chain_id: str, token_type: str = "usdc") -> str:
     """Get the default token address for a given chain and token type"""
-    for token in KNOWN_TOKENS[chain_id]:
-        if token["human_name"] == token_type:
-            return token["address"]
-    raise ValueError(f"Token type '{token_type}' not found for chain {chain_id}")
+    return _registry.get_by_symbol(chain_id, token_type).address
@@ -1,13 +1,35 @@
-from x402.clients.base import x402Client, decode_x_payment_response
-from x402.clients.httpx import (
-    x402_payment_hooks,
-    x402HttpxClient,
-)
-from x402.clients.requests import (
-    x402HTTPAdapter,
-    x402_http_adapter,
-    x402_requests,
-)
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from x402.clients.base import x402Client, decode_x_payment_response
+    from x402.clients.httpx import (
+        x402_payment_hooks,
+        x402HttpxClient,
+    )
+    from x402.clients.requests import (
+        x402HTTPAdapter,
+        x402_http_adapter,
+        x402_requests,
+    )
+    from x402.clients.balances import BalanceTracker, JsonRpcBalanceProvider
+    from x402.clients.selection import CostAwareSelector, PaymentStats
+
+# Exports are imported on first access (PEP 562) so that using one HTTP
+# library does not import the other
+_LAZY_EXPORTS = {
+    "x402Client": "x402.clients.base",
+    "decode_x_payment_response": "x402.clients.base",
+    "x402_payment_hooks": "x402.clients.httpx",
+    "x402HttpxClient": "x402.clients.httpx",
+    "x402HTTPAdapter": "x402.clients.requests",
+    "x402_http_adapter": "x402.clients.requests",
+    "x402_requests": "x402.clients.requests",
+    "BalanceTracker": "x402.clients.balances",
+    "JsonRpcBalanceProvider": "x402.clients.balances",
+    "CostAwareSelector": "x402.clients.selection",
+    "PaymentStats": "x402.clients.selection",
+}
 
 __all__ = [
     "x402Client",
@@ -17,4 +39,21 @@ __all__ = [
     "x402HTTPAdapter",
     "x402_http_adapter",
     "x402_requests",
+    "BalanceTracker",
+    "JsonRpcBalanceProvider",
+    "CostAwareSelector",
+    "PaymentStats",
 ]
+
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY_EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *__all__])
@@ -0,0 +1,202 @@
+"""Wallet balance tracking for pre-flight affordability checks.
+
+With a `BalanceTracker`, `x402Client` checks that the wallet can afford a
+payment before signing it, instead of learning from the facilitator's
+`insufficient_funds` after a verify round trip:
+
+    tracker = BalanceTracker(JsonRpcBalanceProvider({"base": "https://mainnet.base.org"}))
+    client = x402HttpxClient(account, balance_tracker=tracker)
+
+Balances are read through a `BalanceProvider` and cached for `ttl` seconds.
+Every signed payment is held against the cached balance until the server
+answers it. Accepted payments are then deducted, and rejected ones released,
+as are payments that failed to sign or send.
+A fresh read replaces the balance and drops the holds, so payments that
+never got an answer do not stay held. A provider error never blocks a
+payment.
+
+Providers are synchronous. `x402HttpxClient` signs in a worker thread when a
+tracker is set, so balance reads do not block the event loop.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Optional, Protocol
+
+from x402.clients.base import InsufficientFundsError
+from x402.types import PaymentRequirements
+
+logger = logging.getLogger(__name__)
+
+# Seconds a balance read from the provider is trusted
+BALANCE_TTL = 30.0
+
+# ERC-20 balanceOf(address) selector
+_BALANCE_OF = "0x70a08231"
+
+
+class BalanceProvider(Protocol):
+    """Reads token balances, e.g. from an RPC node."""
+
+    def balance_of(self, network: str, asset: str, owner: str) -> int:
+        """Token balance of `owner` in atomic units"""
+        ...
+
+
+class InMemoryBalances:
+    """A BalanceProvider serving balances set with `set`, for tests."""
+
+    def __init__(self):
+        self._balances: dict[tuple[str, str, str], int] = {}
+        self.reads = 0
+
+    def set(self, network: str, asset: str, owner: str, balance: int) -> None:
+        self._balances[(network, asset.lower(), owner.lower())] = balance
+
+    def balance_of(self, network: str, asset: str, owner: str) -> int:
+        self.reads += 1
+        return self._balances.get((network, asset.lower(), owner.lower()), 0)
+
+
+class JsonRpcBalanceProvider:
+    """A BalanceProvider calling ERC-20 `balanceOf` through JSON-RPC nodes.
+
+    Args:
+        rpc_urls: JSON-RPC endpoint per network name
+        timeout: Seconds to wait for a node
+    """
+
+    def __init__(self, rpc_urls: dict[str, str], timeout: float = 5.0):
+        self.rpc_urls = dict(rpc_urls)
+        self.timeout = timeout
+
+    def balance_of(self, network: str, asset: str, owner: str) -> int:
+        import httpx
+
+        url = self.rpc_urls.get(network)
+        if url is None:
+            raise ValueError(f"No RPC URL configured for network {network}")
+        call = {"to": asset, "data": _BALANCE_OF + owner[2:].lower().rjust(64, "0")}
+        response = httpx.post(
+            url,
+            json={
+                "jsonrpc": "2.0",
+                "id": 1,
+                "method": "eth_call",
+                "params": [call, "latest"],
+            },
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        data = response.json()
+        if "error" in data:
+            raise ValueError(f"balanceOf failed: {data['error']}")
+        return int(data["result"], 16)
+
+
+class _Balance:
+    __slots__ = ("balance", "held", "read_at")
+
+    def __init__(self, balance: int, read_at: float):
+        self.balance = balance
+        # Signed payments the server has not answered yet
+        self.held = 0
+        self.read_at = read_at
+
+
+class BalanceTracker:
+    """Cached wallet balances, debited optimistically as payments are signed.
+
+    Thread-safe. Provider reads happen outside the lock.
+    """
+
+    def __init__(
+        self,
+        provider: BalanceProvider,
+        ttl: float = BALANCE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.provider = provider
+        self.ttl = ttl
+        self.clock = clock
+        self._balances: dict[tuple[str, str, str], _Balance] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(owner: str, requirements: PaymentRequirements) -> tuple[str, str, str]:
+        return owner.lower(), requirements.network, requirements.asset.lower()
+
+    def available(self, owner: str, requirements: PaymentRequirements) -> Optional[int]:
+        """Balance of the requirements' asset not held by pending payments, or
+        None if the provider cannot tell"""
+        key = self._key(owner, requirements)
+        now = self.clock()
+        with self._lock:
+            entry = self._balances.get(key)
+            if entry is not None and now - entry.read_at < self.ttl:
+                return entry.balance - entry.held
+        try:
+            balance = self.provider.balance_of(
+                requirements.network, requirements.asset, owner
+            )
+        except Exception as e:
+            logger.warning(
+                "Could not read %s balance on %s: %s",
+                requirements.asset,
+                requirements.network,
+                e,
+            )
+            return None
+        with self._lock:
+            entry = self._balances.get(key)
+            if entry is None:
+                entry = self._balances[key] = _Balance(balance, now)
+            else:
+                entry.balance = balance
+                entry.held = 0
+                entry.read_at = now
+            return entry.balance - entry.held
+
+    def known(self, owner: str, requirements: PaymentRequirements) -> Optional[int]:
+        """Like `available`, but only from a balance read within `ttl`,
+        never calling the provider"""
+        with self._lock:
+            entry = self._balances.get(self._key(owner, requirements))
+            if entry is None or self.clock() - entry.read_at >= self.ttl:
+                return None
+            return entry.balance - entry.held
+
+    def hold(self, owner: str, requirements: PaymentRequirements) -> None:
+        """Hold the amount of a payment about to be signed.
+
+        Raises:
+            InsufficientFundsError: If the known balance cannot cover it
+        """
+        amount = int(requirements.max_amount_required)
+        available = self.available(owner, requirements)
+        if available is None:
+            return
+        with self._lock:
+            entry = self._balances[self._key(owner, requirements)]
+            available = entry.balance - entry.held
+            if available < amount:
+                raise InsufficientFundsError(
+                    f"Payment of {amount} exceeds available balance {available} "
+                    f"of {requirements.asset} on {requirements.network}"
+                )
+            entry.held += amount
+
+    def settle(
+        self, owner: str, requirements: PaymentRequirements, succeeded: bool
+    ) -> None:
+        """Reconcile a held payment once the server answered it: deduct it
+        if it went through, release it otherwise"""
+        amount = int(requirements.max_amount_required)
+        with self._lock:
+            entry = self._balances.get(self._key(owner, requirements))
+            if entry is None:
+                return
+            entry.held = max(entry.held - amount, 0)
+            if succeeded:
+                entry.balance -= amount
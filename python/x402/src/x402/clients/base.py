@@ -1,16 +1,22 @@
 import time
-from typing import Optional, Callable, Dict, Any, List
-from eth_account import Account
-from x402.exact import sign_payment_header
+from typing import TYPE_CHECKING, Optional, Callable, Dict, Any, List
+from x402 import instrumentation
+from x402.schemes import get_scheme, require_scheme
 from x402.types import (
     PaymentRequirements,
     UnsupportedSchemeException,
 )
+from x402.clients.sessions import ReusableAuthorizations, SessionTokens
 from x402.common import x402_VERSION
-import secrets
-from x402.encoding import safe_base64_decode
+from x402.encoding import base64_decode_bytes
+from x402.nonces import NonceSource, random_nonce
 import json
 
+if TYPE_CHECKING:
+    from eth_account import Account
+    from x402.clients.balances import BalanceTracker
+    from x402.clients.selection import PaymentStats
+
 # Define type for the payment requirements selector
 PaymentSelectorCallable = Callable[
     [List[PaymentRequirements], Optional[str], Optional[str], Optional[int]],
@@ -31,9 +37,7 @@ def decode_x_payment_response(header: str) -> Dict[str, Any]:
         - network: str
         - payer: str (address)
     """
-    decoded = safe_base64_decode(header)
-    result = json.loads(decoded)
-    return result
+    return json.loads(base64_decode_bytes(header))
 
 
 class PaymentError(Exception):
@@ -48,6 +52,12 @@ class PaymentAmountExceededError(PaymentError):
     pass
 
 
+class InsufficientFundsError(PaymentError):
+    """Raised before signing when the wallet cannot afford a payment."""
+
+    pass
+
+
 class MissingRequestConfigError(PaymentError):
     """Raised when request configuration is missing."""
 
@@ -65,9 +75,13 @@ class x402Client:
 
     def __init__(
         self,
-        account: Account,
+        account: "Account",
         max_value: Optional[int] = None,
         payment_requirements_selector: Optional[PaymentSelectorCallable] = None,
+        payment_stats: Optional["PaymentStats"] = None,
+        balance_tracker: Optional["BalanceTracker"] = None,
+        nonce_source: Optional[NonceSource] = None,
+        upto_ceiling: Optional[int] = None,
     ):
         """Initialize the x402 client.
 
@@ -75,12 +89,39 @@ class x402Client:
             account: eth_account.Account instance for signing payments
             max_value: Optional maximum allowed payment amount in base units
             payment_requirements_selector: Optional custom selector for payment requirements
+            payment_stats: Optional store fed with the outcome of each payment. Defaults
+                to the selector's own store, e.g. a CostAwareSelector's
+            balance_tracker: Optional wallet balance cache. Payments the wallet cannot afford
+                then fail before signing
+            nonce_source: Optional source of authorization nonces, e.g. a
+                CounterNonceSource. Defaults to the shared random source
+            upto_ceiling: Optional amount `upto` authorizations are signed for, so one
+                authorization pays for several requests. Must not exceed `max_value`.
+                Defaults to the requested amount
         """
+        if (
+            upto_ceiling is not None
+            and max_value is not None
+            and upto_ceiling > max_value
+        ):
+            raise ValueError("upto_ceiling cannot exceed max_value")
         self.account = account
         self.max_value = max_value
+        # Prepaid session tokens returned by servers, see x402.sessions
+        self.sessions = SessionTokens()
+        # Payment headers of reusable schemes, sent again until rejected
+        self.authorizations = ReusableAuthorizations()
         self._payment_requirements_selector = (
             payment_requirements_selector or self.default_payment_requirements_selector
         )
+        self.payment_stats = (
+            payment_stats
+            if payment_stats is not None
+            else getattr(payment_requirements_selector, "stats", None)
+        )
+        self.balance_tracker = balance_tracker
+        self.nonce_source = nonce_source
+        self.upto_ceiling = upto_ceiling
 
     @staticmethod
     def default_payment_requirements_selector(
@@ -116,7 +157,7 @@ class x402Client:
             if network_filter and network != network_filter:
                 continue
 
-            if scheme == "exact":
+            if get_scheme(scheme) is not None:
                 # Check max value if set
                 if max_value is not None:
                     max_amount = int(paymentRequirements.max_amount_required)
@@ -160,40 +201,119 @@ class x402Client:
     ) -> str:
         """Create a payment header for the given requirements.
 
+        Reusable schemes such as `upto` sign a ceiling of `upto_ceiling`, if
+        set, so the payment can cover several requests.
+
         Args:
             payment_requirements: Selected payment requirements
             x402_version: x402 protocol version
 
         Returns:
             Signed payment header
+
+        Raises:
+            UnsupportedSchemeException: If the scheme is not registered
+            InsufficientFundsError: If the balance tracker knows the wallet
+                cannot afford the payment
         """
-        unsigned_header = {
-            "x402Version": x402_version,
-            "scheme": payment_requirements.scheme,
-            "network": payment_requirements.network,
-            "payload": {
-                "signature": None,
-                "authorization": {
-                    "from": self.account.address,
-                    "to": payment_requirements.pay_to,
-                    "value": payment_requirements.max_amount_required,
-                    "validAfter": str(int(time.time()) - 60),  # 60 seconds before
-                    "validBefore": str(
-                        int(time.time()) + payment_requirements.max_timeout_seconds
-                    ),
-                    "nonce": self.generate_nonce(),
-                },
-            },
-        }
-
-        signed_header = sign_payment_header(
-            self.account,
-            payment_requirements,
-            unsigned_header,
+        scheme = require_scheme(payment_requirements.scheme)
+        if self.balance_tracker is not None:
+            try:
+                self.balance_tracker.hold(self.account.address, payment_requirements)
+            finally:
+                self._record_balance(payment_requirements)
+
+        try:
+            with instrumentation.span(
+                "x402.client.sign",
+                scheme=payment_requirements.scheme,
+                network=payment_requirements.network,
+            ):
+                signed_header = scheme.create_payment_header(
+                    self.account,
+                    payment_requirements,
+                    x402_version,
+                    nonce=self.next_nonce(),
+                    max_value=self.upto_ceiling,
+                )
+        except BaseException:
+            self.release_payment(payment_requirements)
+            raise
+        instrumentation.count(
+            "x402.client.payments",
+            network=payment_requirements.network,
+            asset=payment_requirements.asset,
         )
         return signed_header
 
+    def keep_authorization(
+        self, url: str, payment_requirements: PaymentRequirements, header: str
+    ) -> None:
+        """Keep a payment header accepted by `url` for the following requests,
+        if its scheme is reusable"""
+        scheme = get_scheme(payment_requirements.scheme)
+        if scheme is not None and scheme.reusable:
+            expires_at = time.time() + payment_requirements.max_timeout_seconds
+            self.authorizations.add(url, header, expires_at)
+
+    def record_payment(
+        self,
+        payment_requirements: PaymentRequirements,
+        succeeded: bool,
+        latency: float,
+        receipt: Optional[str] = None,
+    ) -> None:
+        """Feed the outcome of a paid request to `payment_stats` and
+        `balance_tracker`, if any.
+
+        Args:
+            payment_requirements: Requirements the request paid
+            succeeded: Whether the server accepted the payment
+            latency: Seconds from sending the payment to the response
+            receipt: The response's X-PAYMENT-RESPONSE header, if any
+        """
+        if receipt:
+            try:
+                succeeded = bool(
+                    decode_x_payment_response(receipt).get("success", succeeded)
+                )
+            except ValueError:
+                pass
+        if self.payment_stats is not None:
+            self.payment_stats.record_payment(
+                payment_requirements.network, latency, succeeded
+            )
+        if self.balance_tracker is not None:
+            self.balance_tracker.settle(
+                self.account.address, payment_requirements, succeeded
+            )
+            self._record_balance(payment_requirements)
+
+    def release_payment(self, payment_requirements: PaymentRequirements) -> None:
+        """Release the balance held for a payment that was never answered,
+        e.g. because sending it failed"""
+        if self.balance_tracker is not None:
+            self.balance_tracker.settle(
+                self.account.address, payment_requirements, succeeded=False
+            )
+            self._record_balance(payment_requirements)
+
+    def _record_balance(self, payment_requirements: PaymentRequirements) -> None:
+        # Let the selector rank entries the wallet cannot afford last
+        if self.payment_stats is None or self.balance_tracker is None:
+            return
+        balance = self.balance_tracker.known(self.account.address, payment_requirements)
+        if balance is not None:
+            self.payment_stats.record_balance(
+                payment_requirements.network, payment_requirements.asset, balance
+            )
+
+    def next_nonce(self) -> bytes:
+        """The 32 byte nonce for the next payment"""
+        if self.nonce_source is not None:
+            return self.nonce_source.next()
+        return random_nonce()
+
     def generate_nonce(self):
         # Generate a random nonce (32 bytes = 64 hex chars)
-        nonce = secrets.token_hex(32)
-        return nonce
+        return self.next_nonce().hex()
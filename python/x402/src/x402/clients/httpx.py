@@ -1,14 +1,20 @@
-from typing import Optional, Dict, List
+import asyncio
+import time
+from typing import TYPE_CHECKING, Optional, Dict, List
 from httpx import Request, Response, AsyncClient
-from eth_account import Account
 from x402.clients.base import (
     x402Client,
     MissingRequestConfigError,
     PaymentError,
     PaymentSelectorCallable,
 )
+from x402.sessions import SESSION_HEADER, SESSION_REMAINING_HEADER
 from x402.types import x402PaymentRequiredResponse
 
+if TYPE_CHECKING:
+    from eth_account import Account
+    from x402.clients.balances import BalanceTracker
+
 
 class HttpxHooks:
     def __init__(self, client: x402Client):
@@ -17,13 +23,37 @@ class HttpxHooks:
 
     async def on_request(self, request: Request):
         """Handle request before it is sent."""
-        pass
+        # Pay with a prepaid session if the server gave us one for this URL
+        token = self.client.sessions.get(str(request.url))
+        if token is not None and SESSION_HEADER not in request.headers:
+            request.headers[SESSION_HEADER] = token
+        # Or with an upto authorization it accepted before
+        authorization = self.client.authorizations.get(str(request.url))
+        if (
+            token is None
+            and authorization is not None
+            and "X-Payment" not in request.headers
+        ):
+            request.headers["X-Payment"] = authorization
+
+    def _update_session(self, request: Request, response: Response) -> None:
+        url = str(request.url)
+        token = response.headers.get(SESSION_HEADER)
+        if token:
+            self.client.sessions.add(url, token)
+        elif response.headers.get(SESSION_REMAINING_HEADER) == "0":
+            self.client.sessions.discard(url, request.headers.get(SESSION_HEADER, ""))
 
     async def on_response(self, response: Response) -> Response:
         """Handle response after it is received."""
 
         # If this is not a 402, just return the response
         if response.status_code != 402:
+            if (
+                SESSION_HEADER in response.headers
+                or SESSION_REMAINING_HEADER in response.headers
+            ):
+                self._update_session(response.request, response)
             return response
 
         # If this is a retry response, just return it
@@ -47,25 +77,63 @@ class HttpxHooks:
             )
 
             # Create payment header
-            payment_header = self.client.create_payment_header(
-                selected_requirements, payment_response.x402_version
-            )
+            if self.client.balance_tracker is not None:
+                # Checking the balance may be a blocking RPC call
+                payment_header = await asyncio.to_thread(
+                    self.client.create_payment_header,
+                    selected_requirements,
+                    payment_response.x402_version,
+                )
+            else:
+                payment_header = self.client.create_payment_header(
+                    selected_requirements, payment_response.x402_version
+                )
 
             # Mark as retry and add payment header
             self._is_retry = True
             request = response.request
 
+            # The session we sent, if any, is used up or expired
+            if SESSION_HEADER in request.headers:
+                self.client.sessions.discard(
+                    str(request.url), request.headers[SESSION_HEADER]
+                )
+                del request.headers[SESSION_HEADER]
+            # So is the reused authorization we sent, if any
+            if "X-Payment" in request.headers:
+                self.client.authorizations.discard(
+                    str(request.url), request.headers["X-Payment"]
+                )
+
             request.headers["X-Payment"] = payment_header
             request.headers["Access-Control-Expose-Headers"] = "X-Payment-Response"
 
             # Retry the request
             async with AsyncClient() as client:
-                retry_response = await client.send(request)
+                started = time.monotonic()
+                try:
+                    retry_response = await client.send(request)
+                except BaseException:
+                    self.client.release_payment(selected_requirements)
+                    raise
+                self.client.record_payment(
+                    selected_requirements,
+                    retry_response.status_code < 400,
+                    time.monotonic() - started,
+                    retry_response.headers.get("X-Payment-Response"),
+                )
 
                 # Copy the retry response data to the original response
                 response.status_code = retry_response.status_code
                 response.headers = retry_response.headers
                 response._content = retry_response._content
+                if response.status_code < 400:
+                    self._update_session(request, retry_response)
+                    self.client.keep_authorization(
+                        str(request.url), selected_requirements, payment_header
+                    )
+                # Later 402s need paying again
+                self._is_retry = False
                 return response
 
         except PaymentError as e:
@@ -77,9 +145,11 @@ class HttpxHooks:
 
 
 def x402_payment_hooks(
-    account: Account,
+    account: "Account",
     max_value: Optional[int] = None,
     payment_requirements_selector: Optional[PaymentSelectorCallable] = None,
+    balance_tracker: Optional["BalanceTracker"] = None,
+    upto_ceiling: Optional[int] = None,
 ) -> Dict[str, List]:
     """Create httpx event hooks dictionary for handling 402 Payment Required responses.
 
@@ -89,6 +159,10 @@ def x402_payment_hooks(
         payment_requirements_selector: Optional custom selector for payment requirements.
             Should be a callable that takes (accepts, network_filter, scheme_filter, max_value)
             and returns a PaymentRequirements object.
+        balance_tracker: Optional wallet balance cache from x402.clients.balances, so
+            payments the wallet cannot afford fail before signing
+        upto_ceiling: Optional amount `upto` authorizations are signed for, so one
+            authorization pays for several requests. Defaults to the requested amount
 
     Returns:
         Dictionary of event hooks that can be directly assigned to client.event_hooks
@@ -98,6 +172,8 @@ def x402_payment_hooks(
         account,
         max_value=max_value,
         payment_requirements_selector=payment_requirements_selector,
+        balance_tracker=balance_tracker,
+        upto_ceiling=upto_ceiling,
     )
 
     # Create hooks
@@ -115,9 +191,11 @@ class x402HttpxClient(AsyncClient):
 
     def __init__(
         self,
-        account: Account,
+        account: "Account",
         max_value: Optional[int] = None,
         payment_requirements_selector: Optional[PaymentSelectorCallable] = None,
+        balance_tracker: Optional["BalanceTracker"] = None,
+        upto_ceiling: Optional[int] = None,
         **kwargs,
     ):
         """Initialize an AsyncClient with x402 payment handling.
@@ -128,9 +206,17 @@ class x402HttpxClient(AsyncClient):
             payment_requirements_selector: Optional custom selector for payment requirements.
                 Should be a callable that takes (accepts, network_filter, scheme_filter, max_value)
                 and returns a PaymentRequirements object.
+            balance_tracker: Optional wallet balance cache from x402.clients.balances, so
+                payments the wallet cannot afford fail before signing
+            upto_ceiling: Optional amount `upto` authorizations are signed for, so one
+                authorization pays for several requests. Defaults to the requested amount
             **kwargs: Additional arguments to pass to AsyncClient
         """
         super().__init__(**kwargs)
         self.event_hooks = x402_payment_hooks(
-            account, max_value, payment_requirements_selector
+            account,
+            max_value,
+            payment_requirements_selector,
+            balance_tracker,
+            upto_ceiling,
         )
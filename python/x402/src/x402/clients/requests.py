@@ -1,15 +1,20 @@
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 import requests
 import json
 from requests.adapters import HTTPAdapter
-from eth_account import Account
 from x402.clients.base import (
     x402Client,
     PaymentError,
     PaymentSelectorCallable,
 )
+from x402.sessions import SESSION_HEADER, SESSION_REMAINING_HEADER
 from x402.types import x402PaymentRequiredResponse
 import copy
+import time
+
+if TYPE_CHECKING:
+    from eth_account import Account
+    from x402.clients.balances import BalanceTracker
 
 
 class x402HTTPAdapter(HTTPAdapter):
@@ -40,9 +45,23 @@ class x402HTTPAdapter(HTTPAdapter):
             self._is_retry = False
             return super().send(request, **kwargs)
 
+        # Pay with a prepaid session if the server gave us one for this URL
+        token = self.client.sessions.get(request.url)
+        if token is not None and SESSION_HEADER not in request.headers:
+            request.headers[SESSION_HEADER] = token
+        # Or with an upto authorization it accepted before
+        authorization = self.client.authorizations.get(request.url)
+        if (
+            token is None
+            and authorization is not None
+            and "X-Payment" not in request.headers
+        ):
+            request.headers["X-Payment"] = authorization
+
         response = super().send(request, **kwargs)
 
         if response.status_code != 402:
+            self._update_session(request, response)
             return response
 
         try:
@@ -65,10 +84,38 @@ class x402HTTPAdapter(HTTPAdapter):
 
             # Mark as retry and add payment header
             self._is_retry = True
+            # The session we sent, if any, is used up or expired
+            if SESSION_HEADER in request.headers:
+                self.client.sessions.discard(
+                    request.url, request.headers[SESSION_HEADER]
+                )
+                del request.headers[SESSION_HEADER]
+            # So is the reused authorization we sent, if any
+            if "X-Payment" in request.headers:
+                self.client.authorizations.discard(
+                    request.url, request.headers["X-Payment"]
+                )
+
             request.headers["X-Payment"] = payment_header
             request.headers["Access-Control-Expose-Headers"] = "X-Payment-Response"
 
-            retry_response = super().send(request, **kwargs)
+            started = time.monotonic()
+            try:
+                retry_response = super().send(request, **kwargs)
+            except BaseException:
+                self.client.release_payment(selected_requirements)
+                raise
+            self.client.record_payment(
+                selected_requirements,
+                retry_response.status_code < 400,
+                time.monotonic() - started,
+                retry_response.headers.get("X-Payment-Response"),
+            )
+            if retry_response.status_code < 400:
+                self._update_session(request, retry_response)
+                self.client.keep_authorization(
+                    request.url, selected_requirements, payment_header
+                )
 
             # Copy the retry response data to the original response
             response.status_code = retry_response.status_code
@@ -83,11 +130,22 @@ class x402HTTPAdapter(HTTPAdapter):
             self._is_retry = False
             raise PaymentError(f"Failed to handle payment: {str(e)}") from e
 
+    def _update_session(self, request, response) -> None:
+        token = response.headers.get(SESSION_HEADER)
+        if token:
+            self.client.sessions.add(request.url, token)
+        elif response.headers.get(SESSION_REMAINING_HEADER) == "0":
+            self.client.sessions.discard(
+                request.url, request.headers.get(SESSION_HEADER, "")
+            )
+
 
 def x402_http_adapter(
-    account: Account,
+    account: "Account",
     max_value: Optional[int] = None,
     payment_requirements_selector: Optional[PaymentSelectorCallable] = None,
+    balance_tracker: Optional["BalanceTracker"] = None,
+    upto_ceiling: Optional[int] = None,
     **kwargs,
 ) -> x402HTTPAdapter:
     """Create an HTTP adapter that handles 402 Payment Required responses.
@@ -98,6 +156,10 @@ def x402_http_adapter(
         payment_requirements_selector: Optional custom selector for payment requirements.
             Should be a callable that takes (accepts, network_filter, scheme_filter, max_value)
             and returns a PaymentRequirements object.
+        balance_tracker: Optional wallet balance cache from x402.clients.balances, so
+            payments the wallet cannot afford fail before signing
+        upto_ceiling: Optional amount `upto` authorizations are signed for, so one
+            authorization pays for several requests. Defaults to the requested amount
         **kwargs: Additional arguments to pass to HTTPAdapter
 
     Returns:
@@ -107,14 +169,18 @@ def x402_http_adapter(
         account,
         max_value=max_value,
         payment_requirements_selector=payment_requirements_selector,
+        balance_tracker=balance_tracker,
+        upto_ceiling=upto_ceiling,
     )
     return x402HTTPAdapter(client, **kwargs)
 
 
 def x402_requests(
-    account: Account,
+    account: "Account",
     max_value: Optional[int] = None,
     payment_requirements_selector: Optional[PaymentSelectorCallable] = None,
+    balance_tracker: Optional["BalanceTracker"] = None,
+    upto_ceiling: Optional[int] = None,
     **kwargs,
 ) -> requests.Session:
     """Create a requests session with x402 payment handling.
@@ -125,6 +191,10 @@ def x402_requests(
         payment_requirements_selector: Optional custom selector for payment requirements.
             Should be a callable that takes (accepts, network_filter, scheme_filter, max_value)
             and returns a PaymentRequirements object.
+        balance_tracker: Optional wallet balance cache from x402.clients.balances, so
+            payments the wallet cannot afford fail before signing
+        upto_ceiling: Optional amount `upto` authorizations are signed for, so one
+            authorization pays for several requests. Defaults to the requested amount
         **kwargs: Additional arguments to pass to HTTPAdapter
 
     Returns:
@@ -135,6 +205,8 @@ def x402_requests(
         account,
         max_value=max_value,
         payment_requirements_selector=payment_requirements_selector,
+        balance_tracker=balance_tracker,
+        upto_ceiling=upto_ceiling,
         **kwargs,
     )
 
@@ -0,0 +1,261 @@
+"""Cost-aware selection of payment requirements.
+
+`x402Client` pays the first supported entry of a 402's `accepts` by default.
+`CostAwareSelector` instead picks the one with the lowest expected cost:
+
+    cost = amount + network_costs[network] + latency_cost * latency
+           + failure_cost * failure_rate
+
+`amount` is counted in whole tokens, using the token registry's decimals, so
+USDC on different chains compares directly. `network_costs` are fixed
+overheads per network in the same unit, such as gas or fees the payer bears.
+They are configured rather than learned, as X-PAYMENT-RESPONSE receipts do
+not report fees. `latency` (from sending the payment to its response, which
+includes settlement) and `failure_rate` are learned from the paid requests
+the client makes and the receipts they return, kept in a `PaymentStats`
+store. Entries the wallet is known not to afford are only chosen when nothing
+else is left. A client with a `BalanceTracker` records the balances it knows
+there:
+
+    selector = CostAwareSelector({"network_costs": {"base": 0.001}, "latency_cost": 0.01})
+    client = x402HttpxClient(account, payment_requirements_selector=selector)
+
+Decisions are cached per resource, so paying the same endpoint again does not
+score its `accepts` again. A decision is dropped after `decision_ttl` seconds,
+when the server changes the chosen entry, when the wallet can no longer afford
+it, or when a payment fails; new latency samples and balances take effect as
+decisions expire.
+"""
+
+import threading
+import time
+from typing import Callable, Hashable, List, Optional
+
+from typing_extensions import TypedDict
+
+from x402.chains import get_token_registry
+from x402.clients.base import PaymentAmountExceededError
+from x402.schemes import get_scheme
+from x402.types import PaymentRequirements, UnsupportedSchemeException
+
+# Weight of each new sample in the moving averages
+STATS_SMOOTHING = 0.2
+
+# Maximum number of (resource, filters) decisions kept
+DECISION_CACHE_SIZE = 1024
+
+# Decimals assumed for tokens missing from the token registry
+DEFAULT_DECIMALS = 6
+
+
+class SelectionConfig(TypedDict, total=False):
+    """Configuration of a CostAwareSelector.
+
+    Attributes:
+        network_costs: Fixed cost of paying on each network, in whole tokens
+        latency_cost: Cost per second of expected settlement latency
+        failure_cost: Cost of a payment that fails, weighted by the network's
+            failure rate
+        decision_ttl: Seconds a decision is reused for a resource. Defaults
+            to 60.
+    """
+
+    network_costs: dict[str, float]
+    latency_cost: float
+    failure_cost: float
+    decision_ttl: float
+
+
+class _NetworkStats:
+    __slots__ = ("latency", "failure_rate")
+
+    def __init__(self, latency: float, failure_rate: float):
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+
+class PaymentStats:
+    """In-memory statistics of past payments per network, and known wallet
+    balances per (network, asset).
+
+    Thread-safe. `version` changes whenever a payment fails, so cached
+    decisions can tell when to score entries again.
+    """
+
+    def __init__(self, smoothing: float = STATS_SMOOTHING):
+        self.smoothing = smoothing
+        self.version = 0
+        self._networks: dict[str, _NetworkStats] = {}
+        self._balances: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def record_payment(self, network: str, latency: float, succeeded: bool) -> None:
+        """Record a paid request: seconds until its response, and whether the
+        payment went through"""
+        failed = 0.0 if succeeded else 1.0
+        with self._lock:
+            stats = self._networks.get(network)
+            if stats is None:
+                self._networks[network] = _NetworkStats(latency, failed)
+            else:
+                stats.latency += self.smoothing * (latency - stats.latency)
+                stats.failure_rate += self.smoothing * (failed - stats.failure_rate)
+            if not succeeded:
+                self.version += 1
+
+    def record_balance(self, network: str, asset: str, balance: int) -> None:
+        """Record the wallet's balance of `asset`, in atomic units"""
+        with self._lock:
+            self._balances[(network, asset.lower())] = balance
+
+    def latency(self, network: str) -> Optional[float]:
+        """Average seconds from payment to response on `network`, if known"""
+        stats = self._networks.get(network)
+        return stats.latency if stats is not None else None
+
+    def failure_rate(self, network: str) -> float:
+        """Recent fraction of failed payments on `network`"""
+        stats = self._networks.get(network)
+        return stats.failure_rate if stats is not None else 0.0
+
+    def balance(self, network: str, asset: str) -> Optional[int]:
+        """Known balance of `asset` in atomic units, if any"""
+        return self._balances.get((network, asset.lower()))
+
+
+def _fingerprint(requirements: PaymentRequirements) -> tuple:
+    return (
+        requirements.scheme,
+        requirements.network,
+        requirements.asset,
+        requirements.max_amount_required,
+    )
+
+
+class CostAwareSelector:
+    """Payment requirements selector choosing the cheapest entry by expected
+    cost, for `x402Client(payment_requirements_selector=...)`.
+
+    The client feeds the outcome of its payments to `stats`.
+    """
+
+    def __init__(
+        self,
+        config: Optional[SelectionConfig] = None,
+        stats: Optional[PaymentStats] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        config = config or {}
+        self.network_costs = dict(config.get("network_costs", {}))
+        self.latency_cost = config.get("latency_cost", 0.0)
+        self.failure_cost = config.get("failure_cost", 0.0)
+        self.decision_ttl = config.get("decision_ttl", 60.0)
+        self.stats = stats if stats is not None else PaymentStats()
+        self.clock = clock
+        self._decimals: dict[tuple[str, str], int] = {}
+        # (resource, filters) -> (index, fingerprint, len(accepts), version, expires_at)
+        self._decisions: dict[Hashable, tuple[int, tuple, int, int, float]] = {}
+        self._lock = threading.Lock()
+
+    def _token_decimals(self, network: str, asset: str) -> int:
+        key = (network, asset)
+        decimals = self._decimals.get(key)
+        if decimals is None:
+            registry = get_token_registry()
+            try:
+                token = registry.find(registry.chain_id(network), asset)
+            except ValueError:
+                token = None
+            decimals = token.decimals if token is not None else DEFAULT_DECIMALS
+            self._decimals[key] = decimals
+        return decimals
+
+    def cost(self, requirements: PaymentRequirements) -> float:
+        """Expected cost of paying `requirements`, in whole tokens"""
+        network = requirements.network
+        amount = int(requirements.max_amount_required)
+        cost = amount / 10 ** self._token_decimals(network, requirements.asset)
+        cost += self.network_costs.get(network, 0.0)
+        latency = self.stats.latency(network)
+        if latency is not None:
+            cost += self.latency_cost * latency
+        return cost + self.failure_cost * self.stats.failure_rate(network)
+
+    def _affordable(self, requirements: PaymentRequirements) -> bool:
+        balance = self.stats.balance(requirements.network, requirements.asset)
+        return balance is None or balance >= int(requirements.max_amount_required)
+
+    def __call__(
+        self,
+        accepts: List[PaymentRequirements],
+        network_filter: Optional[str] = None,
+        scheme_filter: Optional[str] = None,
+        max_value: Optional[int] = None,
+    ) -> PaymentRequirements:
+        """Select payment requirements, like
+        `x402Client.default_payment_requirements_selector`
+
+        Raises:
+            UnsupportedSchemeException: If no supported scheme is found
+            PaymentAmountExceededError: If every candidate exceeds max_value
+        """
+        if not accepts:
+            raise UnsupportedSchemeException("No supported payment scheme found")
+        key = (accepts[0].resource, network_filter, scheme_filter, max_value)
+        now = self.clock()
+        with self._lock:
+            decision = self._decisions.get(key)
+        if decision is not None:
+            index, fingerprint, count, version, expires_at = decision
+            if (
+                expires_at > now
+                and version == self.stats.version
+                and count == len(accepts)
+                and index < count
+                and _fingerprint(accepts[index]) == fingerprint
+                and self._affordable(accepts[index])
+            ):
+                return accepts[index]
+
+        version = self.stats.version
+        best: Optional[tuple[bool, float, int]] = None
+        exceeded = None
+        for index, requirements in enumerate(accepts):
+            if scheme_filter and requirements.scheme != scheme_filter:
+                continue
+            if network_filter and requirements.network != network_filter:
+                continue
+            if get_scheme(requirements.scheme) is None:
+                continue
+            amount = int(requirements.max_amount_required)
+            if max_value is not None and amount > max_value:
+                exceeded = amount
+                continue
+            # Unaffordable entries rank after every affordable one
+            candidate = (
+                not self._affordable(requirements),
+                self.cost(requirements),
+                index,
+            )
+            if best is None or candidate < best:
+                best = candidate
+
+        if best is None:
+            if exceeded is not None:
+                raise PaymentAmountExceededError(
+                    f"Payment amount {exceeded} exceeds maximum allowed value {max_value}"
+                )
+            raise UnsupportedSchemeException("No supported payment scheme found")
+
+        index = best[2]
+        with self._lock:
+            if len(self._decisions) >= DECISION_CACHE_SIZE:
+                self._decisions.pop(next(iter(self._decisions)), None)
+            self._decisions[key] = (
+                index,
+                _fingerprint(accepts[index]),
+                len(accepts),
+                version,
+                now + self.decision_ttl,
+            )
+        return accepts[index]
@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+from x402.path import path_is_match
+from x402.sessions import read_session_token
+
+
+class SessionTokens:
+    """Session tokens received from servers, sent back on matching requests.
+
+    Tokens are kept per origin and matched against request paths with the
+    path patterns embedded in them, so one client can hold sessions for
+    several routes.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._tokens: dict[tuple[str, str], dict[str, tuple[object, int]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _split(url: str) -> tuple[tuple[str, str], str]:
+        parts = urlsplit(url)
+        return (parts.scheme, parts.netloc), parts.path or "/"
+
+    def get(self, url: str) -> Optional[str]:
+        """The session token to send with a request to `url`, if any"""
+        origin, path = self._split(url)
+        now = self.clock()
+        with self._lock:
+            tokens = self._tokens.get(origin, {})
+            for token, (paths, expires_at) in list(tokens.items()):
+                if expires_at <= now:
+                    del tokens[token]
+                elif path_is_match(paths, path):  # type: ignore[arg-type]
+                    return token
+        return None
+
+    def add(self, url: str, token: str) -> None:
+        """Keep a token received in a response from `url`"""
+        payload = read_session_token(token)
+        if payload is None or not isinstance(payload.get("exp"), int):
+            return
+        paths = payload.get("paths") or self._split(url)[1]
+        origin = self._split(url)[0]
+        with self._lock:
+            tokens = self._tokens.setdefault(origin, {})
+            # A new session for a route replaces the used up one
+            for existing, (existing_paths, _) in list(tokens.items()):
+                if existing_paths == paths:
+                    del tokens[existing]
+            tokens[token] = (paths, payload["exp"])
+
+    def discard(self, url: str, token: str) -> None:
+        """Forget a token the server no longer accepts"""
+        origin = self._split(url)[0]
+        with self._lock:
+            self._tokens.get(origin, {}).pop(token, None)
+
+
+class ReusableAuthorizations:
+    """Payment headers of reusable schemes such as `upto`, kept per resource.
+
+    A header is sent again with later requests to the same URL path until it
+    expires or the server answers it with a 402.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._headers: dict[tuple[str, str, str], tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url: str) -> tuple[str, str, str]:
+        parts = urlsplit(url)
+        return parts.scheme, parts.netloc, parts.path or "/"
+
+    def get(self, url: str) -> Optional[str]:
+        """The payment header to send with a request to `url`, if any"""
+        key = self._key(url)
+        with self._lock:
+            entry = self._headers.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= self.clock():
+                del self._headers[key]
+                return None
+            return entry[0]
+
+    def add(self, url: str, header: str, expires_at: float) -> None:
+        """Keep a payment header accepted by `url`"""
+        with self._lock:
+            self._headers[self._key(url)] = (header, expires_at)
+
+    def discard(self, url: str, header: str) -> None:
+        """Forget a payment header the server no longer accepts"""
+        key = self._key(url)
+        with self._lock:
+            if self._headers.get(key, ("", 0.0))[0] == header:
+                del self._headers[key]
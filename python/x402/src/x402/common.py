@@ -1,14 +1,22 @@
-from decimal import Decimal
 from typing import List, Optional
 
+from pydantic_core import to_json
+
 from x402.chains import (
     get_chain_id,
     get_token_decimals,
-    get_token_name,
-    get_token_version,
     get_default_token_address,
 )
-from x402.types import Price, TokenAmount, PaymentRequirements, PaymentPayload
+from x402.encoding import base64_encode_bytes
+from x402.pricing import compile_price, to_atomic_units
+from x402.schemes import RequirementsIndex
+from x402.types import (
+    Price,
+    TokenAmount,
+    PaymentRequirements,
+    PaymentPayload,
+    SettleResponse,
+)
 
 
 def parse_money(amount: str | int, address: str, network: str) -> int:
@@ -18,14 +26,9 @@ def parse_money(amount: str | int, address: str, network: str) -> int:
         amount: str | int - if int, should be the full amount including token specific decimals
     """
     if isinstance(amount, str):
-        if amount.startswith("$"):
-            amount = amount[1:]
-        decimal_amount = Decimal(amount)
-
         chain_id = get_chain_id(network)
         decimals = get_token_decimals(chain_id, address)
-        decimal_amount = decimal_amount * Decimal(10**decimals)
-        return int(decimal_amount)
+        return to_atomic_units(amount, decimals)
     return amount
 
 
@@ -34,6 +37,8 @@ def process_price_to_atomic_amount(
 ) -> tuple[str, str, dict[str, str]]:
     """Process a Price into atomic amount, asset address, and EIP-712 domain info
 
+    Results are memoized, see `x402.pricing.compile_price`.
+
     Args:
         price: Either Money (USD string/int) or TokenAmount
         network: Network identifier
@@ -44,46 +49,14 @@ def process_price_to_atomic_amount(
     Raises:
         ValueError: If price format is invalid
     """
-    if isinstance(price, (str, int)):
-        # Money type - convert USD to USDC atomic units
-        try:
-            if isinstance(price, str) and price.startswith("$"):
-                price = price[1:]
-            amount = Decimal(str(price))
-
-            # Get USDC address for the network
-            chain_id = get_chain_id(network)
-            asset_address = get_usdc_address(chain_id)
-            decimals = get_token_decimals(chain_id, asset_address)
-
-            # Convert to atomic units
-            atomic_amount = int(amount * Decimal(10**decimals))
-
-            # Get EIP-712 domain info
-            eip712_domain = {
-                "name": get_token_name(chain_id, asset_address),
-                "version": get_token_version(chain_id, asset_address),
-            }
-
-            return str(atomic_amount), asset_address, eip712_domain
-
-        except (ValueError, KeyError) as e:
-            raise ValueError(f"Invalid price format: {price}. Error: {e}")
-
-    elif isinstance(price, TokenAmount):
-        # TokenAmount type - already in atomic units with asset info
-        return (
-            price.amount,
-            price.asset.address,
-            {
-                "name": price.asset.eip712.name,
-                "version": price.asset.eip712.version,
-            },
-        )
-
-    else:
+    if not isinstance(price, (str, int, float, TokenAmount)):
         raise ValueError(f"Invalid price type: {type(price)}")
 
+    try:
+        return compile_price(price, network).as_tuple()
+    except ValueError as e:
+        raise ValueError(f"Invalid price format: {price}. Error: {e}")
+
 
 def get_usdc_address(chain_id: int | str) -> str:
     """Get the USDC contract address for a given chain ID"""
@@ -98,6 +71,10 @@ def find_matching_payment_requirements(
     """
     Finds the matching payment requirements for the given payment.
 
+    Matches on scheme, network and, when the scheme's payload names it, asset.
+    To match many payments against the same requirements, build a
+    `x402.schemes.RequirementsIndex` once instead.
+
     Args:
         payment_requirements: The payment requirements to search through
         payment: The payment to match against
@@ -105,10 +82,13 @@ def find_matching_payment_requirements(
     Returns:
         The matching payment requirements or None if no match is found
     """
-    for req in payment_requirements:
-        if req.scheme == payment.scheme and req.network == payment.network:
-            return req
-    return None
+    return RequirementsIndex(payment_requirements).match(payment)
+
+
+def settlement_header(settle_response: SettleResponse) -> str:
+    """Encode a settle response for the X-PAYMENT-RESPONSE header or trailer."""
+    # pydantic_core serializes straight to bytes, skipping a str round trip
+    return base64_encode_bytes(to_json(settle_response, by_alias=True)).decode("ascii")
 
 
 x402_VERSION = 1
@@ -0,0 +1,177 @@
+"""Bounded decoding of X-PAYMENT headers.
+
+Payment headers come from untrusted clients, so `PaymentHeaderDecoder`
+checks the cheap properties first and fails fast:
+
+1. The header length, before anything is allocated
+2. A digest of headers rejected before, so a replayed bad header is not
+   decoded and parsed again
+3. Base64 decoding, bounded by the length check
+4. The nesting depth of the JSON, in a single pass over its structural
+   characters that stops at the first violation
+5. JSON parsing and payload validation
+
+Rejections are counted with instrumentation as `x402.decode.rejected` and
+`x402.decode.rejected_bytes`, by reason.
+"""
+
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Literal
+
+from x402 import instrumentation
+from x402.encoding import base64_decode_bytes
+from x402.types import PaymentPayload
+
+# A signed exact payment header is about 800 bytes
+DEFAULT_MAX_HEADER_SIZE = 8 * 1024
+# Exact payloads nest 3 levels deep (payment, payload, authorization)
+DEFAULT_MAX_DEPTH = 8
+REJECTED_CACHE_SIZE = 4096
+
+RejectionReason = Literal[
+    "too_large", "too_deep", "invalid_base64", "invalid_json", "invalid_payload"
+]
+
+_STRUCTURAL_RE = re.compile(rb'[\[\]{}"\\]')
+_OPEN = frozenset(b"[{")
+_CLOSE = frozenset(b"]}")
+_QUOTE = ord('"')
+_BACKSLASH = ord("\\")
+
+
+class PaymentHeaderError(ValueError):
+    """The X-PAYMENT header was rejected before or while decoding it."""
+
+    def __init__(self, reason: RejectionReason, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def json_depth_exceeds(data: bytes, max_depth: int) -> bool:
+    """Whether JSON nests arrays and objects deeper than `max_depth`.
+
+    Only looks at brackets outside of strings, so it runs in a single pass
+    without parsing and returns at the first bracket over the limit. The
+    data does not need to be valid JSON.
+    """
+    depth = 0
+    in_string = False
+    escaped = -1
+    for match in _STRUCTURAL_RE.finditer(data):
+        position = match.start()
+        if position == escaped:
+            continue
+        char = data[position]
+        if in_string:
+            if char == _BACKSLASH:
+                escaped = position + 1
+            elif char == _QUOTE:
+                in_string = False
+        elif char == _QUOTE:
+            in_string = True
+        elif char in _OPEN:
+            depth += 1
+            if depth > max_depth:
+                return True
+        elif char in _CLOSE:
+            depth -= 1
+    return False
+
+
+class PaymentHeaderDecoder:
+    """Decodes X-PAYMENT headers within size and depth limits.
+
+    Thread-safe.
+
+    Args:
+        max_size: Maximum length of the base64 encoded header
+        max_depth: Maximum nesting depth of the decoded JSON
+        rejected_cache_size: Number of rejected header digests to remember
+    """
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_MAX_HEADER_SIZE,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        rejected_cache_size: int = REJECTED_CACHE_SIZE,
+    ):
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+        if max_depth <= 0:
+            raise ValueError("max_depth must be positive")
+        self.max_size = max_size
+        self.max_depth = max_depth
+        self.rejected_cache_size = rejected_cache_size
+        self._rejected: OrderedDict[bytes, tuple[RejectionReason, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def decode(self, header: str) -> PaymentPayload:
+        """Decode and validate a payment header.
+
+        Raises:
+            PaymentHeaderError: If the header is rejected
+        """
+        if len(header) > self.max_size:
+            error = PaymentHeaderError(
+                "too_large",
+                f"Payment header is {len(header)} bytes, the maximum is {self.max_size}",
+            )
+            self._count(error, len(header), cached=False)
+            raise error
+
+        digest = hashlib.blake2b(
+            header.encode("utf-8", "surrogatepass"), digest_size=16
+        ).digest()
+        with self._lock:
+            rejection = self._rejected.get(digest)
+            if rejection is not None:
+                self._rejected.move_to_end(digest)
+        if rejection is not None:
+            error = PaymentHeaderError(*rejection)
+            self._count(error, len(header), cached=True)
+            raise error
+
+        try:
+            return self._decode(header)
+        except PaymentHeaderError as e:
+            with self._lock:
+                self._rejected[digest] = (e.reason, str(e))
+                if len(self._rejected) > self.rejected_cache_size:
+                    self._rejected.popitem(last=False)
+            self._count(e, len(header), cached=False)
+            raise
+
+    def _decode(self, header: str) -> PaymentPayload:
+        try:
+            data = base64_decode_bytes(header)
+        except ValueError as e:
+            raise PaymentHeaderError("invalid_base64", f"Invalid base64: {e}") from e
+
+        if json_depth_exceeds(data, self.max_depth):
+            raise PaymentHeaderError(
+                "too_deep", f"Payment header nests deeper than {self.max_depth} levels"
+            )
+
+        try:
+            payment_dict = json.loads(data)
+        except ValueError as e:
+            raise PaymentHeaderError("invalid_json", f"Invalid JSON: {e}") from e
+
+        if not isinstance(payment_dict, dict):
+            raise PaymentHeaderError("invalid_payload", "Payment must be a JSON object")
+        try:
+            return PaymentPayload(**payment_dict)
+        except (ValueError, TypeError) as e:
+            raise PaymentHeaderError("invalid_payload", str(e)) from e
+
+    def _count(self, error: PaymentHeaderError, size: int, cached: bool) -> None:
+        instrumentation.count(
+            "x402.decode.rejected", reason=error.reason, cached=cached
+        )
+        instrumentation.count(
+            "x402.decode.rejected_bytes", size, reason=error.reason, cached=cached
+        )
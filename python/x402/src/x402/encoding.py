@@ -1,5 +1,65 @@
-import base64
-from typing import Union
+import binascii
+from typing import Optional, Union
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+_TO_URLSAFE = bytes.maketrans(b"+/", b"-_")
+_FROM_URLSAFE = bytes.maketrans(b"-_", b"+/")
+
+
+def base64_encode_bytes(
+    data: BytesLike, urlsafe: bool = False, padding: bool = True
+) -> bytes:
+    """Encode bytes to base64 without going through str.
+
+    Args:
+        data: Bytes-like object to encode, memoryviews are read in place
+        urlsafe: Use the URL-safe alphabet (`-` and `_` instead of `+` and `/`)
+        padding: Keep the trailing `=` padding
+
+    Returns:
+        Base64 encoded bytes
+    """
+    encoded = binascii.b2a_base64(data, newline=False)
+    if urlsafe:
+        encoded = encoded.translate(_TO_URLSAFE)
+    if not padding:
+        encoded = encoded.rstrip(b"=")
+    return encoded
+
+
+def base64_decode_bytes(
+    data: Union[str, BytesLike],
+    urlsafe: bool = False,
+    max_length: Optional[int] = None,
+) -> bytes:
+    """Decode base64 to bytes without going through str.
+
+    The length is checked before decoding, so oversized input is rejected
+    without allocating.
+
+    Args:
+        data: Base64 encoded ASCII str or bytes-like object
+        urlsafe: Decode the URL-safe alphabet, padding is optional
+        max_length: Optional maximum length of the encoded data
+
+    Returns:
+        Decoded bytes, e.g. for `json.loads`
+
+    Raises:
+        ValueError: If the data is too long or not valid base64
+    """
+    if max_length is not None and len(data) > max_length:
+        raise ValueError(
+            f"Base64 data is {len(data)} bytes long, the maximum is {max_length}"
+        )
+    if urlsafe:
+        if isinstance(data, str):
+            data = data.encode("ascii")
+        data = bytes(data).translate(_FROM_URLSAFE)
+        data += b"=" * (-len(data) % 4)
+    # a2b_base64 reads ASCII str and bytes-like objects without copying
+    return binascii.a2b_base64(data)
 
 
 def safe_base64_encode(data: Union[str, bytes]) -> str:
@@ -13,7 +73,7 @@ def safe_base64_encode(data: Union[str, bytes]) -> str:
     """
     if isinstance(data, str):
         data = data.encode("utf-8")
-    return base64.b64encode(data).decode("utf-8")
+    return base64_encode_bytes(data).decode("ascii")
 
 
 def safe_base64_decode(data: str) -> str:
@@ -25,4 +85,4 @@ def safe_base64_decode(data: str) -> str:
     Returns:
         Decoded utf-8 string
     """
-    return base64.b64decode(data).decode("utf-8")
+    return base64_decode_bytes(data).decode("utf-8")
@@ -1,21 +1,26 @@
 import time
-import secrets
-from typing import Dict, Any
+from typing import TYPE_CHECKING, Dict, Any, Optional, Union
 from typing_extensions import (
     TypedDict,
 )  # use `typing_extensions.TypedDict` instead of `typing.TypedDict` on Python < 3.12
-from eth_account import Account
-from x402.encoding import safe_base64_encode, safe_base64_decode
+from x402.encoding import base64_decode_bytes, base64_encode_bytes
+from x402.schemes import VALID_BEFORE_MARGIN, Scheme
 from x402.types import (
+    ExactPaymentPayload,
+    PaymentPayload,
     PaymentRequirements,
 )
 from x402.chains import get_chain_id
+from x402.nonces import random_nonce
 import json
 
+if TYPE_CHECKING:
+    from eth_account import Account
+
 
 def create_nonce() -> bytes:
     """Create a random 32-byte nonce for authorization signatures."""
-    return secrets.token_bytes(32)
+    return random_nonce()
 
 
 def prepare_payment_header(
@@ -44,6 +49,37 @@ def prepare_payment_header(
     }
 
 
+def transfer_authorization_typed_data(
+    payment_requirements: PaymentRequirements, message: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Build the EIP-712 typed data for an EIP-3009 TransferWithAuthorization.
+
+    Args:
+        payment_requirements: Requirements providing the token's EIP-712 domain
+        message: Authorization with integer amounts/timestamps and a bytes nonce
+    """
+    return {
+        "types": {
+            "TransferWithAuthorization": [
+                {"name": "from", "type": "address"},
+                {"name": "to", "type": "address"},
+                {"name": "value", "type": "uint256"},
+                {"name": "validAfter", "type": "uint256"},
+                {"name": "validBefore", "type": "uint256"},
+                {"name": "nonce", "type": "bytes32"},
+            ]
+        },
+        "primaryType": "TransferWithAuthorization",
+        "domain": {
+            "name": payment_requirements.extra["name"],
+            "version": payment_requirements.extra["version"],
+            "chainId": int(get_chain_id(payment_requirements.network)),
+            "verifyingContract": payment_requirements.asset,
+        },
+        "message": message,
+    }
+
+
 class PaymentHeader(TypedDict):
     x402Version: int
     scheme: str
@@ -52,33 +88,25 @@ class PaymentHeader(TypedDict):
 
 
 def sign_payment_header(
-    account: Account, payment_requirements: PaymentRequirements, header: PaymentHeader
+    account: "Account", payment_requirements: PaymentRequirements, header: PaymentHeader
 ) -> str:
-    """Sign a payment header using the account's private key."""
+    """Sign a payment header using the account's private key.
+
+    The authorization's nonce may be bytes or a hex string.
+    """
     try:
         auth = header["payload"]["authorization"]
 
-        nonce_bytes = bytes.fromhex(auth["nonce"])
-
-        typed_data = {
-            "types": {
-                "TransferWithAuthorization": [
-                    {"name": "from", "type": "address"},
-                    {"name": "to", "type": "address"},
-                    {"name": "value", "type": "uint256"},
-                    {"name": "validAfter", "type": "uint256"},
-                    {"name": "validBefore", "type": "uint256"},
-                    {"name": "nonce", "type": "bytes32"},
-                ]
-            },
-            "primaryType": "TransferWithAuthorization",
-            "domain": {
-                "name": payment_requirements.extra["name"],
-                "version": payment_requirements.extra["version"],
-                "chainId": int(get_chain_id(payment_requirements.network)),
-                "verifyingContract": payment_requirements.asset,
-            },
-            "message": {
+        nonce = auth["nonce"]
+        nonce_bytes = (
+            nonce
+            if isinstance(nonce, bytes)
+            else bytes.fromhex(nonce.removeprefix("0x"))
+        )
+
+        typed_data = transfer_authorization_typed_data(
+            payment_requirements,
+            {
                 "from": auth["from"],
                 "to": auth["to"],
                 "value": int(auth["value"]),
@@ -86,7 +114,7 @@ def sign_payment_header(
                 "validBefore": int(auth["validBefore"]),
                 "nonce": nonce_bytes,
             },
-        }
+        )
 
         signed_message = account.sign_typed_data(
             domain_data=typed_data["domain"],
@@ -99,7 +127,7 @@ def sign_payment_header(
 
         header["payload"]["signature"] = signature
 
-        header["payload"]["authorization"]["nonce"] = f"0x{auth['nonce']}"
+        header["payload"]["authorization"]["nonce"] = "0x" + nonce_bytes.hex()
 
         encoded = encode_payment(header)
         return encoded
@@ -122,9 +150,148 @@ def encode_payment(payment_payload: Dict[str, Any]) -> str:
             f"Object of type {obj.__class__.__name__} is not JSON serializable"
         )
 
-    return safe_base64_encode(json.dumps(payment_payload, default=default))
+    return base64_encode_bytes(
+        json.dumps(payment_payload, default=default).encode("utf-8")
+    ).decode("ascii")
 
 
 def decode_payment(encoded_payment: str) -> Dict[str, Any]:
     """Decode a base64 encoded payment string back into a PaymentPayload object."""
-    return json.loads(safe_base64_decode(encoded_payment))
+    return json.loads(base64_decode_bytes(encoded_payment))
+
+
+def recover_signer(typed_data: Dict[str, Any], signature: str) -> str:
+    """Recover the address that signed EIP-712 typed data.
+
+    Raises:
+        Exception: If the signature is malformed
+    """
+    from eth_account import Account
+    from eth_account.messages import encode_typed_data
+
+    return Account.recover_message(
+        encode_typed_data(
+            domain_data=typed_data["domain"],
+            message_types=typed_data["types"],
+            message_data=typed_data["message"],
+        ),
+        signature=signature,
+    )
+
+
+class ExactScheme(Scheme):
+    """Pays `max_amount_required` with an EIP-3009 transferWithAuthorization."""
+
+    name = "exact"
+    payload_type = ExactPaymentPayload
+
+    def create_payment_header(
+        self,
+        account: "Account",
+        requirements: PaymentRequirements,
+        x402_version: int,
+        nonce: Optional[Union[bytes, str]] = None,
+        **kwargs: Any,
+    ) -> str:
+        """Sign an authorization of `max_amount_required`.
+
+        Args:
+            nonce: 32 byte nonce, as bytes or hex encoded. Random by default.
+        """
+        now = int(time.time())
+        header: PaymentHeader = {
+            "x402Version": x402_version,
+            "scheme": requirements.scheme,
+            "network": requirements.network,
+            "payload": {
+                "signature": None,
+                "authorization": {
+                    "from": account.address,
+                    "to": requirements.pay_to,
+                    "value": requirements.max_amount_required,
+                    "validAfter": str(now - 60),  # 60 seconds before
+                    "validBefore": str(now + requirements.max_timeout_seconds),
+                    "nonce": nonce or create_nonce(),
+                },
+            },
+        }
+        return sign_payment_header(account, requirements, header)
+
+    def _signed_by_payer(
+        self, payment: PaymentPayload, requirements: PaymentRequirements
+    ) -> bool:
+        """Whether the payer signed `payment` under the EIP-712 domain of the
+        requirements' token"""
+        authorization = payment.payload.authorization  # type: ignore[attr-defined]
+        try:
+            typed_data = transfer_authorization_typed_data(
+                requirements,
+                {
+                    "from": authorization.from_,
+                    "to": authorization.to,
+                    "value": int(authorization.value),
+                    "validAfter": int(authorization.valid_after),
+                    "validBefore": int(authorization.valid_before),
+                    "nonce": bytes.fromhex(authorization.nonce.removeprefix("0x")),
+                },
+            )
+            signer = recover_signer(typed_data, payment.payload.signature)
+        except Exception:
+            return False
+        return signer.lower() == authorization.from_.lower()
+
+    def matches(
+        self, payment: PaymentPayload, requirements: PaymentRequirements
+    ) -> bool:
+        # The token only shows in the domain the authorization was signed for
+        authorization = payment.payload.authorization  # type: ignore[attr-defined]
+        return authorization.to.lower() == requirements.pay_to.lower() and (
+            self._signed_by_payer(payment, requirements)
+        )
+
+    async def verify_locally(
+        self,
+        payment: PaymentPayload,
+        requirements: PaymentRequirements,
+        chain: Any,
+        now: int,
+    ) -> Optional[str]:
+        authorization = payment.payload.authorization  # type: ignore[attr-defined]
+        payer = authorization.from_
+
+        if not self._signed_by_payer(payment, requirements):
+            return "invalid_exact_evm_payload_signature"
+
+        if authorization.to.lower() != requirements.pay_to.lower():
+            return "invalid_exact_evm_payload_recipient_mismatch"
+
+        if int(authorization.valid_before) < now + VALID_BEFORE_MARGIN:
+            return "invalid_exact_evm_payload_authorization_valid_before"
+        if int(authorization.valid_after) > now:
+            return "invalid_exact_evm_payload_authorization_valid_after"
+
+        value = int(authorization.value)
+        if value < int(requirements.max_amount_required):
+            return "invalid_exact_evm_payload_authorization_value"
+
+        network, asset = requirements.network, requirements.asset
+        if await chain.authorization_used(network, asset, payer, authorization.nonce):
+            return "invalid_exact_evm_payload_authorization_nonce"
+        if await chain.balance_of(network, asset, payer) < value:
+            return "insufficient_funds"
+        return None
+
+    async def settle_locally(
+        self, payment: PaymentPayload, requirements: PaymentRequirements, chain: Any
+    ) -> str:
+        return await chain.transfer_with_authorization(
+            requirements.network,
+            requirements.asset,
+            payment.payload.authorization,  # type: ignore[attr-defined]
+            payment.payload.signature,
+        )
+
+    def settled_amount(
+        self, payment: PaymentPayload, requirements: PaymentRequirements
+    ) -> int:
+        return int(payment.payload.authorization.value)  # type: ignore[attr-defined]
@@ -1,8 +1,19 @@
-from typing import Callable, Optional
+import asyncio
+import concurrent.futures
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Literal, Optional
 from typing_extensions import (
     TypedDict,
 )  # use `typing_extensions.TypedDict` instead of `typing.TypedDict` on Python < 3.12
 import httpx
+from x402 import instrumentation
+from x402.encoding import base64_decode_bytes
+from x402.schemes import payment_sticky_key
 from x402.types import (
     PaymentPayload,
     PaymentRequirements,
@@ -12,6 +23,143 @@ from x402.types import (
     ListDiscoveryResourcesResponse,
 )
 
+Endpoint = Literal["verify", "settle", "list"]
+RoutingStrategy = Literal["p2c", "ewma", "ordered"]
+CreateHeaders = Callable[[], Awaitable[dict[str, dict[str, str]]]]
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for each facilitator endpoint before giving up
+DEFAULT_TIMEOUTS: dict[str, float] = {"verify": 5.0, "settle": 30.0, "list": 10.0}
+
+# Weight of the newest sample in a replica's latency moving average
+EWMA_ALPHA = 0.3
+
+# Maximum number of in-flight payments remembered for sticky routing
+STICKY_CACHE_SIZE = 10_000
+
+DEFAULT_HEALTH_CHECK_PATH = "/supported"
+
+# Seconds cached auth headers are reused when they carry no JWT expiry
+DEFAULT_HEADERS_TTL = 60.0
+
+# Seconds before expiry at which cached auth headers are refreshed in the background
+DEFAULT_HEADERS_REFRESH_MARGIN = 10.0
+
+
+class FacilitatorError(Exception):
+    """Raised when the facilitator returns an unusable response."""
+
+    pass
+
+
+class FacilitatorUnavailableError(FacilitatorError):
+    """Raised when no facilitator could be reached, or all circuits are open."""
+
+    pass
+
+
+class FacilitatorRequestError(FacilitatorError):
+    """Raised when a request failed after it may have reached the facilitator,
+    e.g. on a read timeout or a 5xx response, so the facilitator may have
+    acted on it."""
+
+    pass
+
+
+class CircuitBreakerConfig(TypedDict, total=False):
+    """Configuration for the per-facilitator circuit breaker.
+
+    Attributes:
+        failure_threshold: Consecutive failures before the circuit opens
+        recovery_timeout: Seconds the circuit stays open before a half-open probe
+        half_open_max_calls: Probe requests allowed while half-open
+    """
+
+    failure_threshold: int
+    recovery_timeout: float
+    half_open_max_calls: int
+
+
+class CircuitBreaker:
+    """Circuit breaker guarding calls to a single facilitator.
+
+    The circuit is closed while calls succeed. After `failure_threshold`
+    consecutive failures it opens and calls are rejected immediately. Once
+    `recovery_timeout` seconds have passed it becomes half-open and lets
+    `half_open_max_calls` probes through: a successful probe closes the
+    circuit, a failed one opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if (
+                self._state == self.OPEN
+                and self._clock() - self._opened_at >= self.recovery_timeout
+            ):
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Return whether a call may be made, reserving a probe if half-open."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if self._clock() - self._opened_at < self.recovery_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probes = 0
+            if self._probes >= self.half_open_max_calls:
+                return False
+            self._probes += 1
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if (
+                self._state == self.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._probes = 0
+
+    def release(self) -> None:
+        """Give back a half-open probe whose call was cancelled."""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
 
 class FacilitatorConfig(TypedDict, total=False):
     """Configuration for the X402 facilitator service.
@@ -19,10 +167,390 @@ class FacilitatorConfig(TypedDict, total=False):
     Attributes:
         url: The base URL for the facilitator service
         create_headers: Optional function to create authentication headers
+        cache_headers: Whether to reuse the result of `create_headers` until
+            it expires instead of calling it for every request. Defaults to
+            False.
+        headers_ttl: Seconds cached headers are reused when no JWT `exp`
+            claim is found in them. Defaults to 60.
+        headers_refresh_margin: Seconds before expiry at which cached headers
+            are refreshed in the background. Defaults to 10.
+        urls: Optional additional facilitator base URLs, used as failover
+            targets and for hedged verification
+        timeouts: Optional per-endpoint timeouts in seconds, keyed by
+            "verify", "settle" and "list"
+        circuit_breaker: Optional circuit breaker settings, applied to each URL
+        hedge_verify: Whether to race /verify across URLs. Defaults to False.
+        hedge_delay: Seconds to wait for a /verify answer before asking the
+            next URL. Defaults to 0.5.
+        routing: How to pick a replica when several URLs are configured:
+            "p2c" (power of two choices, the default), "ewma" (lowest
+            latency-weighted load) or "ordered" (first available URL)
+        health_check_interval: Seconds between active health checks of every
+            replica. Disabled by default, failures are then only detected
+            from live traffic.
+        health_check_path: Path probed by health checks. Defaults to
+            "/supported".
     """
 
     url: str
-    create_headers: Callable[[], dict[str, dict[str, str]]]
+    create_headers: CreateHeaders
+    cache_headers: bool
+    headers_ttl: float
+    headers_refresh_margin: float
+    urls: list[str]
+    timeouts: dict[str, float]
+    circuit_breaker: CircuitBreakerConfig
+    hedge_verify: bool
+    hedge_delay: float
+    routing: RoutingStrategy
+    health_check_interval: float
+    health_check_path: str
+
+
+def _normalize_url(url: str) -> str:
+    # Validate URL format
+    if not url.startswith(("http://", "https://")):
+        raise ValueError(f"Invalid URL {url}, must start with http:// or https://")
+    if url.endswith("/"):
+        url = url[:-1]
+    return url
+
+
+def _jwt_expiry(value: str) -> Optional[float]:
+    """Read the `exp` claim of a (Bearer) JWT without verifying it"""
+    if value.startswith("Bearer "):
+        value = value[len("Bearer ") :]
+    parts = value.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        payload = base64_decode_bytes(parts[1], urlsafe=True)
+        exp = json.loads(payload).get("exp")
+    except (ValueError, AttributeError):
+        return None
+    if isinstance(exp, (int, float)) and not isinstance(exp, bool):
+        return float(exp)
+    return None
+
+
+def headers_expiry(headers: dict[str, dict[str, str]]) -> Optional[float]:
+    """Earliest JWT expiry (unix time) found in the headers for any endpoint"""
+    expiries = [
+        exp
+        for endpoint_headers in headers.values()
+        for value in endpoint_headers.values()
+        if isinstance(value, str) and (exp := _jwt_expiry(value)) is not None
+    ]
+    return min(expiries) if expiries else None
+
+
+class HeaderCache:
+    """Caches the result of a `create_headers` function.
+
+    Headers are reused until they expire, taken from the earliest JWT `exp`
+    claim they contain or `ttl` seconds otherwise. Within `refresh_margin`
+    seconds of expiry the cached headers are still served while a task on
+    the caller's event loop fetches new ones. If that loop closes first, the
+    headers are refreshed in the foreground once they expire. Concurrent
+    callers share a single in-flight refresh, also across threads and event
+    loops.
+    """
+
+    def __init__(
+        self,
+        create_headers: CreateHeaders,
+        ttl: float = DEFAULT_HEADERS_TTL,
+        refresh_margin: float = DEFAULT_HEADERS_REFRESH_MARGIN,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.create_headers = create_headers
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._headers: Optional[dict[str, dict[str, str]]] = None
+        self._expires_at = 0.0
+        self._inflight: Optional[concurrent.futures.Future] = None
+        self._background: Optional[asyncio.Task] = None
+
+    async def get(self) -> dict[str, dict[str, str]]:
+        """Get valid headers, creating them if the cache is empty or expired"""
+        now = self._clock()
+        with self._lock:
+            headers, expires_at = self._headers, self._expires_at
+        if headers is not None and now < expires_at:
+            if now >= expires_at - self.refresh_margin:
+                self._refresh_in_background()
+            return headers
+        return await self.refresh()
+
+    def invalidate(self) -> None:
+        """Drop the cached headers, e.g. after the facilitator rejected them"""
+        with self._lock:
+            self._headers = None
+
+    async def refresh(self) -> dict[str, dict[str, str]]:
+        """Create new headers, joining a refresh already in flight"""
+        with self._lock:
+            future = self._inflight
+            leader = future is None
+            if leader:
+                future = self._inflight = concurrent.futures.Future()
+        if not leader:
+            return await asyncio.wrap_future(future)
+        return await self._create(future)
+
+    async def _create(
+        self, future: concurrent.futures.Future
+    ) -> dict[str, dict[str, str]]:
+        """Create headers as the leader of the refresh in flight"""
+        try:
+            headers = await self.create_headers()
+        except BaseException as e:
+            with self._lock:
+                self._inflight = None
+            future.set_exception(e)
+            raise
+
+        expires_at = headers_expiry(headers)
+        if expires_at is None:
+            expires_at = self._clock() + self.ttl
+        with self._lock:
+            self._headers, self._expires_at = headers, expires_at
+            self._inflight = None
+        future.set_result(headers)
+        return headers
+
+    def _refresh_in_background(self) -> None:
+        # Claimed under the lock, so only one caller starts a refresh
+        with self._lock:
+            if self._inflight is not None:
+                return
+            future = self._inflight = concurrent.futures.Future()
+        task = asyncio.get_running_loop().create_task(self._background_refresh(future))
+        task.add_done_callback(lambda _: self._abandon(future))
+        self._background = task
+
+    def _abandon(self, future: concurrent.futures.Future) -> None:
+        """Release a refresh whose task was cancelled before it started, e.g.
+        by its event loop shutting down"""
+        if future.done():
+            return
+        with self._lock:
+            if self._inflight is future:
+                self._inflight = None
+        future.set_exception(
+            FacilitatorError("Background refresh of facilitator headers was cancelled")
+        )
+
+    async def _background_refresh(self, future: concurrent.futures.Future) -> None:
+        try:
+            await self._create(future)
+        except Exception:
+            # Cached headers stay valid until they expire, the next caller
+            # retries in the foreground
+            logger.warning("Background refresh of facilitator headers failed")
+
+
+class FacilitatorReplica:
+    """A single facilitator URL in a pool, with its health and load stats."""
+
+    def __init__(self, url: str, breaker: CircuitBreaker):
+        self.url = url
+        self.breaker = breaker
+        self.latency = 0.0
+        self.samples = 0
+        self.in_flight = 0
+
+    @property
+    def load(self) -> float:
+        """Expected cost of sending one more request to this replica.
+
+        Replicas without samples score 0 so they are tried early.
+        """
+        return self.latency * (self.in_flight + 1)
+
+
+class FacilitatorPool:
+    """Routes facilitator calls across a set of replicas.
+
+    Replicas whose circuit is open are skipped. Among the remaining ones a
+    replica is picked by `routing`; requests that carry a sticky key (the
+    payment nonce) keep going to the replica that first served that key, so
+    the verify and settle calls for one payment hit the same facilitator.
+
+    Pools are shared between clients configured with the same URLs, see
+    `get_facilitator_pool`.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        routing: RoutingStrategy = "p2c",
+        circuit_breaker: Optional[CircuitBreakerConfig] = None,
+        sticky_size: int = STICKY_CACHE_SIZE,
+    ):
+        if routing not in ("p2c", "ewma", "ordered"):
+            raise ValueError(
+                f"Unknown routing strategy: {routing}. Must be one of: p2c, ewma, ordered"
+            )
+        self.routing = routing
+        self.replicas = {
+            url: FacilitatorReplica(url, CircuitBreaker(**(circuit_breaker or {})))
+            for url in urls
+        }
+        self.sticky_size = sticky_size
+        self._sticky: OrderedDict[Hashable, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._health_thread: Optional[threading.Thread] = None
+        self._health_stop = threading.Event()
+
+    def __getitem__(self, url: str) -> FacilitatorReplica:
+        return self.replicas[url]
+
+    def candidates(self, sticky_key: Optional[Hashable] = None) -> list[str]:
+        """URLs to try, best first, skipping replicas whose circuit is open.
+
+        Raises:
+            FacilitatorUnavailableError: If every replica's circuit is open
+        """
+        available = [
+            r for r in self.replicas.values() if r.breaker.state != CircuitBreaker.OPEN
+        ]
+        if not available:
+            raise FacilitatorUnavailableError(
+                "Circuit open for all configured facilitators"
+            )
+
+        with self._lock:
+            if self.routing != "ordered":
+                available.sort(key=lambda r: r.load)
+            if self.routing == "p2c" and len(available) > 2:
+                # Compare two random replicas instead of always taking the
+                # least loaded one, so a fast replica is not stampeded
+                first, second = random.sample(range(len(available)), 2)
+                winner = available.pop(min(first, second))
+                available.insert(0, winner)
+
+            if sticky_key is not None:
+                sticky_url = self._sticky.get(sticky_key)
+                for i, replica in enumerate(available):
+                    if replica.url == sticky_url:
+                        available.insert(0, available.pop(i))
+                        break
+
+        return [r.url for r in available]
+
+    def bind(self, sticky_key: Hashable, url: str) -> None:
+        """Route later requests with `sticky_key` to `url`"""
+        with self._lock:
+            self._sticky[sticky_key] = url
+            self._sticky.move_to_end(sticky_key)
+            if len(self._sticky) > self.sticky_size:
+                self._sticky.popitem(last=False)
+
+    def unbind(self, sticky_key: Hashable) -> None:
+        with self._lock:
+            self._sticky.pop(sticky_key, None)
+
+    def started(self, url: str) -> None:
+        with self._lock:
+            self.replicas[url].in_flight += 1
+
+    def finished(self, url: str, elapsed: float) -> None:
+        """Record a completed request and fold its latency into the EWMA"""
+        with self._lock:
+            replica = self.replicas[url]
+            replica.in_flight -= 1
+            if replica.samples == 0:
+                replica.latency = elapsed
+            else:
+                replica.latency += EWMA_ALPHA * (elapsed - replica.latency)
+            replica.samples += 1
+
+    def check_health(
+        self, path: str = DEFAULT_HEALTH_CHECK_PATH, timeout: float = 5.0
+    ) -> dict[str, bool]:
+        """Probe every replica once and update its circuit breaker.
+
+        Returns:
+            Mapping of URL to whether the replica answered without a 5xx
+        """
+        results = {}
+        with httpx.Client(timeout=timeout) as client:
+            for url, replica in self.replicas.items():
+                try:
+                    healthy = client.get(f"{url}{path}").status_code < 500
+                except httpx.HTTPError:
+                    healthy = False
+                if healthy:
+                    replica.breaker.record_success()
+                else:
+                    replica.breaker.record_failure()
+                results[url] = healthy
+        return results
+
+    def start_health_checks(
+        self, interval: float, path: str = DEFAULT_HEALTH_CHECK_PATH
+    ) -> None:
+        """Run `check_health` every `interval` seconds in a daemon thread.
+
+        Calling this again while checks are running does nothing.
+        """
+        with self._lock:
+            if self._health_thread is not None:
+                return
+            self._health_stop.clear()
+            self._health_thread = threading.Thread(
+                target=self._health_loop,
+                args=(interval, path),
+                name="x402-facilitator-health",
+                daemon=True,
+            )
+            self._health_thread.start()
+
+    def stop_health_checks(self) -> None:
+        with self._lock:
+            thread, self._health_thread = self._health_thread, None
+        if thread is not None:
+            self._health_stop.set()
+            thread.join()
+
+    def _health_loop(self, interval: float, path: str) -> None:
+        while not self._health_stop.wait(interval):
+            self.check_health(path, timeout=min(interval, 5.0))
+
+
+_pools: dict[tuple, FacilitatorPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_facilitator_pool(
+    urls: list[str],
+    routing: RoutingStrategy = "p2c",
+    circuit_breaker: Optional[CircuitBreakerConfig] = None,
+) -> FacilitatorPool:
+    """Get the process-wide pool for a set of facilitator URLs.
+
+    Every FacilitatorClient configured with the same URLs, routing and circuit
+    breaker settings shares one pool, so all middlewares in a process see the
+    same replica health and latency.
+    """
+    key = (tuple(urls), routing, tuple(sorted((circuit_breaker or {}).items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = FacilitatorPool(urls, routing, circuit_breaker)
+        return pool
+
+
+def clear_facilitator_pools() -> None:
+    """Stop health checks and forget all shared pools"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.stop_health_checks()
 
 
 class FacilitatorClient:
@@ -30,66 +558,242 @@ class FacilitatorClient:
         if config is None:
             config = {"url": "https://x402.org/facilitator"}
 
-        # Validate URL format
-        url = config.get("url", "")
-        if not url.startswith(("http://", "https://")):
-            raise ValueError(f"Invalid URL {url}, must start with http:// or https://")
-        if url.endswith("/"):
-            url = url[:-1]
+        url = _normalize_url(config.get("url", ""))
+        urls = [url]
+        for extra_url in config.get("urls", []):
+            extra_url = _normalize_url(extra_url)
+            if extra_url not in urls:
+                urls.append(extra_url)
 
         self.config = {"url": url, "create_headers": config.get("create_headers")}
+        self.header_cache: Optional[HeaderCache] = None
+        if config.get("create_headers") and config.get("cache_headers"):
+            self.header_cache = HeaderCache(
+                config["create_headers"],
+                config.get("headers_ttl", DEFAULT_HEADERS_TTL),
+                config.get("headers_refresh_margin", DEFAULT_HEADERS_REFRESH_MARGIN),
+            )
+        self.urls = urls
+        self.timeouts = {**DEFAULT_TIMEOUTS, **config.get("timeouts", {})}
+        self.hedge_verify = config.get("hedge_verify", False)
+        self.hedge_delay = config.get("hedge_delay", 0.5)
+        self.pool = get_facilitator_pool(
+            urls, config.get("routing", "p2c"), config.get("circuit_breaker")
+        )
+        self.breakers = {u: r.breaker for u, r in self.pool.replicas.items()}
+        if config.get("health_check_interval"):
+            self.pool.start_health_checks(
+                config["health_check_interval"],
+                config.get("health_check_path", DEFAULT_HEALTH_CHECK_PATH),
+            )
 
-    async def verify(
-        self, payment: PaymentPayload, payment_requirements: PaymentRequirements
-    ) -> VerifyResponse:
-        """Verify a payment header is valid and a request should be processed"""
+    async def _headers(self, endpoint: Endpoint) -> dict[str, str]:
         headers = {"Content-Type": "application/json"}
 
-        if self.config.get("create_headers"):
+        if self.header_cache is not None:
+            custom_headers = await self.header_cache.get()
+            headers.update(custom_headers.get(endpoint, {}))
+        elif self.config.get("create_headers"):
             custom_headers = await self.config["create_headers"]()
-            headers.update(custom_headers.get("verify", {}))
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.config['url']}/verify",
-                json={
-                    "x402Version": payment.x402_version,
-                    "paymentPayload": payment.model_dump(by_alias=True),
-                    "paymentRequirements": payment_requirements.model_dump(
-                        by_alias=True, exclude_none=True
-                    ),
-                },
-                headers=headers,
-                follow_redirects=True,
+            headers.update(custom_headers.get(endpoint, {}))
+        return headers
+
+    async def _request(
+        self, url: str, endpoint: Endpoint, method: str, path: str, **kwargs: Any
+    ) -> httpx.Response:
+        """Send a request to one facilitator, tracking its circuit breaker
+        and latency.
+
+        Raises:
+            FacilitatorUnavailableError: If the circuit is open or the
+                connection could not be made
+            FacilitatorRequestError: If the request failed once sent, e.g.
+                timed out waiting for the response, or the facilitator
+                returned a 5xx response
+        """
+        breaker = self.breakers[url]
+        if not breaker.allow_request():
+            instrumentation.count("x402.facilitator.circuit_open", url=url)
+            raise FacilitatorUnavailableError(f"Circuit open for facilitator {url}")
+
+        self.pool.started(url)
+        start = time.perf_counter()
+        with instrumentation.span(
+            "x402.facilitator.request", url=url, endpoint=endpoint
+        ) as span:
+            try:
+                async with httpx.AsyncClient(timeout=self.timeouts[endpoint]) as client:
+                    response = await client.request(
+                        method, f"{url}{path}", follow_redirects=True, **kwargs
+                    )
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                breaker.record_failure()
+                raise FacilitatorUnavailableError(
+                    f"Facilitator {url} {endpoint} request failed: {e!r}"
+                ) from e
+            except httpx.HTTPError as e:
+                breaker.record_failure()
+                raise FacilitatorRequestError(
+                    f"Facilitator {url} {endpoint} request failed: {e!r}"
+                ) from e
+            finally:
+                self.pool.finished(url, time.perf_counter() - start)
+            span.set_attribute("status_code", response.status_code)
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+            raise FacilitatorRequestError(
+                f"Facilitator {url} {endpoint} failed: {response.status_code} {response.text}"
             )
+        breaker.record_success()
+        if response.status_code == 401 and self.header_cache is not None:
+            self.header_cache.invalidate()
+        return response
+
+    async def _request_with_failover(
+        self,
+        endpoint: Endpoint,
+        method: str,
+        path: str,
+        sticky_key: Optional[Hashable] = None,
+        retry_sent: bool = True,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """Send a request to the best available facilitator, failing over to
+        the next one if it cannot be reached or, with `retry_sent`, if the
+        request failed once sent.
+
+        Args:
+            retry_sent: Also fail over when the request failed after it was
+                sent, e.g. on a timeout or a 5xx response. Only safe for
+                requests the facilitator can repeat.
+        """
+        error: Optional[Exception] = None
+        for url in self.pool.candidates(sticky_key):
+            try:
+                response = await self._request(url, endpoint, method, path, **kwargs)
+            except FacilitatorUnavailableError as e:
+                error = e
+                continue
+            except FacilitatorRequestError as e:
+                if not retry_sent:
+                    raise
+                error = e
+                continue
+            if sticky_key is not None:
+                self.pool.bind(sticky_key, url)
+            return response
+        raise FacilitatorUnavailableError(str(error)) from error
+
+    async def _post_hedged(
+        self,
+        endpoint: Endpoint,
+        path: str,
+        sticky_key: Optional[Hashable] = None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """POST to the available facilitators in turn, starting the next
+        attempt after `hedge_delay` seconds or as soon as one fails. The first
+        good answer wins and the remaining attempts are cancelled."""
+        pending_urls = self.pool.candidates(sticky_key)
+        tasks: dict[asyncio.Future, str] = {}
+        error: Optional[Exception] = None
+
+        def launch() -> None:
+            url = pending_urls.pop(0)
+            task = asyncio.ensure_future(
+                self._request(url, endpoint, "POST", path, **kwargs)
+            )
+            tasks[task] = url
+
+        launch()
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(
+                    tasks,
+                    timeout=self.hedge_delay if pending_urls else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    url = tasks.pop(task)
+                    if task.exception() is None:
+                        if sticky_key is not None:
+                            self.pool.bind(sticky_key, url)
+                        return task.result()
+                    error = task.exception()
+                # Either the hedge delay elapsed or an attempt failed
+                if pending_urls:
+                    launch()
+        finally:
+            for task in tasks:
+                task.cancel()
+        raise FacilitatorUnavailableError(str(error)) from error
+
+    def _payment_body(
+        self, payment: PaymentPayload, payment_requirements: PaymentRequirements
+    ) -> dict[str, Any]:
+        return {
+            "x402Version": payment.x402_version,
+            "paymentPayload": payment.model_dump(by_alias=True),
+            "paymentRequirements": payment_requirements.model_dump(
+                by_alias=True, exclude_none=True
+            ),
+        }
 
-            data = response.json()
-            return VerifyResponse(**data)
+    @staticmethod
+    def _json(response: httpx.Response, endpoint: Endpoint) -> Any:
+        try:
+            return response.json()
+        except ValueError as e:
+            raise FacilitatorError(
+                f"Facilitator {endpoint} returned invalid JSON: {response.status_code} {response.text}"
+            ) from e
+
+    async def verify(
+        self, payment: PaymentPayload, payment_requirements: PaymentRequirements
+    ) -> VerifyResponse:
+        """Verify a payment header is valid and a request should be processed"""
+        headers = await self._headers("verify")
+        kwargs: dict[str, Any] = {
+            "sticky_key": payment_sticky_key(payment),
+            "json": self._payment_body(payment, payment_requirements),
+            "headers": headers,
+        }
+        if self.hedge_verify:
+            response = await self._post_hedged("verify", "/verify", **kwargs)
+        else:
+            response = await self._request_with_failover(
+                "verify", "POST", "/verify", **kwargs
+            )
+        data = self._json(response, "verify")
+        return VerifyResponse(**data)
 
     async def settle(
         self, payment: PaymentPayload, payment_requirements: PaymentRequirements
     ) -> SettleResponse:
-        headers = {"Content-Type": "application/json"}
-
-        if self.config.get("create_headers"):
-            custom_headers = await self.config["create_headers"]()
-            headers.update(custom_headers.get("settle", {}))
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.config['url']}/settle",
-                json={
-                    "x402Version": payment.x402_version,
-                    "paymentPayload": payment.model_dump(by_alias=True),
-                    "paymentRequirements": payment_requirements.model_dump(
-                        by_alias=True, exclude_none=True
-                    ),
-                },
+        # Settlement is never hedged, a payment must only be submitted once.
+        # It only fails over when the facilitator could not be reached: one
+        # that timed out or failed with a 5xx may already have submitted the
+        # payment.
+        headers = await self._headers("settle")
+        sticky_key = payment_sticky_key(payment)
+        try:
+            response = await self._request_with_failover(
+                "settle",
+                "POST",
+                "/settle",
+                sticky_key=sticky_key,
+                retry_sent=False,
+                json=self._payment_body(payment, payment_requirements),
                 headers=headers,
-                follow_redirects=True,
             )
-            data = response.json()
-            return SettleResponse(**data)
+        finally:
+            self.pool.unbind(sticky_key)
+        data = self._json(response, "settle")
+        return SettleResponse(**data)
 
     async def list(
         self, request: Optional[ListDiscoveryResourcesRequest] = None
@@ -105,11 +809,7 @@ class FacilitatorClient:
         if request is None:
             request = ListDiscoveryResourcesRequest()
 
-        headers = {"Content-Type": "application/json"}
-
-        if self.config.get("create_headers"):
-            custom_headers = await self.config["create_headers"]()
-            headers.update(custom_headers.get("list", {}))
+        headers = await self._headers("list")
 
         # Build query parameters, excluding None values
         params = {
@@ -118,18 +818,18 @@ class FacilitatorClient:
             if v is not None
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.config['url']}/discovery/resources",
-                params=params,
-                headers=headers,
-                follow_redirects=True,
-            )
+        response = await self._request_with_failover(
+            "list",
+            "GET",
+            "/discovery/resources",
+            params=params,
+            headers=headers,
+        )
 
-            if response.status_code != 200:
-                raise ValueError(
-                    f"Failed to list discovery resources: {response.status_code} {response.text}"
-                )
+        if response.status_code != 200:
+            raise ValueError(
+                f"Failed to list discovery resources: {response.status_code} {response.text}"
+            )
 
-            data = response.json()
-            return ListDiscoveryResourcesResponse(**data)
+        data = response.json()
+        return ListDiscoveryResourcesResponse(**data)
@@ -0,0 +1,19 @@
+from typing import Awaitable, Callable
+
+from fastapi import Response
+
+from x402.metrics import CONTENT_TYPE, MetricsRegistry
+
+
+def metrics_endpoint(registry: MetricsRegistry) -> Callable[[], Awaitable[Response]]:
+    """Create a route serving the registry in the Prometheus text format.
+
+    Usage:
+        registry = enable_metrics()
+        app.get("/metrics", include_in_schema=False)(metrics_endpoint(registry))
+    """
+
+    async def metrics() -> Response:
+        return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+    return metrics
@@ -1,37 +1,625 @@
-import base64
+import asyncio
+import inspect
 import json
 import logging
-from typing import Any, Callable, Optional, get_args, cast
+from typing import Any, AsyncIterator, Callable, NamedTuple, Optional, Union, get_args
 
 from fastapi import Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from pydantic import validate_call
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from x402.common import (
-    process_price_to_atomic_amount,
-    x402_VERSION,
-    find_matching_payment_requirements,
+from x402 import instrumentation
+from x402.admission import (
+    AdmissionConfig,
+    AdmissionController,
+    AdmissionRejection,
+)
+from x402.aggregation import AggregationConfig, PaymentAggregator
+from x402.common import settlement_header
+from x402.decoding import (
+    DEFAULT_MAX_DEPTH,
+    DEFAULT_MAX_HEADER_SIZE,
+    PaymentHeaderDecoder,
 )
-from x402.encoding import safe_base64_decode
 from x402.facilitator import FacilitatorClient, FacilitatorConfig
+from x402.metering import MeteringConfig, UsageMeter
 from x402.path import path_is_match
+from x402.schemes import payment_payer, settled_amount
 from x402.paywall import is_browser_request, get_paywall_html
+from x402.requirements import (
+    DynamicPrice,
+    PaymentOption,
+    PaymentRequirementsCache,
+    PaymentRequirementsEntry,
+    PriceTierKeyCallable,
+)
+from x402.sessions import (
+    SESSION_HEADER,
+    SESSION_REMAINING_HEADER,
+    SessionConfig,
+    SessionGrant,
+    SessionManager,
+)
 from x402.types import (
     PaymentPayload,
     PaymentRequirements,
-    Price,
-    x402PaymentRequiredResponse,
     PaywallConfig,
+    RefundHook,
+    SettleResponse,
     SupportedNetworks,
     HTTPInputSchema,
 )
+from x402.upto import UptoTracker
 
 logger = logging.getLogger(__name__)
 
+# Name of the final SSE event carrying the settlement receipt in streaming mode
+SSE_PAYMENT_RESPONSE_EVENT = "x402-payment-response"
+
+# Strong references to in-flight settlements so they are not garbage collected
+# when a streaming client disconnects
+_pending_settlements: set[asyncio.Task] = set()
+
+
+async def _refund_if_settled(
+    settlement: "asyncio.Future[SettleResponse]",
+    payment: PaymentPayload,
+    payment_requirements: PaymentRequirements,
+    refund_hook: Optional[RefundHook],
+) -> Optional[SettleResponse]:
+    """Wait for a speculative settlement whose handler failed.
+
+    Returns the settle response if the payment went through, after handing it
+    to the refund hook, or None if settlement failed.
+    """
+    try:
+        settle_response = await settlement
+    except Exception as e:
+        logger.warning(f"Speculative settle failed: {e}")
+        return None
+    if not settle_response.success:
+        return None
+
+    logger.warning(
+        f"Payment {settle_response.transaction} settled but the handler failed, refund required"
+    )
+    if refund_hook is not None:
+        try:
+            result = refund_hook(payment, payment_requirements, settle_response)
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            logger.exception("Refund hook failed")
+    return settle_response
+
+
+def _keep_until_done(settlement: "asyncio.Future[SettleResponse]") -> None:
+    _pending_settlements.add(settlement)  # type: ignore[arg-type]
+    settlement.add_done_callback(_pending_settlements.discard)  # type: ignore[arg-type]
+
+
+async def _send_receipt(
+    send: Send, settlement: "asyncio.Future[SettleResponse]", use_trailers: bool
+) -> None:
+    """Finish a streamed response with the settlement receipt.
+
+    Sends the final body message followed by an X-PAYMENT-RESPONSE trailer, or
+    a final `x402-payment-response` server-sent event.
+    """
+    try:
+        settle_response = await asyncio.shield(settlement)
+    except Exception as e:
+        logger.warning(f"Settle failed: {e}")
+        settle_response = SettleResponse(success=False, error_reason="Settle failed")
+    if not settle_response.success:
+        logger.warning(f"Settle failed: {settle_response.error_reason}")
+    receipt = settlement_header(settle_response)
+
+    if use_trailers:
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+        await send(
+            {
+                "type": "http.response.trailers",
+                "headers": [(b"x-payment-response", receipt.encode("ascii"))],
+                "more_trailers": False,
+            }
+        )
+    else:
+        event = f"event: {SSE_PAYMENT_RESPONSE_EVENT}\ndata: {receipt}\n\n"
+        await send(
+            {
+                "type": "http.response.body",
+                "body": event.encode("utf-8"),
+                "more_body": False,
+            }
+        )
+
+
+class SettlementStreamingResponse(StreamingResponse):
+    """Streams a paid response while the payment settles in the background.
+
+    The settlement receipt is delivered after the body, either as an
+    `X-PAYMENT-RESPONSE` HTTP trailer (when the server supports the
+    `http.response.trailers` ASGI extension) or as a final
+    `x402-payment-response` server-sent event. Settlement keeps running if
+    the client aborts the stream; its outcome is logged.
+    """
+
+    def __init__(
+        self,
+        response: Response,
+        settlement: "asyncio.Future[SettleResponse]",
+        use_trailers: bool,
+    ):
+        super().__init__(
+            content=response.body_iterator,  # type: ignore[attr-defined]
+            status_code=response.status_code,
+            background=response.background,
+        )
+        self.raw_headers = list(response.raw_headers)
+        self.settlement = settlement
+        self.use_trailers = use_trailers
+        if use_trailers:
+            self.raw_headers.append((b"trailer", b"X-PAYMENT-RESPONSE"))
+        else:
+            # The receipt event makes the body longer than the handler's
+            self.raw_headers = [
+                (name, value)
+                for name, value in self.raw_headers
+                if name.lower() != b"content-length"
+            ]
+
+    async def stream_response(self, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+                "trailers": self.use_trailers,
+            }
+        )
+        async for chunk in self.body_iterator:
+            if not isinstance(chunk, (bytes, memoryview)):
+                chunk = chunk.encode(self.charset)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+        await _send_receipt(send, self.settlement, self.use_trailers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        _keep_until_done(self.settlement)
+        await super().__call__(scope, receive, send)
+
+
+class _PaymentGate:
+    """Framework-level payment logic shared by `require_payment` and
+    `PaymentMiddleware`: builds 402 responses, decodes and verifies payments
+    and starts settlements."""
+
+    @validate_call
+    def __init__(
+        self,
+        price: DynamicPrice,
+        pay_to_address: str,
+        path: str | list[str],
+        description: str,
+        mime_type: str,
+        max_deadline_seconds: int,
+        input_schema: Optional[HTTPInputSchema],
+        output_schema: Optional[Any],
+        discoverable: Optional[bool],
+        facilitator_config: Optional[FacilitatorConfig],
+        network: str,
+        resource: Optional[str],
+        paywall_config: Optional[PaywallConfig],
+        custom_paywall_html: Optional[str],
+        price_tier_key: Optional[PriceTierKeyCallable],
+        stream_settlement: bool,
+        speculative_settle: bool,
+        refund_hook: Optional[RefundHook],
+        facilitator: Optional[Any],
+        max_payment_header_size: int,
+        max_payment_header_depth: int,
+        admission: Optional[AdmissionConfig],
+        session: Optional[SessionConfig],
+        aggregation: Optional[AggregationConfig],
+        metering: Optional[MeteringConfig],
+        options: Optional[list[PaymentOption]],
+    ):
+        # Validate networks are supported
+        supported_networks = get_args(SupportedNetworks)
+        for option_network in [network, *(o["network"] for o in options or ())]:
+            if option_network not in supported_networks:
+                raise ValueError(
+                    f"Unsupported network: {option_network}. Must be one of: {supported_networks}"
+                )
+        if metering is not None:
+            if not metering.get("spender"):
+                raise ValueError("Metering config requires a spender")
+            if speculative_settle or session is not None:
+                raise ValueError(
+                    "metering cannot be combined with speculative_settle or session"
+                )
+        if stream_settlement and session is not None:
+            # The session token goes out with the response headers, before a
+            # streamed response's payment has settled
+            raise ValueError("stream_settlement cannot be combined with session")
+
+        try:
+            self.requirements_cache = PaymentRequirementsCache(
+                price=price,
+                pay_to_address=pay_to_address,
+                network=network,
+                description=description,
+                mime_type=mime_type,
+                max_deadline_seconds=max_deadline_seconds,
+                input_schema=input_schema,
+                output_schema=output_schema,
+                discoverable=discoverable,
+                price_tier_key=price_tier_key,
+                scheme="upto" if metering is not None else "exact",
+                extra={"spender": metering["spender"]}
+                if metering is not None
+                else None,
+                options=options,
+            )
+        except Exception as e:
+            raise ValueError(f"Invalid price: {price}. Error: {e}")
+
+        self.path = path
+        # Low-cardinality route label for instrumentation
+        self.route = path if isinstance(path, str) else ",".join(path)
+        self.resource = resource
+        self.paywall_config = paywall_config
+        self.custom_paywall_html = custom_paywall_html
+        self.stream_settlement = stream_settlement
+        self.speculative_settle = speculative_settle
+        self.refund_hook = refund_hook
+        self.facilitator = (
+            facilitator
+            if facilitator is not None
+            else FacilitatorClient(facilitator_config)
+        )
+        self.header_decoder = PaymentHeaderDecoder(
+            max_payment_header_size, max_payment_header_depth
+        )
+        self.admission = (
+            AdmissionController(admission) if admission is not None else None
+        )
+        self.sessions = SessionManager(session, path) if session is not None else None
+        if aggregation is not None and speculative_settle:
+            raise ValueError("aggregation and speculative_settle cannot be combined")
+        self.aggregator = (
+            PaymentAggregator(aggregation, self.facilitator, self.route)
+            if aggregation is not None and metering is None
+            else None
+        )
+        # Metered usage always settles later, once per authorization
+        self.metering = metering
+        self.upto = UptoTracker() if metering is not None else None
+        if self.upto is not None:
+            self.aggregator = PaymentAggregator(
+                aggregation or {},
+                self.facilitator,
+                self.route,
+                on_settling=self.upto.close,
+            )
+
+    def matches(self, request_path: str) -> bool:
+        return path_is_match(self.path, request_path)
+
+    def payment_required_response(
+        self,
+        request: Request,
+        requirements_entry: PaymentRequirementsEntry,
+        error: str,
+        reason: str,
+    ) -> Response:
+        """Create a 402 response with payment requirements.
+
+        ``reason`` is a fixed code used as the metric label, the detailed
+        ``error`` only goes in the response body.
+        """
+        status_code = 402
+        instrumentation.count("x402.payment_required", route=self.route, reason=reason)
+
+        if is_browser_request(dict(request.headers)):
+            with instrumentation.span("x402.paywall", route=self.route):
+                html_content = self.custom_paywall_html or get_paywall_html(
+                    error, requirements_entry.requirements, self.paywall_config
+                )
+            headers = {"Content-Type": "text/html; charset=utf-8"}
+
+            return HTMLResponse(
+                content=html_content,
+                status_code=status_code,
+                headers=headers,
+            )
+        else:
+            return Response(
+                content=requirements_entry.json_body(error),
+                status_code=status_code,
+                media_type="application/json",
+            )
+
+    def redeem_session(self, request: Request) -> Optional[SessionGrant]:
+        """Take a session credit for the request, if it carries a valid
+        session token."""
+        if self.sessions is None:
+            return None
+        return self.sessions.redeem(request.headers.get(SESSION_HEADER))
+
+    def issue_session(self, verified: "_VerifiedPayment") -> Optional[str]:
+        """Start a session for a settled payment, returning its token."""
+        if self.sessions is None:
+            return None
+        return self.sessions.issue(payment_payer(verified.payment))
+
+    def too_many_requests_response(self, rejection: AdmissionRejection) -> Response:
+        """Create a 429 response for a payment attempt rejected by admission
+        control."""
+        return Response(
+            content=json.dumps({"error": "Too many payment attempts"}),
+            status_code=429,
+            headers={"Retry-After": rejection.retry_after_header},
+            media_type="application/json",
+        )
+
+    async def authorize(self, request: Request) -> Union[Response, "_VerifiedPayment"]:
+        """Check the request's payment, returning either a 402 response or the
+        verified payment."""
+        # Get resource URL if not explicitly provided
+        resource_url = self.resource or str(request.url)
+
+        # Payment details are cached per pricing tier, resource and method
+        with instrumentation.span("x402.requirements", route=self.route):
+            requirements_entry = self.requirements_cache.get(
+                request, resource_url, request.method.upper()
+            )
+
+        def x402_response(error: str, reason: str) -> Response:
+            return self.payment_required_response(
+                request, requirements_entry, error, reason
+            )
+
+        # Check for payment header
+        payment_header = request.headers.get("X-PAYMENT", "")
+
+        if payment_header == "":
+            return x402_response("No X-PAYMENT header provided", "missing_header")
+
+        # Decode payment header
+        try:
+            with instrumentation.span("x402.decode", route=self.route):
+                payment = self.header_decoder.decode(payment_header)
+        except Exception as e:
+            logger.warning(
+                f"Invalid payment header format from {request.client.host if request.client else 'unknown'}: {str(e)}"
+            )
+            return x402_response("Invalid payment header format", "bad_header")
+
+        # Find matching payment requirements
+        selected_payment_requirements = requirements_entry.match(payment)
+
+        if not selected_payment_requirements:
+            return x402_response("No matching payment requirements found", "no_match")
+
+        # Upto authorizations are verified once and reused until exhausted.
+        # Payloads that differ from the verified one are verified below.
+        if self.upto is not None:
+            state = self.upto.reserve(
+                payment, int(selected_payment_requirements.max_amount_required)
+            )
+            if state == "exhausted":
+                return x402_response("Payment authorization exhausted", "exhausted")
+            if state == "reserved":
+                return self.start_metering(
+                    request, payment, selected_payment_requirements, requirements_entry
+                )
+
+        # Throttle payers and clients before calling the facilitator
+        if self.admission is not None:
+            rejection = self.admission.admit(
+                payment_payer(payment),
+                request.client.host if request.client else None,
+            )
+            if rejection is not None:
+                return self.too_many_requests_response(rejection)
+
+        # Verify payment
+        try:
+            with instrumentation.span(
+                "x402.verify", route=self.route, network=payment.network
+            ) as span:
+                verify_response = await self.facilitator.verify(
+                    payment, selected_payment_requirements
+                )
+                span.set_attribute("valid", verify_response.is_valid)
+        finally:
+            if self.admission is not None:
+                self.admission.release()
+        instrumentation.count(
+            "x402.verify.result",
+            route=self.route,
+            valid=verify_response.is_valid,
+            reason=verify_response.invalid_reason,
+        )
+
+        if not verify_response.is_valid:
+            error_reason = verify_response.invalid_reason or "Unknown error"
+            return x402_response(f"Invalid payment: {error_reason}", "invalid")
+
+        request.state.verify_response = verify_response
+        if self.upto is not None:
+            self.upto.open(payment)
+            state = self.upto.reserve(
+                payment, int(selected_payment_requirements.max_amount_required)
+            )
+            if state == "exhausted":
+                return x402_response("Payment authorization exhausted", "exhausted")
+            if state != "reserved":
+                return x402_response("Payment authorization already in use", "in_use")
+            return self.start_metering(
+                request, payment, selected_payment_requirements, requirements_entry
+            )
+
+        # Aggregated payments settle later, grant access right away
+        if self.aggregator is not None and not self.aggregator.record(
+            payment, selected_payment_requirements
+        ):
+            return x402_response("Payment already used", "replay")
+
+        request.state.payment_details = selected_payment_requirements
+
+        settlement = None
+        if self.speculative_settle:
+            settlement = self.start_settlement(payment, selected_payment_requirements)
+
+        return _VerifiedPayment(
+            payment,
+            selected_payment_requirements,
+            requirements_entry,
+            settlement,
+            self.aggregator is not None,
+        )
+
+    def start_metering(
+        self,
+        request: Request,
+        payment: PaymentPayload,
+        payment_requirements: PaymentRequirements,
+        requirements_entry: PaymentRequirementsEntry,
+    ) -> "_VerifiedPayment":
+        """Give a request paid with a reserved upto authorization its meter"""
+        meter = UsageMeter()
+        request.state.payment_details = payment_requirements
+        request.state.x402_meter = meter
+        return _VerifiedPayment(
+            payment, payment_requirements, requirements_entry, None, meter=meter
+        )
+
+    def finish_metering(self, verified: "_VerifiedPayment", succeeded: bool) -> None:
+        """Charge the usage of a metered request, or release its reservation
+        if it did not succeed. Only the first call has an effect."""
+        meter = verified.meter
+        if meter is None or meter.finished:
+            return
+        assert self.upto is not None and self.aggregator is not None
+        meter.finished = True
+        reserved = int(verified.requirements.max_amount_required)
+        if not succeeded:
+            self.upto.release(verified.payment, reserved)
+            return
+
+        assert self.metering is not None
+        cost = meter.cost(self.metering, reserved)
+        consumed = self.upto.charge(verified.payment, reserved, cost)
+        instrumentation.count("x402.metering.charged", cost, route=self.route)
+        if consumed == 0:
+            return
+        # Settle everything consumed so far, replacing the pending amount
+        requirements = verified.requirements.model_copy(
+            update={"max_amount_required": str(consumed)}
+        )
+        if not self.aggregator.record(verified.payment, requirements, replace=True):
+            logger.warning(
+                f"Usage of {cost} not charged, its authorization is already settling"
+            )
+
+    async def settle(
+        self, payment: PaymentPayload, payment_requirements: PaymentRequirements
+    ) -> SettleResponse:
+        outcome, reason = "error", None
+        try:
+            with instrumentation.span(
+                "x402.settle", route=self.route, network=payment.network
+            ) as span:
+                settle_response = await self.facilitator.settle(
+                    payment, payment_requirements
+                )
+                span.set_attribute("success", settle_response.success)
+            outcome = "success" if settle_response.success else "failure"
+            reason = settle_response.error_reason
+            if settle_response.success:
+                instrumentation.count(
+                    "x402.revenue",
+                    settled_amount(payment, payment_requirements),
+                    route=self.route,
+                    network=payment.network,
+                    asset=payment_requirements.asset,
+                )
+            return settle_response
+        finally:
+            instrumentation.count(
+                "x402.settle.result", route=self.route, outcome=outcome, reason=reason
+            )
+
+    def start_settlement(
+        self, payment: PaymentPayload, payment_requirements: PaymentRequirements
+    ) -> "asyncio.Future[SettleResponse]":
+        return asyncio.ensure_future(self.settle(payment, payment_requirements))
+
+    async def refund_if_settled(self, verified: "_VerifiedPayment"):
+        if verified.meter is not None:
+            self.finish_metering(verified, succeeded=False)
+            return None
+        if verified.aggregated:
+            # Not settled yet, so it only needs dropping from the ledger
+            assert self.aggregator is not None
+            self.aggregator.cancel(verified.payment)
+            return None
+        if verified.settlement is None:
+            return None
+        return await _refund_if_settled(
+            verified.settlement,
+            verified.payment,
+            verified.requirements,
+            self.refund_hook,
+        )
+
+    def use_streaming(self, scope: Scope, content_type: str) -> Optional[bool]:
+        """Decide how to deliver the receipt for a response in streaming mode.
+
+        Returns None if the response should settle before being sent, True to
+        send the receipt as a trailer and False to send it as an SSE event.
+        """
+        if not self.stream_settlement:
+            return None
+        if content_type.startswith("text/event-stream"):
+            # Event stream consumers such as EventSource cannot read trailers
+            return False
+        if "http.response.trailers" in scope.get("extensions", {}):
+            return True
+        return None
+
+
+class _VerifiedPayment(NamedTuple):
+    payment: PaymentPayload
+    requirements: PaymentRequirements
+    requirements_entry: PaymentRequirementsEntry
+    settlement: Optional["asyncio.Future[SettleResponse]"]
+    aggregated: bool = False
+    meter: Optional[UsageMeter] = None
+
+
+async def _metered_body(
+    gate: _PaymentGate, verified: _VerifiedPayment, body: AsyncIterator[bytes]
+) -> AsyncIterator[bytes]:
+    """Count the bytes of a metered response and charge its usage once sent,
+    or once the client goes away"""
+    assert verified.meter is not None
+    try:
+        async for chunk in body:
+            verified.meter.bytes += len(chunk)
+            yield chunk
+    finally:
+        gate.finish_metering(verified, succeeded=True)
+
 
 @validate_call
 def require_payment(
-    price: Price,
+    price: DynamicPrice,
     pay_to_address: str,
     path: str | list[str] = "*",
     description: str = "",
@@ -45,6 +633,18 @@ def require_payment(
     resource: Optional[str] = None,
     paywall_config: Optional[PaywallConfig] = None,
     custom_paywall_html: Optional[str] = None,
+    price_tier_key: Optional[PriceTierKeyCallable] = None,
+    stream_settlement: bool = False,
+    speculative_settle: bool = False,
+    refund_hook: Optional[RefundHook] = None,
+    facilitator: Optional[Any] = None,
+    max_payment_header_size: int = DEFAULT_MAX_HEADER_SIZE,
+    max_payment_header_depth: int = DEFAULT_MAX_DEPTH,
+    admission: Optional[AdmissionConfig] = None,
+    session: Optional[SessionConfig] = None,
+    aggregation: Optional[AggregationConfig] = None,
+    metering: Optional[MeteringConfig] = None,
+    options: Optional[list[PaymentOption]] = None,
 ):
     """Generate a FastAPI middleware that gates payments for an endpoint.
 
@@ -52,6 +652,8 @@ def require_payment(
         price (Price): Payment price. Can be:
             - Money: USD amount as string/int (e.g., "$3.10", 0.10, "0.001") - defaults to USDC
             - TokenAmount: Custom token amount with asset information
+            - Callable: Function taking the Request and returning one of the above,
+              for per-request pricing
         pay_to_address (str): Ethereum address to receive the payment
         path (str | list[str], optional): Path to gate with payments. Defaults to "*" for all paths.
         description (str, optional): Description of what is being purchased. Defaults to "".
@@ -67,153 +669,392 @@ def require_payment(
         paywall_config (Optional[PaywallConfig], optional): Configuration for paywall UI customization.
             Includes options like cdp_client_key, app_name, app_logo, session_token_endpoint.
         custom_paywall_html (Optional[str], optional): Custom HTML to display for paywall instead of default.
+        price_tier_key (Optional[Callable], optional): For callable prices, function taking the Request and
+            returning a hashable pricing tier. Requirements are cached per tier so the price callable only
+            runs once per tier. Defaults to None (price callable runs on every request).
+        stream_settlement (bool, optional): Start sending server-sent event streams (and any response when the
+            server supports HTTP trailers) before settlement completes. The payment settles while the body is
+            transmitted and the receipt is sent as an X-PAYMENT-RESPONSE trailer or a final
+            `x402-payment-response` event. Cannot be combined with `session`. Defaults to False.
+        speculative_settle (bool, optional): Start settling right after verification, concurrently with the
+            handler, so paid requests take roughly max(handler, settle) instead of their sum. Only use this for
+            idempotent resources that are cheap to refund: if the handler fails or returns a non-2xx status
+            after the payment settled, the handler's response is returned with the X-PAYMENT-RESPONSE receipt
+            and `refund_hook` is called. Defaults to False.
+        refund_hook (Optional[Callable], optional): Called with (payment, payment_requirements, settle_response)
+            when a speculatively settled payment needs refunding. May be async. Defaults to None.
+        facilitator (Optional[Any], optional): Object with async `verify` and `settle` methods to use instead
+            of a FacilitatorClient built from `facilitator_config`, e.g. a LocalFacilitator. Defaults to None.
+        max_payment_header_size (int, optional): X-PAYMENT headers longer than this are rejected before
+            decoding. Defaults to 8 KiB.
+        max_payment_header_depth (int, optional): X-PAYMENT headers whose JSON nests deeper than this are
+            rejected before parsing. Defaults to 8.
+        admission (Optional[AdmissionConfig], optional): Rate limits per payer address and client IP and a
+            limit on concurrent verifications, applied before calling the facilitator. Rejected attempts get
+            a 429 with Retry-After. Defaults to None (no limits).
+        session (Optional[SessionConfig], optional): Sell prepaid sessions instead of single calls: `price`
+            buys `session["calls"]` calls, and the paid response returns an X-PAYMENT-SESSION token that pays
+            for the remaining ones without contacting the facilitator. Cannot be combined with
+            `stream_settlement`. Defaults to None.
+        aggregation (Optional[AggregationConfig], optional): Serve verified payments right away and settle them
+            later in batches, recorded in a ledger under `aggregation["directory"]`. Responses carry no
+            X-PAYMENT-RESPONSE receipt. Reused authorizations are only rejected within one process, so under a
+            multi-worker server an authorization can be served once per worker until it settles. Cannot be
+            combined with `speculative_settle`. Defaults to None.
+        metering (Optional[MeteringConfig], optional): Charge for usage with the `upto` scheme. `price` becomes
+            the most one request can cost; handlers count usage on `request.state.x402_meter` and the consumed
+            total of each authorization settles later as with `aggregation`, which configures the ledger.
+            Cannot be combined with `speculative_settle` or `session`. Defaults to None.
+        options (Optional[list[PaymentOption]], optional): Further {"network", "price"} pairs to accept, e.g. the
+            same resource priced in USDC on several chains. The 402 response lists `price` on `network` first,
+            then each option, and payments on any of them are accepted. Defaults to None.
 
     Returns:
         Callable: FastAPI middleware function that checks for valid payment before processing requests
     """
 
-    # Validate network is supported
-    supported_networks = get_args(SupportedNetworks)
-    if network not in supported_networks:
-        raise ValueError(
-            f"Unsupported network: {network}. Must be one of: {supported_networks}"
-        )
-
-    try:
-        max_amount_required, asset_address, eip712_domain = (
-            process_price_to_atomic_amount(price, network)
-        )
-    except Exception as e:
-        raise ValueError(f"Invalid price: {price}. Error: {e}")
-
-    facilitator = FacilitatorClient(facilitator_config)
+    gate = _PaymentGate(
+        price=price,
+        pay_to_address=pay_to_address,
+        path=path,
+        description=description,
+        mime_type=mime_type,
+        max_deadline_seconds=max_deadline_seconds,
+        input_schema=input_schema,
+        output_schema=output_schema,
+        discoverable=discoverable,
+        facilitator_config=facilitator_config,
+        network=network,
+        resource=resource,
+        paywall_config=paywall_config,
+        custom_paywall_html=custom_paywall_html,
+        price_tier_key=price_tier_key,
+        stream_settlement=stream_settlement,
+        speculative_settle=speculative_settle,
+        refund_hook=refund_hook,
+        facilitator=facilitator,
+        max_payment_header_size=max_payment_header_size,
+        max_payment_header_depth=max_payment_header_depth,
+        admission=admission,
+        session=session,
+        aggregation=aggregation,
+        metering=metering,
+        options=options,
+    )
 
     async def middleware(request: Request, call_next: Callable):
         # Skip if the path is not the same as the path in the middleware
-        if not path_is_match(path, request.url.path):
+        if not gate.matches(request.url.path):
             return await call_next(request)
 
-        # Get resource URL if not explicitly provided
-        resource_url = resource or str(request.url)
-
-        # Construct payment details
-        payment_requirements = [
-            PaymentRequirements(
-                scheme="exact",
-                network=cast(SupportedNetworks, network),
-                asset=asset_address,
-                max_amount_required=max_amount_required,
-                resource=resource_url,
-                description=description,
-                mime_type=mime_type,
-                pay_to=pay_to_address,
-                max_timeout_seconds=max_deadline_seconds,
-                # TODO: Rename output_schema to request_structure
-                output_schema={
-                    "input": {
-                        "type": "http",
-                        "method": request.method.upper(),
-                        "discoverable": discoverable
-                        if discoverable is not None
-                        else True,
-                        **(input_schema.model_dump() if input_schema else {}),
-                    },
-                    "output": output_schema,
-                },
-                extra=eip712_domain,
-            )
-        ]
-
-        def x402_response(error: str):
-            """Create a 402 response with payment requirements."""
-            request_headers = dict(request.headers)
-            status_code = 402
-
-            if is_browser_request(request_headers):
-                html_content = custom_paywall_html or get_paywall_html(
-                    error, payment_requirements, paywall_config
+        grant = gate.redeem_session(request)
+        if grant is not None:
+            return await _call_with_session(gate, grant, request, call_next)
+
+        verified = await gate.authorize(request)
+        if isinstance(verified, Response):
+            return verified
+
+        # Process the request
+        try:
+            with instrumentation.span("x402.handler", route=gate.route):
+                response = await call_next(request)
+        except Exception:
+            await gate.refund_if_settled(verified)
+            raise
+
+        # Early return without settling if the response is not a 2xx
+        if response.status_code < 200 or response.status_code >= 300:
+            settle_response = await gate.refund_if_settled(verified)
+            if settle_response is not None:
+                response.headers["X-PAYMENT-RESPONSE"] = settlement_header(
+                    settle_response
+                )
+            return response
+
+        if verified.meter is not None:
+            response.body_iterator = _metered_body(  # type: ignore[attr-defined]
+                gate,
+                verified,
+                response.body_iterator,  # type: ignore[attr-defined]
+            )
+            return response
+
+        if verified.aggregated:
+            session_token = gate.issue_session(verified)
+            if session_token is not None:
+                response.headers[SESSION_HEADER] = session_token
+            return response
+
+        use_trailers = gate.use_streaming(
+            request.scope, response.headers.get("content-type", "")
+        )
+        if use_trailers is not None:
+            # Settle while the body is being sent instead of before the first byte
+            settlement = verified.settlement
+            if settlement is None:
+                settlement = gate.start_settlement(
+                    verified.payment, verified.requirements
                 )
-                headers = {"Content-Type": "text/html; charset=utf-8"}
+            return SettlementStreamingResponse(response, settlement, use_trailers)
 
-                return HTMLResponse(
-                    content=html_content,
-                    status_code=status_code,
-                    headers=headers,
+        # Settle the payment
+        try:
+            if verified.settlement is not None:
+                settle_response = await verified.settlement
+            else:
+                settle_response = await gate.settle(
+                    verified.payment, verified.requirements
+                )
+            if settle_response.success:
+                response.headers["X-PAYMENT-RESPONSE"] = settlement_header(
+                    settle_response
                 )
+                session_token = gate.issue_session(verified)
+                if session_token is not None:
+                    response.headers[SESSION_HEADER] = session_token
             else:
-                response_data = x402PaymentRequiredResponse(
-                    x402_version=x402_VERSION,
-                    accepts=payment_requirements,
-                    error=error,
-                ).model_dump(by_alias=True)
-                headers = {"Content-Type": "application/json"}
-
-                return JSONResponse(
-                    content=response_data,
-                    status_code=status_code,
-                    headers=headers,
+                return gate.payment_required_response(
+                    request,
+                    verified.requirements_entry,
+                    "Settle failed: "
+                    + (settle_response.error_reason or "Unknown error"),
+                    "settle_failed",
                 )
+        except Exception:
+            return gate.payment_required_response(
+                request, verified.requirements_entry, "Settle failed", "settle_failed"
+            )
 
-        # Check for payment header
-        payment_header = request.headers.get("X-PAYMENT", "")
+        return response
 
-        if payment_header == "":
-            return x402_response("No X-PAYMENT header provided")
+    return middleware
 
-        # Decode payment header
-        try:
-            payment_dict = json.loads(safe_base64_decode(payment_header))
-            payment = PaymentPayload(**payment_dict)
-        except Exception as e:
-            logger.warning(
-                f"Invalid payment header format from {request.client.host if request.client else 'unknown'}: {str(e)}"
-            )
-            return x402_response("Invalid payment header format")
 
-        # Find matching payment requirements
-        selected_payment_requirements = find_matching_payment_requirements(
-            payment_requirements, payment
-        )
+async def _call_with_session(
+    gate: _PaymentGate, grant: SessionGrant, request: Request, call_next: Callable
+) -> Response:
+    """Run the handler for a call paid by a session credit, giving the
+    credit back if it does not succeed."""
+    assert gate.sessions is not None
+    try:
+        with instrumentation.span("x402.handler", route=gate.route):
+            response = await call_next(request)
+    except Exception:
+        gate.sessions.restore(grant)
+        raise
+    if response.status_code < 200 or response.status_code >= 300:
+        gate.sessions.restore(grant)
+    else:
+        response.headers[SESSION_REMAINING_HEADER] = str(grant.remaining)
+    return response
 
-        if not selected_payment_requirements:
-            return x402_response("No matching payment requirements found")
 
-        # Verify payment
-        verify_response = await facilitator.verify(
-            payment, selected_payment_requirements
+# Default keyword arguments of `require_payment`, reused by `PaymentMiddleware`
+_GATE_DEFAULTS: dict[str, Any] = {
+    name: parameter.default
+    for name, parameter in inspect.signature(require_payment).parameters.items()
+    if parameter.default is not inspect.Parameter.empty
+}
+
+
+class PaymentMiddleware:
+    """Pure ASGI middleware that gates payments for an endpoint.
+
+    Unlike `require_payment`, which is installed with `app.middleware("http")`
+    and therefore runs inside Starlette's `BaseHTTPMiddleware`, this class
+    adds no task, memory stream or `Request` object to requests whose path
+    does not match. Paid responses are passed through untouched except for
+    the `X-PAYMENT-RESPONSE` header, which is injected by wrapping `send`.
+
+    Usage:
+        app.add_middleware(
+            PaymentMiddleware,
+            price="$0.01",
+            pay_to_address="0x...",
+            path="/premium/*",
         )
 
-        if not verify_response.is_valid:
-            error_reason = verify_response.invalid_reason or "Unknown error"
-            return x402_response(f"Invalid payment: {error_reason}")
+    Accepts the same keyword arguments as `require_payment`.
+    """
 
-        request.state.payment_details = selected_payment_requirements
-        request.state.verify_response = verify_response
+    def __init__(self, app: ASGIApp, **kwargs: Any):
+        self.app = app
+        self.gate = _PaymentGate(**{**_GATE_DEFAULTS, **kwargs})
 
-        # Process the request
-        response = await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.gate.matches(scope["path"]):
+            await self.app(scope, receive, send)
+            return
 
-        # Early return without settling if the response is not a 2xx
-        if response.status_code < 200 or response.status_code >= 300:
-            return response
+        request = Request(scope, receive)
+        grant = self.gate.redeem_session(request)
+        if grant is not None:
+            await self.call_with_session(grant, scope, receive, send)
+            return
 
-        # Settle the payment
+        verified = await self.gate.authorize(request)
+        if isinstance(verified, Response):
+            await verified(scope, receive, send)
+            return
+
+        sender = _SettlingSender(self.gate, request, verified, send)
         try:
-            settle_response = await facilitator.settle(
-                payment, selected_payment_requirements
-            )
-            if settle_response.success:
-                response.headers["X-PAYMENT-RESPONSE"] = base64.b64encode(
-                    settle_response.model_dump_json(by_alias=True).encode("utf-8")
-                ).decode("utf-8")
+            with instrumentation.span("x402.handler", route=self.gate.route):
+                await self.app(scope, receive, sender)
+        except Exception:
+            await self.gate.refund_if_settled(verified)
+            raise
+        # Charge a metered response whose app returned without finishing it
+        self.gate.finish_metering(verified, succeeded=sender.mode == "metered")
+
+    async def call_with_session(
+        self, grant: SessionGrant, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        """Run the app for a call paid by a session credit, giving the credit
+        back if it does not succeed."""
+        sessions = self.gate.sessions
+        assert sessions is not None
+        succeeded = False
+
+        async def send_with_remaining(message: Message) -> None:
+            nonlocal succeeded
+            if message["type"] == "http.response.start":
+                succeeded = 200 <= message["status"] < 300
+                if succeeded:
+                    MutableHeaders(scope=message).append(
+                        SESSION_REMAINING_HEADER, str(grant.remaining)
+                    )
+            await send(message)
+
+        try:
+            with instrumentation.span("x402.handler", route=self.gate.route):
+                await self.app(scope, receive, send_with_remaining)
+        finally:
+            if not succeeded:
+                sessions.restore(grant)
+
+
+class _SettlingSender:
+    """Wraps ASGI `send` to settle a verified payment once the response
+    status is known and attach the receipt to the response."""
+
+    def __init__(
+        self,
+        gate: _PaymentGate,
+        request: Request,
+        verified: _VerifiedPayment,
+        send: Send,
+    ):
+        self.gate = gate
+        self.request = request
+        self.verified = verified
+        self.send = send
+        self.settlement = verified.settlement
+        # One of "passthrough", "stream", "metered" or "replaced" once the
+        # response starts
+        self.mode: Optional[str] = None
+        self.use_trailers = False
+
+    async def __call__(self, message: Message) -> None:
+        if self.mode == "replaced":
+            # The handler's response was replaced by a 402, drop the rest of it
+            return
+        if message["type"] == "http.response.start":
+            await self.start(message)
+        elif message["type"] == "http.response.body" and self.mode == "stream":
+            await self.stream_body(message)
+        elif message["type"] == "http.response.body" and self.mode == "metered":
+            assert self.verified.meter is not None
+            self.verified.meter.bytes += len(message.get("body", b""))
+            await self.send(message)
+            if not message.get("more_body", False):
+                self.gate.finish_metering(self.verified, succeeded=True)
+        else:
+            await self.send(message)
+
+    async def start(self, message: Message) -> None:
+        verified = self.verified
+        status = message["status"]
+        headers = MutableHeaders(scope=message)
+
+        if status < 200 or status >= 300:
+            self.mode = "passthrough"
+            settle_response = await self.gate.refund_if_settled(verified)
+            if settle_response is not None:
+                headers.append("X-PAYMENT-RESPONSE", settlement_header(settle_response))
+            await self.send(message)
+            return
+
+        if verified.meter is not None:
+            self.mode = "metered"
+            await self.send(message)
+            return
+
+        if verified.aggregated:
+            self.mode = "passthrough"
+            session_token = self.gate.issue_session(verified)
+            if session_token is not None:
+                headers.append(SESSION_HEADER, session_token)
+            await self.send(message)
+            return
+
+        use_trailers = self.gate.use_streaming(
+            self.request.scope, headers.get("content-type", "")
+        )
+        if use_trailers is not None:
+            self.mode = "stream"
+            self.use_trailers = use_trailers
+            if self.settlement is None:
+                self.settlement = self.gate.start_settlement(
+                    verified.payment, verified.requirements
+                )
+            _keep_until_done(self.settlement)
+            if use_trailers:
+                headers.append("Trailer", "X-PAYMENT-RESPONSE")
+                message["trailers"] = True
             else:
-                return x402_response(
-                    "Settle failed: "
-                    + (settle_response.error_reason or "Unknown error")
+                # The receipt event makes the body longer than the app's
+                del headers["content-length"]
+            await self.send(message)
+            return
+
+        # Settle the payment before the response headers go out
+        error = None
+        try:
+            if self.settlement is not None:
+                settle_response = await self.settlement
+            else:
+                settle_response = await self.gate.settle(
+                    verified.payment, verified.requirements
+                )
+            if not settle_response.success:
+                error = "Settle failed: " + (
+                    settle_response.error_reason or "Unknown error"
                 )
         except Exception:
-            return x402_response("Settle failed")
+            error = "Settle failed"
 
-        return response
+        if error is not None:
+            self.mode = "replaced"
+            response = self.gate.payment_required_response(
+                self.request, verified.requirements_entry, error, "settle_failed"
+            )
+            await response(self.request.scope, self.request.receive, self.send)
+            return
 
-    return middleware
+        self.mode = "passthrough"
+        headers.append("X-PAYMENT-RESPONSE", settlement_header(settle_response))
+        session_token = self.gate.issue_session(verified)
+        if session_token is not None:
+            headers.append(SESSION_HEADER, session_token)
+        await self.send(message)
+
+    async def stream_body(self, message: Message) -> None:
+        if message.get("more_body", False):
+            await self.send(message)
+            return
+        if message.get("body"):
+            await self.send({**message, "more_body": True})
+        assert self.settlement is not None
+        await _send_receipt(self.send, self.settlement, self.use_trailers)
@@ -0,0 +1,19 @@
+from typing import Callable
+
+from flask import Response
+
+from x402.metrics import CONTENT_TYPE, MetricsRegistry
+
+
+def metrics_view(registry: MetricsRegistry) -> Callable[[], Response]:
+    """Create a view serving the registry in the Prometheus text format.
+
+    Usage:
+        registry = enable_metrics()
+        app.add_url_rule("/metrics", view_func=metrics_view(registry))
+    """
+
+    def metrics() -> Response:
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+    return metrics
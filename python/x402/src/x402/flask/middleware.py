@@ -1,25 +1,97 @@
-import base64
+import asyncio
+import atexit
+import inspect
 import json
-from typing import Any, Dict, Optional, Union, get_args, cast
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Union, get_args
 from flask import Flask, request, g
+from x402 import instrumentation
+from x402.admission import AdmissionConfig, AdmissionController
+from x402.aggregation import AggregationConfig, PaymentAggregator
+from x402.metering import MeteringConfig, UsageMeter
 from x402.path import path_is_match
+from x402.schemes import payment_payer, settled_amount
 from x402.types import (
-    Price,
     PaymentPayload,
     PaymentRequirements,
-    x402PaymentRequiredResponse,
     PaywallConfig,
+    RefundHook,
+    SettleResponse,
     SupportedNetworks,
     HTTPInputSchema,
+    VerifyResponse,
 )
-from x402.common import (
-    process_price_to_atomic_amount,
-    x402_VERSION,
-    find_matching_payment_requirements,
+from x402.upto import UptoTracker
+from x402.common import settlement_header
+from x402.requirements import (
+    DynamicPrice,
+    PaymentOption,
+    PaymentRequirementsCache,
+    PriceTierKeyCallable,
+)
+from x402.decoding import (
+    DEFAULT_MAX_DEPTH,
+    DEFAULT_MAX_HEADER_SIZE,
+    PaymentHeaderDecoder,
 )
-from x402.encoding import safe_base64_decode
 from x402.facilitator import FacilitatorClient, FacilitatorConfig
 from x402.paywall import is_browser_request, get_paywall_html
+from x402.sessions import (
+    SESSION_HEADER,
+    SESSION_REMAINING_HEADER,
+    SessionConfig,
+    SessionManager,
+)
+
+logger = logging.getLogger(__name__)
+
+# Runs speculative settlements alongside the WSGI handler, created on first use
+# and shut down at exit once the settlements in flight have finished
+_settle_executor: Optional[ThreadPoolExecutor] = None
+_settle_executor_lock = threading.Lock()
+
+
+def _get_settle_executor() -> ThreadPoolExecutor:
+    global _settle_executor
+    with _settle_executor_lock:
+        if _settle_executor is None:
+            _settle_executor = ThreadPoolExecutor(thread_name_prefix="x402-settle")
+            atexit.register(_settle_executor.shutdown)
+        return _settle_executor
+
+
+def _refund_if_settled(
+    settlement: "Future[SettleResponse]",
+    payment: PaymentPayload,
+    payment_requirements: PaymentRequirements,
+    refund_hook: Optional[RefundHook],
+) -> Optional[SettleResponse]:
+    """Wait for a speculative settlement whose handler failed.
+
+    Returns the settle response if the payment went through, after handing it
+    to the refund hook, or None if settlement failed.
+    """
+    try:
+        settle_response = settlement.result()
+    except Exception as e:
+        logger.warning(f"Speculative settle failed: {e}")
+        return None
+    if not settle_response.success:
+        return None
+
+    logger.warning(
+        f"Payment {settle_response.transaction} settled but the handler failed, refund required"
+    )
+    if refund_hook is not None:
+        try:
+            result = refund_hook(payment, payment_requirements, settle_response)
+            if inspect.isawaitable(result):
+                asyncio.run(result)  # type: ignore[arg-type]
+        except Exception:
+            logger.exception("Refund hook failed")
+    return settle_response
 
 
 class ResponseWrapper:
@@ -41,6 +113,29 @@ class ResponseWrapper:
         self.headers.append((name, value))
 
 
+class _MeteredBody:
+    """Counts the bytes of a metered response and charges its usage once the
+    server closes it."""
+
+    def __init__(self, body, meter: UsageMeter, finish):
+        self.body = body
+        self.meter = meter
+        self.finish = finish
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.meter.bytes += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            close = getattr(self.body, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self.finish()
+
+
 class PaymentMiddleware:
     """
     Flask middleware for x402 payment requirements.
@@ -58,7 +153,7 @@ class PaymentMiddleware:
 
     def add(
         self,
-        price: Price,
+        price: DynamicPrice,
         pay_to_address: str,
         path: Union[str, list[str]] = "*",
         description: str = "",
@@ -72,12 +167,24 @@ class PaymentMiddleware:
         resource: Optional[str] = None,
         paywall_config: Optional[PaywallConfig] = None,
         custom_paywall_html: Optional[str] = None,
+        price_tier_key: Optional[PriceTierKeyCallable] = None,
+        speculative_settle: bool = False,
+        refund_hook: Optional[RefundHook] = None,
+        facilitator: Optional[Any] = None,
+        max_payment_header_size: int = DEFAULT_MAX_HEADER_SIZE,
+        max_payment_header_depth: int = DEFAULT_MAX_DEPTH,
+        admission: Optional[AdmissionConfig] = None,
+        session: Optional[SessionConfig] = None,
+        aggregation: Optional[AggregationConfig] = None,
+        metering: Optional[MeteringConfig] = None,
+        options: Optional[list[PaymentOption]] = None,
     ):
         """
         Add a payment middleware configuration.
 
         Args:
-            price (Price): Payment price (USD or TokenAmount)
+            price (Price | Callable): Payment price (USD or TokenAmount), or a function taking the
+                Flask request and returning one for per-request pricing
             pay_to_address (str): Ethereum address to receive payment
             path (str | list[str], optional): Path(s) to protect. Defaults to "*".
             description (str, optional): Description of the resource
@@ -91,7 +198,47 @@ class PaymentMiddleware:
             resource (str, optional): Resource URL
             paywall_config (PaywallConfig, optional): Paywall UI customization config
             custom_paywall_html (str, optional): Custom HTML to display for paywall instead of default
+            price_tier_key (Callable, optional): For callable prices, function taking the Flask request
+                and returning a hashable pricing tier. Requirements are cached per tier.
+            speculative_settle (bool, optional): Settle concurrently with the handler instead of after it.
+                Only for idempotent, cheap-to-refund resources: if the handler does not return a 2xx after
+                the payment settled, its response is returned with the receipt and `refund_hook` is called.
+            refund_hook (Callable, optional): Called with (payment, payment_requirements, settle_response)
+                when a speculatively settled payment needs refunding
+            facilitator (optional): Object with async `verify` and `settle` methods to use instead of
+                a FacilitatorClient built from `facilitator_config`, e.g. a LocalFacilitator
+            max_payment_header_size (int, optional): X-PAYMENT headers longer than this are rejected
+                before decoding. Defaults to 8 KiB.
+            max_payment_header_depth (int, optional): X-PAYMENT headers whose JSON nests deeper than
+                this are rejected before parsing. Defaults to 8.
+            admission (AdmissionConfig, optional): Rate limits per payer address and client IP and a
+                limit on concurrent verifications, applied before calling the facilitator. Rejected
+                attempts get a 429 with Retry-After.
+            session (SessionConfig, optional): Sell prepaid sessions instead of single calls: `price`
+                buys `session["calls"]` calls, and the paid response returns an X-PAYMENT-SESSION token
+                that pays for the remaining ones without contacting the facilitator.
+            aggregation (AggregationConfig, optional): Serve verified payments right away and settle
+                them later in batches, recorded in a ledger under `aggregation["directory"]`. Responses
+                carry no X-PAYMENT-RESPONSE receipt. Reused authorizations are only rejected within
+                one process, so under a multi-worker server an authorization can be served once per
+                worker until it settles. Cannot be combined with `speculative_settle`.
+            metering (MeteringConfig, optional): Charge for usage with the `upto` scheme. `price`
+                becomes the most one request can cost; handlers count usage on `g.x402_meter` and the
+                consumed total of each authorization settles later as with `aggregation`, which
+                configures the ledger. Cannot be combined with `speculative_settle` or `session`.
+            options (list[PaymentOption], optional): Further {"network", "price"} pairs to accept,
+                listed after `price` on `network` in the 402 response. Payments on any of them
+                are accepted.
         """
+        if aggregation is not None and speculative_settle:
+            raise ValueError("aggregation and speculative_settle cannot be combined")
+        if metering is not None:
+            if not metering.get("spender"):
+                raise ValueError("Metering config requires a spender")
+            if speculative_settle or session is not None:
+                raise ValueError(
+                    "metering cannot be combined with speculative_settle or session"
+                )
         config = {
             "price": price,
             "pay_to_address": pay_to_address,
@@ -107,6 +254,17 @@ class PaymentMiddleware:
             "resource": resource,
             "paywall_config": paywall_config,
             "custom_paywall_html": custom_paywall_html,
+            "price_tier_key": price_tier_key,
+            "speculative_settle": speculative_settle,
+            "refund_hook": refund_hook,
+            "facilitator": facilitator,
+            "max_payment_header_size": max_payment_header_size,
+            "max_payment_header_depth": max_payment_header_depth,
+            "admission": admission,
+            "session": session,
+            "aggregation": aggregation,
+            "metering": metering,
+            "options": options,
         }
         self.middleware_configs.append(config)
 
@@ -127,30 +285,165 @@ class PaymentMiddleware:
     def _create_middleware(self, config: Dict[str, Any], next_app):
         """Create a WSGI middleware function for the given configuration."""
 
-        # Validate network is supported
+        # Validate networks are supported
         supported_networks = get_args(SupportedNetworks)
-        if config["network"] not in supported_networks:
-            raise ValueError(
-                f"Unsupported network: {config['network']}. Must be one of: {supported_networks}"
-            )
+        options = config.get("options") or []
+        for network in [config["network"], *(o["network"] for o in options)]:
+            if network not in supported_networks:
+                raise ValueError(
+                    f"Unsupported network: {network}. Must be one of: {supported_networks}"
+                )
 
         # Process price configuration (same as FastAPI)
         try:
-            max_amount_required, asset_address, eip712_domain = (
-                process_price_to_atomic_amount(config["price"], config["network"])
+            requirements_cache = PaymentRequirementsCache(
+                price=config["price"],
+                pay_to_address=config["pay_to_address"],
+                network=config["network"],
+                description=config["description"],
+                mime_type=config["mime_type"],
+                max_deadline_seconds=config["max_deadline_seconds"],
+                input_schema=config["input_schema"],
+                output_schema=config["output_schema"],
+                discoverable=config.get("discoverable", True),
+                price_tier_key=config.get("price_tier_key"),
+                scheme="upto" if config.get("metering") is not None else "exact",
+                extra=(
+                    {"spender": config["metering"]["spender"]}
+                    if config.get("metering") is not None
+                    else None
+                ),
+                options=options,
             )
         except Exception as e:
             raise ValueError(f"Invalid price: {config['price']}. Error: {e}")
 
-        facilitator = FacilitatorClient(config["facilitator_config"])
+        facilitator = config.get("facilitator") or FacilitatorClient(
+            config["facilitator_config"]
+        )
+        header_decoder = PaymentHeaderDecoder(
+            config.get("max_payment_header_size", DEFAULT_MAX_HEADER_SIZE),
+            config.get("max_payment_header_depth", DEFAULT_MAX_DEPTH),
+        )
+        admission = (
+            AdmissionController(config["admission"])
+            if config.get("admission") is not None
+            else None
+        )
+        path = config["path"]
+        sessions = (
+            SessionManager(config["session"], path)
+            if config.get("session") is not None
+            else None
+        )
+        # Low-cardinality route label for instrumentation
+        route = path if isinstance(path, str) else ",".join(path)
+        metering = config.get("metering")
+        aggregator = (
+            PaymentAggregator(config["aggregation"], facilitator, route)
+            if config.get("aggregation") is not None and metering is None
+            else None
+        )
+        # Metered usage always settles later, once per authorization
+        upto = UptoTracker() if metering is not None else None
+        if upto is not None:
+            aggregator = PaymentAggregator(
+                config.get("aggregation") or {},
+                facilitator,
+                route,
+                on_settling=upto.close,
+            )
+
+        def finish_metering(
+            payment: PaymentPayload,
+            payment_requirements: PaymentRequirements,
+            meter: UsageMeter,
+            succeeded: bool,
+        ) -> None:
+            """Charge the usage of a metered request, or release its reservation
+            if it did not succeed. Only the first call has an effect."""
+            if meter.finished:
+                return
+            assert upto is not None and aggregator is not None
+            meter.finished = True
+            reserved = int(payment_requirements.max_amount_required)
+            if not succeeded:
+                upto.release(payment, reserved)
+                return
+
+            cost = meter.cost(metering, reserved)
+            consumed = upto.charge(payment, reserved, cost)
+            instrumentation.count("x402.metering.charged", cost, route=route)
+            if consumed == 0:
+                return
+            # Settle everything consumed so far, replacing the pending amount
+            requirements = payment_requirements.model_copy(
+                update={"max_amount_required": str(consumed)}
+            )
+            if not aggregator.record(payment, requirements, replace=True):
+                logger.warning(
+                    f"Usage of {cost} not charged, its authorization is already settling"
+                )
+
+        async def settle(
+            payment: PaymentPayload, payment_requirements: PaymentRequirements
+        ) -> SettleResponse:
+            outcome, reason = "error", None
+            try:
+                with instrumentation.span(
+                    "x402.settle", route=route, network=payment.network
+                ) as span:
+                    settle_response = await facilitator.settle(
+                        payment, payment_requirements
+                    )
+                    span.set_attribute("success", settle_response.success)
+                outcome = "success" if settle_response.success else "failure"
+                reason = settle_response.error_reason
+                if settle_response.success:
+                    instrumentation.count(
+                        "x402.revenue",
+                        settled_amount(payment, payment_requirements),
+                        route=route,
+                        network=payment.network,
+                        asset=payment_requirements.asset,
+                    )
+                return settle_response
+            finally:
+                instrumentation.count(
+                    "x402.settle.result", route=route, outcome=outcome, reason=reason
+                )
 
         def middleware(environ, start_response):
             # Create Flask request context
             with self.app.request_context(environ):
                 # Skip if the path is not the same as the path in the middleware
-                if not path_is_match(config["path"], request.path):
+                if not path_is_match(path, request.path):
                     return next_app(environ, start_response)
 
+                # Calls paid by a session credit skip verification and settlement
+                grant = (
+                    sessions.redeem(request.headers.get(SESSION_HEADER))
+                    if sessions is not None
+                    else None
+                )
+                if grant is not None:
+                    assert sessions is not None
+                    response_wrapper = ResponseWrapper(start_response)
+                    try:
+                        with instrumentation.span("x402.handler", route=route):
+                            response = next_app(environ, response_wrapper)
+                    except Exception:
+                        sessions.restore(grant)
+                        raise
+                    status_code = response_wrapper.status_code
+                    if status_code is not None and 200 <= status_code < 300:
+                        response_wrapper.add_header(
+                            SESSION_REMAINING_HEADER, str(grant.remaining)
+                        )
+                    else:
+                        sessions.restore(grant)
+                    return response
+
                 # Get resource URL if not explicitly provided
                 original_uri = request.headers.get("X-Original-URI")
                 if original_uri:
@@ -160,112 +453,194 @@ class PaymentMiddleware:
                     # Fallback to request.url if the header is not present
                     resource_url = config["resource"] or request.url
 
-                # Construct payment details
-                payment_requirements = [
-                    PaymentRequirements(
-                        scheme="exact",
-                        network=cast(SupportedNetworks, config["network"]),
-                        asset=asset_address,
-                        max_amount_required=max_amount_required,
-                        resource=resource_url,
-                        description=config["description"],
-                        mime_type=config["mime_type"],
-                        pay_to=config["pay_to_address"],
-                        max_timeout_seconds=config["max_deadline_seconds"],
-                        # TODO: Rename output_schema to request_structure
-                        output_schema={
-                            "input": {
-                                "type": "http",
-                                "method": request.method.upper(),
-                                "discoverable": config.get("discoverable", True),
-                                **(
-                                    config["input_schema"].model_dump()
-                                    if config["input_schema"]
-                                    else {}
-                                ),
-                            },
-                            "output": config["output_schema"],
-                        },
-                        extra=eip712_domain,
+                # Payment details are cached per pricing tier, resource and method
+                with instrumentation.span("x402.requirements", route=route):
+                    requirements_entry = requirements_cache.get(
+                        request, resource_url, request.method.upper()
                     )
-                ]
+                payment_requirements = requirements_entry.requirements
+
+                def x402_response(error: str, reason: str):
+                    """Create a 402 response with payment requirements.
 
-                def x402_response(error: str):
-                    """Create a 402 response with payment requirements."""
+                    ``reason`` is a fixed code used as the metric label, the
+                    detailed ``error`` only goes in the response body.
+                    """
                     request_headers = dict(request.headers)
                     status = "402 Payment Required"
+                    instrumentation.count(
+                        "x402.payment_required", route=route, reason=reason
+                    )
 
                     if is_browser_request(request_headers):
-                        html_content = config[
-                            "custom_paywall_html"
-                        ] or get_paywall_html(
-                            error, payment_requirements, config["paywall_config"]
-                        )
+                        with instrumentation.span("x402.paywall", route=route):
+                            html_content = config[
+                                "custom_paywall_html"
+                            ] or get_paywall_html(
+                                error, payment_requirements, config["paywall_config"]
+                            )
                         headers = [("Content-Type", "text/html; charset=utf-8")]
 
                         start_response(status, headers)
                         return [html_content.encode("utf-8")]
                     else:
-                        response_data = x402PaymentRequiredResponse(
-                            x402_version=x402_VERSION,
-                            accepts=payment_requirements,
-                            error=error,
-                        ).model_dump(by_alias=True)
-
+                        body = requirements_entry.json_body(error)
                         headers = [
                             ("Content-Type", "application/json"),
-                            ("Content-Length", str(len(json.dumps(response_data)))),
+                            ("Content-Length", str(len(body))),
                         ]
 
                         start_response(status, headers)
-                        return [json.dumps(response_data).encode("utf-8")]
+                        return [body]
 
                 # Check for payment header
                 payment_header = request.headers.get("X-PAYMENT", "")
 
                 if payment_header == "":
-                    return x402_response("No X-PAYMENT header provided")
+                    return x402_response(
+                        "No X-PAYMENT header provided", "missing_header"
+                    )
 
                 # Decode payment header
                 try:
-                    payment_dict = json.loads(safe_base64_decode(payment_header))
-                    payment = PaymentPayload(**payment_dict)
+                    with instrumentation.span("x402.decode", route=route):
+                        payment = header_decoder.decode(payment_header)
                 except Exception as e:
-                    return x402_response(f"Invalid payment header format: {str(e)}")
+                    return x402_response(
+                        f"Invalid payment header format: {str(e)}", "bad_header"
+                    )
 
                 # Find matching payment requirements
-                selected_payment_requirements = find_matching_payment_requirements(
-                    payment_requirements, payment
-                )
+                selected_payment_requirements = requirements_entry.match(payment)
 
                 if not selected_payment_requirements:
-                    return x402_response("No matching payment requirements found")
+                    return x402_response(
+                        "No matching payment requirements found", "no_match"
+                    )
 
-                # Verify payment (async call in sync context)
-                import asyncio
+                # Upto authorizations are verified once and reused until exhausted.
+                # Payloads that differ from the verified one are verified below.
+                meter: Optional[UsageMeter] = None
+                verify_response: Optional[VerifyResponse] = None
+                if upto is not None:
+                    state = upto.reserve(
+                        payment, int(selected_payment_requirements.max_amount_required)
+                    )
+                    if state == "exhausted":
+                        return x402_response(
+                            "Payment authorization exhausted", "exhausted"
+                        )
+                    if state == "reserved":
+                        meter = UsageMeter()
+
+                if meter is None:
+                    # Throttle payers and clients before calling the facilitator
+                    if admission is not None:
+                        rejection = admission.admit(
+                            payment_payer(payment), request.remote_addr
+                        )
+                        if rejection is not None:
+                            body = json.dumps(
+                                {"error": "Too many payment attempts"}
+                            ).encode("utf-8")
+                            start_response(
+                                "429 Too Many Requests",
+                                [
+                                    ("Content-Type", "application/json"),
+                                    ("Content-Length", str(len(body))),
+                                    ("Retry-After", rejection.retry_after_header),
+                                ],
+                            )
+                            return [body]
 
-                try:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    verify_response = loop.run_until_complete(
-                        facilitator.verify(payment, selected_payment_requirements)
+                    # Verify payment (async call in sync context)
+                    try:
+                        with instrumentation.span(
+                            "x402.verify", route=route, network=payment.network
+                        ) as span:
+                            try:
+                                loop = asyncio.new_event_loop()
+                                asyncio.set_event_loop(loop)
+                                verify_response = loop.run_until_complete(
+                                    facilitator.verify(
+                                        payment, selected_payment_requirements
+                                    )
+                                )
+                            finally:
+                                loop.close()
+                            span.set_attribute("valid", verify_response.is_valid)
+                    finally:
+                        if admission is not None:
+                            admission.release()
+                    instrumentation.count(
+                        "x402.verify.result",
+                        route=route,
+                        valid=verify_response.is_valid,
+                        reason=verify_response.invalid_reason,
                     )
-                finally:
-                    loop.close()
 
-                if not verify_response.is_valid:
-                    error_reason = verify_response.invalid_reason or "Unknown error"
-                    return x402_response(f"Invalid payment: {error_reason}")
+                    if not verify_response.is_valid:
+                        error_reason = verify_response.invalid_reason or "Unknown error"
+                        return x402_response(
+                            f"Invalid payment: {error_reason}", "invalid"
+                        )
+
+                if upto is not None:
+                    if meter is None:
+                        upto.open(payment)
+                        state = upto.reserve(
+                            payment,
+                            int(selected_payment_requirements.max_amount_required),
+                        )
+                        if state == "exhausted":
+                            return x402_response(
+                                "Payment authorization exhausted", "exhausted"
+                            )
+                        if state != "reserved":
+                            return x402_response(
+                                "Payment authorization already in use", "in_use"
+                            )
+                        meter = UsageMeter()
+                    g.x402_meter = meter
+                # Aggregated payments settle later, grant access right away
+                elif aggregator is not None and not aggregator.record(
+                    payment, selected_payment_requirements
+                ):
+                    return x402_response("Payment already used", "replay")
 
                 # Store payment details in Flask g object
                 g.payment_details = selected_payment_requirements
                 g.verify_response = verify_response
 
+                settlement: Optional["Future[SettleResponse]"] = None
+                if config.get("speculative_settle"):
+                    settlement = _get_settle_executor().submit(
+                        asyncio.run,
+                        settle(payment, selected_payment_requirements),
+                    )
+
                 # Create response wrapper to capture status and headers
                 response_wrapper = ResponseWrapper(start_response)
 
                 # Process the request
-                response = next_app(environ, response_wrapper)
+                try:
+                    with instrumentation.span("x402.handler", route=route):
+                        response = next_app(environ, response_wrapper)
+                except Exception:
+                    if meter is not None:
+                        finish_metering(
+                            payment, selected_payment_requirements, meter, False
+                        )
+                    elif aggregator is not None:
+                        aggregator.cancel(payment)
+                    if settlement is not None:
+                        _refund_if_settled(
+                            settlement,
+                            payment,
+                            selected_payment_requirements,
+                            config.get("refund_hook"),
+                        )
+                    raise
 
                 # Check if response is successful (2xx status code)
                 if (
@@ -273,33 +648,73 @@ class PaymentMiddleware:
                     and response_wrapper.status_code >= 200
                     and response_wrapper.status_code < 300
                 ):
+                    if meter is not None:
+                        return _MeteredBody(
+                            response,
+                            meter,
+                            lambda: finish_metering(
+                                payment, selected_payment_requirements, meter, True
+                            ),
+                        )
+                    if aggregator is not None:
+                        if sessions is not None:
+                            response_wrapper.add_header(
+                                SESSION_HEADER,
+                                sessions.issue(payment_payer(payment)),
+                            )
+                        return response
+
                     # Settle the payment for successful responses
                     try:
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        settle_response = loop.run_until_complete(
-                            facilitator.settle(payment, selected_payment_requirements)
-                        )
+                        if settlement is not None:
+                            settle_response = settlement.result()
+                        else:
+                            loop = asyncio.new_event_loop()
+                            asyncio.set_event_loop(loop)
+                            try:
+                                settle_response = loop.run_until_complete(
+                                    settle(payment, selected_payment_requirements)
+                                )
+                            finally:
+                                loop.close()
 
                         if settle_response.success:
                             # Add settlement response header
-                            settlement_header = base64.b64encode(
-                                settle_response.model_dump_json(by_alias=True).encode(
-                                    "utf-8"
-                                )
-                            ).decode("utf-8")
                             response_wrapper.add_header(
-                                "X-PAYMENT-RESPONSE", settlement_header
+                                "X-PAYMENT-RESPONSE",
+                                settlement_header(settle_response),
                             )
+                            if sessions is not None:
+                                response_wrapper.add_header(
+                                    SESSION_HEADER,
+                                    sessions.issue(payment_payer(payment)),
+                                )
                         else:
                             # If settlement fails, we can't return a new response since headers are already sent
                             # Just log the error and continue with the original response
-                            print(f"Settle failed: {settle_response.error_reason}")
+                            logger.warning(
+                                f"Settle failed: {settle_response.error_reason}"
+                            )
                     except Exception as e:
                         # Log the error but don't try to return a new response
-                        print(f"Settle failed: {str(e)}")
-                    finally:
-                        loop.close()
+                        logger.warning(f"Settle failed: {e}")
+                elif meter is not None:
+                    finish_metering(
+                        payment, selected_payment_requirements, meter, False
+                    )
+                elif aggregator is not None:
+                    aggregator.cancel(payment)
+                elif settlement is not None:
+                    settle_response = _refund_if_settled(
+                        settlement,
+                        payment,
+                        selected_payment_requirements,
+                        config.get("refund_hook"),
+                    )
+                    if settle_response is not None:
+                        response_wrapper.add_header(
+                            "X-PAYMENT-RESPONSE", settlement_header(settle_response)
+                        )
 
                 return response
 
@@ -0,0 +1,243 @@
+"""Timed spans and counters for the stages of a paid request.
+
+Nothing is recorded until an exporter is installed with `set_exporter`; until
+then `span` returns a shared no-op context manager and `count` returns
+immediately, so instrumented code paths cost one global lookup.
+
+Spans:
+    x402.requirements        Look up (or build) payment requirements
+    x402.decode              Decode the X-PAYMENT header
+    x402.verify              Verify a payment with the facilitator
+    x402.handler             Run the paid route handler
+    x402.settle              Settle a payment with the facilitator
+    x402.paywall             Render the HTML paywall
+    x402.facilitator.request HTTP request to one facilitator URL
+    x402.client.sign         Sign a payment header in x402Client
+
+Counters:
+    x402.payment_required    402 responses, by reason
+    x402.verify.result       Verifications, by validity and reason
+    x402.settle.result       Settlements, by outcome and reason
+    x402.revenue             Settled amounts in atomic units, by network and asset
+    x402.requirements.cache  Requirement lookups, by hit
+    x402.decode.rejected     Rejected X-PAYMENT headers, by reason
+    x402.decode.rejected_bytes  Size of the rejected headers, by reason
+    x402.admission.rejected  Payment attempts rejected with a 429, by reason
+    x402.session.issued      Prepaid sessions started after a settled payment
+    x402.session.redeemed    Calls presenting a session token, by outcome
+    x402.aggregation.batch   Payments settled per deferred batch
+    x402.metering.charged    Atomic units charged for metered (upto) usage
+    x402.client.payments     Payment headers created by x402Client
+    x402.facilitator.circuit_open  Calls rejected by an open circuit breaker
+"""
+
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Any, ContextManager, Iterator, Optional
+
+Attributes = dict[str, Any]
+
+
+class Span:
+    """A timed operation. Attributes can be added until the span ends."""
+
+    __slots__ = ("name", "attributes", "start", "duration", "error")
+
+    def __init__(self, name: str, attributes: Attributes):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[BaseException] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Exporter:
+    """Receives spans and counter increments.
+
+    Subclasses override `on_span_end` and `count`, or `span` itself to manage
+    spans with another tracing library.
+    """
+
+    def span(self, name: str, attributes: Attributes) -> ContextManager[Any]:
+        return self._timed_span(name, attributes)
+
+    @contextmanager
+    def _timed_span(self, name: str, attributes: Attributes) -> Iterator[Span]:
+        span = Span(name, attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = e
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+            self.on_span_end(span)
+
+    def on_span_end(self, span: Span) -> None:
+        pass
+
+    def count(self, name: str, value: float, attributes: Attributes) -> None:
+        pass
+
+
+class InMemoryExporter(Exporter):
+    """Keeps finished spans and counter totals, for tests and debugging."""
+
+    def __init__(self):
+        self.spans: list[Span] = []
+        self.counters: dict[tuple[str, tuple], float] = {}
+
+    def on_span_end(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def count(self, name: str, value: float, attributes: Attributes) -> None:
+        key = (name, tuple(sorted(attributes.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def span_names(self) -> list[str]:
+        return [span.name for span in self.spans]
+
+    def total(self, name: str, **attributes: Any) -> float:
+        """Sum of a counter over all series matching the given attributes"""
+        return sum(
+            value
+            for (counter, labels), value in self.counters.items()
+            if counter == name and attributes.items() <= dict(labels).items()
+        )
+
+
+class CompositeExporter(Exporter):
+    """Forwards spans and counters to several exporters."""
+
+    def __init__(self, *exporters: Exporter):
+        self.exporters = exporters
+
+    @contextmanager
+    def span(self, name: str, attributes: Attributes) -> Iterator[Any]:
+        with ExitStack() as stack:
+            spans = [
+                stack.enter_context(exporter.span(name, attributes))
+                for exporter in self.exporters
+            ]
+            yield _MultiSpan(spans)
+
+    def count(self, name: str, value: float, attributes: Attributes) -> None:
+        for exporter in self.exporters:
+            exporter.count(name, value, attributes)
+
+
+class _MultiSpan:
+    __slots__ = ("spans",)
+
+    def __init__(self, spans: list[Any]):
+        self.spans = spans
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        for span in self.spans:
+            span.set_attribute(key, value)
+
+
+class OpenTelemetryExporter(Exporter):
+    """Exports spans and counters through the OpenTelemetry API.
+
+    Requires the `opentelemetry-api` package. Spans become OpenTelemetry spans
+    in the current context, so they nest under the framework's request span.
+
+    Args:
+        tracer_provider: Optional tracer provider, defaults to the global one
+        meter_provider: Optional meter provider, defaults to the global one
+    """
+
+    def __init__(self, tracer_provider: Any = None, meter_provider: Any = None):
+        try:
+            from opentelemetry import metrics, trace
+        except ImportError as e:
+            raise ImportError(
+                "OpenTelemetryExporter requires opentelemetry-api, install it with "
+                "`pip install opentelemetry-api`"
+            ) from e
+
+        self.tracer = trace.get_tracer("x402", tracer_provider=tracer_provider)
+        self.meter = metrics.get_meter("x402", meter_provider=meter_provider)
+        self._counters: dict[str, Any] = {}
+
+    def span(self, name: str, attributes: Attributes) -> ContextManager[Any]:
+        return self.tracer.start_as_current_span(
+            name, attributes=_otel_attributes(attributes)
+        )
+
+    def count(self, name: str, value: float, attributes: Attributes) -> None:
+        counter = self._counters.get(name)
+        if counter is None:
+            counter = self._counters[name] = self.meter.create_counter(name)
+        counter.add(value, _otel_attributes(attributes))
+
+
+def _otel_attributes(attributes: Attributes) -> Attributes:
+    # OpenTelemetry attribute values must be str, bool, int or float
+    return {
+        key: value if isinstance(value, (str, bool, int, float)) else str(value)
+        for key, value in attributes.items()
+        if value is not None
+    }
+
+
+_exporter: Optional[Exporter] = None
+
+
+def set_exporter(exporter: Optional[Exporter]) -> None:
+    """Install the exporter receiving all spans and counters, or None to
+    disable instrumentation"""
+    global _exporter
+    _exporter = exporter
+
+
+def get_exporter() -> Optional[Exporter]:
+    return _exporter
+
+
+def enabled() -> bool:
+    """Whether an exporter is installed. Use it to skip computing expensive
+    attributes."""
+    return _exporter is not None
+
+
+def span(name: str, **attributes: Any) -> ContextManager[Any]:
+    """Time a block of code.
+
+    Usage:
+        with span("x402.verify", network=network) as s:
+            response = await facilitator.verify(...)
+            s.set_attribute("valid", response.is_valid)
+    """
+    exporter = _exporter
+    if exporter is None:
+        return _NOOP_SPAN
+    return exporter.span(name, attributes)
+
+
+def count(name: str, value: float = 1, **attributes: Any) -> None:
+    """Add `value` to a counter"""
+    exporter = _exporter
+    if exporter is None:
+        return
+    exporter.count(name, value, attributes)
@@ -0,0 +1,269 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional, Protocol
+
+from x402.common import x402_VERSION
+from x402.schemes import get_scheme, payment_payer, require_scheme
+from x402.types import (
+    DiscoveredResource,
+    DiscoveryResourcesPagination,
+    EIP3009Authorization,
+    ListDiscoveryResourcesRequest,
+    ListDiscoveryResourcesResponse,
+    PaymentPayload,
+    PaymentRequirements,
+    SettleResponse,
+    UptoAuthorization,
+    VerifyResponse,
+)
+
+
+class ChainBackend(Protocol):
+    """The on-chain operations a LocalFacilitator needs from a network."""
+
+    async def balance_of(self, network: str, asset: str, owner: str) -> int:
+        """Token balance of `owner` in atomic units"""
+        ...
+
+    async def authorization_used(
+        self, network: str, asset: str, authorizer: str, nonce: str
+    ) -> bool:
+        """Whether an EIP-3009 authorization nonce has already been used"""
+        ...
+
+    async def transfer_with_authorization(
+        self,
+        network: str,
+        asset: str,
+        authorization: EIP3009Authorization,
+        signature: str,
+    ) -> str:
+        """Submit the authorized transfer and return its transaction hash.
+
+        Raises:
+            ValueError: If the transfer is rejected
+        """
+        ...
+
+    async def permit2_nonce_used(self, network: str, owner: str, nonce: str) -> bool:
+        """Whether a Permit2 nonce of `owner` has already been used"""
+        ...
+
+    async def permit_witness_transfer(
+        self,
+        network: str,
+        authorization: UptoAuthorization,
+        amount: int,
+        signature: str,
+    ) -> str:
+        """Submit a Permit2 witness transfer of `amount` and return its
+        transaction hash.
+
+        Raises:
+            ValueError: If the transfer is rejected
+        """
+        ...
+
+
+class InMemoryChain:
+    """A ChainBackend keeping balances and used nonces in memory.
+
+    Transfers are applied atomically, so the same authorization can only be
+    settled once even when settled concurrently.
+    """
+
+    def __init__(self):
+        self._balances: dict[tuple[str, str, str], int] = {}
+        self._used_nonces: set[tuple[str, str, str, str]] = set()
+        self._used_permit2_nonces: set[tuple[str, str, int]] = set()
+        self._lock = threading.Lock()
+        self.transactions: list[str] = []
+
+    @staticmethod
+    def _key(network: str, asset: str, owner: str) -> tuple[str, str, str]:
+        return network, asset.lower(), owner.lower()
+
+    def mint(self, network: str, asset: str, owner: str, amount: int) -> None:
+        """Credit `amount` atomic units of `asset` to `owner`"""
+        key = self._key(network, asset, owner)
+        with self._lock:
+            self._balances[key] = self._balances.get(key, 0) + amount
+
+    async def balance_of(self, network: str, asset: str, owner: str) -> int:
+        with self._lock:
+            return self._balances.get(self._key(network, asset, owner), 0)
+
+    async def authorization_used(
+        self, network: str, asset: str, authorizer: str, nonce: str
+    ) -> bool:
+        with self._lock:
+            return (*self._key(network, asset, authorizer), nonce.lower()) in (
+                self._used_nonces
+            )
+
+    async def transfer_with_authorization(
+        self,
+        network: str,
+        asset: str,
+        authorization: EIP3009Authorization,
+        signature: str,
+    ) -> str:
+        sender = self._key(network, asset, authorization.from_)
+        recipient = self._key(network, asset, authorization.to)
+        nonce = (*sender, authorization.nonce.lower())
+        value = int(authorization.value)
+
+        with self._lock:
+            if nonce in self._used_nonces:
+                raise ValueError("authorization is used or canceled")
+            if self._balances.get(sender, 0) < value:
+                raise ValueError("transfer amount exceeds balance")
+            self._used_nonces.add(nonce)
+            self._balances[sender] -= value
+            self._balances[recipient] = self._balances.get(recipient, 0) + value
+            transaction = "0x" + hashlib.sha256(repr(nonce).encode()).hexdigest()
+            self.transactions.append(transaction)
+        return transaction
+
+    async def permit2_nonce_used(self, network: str, owner: str, nonce: str) -> bool:
+        with self._lock:
+            return (network, owner.lower(), int(nonce)) in self._used_permit2_nonces
+
+    async def permit_witness_transfer(
+        self,
+        network: str,
+        authorization: UptoAuthorization,
+        amount: int,
+        signature: str,
+    ) -> str:
+        sender = self._key(network, authorization.token, authorization.from_)
+        recipient = self._key(network, authorization.token, authorization.to)
+        nonce = (network, authorization.from_.lower(), int(authorization.nonce))
+
+        with self._lock:
+            if nonce in self._used_permit2_nonces:
+                raise ValueError("InvalidNonce")
+            if amount > int(authorization.max_value):
+                raise ValueError("InvalidAmount")
+            if self._balances.get(sender, 0) < amount:
+                raise ValueError("transfer amount exceeds balance")
+            self._used_permit2_nonces.add(nonce)
+            self._balances[sender] -= amount
+            self._balances[recipient] = self._balances.get(recipient, 0) + amount
+            transaction = "0x" + hashlib.sha256(repr(nonce).encode()).hexdigest()
+            self.transactions.append(transaction)
+        return transaction
+
+
+class LocalFacilitator:
+    """An in-process facilitator for the registered schemes.
+
+    Implements the `verify`/`settle`/`list` interface of FacilitatorClient
+    without any network hop: each scheme checks signatures locally and
+    submits transfers through a ChainBackend, an InMemoryChain by default. Resources
+    that settle a payment and are marked discoverable are listed by `list`.
+    """
+
+    def __init__(
+        self,
+        chain: Optional[ChainBackend] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.chain = chain if chain is not None else InMemoryChain()
+        self._clock = clock
+        self._resources: dict[str, DiscoveredResource] = {}
+        self._lock = threading.Lock()
+
+    def _invalid(self, reason: str, payer: Optional[str]) -> VerifyResponse:
+        return VerifyResponse(is_valid=False, invalid_reason=reason, payer=payer)
+
+    async def verify(
+        self, payment: PaymentPayload, payment_requirements: PaymentRequirements
+    ) -> VerifyResponse:
+        """Verify a payment header is valid and a request should be processed"""
+        scheme = get_scheme(payment.scheme)
+        payer = payment_payer(payment)
+
+        if scheme is None or payment.scheme != payment_requirements.scheme:
+            return self._invalid("invalid_scheme", payer)
+        if payment.network != payment_requirements.network:
+            return self._invalid("invalid_network", payer)
+
+        reason = await scheme.verify_locally(
+            payment, payment_requirements, self.chain, int(self._clock())
+        )
+        if reason is not None:
+            return self._invalid(reason, payer)
+        return VerifyResponse(is_valid=True, invalid_reason=None, payer=payer)
+
+    async def settle(
+        self, payment: PaymentPayload, payment_requirements: PaymentRequirements
+    ) -> SettleResponse:
+        """Re-verify the payment and submit the transfer to the chain backend"""
+        verify_response = await self.verify(payment, payment_requirements)
+        payer = verify_response.payer
+        network = payment_requirements.network
+        if not verify_response.is_valid:
+            return SettleResponse(
+                success=False,
+                error_reason=verify_response.invalid_reason,
+                network=network,
+                payer=payer,
+            )
+
+        try:
+            transaction = await require_scheme(payment.scheme).settle_locally(
+                payment, payment_requirements, self.chain
+            )
+        except ValueError as e:
+            return SettleResponse(
+                success=False,
+                error_reason=f"invalid_transaction_state: {e}",
+                network=network,
+                payer=payer,
+            )
+
+        self._record_resource(payment_requirements)
+        return SettleResponse(
+            success=True, transaction=transaction, network=network, payer=payer
+        )
+
+    def _record_resource(self, payment_requirements: PaymentRequirements) -> None:
+        request_structure = (payment_requirements.output_schema or {}).get("input", {})
+        if not request_structure.get("discoverable", False):
+            return
+
+        with self._lock:
+            self._resources[payment_requirements.resource] = DiscoveredResource(
+                resource=payment_requirements.resource,
+                type="http",
+                x402_version=x402_VERSION,
+                accepts=[payment_requirements],
+                last_updated=datetime.now(timezone.utc),
+            )
+
+    async def list(
+        self, request: Optional[ListDiscoveryResourcesRequest] = None
+    ) -> ListDiscoveryResourcesResponse:
+        """List the discoverable resources that settled payments here"""
+        if request is None:
+            request = ListDiscoveryResourcesRequest()
+
+        with self._lock:
+            items = [
+                resource
+                for resource in self._resources.values()
+                if request.type is None or resource.type == request.type
+            ]
+        offset = request.offset or 0
+        limit = request.limit or len(items)
+
+        return ListDiscoveryResourcesResponse(
+            x402_version=x402_VERSION,
+            items=items[offset : offset + limit],
+            pagination=DiscoveryResourcesPagination(
+                limit=limit, offset=offset, total=len(items)
+            ),
+        )
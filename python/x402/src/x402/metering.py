@@ -0,0 +1,67 @@
+"""Usage metering for routes paid with the `upto` scheme.
+
+The middlewares give each metered request a `UsageMeter`, available to the
+handler as `request.state.x402_meter` (FastAPI) or `g.x402_meter` (Flask).
+It counts the response bytes and the time until the response is sent on its
+own; handlers add the units they consume, such as LLM tokens:
+
+    request.state.x402_meter.add(completion.usage.total_tokens)
+
+The request costs `minimum + units * per_unit + seconds * per_second +
+bytes * per_byte` atomic units, rounded up and capped at the route's price.
+"""
+
+import math
+import time
+from typing import Callable
+
+from typing_extensions import TypedDict
+
+
+class MeteringConfig(TypedDict, total=False):
+    """Configuration of a metered route.
+
+    Rates are in atomic units of the asset.
+
+    Attributes:
+        spender: Address allowed to settle the authorizations, the
+            facilitator's settlement wallet
+        minimum: Charge for any successful request
+        per_unit: Charge per unit added with `UsageMeter.add`
+        per_second: Charge per second spent producing the response
+        per_byte: Charge per response body byte
+    """
+
+    spender: str
+    minimum: int
+    per_unit: float
+    per_second: float
+    per_byte: float
+
+
+class UsageMeter:
+    """Usage of one metered request."""
+
+    __slots__ = ("units", "bytes", "started", "finished", "clock")
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.units = 0.0
+        self.bytes = 0
+        self.clock = clock
+        self.started = clock()
+        # Set once the request has been charged or released
+        self.finished = False
+
+    def add(self, units: float = 1) -> None:
+        """Count units consumed by the request"""
+        self.units += units
+
+    def cost(self, config: MeteringConfig, limit: int) -> int:
+        """Atomic units owed for the usage so far, at most `limit`"""
+        cost = (
+            config.get("minimum", 0)
+            + self.units * config.get("per_unit", 0)
+            + (self.clock() - self.started) * config.get("per_second", 0)
+            + self.bytes * config.get("per_byte", 0)
+        )
+        return min(limit, math.ceil(cost))
@@ -0,0 +1,534 @@
+"""Prometheus metrics for x402 servers.
+
+`enable_metrics()` installs an instrumentation exporter that aggregates the
+middlewares' spans and counters into counters and histograms:
+
+    x402_stage_duration_seconds{stage,route}    Latency of each payment stage
+    x402_payments_total{route,network,asset}    Settled payments
+    x402_revenue_atomic_units_total{route,network,asset}
+                                                Settled amount in atomic units
+    x402_settlements_total{route,outcome}       Settlement attempts
+    x402_failures_total{stage,reason}           Verify and settle failures
+    x402_payment_required_total{route,reason}   402 responses
+    x402_rejected_headers_total{reason}         X-PAYMENT headers rejected on decode
+    x402_rejected_header_bytes_total{reason}    Size of the rejected headers
+    x402_admission_rejected_total{reason}       429s from admission control
+    x402_session_calls_total{outcome}           Calls presenting a session token
+
+Reason labels are fixed codes (`missing_header`, `bad_header`, `no_match`,
+`invalid`, `exhausted`, `in_use`, `replay`, `settle_failed`, facilitator
+reason codes) so the number of series stays bounded; the detailed error text
+only goes in the 402 response body.
+
+Each series is allocated once, histograms with all of their buckets, and
+updated in place. With a `multiprocess_dir` every process writes its values
+to its own mmap-backed file in that directory and `render` sums the files of
+all processes, so any gunicorn worker can serve `/metrics` for the whole
+server. Clear the directory when the server starts.
+"""
+
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Any, Iterable, Optional, Sequence, Union
+
+from x402 import instrumentation
+from x402.instrumentation import Attributes, CompositeExporter, Exporter, Span
+
+# Upper bounds in seconds, suited to facilitator round trips and settlement
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Environment variable naming the multi-process directory, as used by the
+# official Prometheus client
+MULTIPROCESS_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+
+class LocalStore:
+    """Keeps series values in preallocated in-process arrays."""
+
+    def __init__(self):
+        self._series: dict[str, array] = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, key: str, size: int) -> "_LocalSlots":
+        with self._lock:
+            values = self._series.get(key)
+            if values is None:
+                values = self._series[key] = array("d", bytes(8 * size))
+        return _LocalSlots(values, self._lock)
+
+    def collect(self) -> dict[str, list[float]]:
+        with self._lock:
+            return {key: list(values) for key, values in self._series.items()}
+
+
+class _LocalSlots:
+    __slots__ = ("values", "lock")
+
+    def __init__(self, values: array, lock: threading.Lock):
+        self.values = values
+        self.lock = lock
+
+    def add(self, index: int, value: float) -> None:
+        with self.lock:
+            self.values[index] += value
+
+
+# File layout: an 8 byte header with the number of bytes used, followed by
+# entries of [key length: u32][slot count: u32][key, padded to 8][slots: f64]
+_HEADER = struct.Struct("<Q")
+_ENTRY = struct.Struct("<II")
+_SLOT = struct.Struct("<d")
+_INITIAL_FILE_SIZE = 64 * 1024
+
+
+def _padded(length: int) -> int:
+    return (length + 7) & ~7
+
+
+class _MmapFile:
+    """A growable, append-only file of named slot arrays mapped into memory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            size = _INITIAL_FILE_SIZE
+            os.ftruncate(self._fd, size)
+        self._mm = mmap.mmap(self._fd, size)
+        self.used = _HEADER.unpack_from(self._mm, 0)[0] or _HEADER.size
+        self.offsets = {key: offset for key, offset, _ in _read_entries(self._mm)}
+
+    def allocate(self, key: str, size: int) -> int:
+        """Reserve `size` zeroed slots for `key`, returning their offset"""
+        offset = self.offsets.get(key)
+        if offset is not None:
+            return offset
+
+        encoded = key.encode("utf-8")
+        entry_size = _ENTRY.size + _padded(len(encoded)) + size * _SLOT.size
+        if self.used + entry_size > len(self._mm):
+            new_size = len(self._mm)
+            while self.used + entry_size > new_size:
+                new_size *= 2
+            os.ftruncate(self._fd, new_size)
+            self._mm.resize(new_size)
+
+        _ENTRY.pack_into(self._mm, self.used, len(encoded), size)
+        start = self.used + _ENTRY.size
+        self._mm[start : start + len(encoded)] = encoded
+        offset = start + _padded(len(encoded))
+        # Publish the entry only once it is complete, readers stop at `used`
+        self.used += entry_size
+        _HEADER.pack_into(self._mm, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+    def add(self, offset: int, value: float) -> None:
+        _SLOT.pack_into(
+            self._mm, offset, _SLOT.unpack_from(self._mm, offset)[0] + value
+        )
+
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+
+
+def _read_entries(buffer: Any) -> Iterable[tuple[str, int, list[float]]]:
+    used = _HEADER.unpack_from(buffer, 0)[0]
+    position = _HEADER.size
+    while position < used:
+        key_length, size = _ENTRY.unpack_from(buffer, position)
+        start = position + _ENTRY.size
+        key = bytes(buffer[start : start + key_length]).decode("utf-8")
+        offset = start + _padded(key_length)
+        values = [
+            _SLOT.unpack_from(buffer, offset + i * _SLOT.size)[0] for i in range(size)
+        ]
+        yield key, offset, values
+        position = offset + size * _SLOT.size
+
+
+class MmapStore:
+    """Keeps series values in a per-process mmap-backed file so several
+    processes can be aggregated.
+
+    Args:
+        directory: Directory shared by all processes of the server
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._file: Optional[_MmapFile] = None
+        self._pid: Optional[int] = None
+        self._sizes: dict[str, int] = {}
+
+    def _own_file(self) -> _MmapFile:
+        # Reopen after fork so each worker writes to its own file
+        pid = os.getpid()
+        if self._pid != pid:
+            self._file = _MmapFile(os.path.join(self.directory, f"x402_{pid}.db"))
+            self._pid = pid
+        assert self._file is not None
+        return self._file
+
+    def allocate(self, key: str, size: int) -> "_MmapSlots":
+        with self._lock:
+            self._sizes[key] = size
+            self._own_file().allocate(key, size)
+        return _MmapSlots(self, key)
+
+    def add(self, key: str, index: int, value: float) -> None:
+        with self._lock:
+            file = self._own_file()
+            offset = file.offsets.get(key)
+            if offset is None:
+                # First write after a fork, the series is not in this
+                # process' file yet
+                offset = file.allocate(key, self._sizes[key])
+            file.add(offset + index * _SLOT.size, value)
+
+    def collect(self) -> dict[str, list[float]]:
+        """Sum the series of every process writing to the directory"""
+        totals: dict[str, list[float]] = {}
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith("x402_") and name.endswith(".db")):
+                continue
+            with open(os.path.join(self.directory, name), "rb") as f:
+                data = f.read()
+            if len(data) < _HEADER.size:
+                continue
+            for key, _, values in _read_entries(data):
+                total = totals.setdefault(key, [0.0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+        return totals
+
+
+class _MmapSlots:
+    __slots__ = ("store", "key")
+
+    def __init__(self, store: MmapStore, key: str):
+        self.store = store
+        self.key = key
+
+    def add(self, index: int, value: float) -> None:
+        self.store.add(self.key, index, value)
+
+
+Store = Union[LocalStore, MmapStore]
+
+
+def _series_key(name: str, labels: dict[str, str]) -> str:
+    return json.dumps([name, sorted(labels.items())], separators=(",", ":"))
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    type = "counter"
+
+    def __init__(
+        self, store: Store, name: str, documentation: str, labelnames: Sequence[str]
+    ):
+        self.store = store
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: dict[tuple, Any] = {}
+
+    def _slots(self, labels: dict[str, Any], size: int) -> Any:
+        values = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        slots = self._series.get(values)
+        if slots is None:
+            key = _series_key(self.name, dict(zip(self.labelnames, values)))
+            slots = self._series[values] = self.store.allocate(key, size)
+        return slots
+
+    def inc(self, value: float = 1, **labels: Any) -> None:
+        self._slots(labels, 1).add(0, value)
+
+
+class Histogram(Counter):
+    """Counts observations in preallocated cumulative buckets.
+
+    A series holds one slot per bucket, one for +Inf and one for the sum.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        store: Store,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(store, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        slots = self._slots(labels, len(self.buckets) + 2)
+        slots.add(bisect_left(self.buckets, value), 1)
+        slots.add(len(self.buckets) + 1, value)
+
+
+class MetricsRegistry:
+    """The x402 metrics, stored locally or in a multi-process directory.
+
+    Args:
+        multiprocess_dir: Optional directory for per-process metric files.
+            Defaults to $PROMETHEUS_MULTIPROC_DIR if set.
+        buckets: Histogram bucket upper bounds in seconds
+    """
+
+    def __init__(
+        self,
+        multiprocess_dir: Optional[str] = None,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        multiprocess_dir = multiprocess_dir or os.environ.get(MULTIPROCESS_DIR_ENV)
+        self.store: Store = (
+            MmapStore(multiprocess_dir) if multiprocess_dir else LocalStore()
+        )
+
+        self.stage_duration = Histogram(
+            self.store,
+            "x402_stage_duration_seconds",
+            "Duration of each stage of a paid request",
+            ("stage", "route"),
+            buckets,
+        )
+        self.payments = Counter(
+            self.store,
+            "x402_payments_total",
+            "Settled payments",
+            ("route", "network", "asset"),
+        )
+        self.revenue = Counter(
+            self.store,
+            "x402_revenue_atomic_units_total",
+            "Settled payment amounts in the asset's atomic units",
+            ("route", "network", "asset"),
+        )
+        self.settlements = Counter(
+            self.store,
+            "x402_settlements_total",
+            "Settlement attempts by outcome",
+            ("route", "outcome"),
+        )
+        self.failures = Counter(
+            self.store,
+            "x402_failures_total",
+            "Failed verifications and settlements by reason",
+            ("stage", "reason"),
+        )
+        self.payment_required = Counter(
+            self.store,
+            "x402_payment_required_total",
+            "402 Payment Required responses by reason",
+            ("route", "reason"),
+        )
+        self.rejected_headers = Counter(
+            self.store,
+            "x402_rejected_headers_total",
+            "X-PAYMENT headers rejected while decoding, by reason",
+            ("reason",),
+        )
+        self.rejected_header_bytes = Counter(
+            self.store,
+            "x402_rejected_header_bytes_total",
+            "Bytes of X-PAYMENT headers rejected while decoding, by reason",
+            ("reason",),
+        )
+        self.admission_rejected = Counter(
+            self.store,
+            "x402_admission_rejected_total",
+            "Payment attempts rejected by admission control, by reason",
+            ("reason",),
+        )
+        self.session_calls = Counter(
+            self.store,
+            "x402_session_calls_total",
+            "Calls presenting a prepaid session token, by outcome",
+            ("outcome",),
+        )
+        self.metrics: list[Counter] = [
+            self.stage_duration,
+            self.payments,
+            self.revenue,
+            self.settlements,
+            self.failures,
+            self.payment_required,
+            self.rejected_headers,
+            self.rejected_header_bytes,
+            self.admission_rejected,
+            self.session_calls,
+        ]
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        values = self.store.collect()
+        series_by_metric: dict[str, list[tuple[list, list[float]]]] = {}
+        for key, slots in values.items():
+            name, labels = json.loads(key)
+            series_by_metric.setdefault(name, []).append((labels, slots))
+
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for labels, slots in sorted(series_by_metric.get(metric.name, [])):
+                if isinstance(metric, Histogram):
+                    lines.extend(_render_histogram(metric, labels, slots))
+                else:
+                    lines.append(f"{metric.name}{_labels(labels)} {_number(slots[0])}")
+        return "\n".join(lines) + "\n"
+
+
+def _render_histogram(
+    histogram: Histogram, labels: list, slots: list[float]
+) -> list[str]:
+    lines = []
+    cumulative = 0.0
+    bounds = [*(_number(bound) for bound in histogram.buckets), "+Inf"]
+    for bound, count in zip(bounds, slots):
+        cumulative += count
+        lines.append(
+            f"{histogram.name}_bucket{_labels([*labels, ['le', bound]])} {_number(cumulative)}"
+        )
+    lines.append(f"{histogram.name}_sum{_labels(labels)} {_number(slots[-1])}")
+    lines.append(f"{histogram.name}_count{_labels(labels)} {_number(cumulative)}")
+    return lines
+
+
+def _labels(labels: Iterable[Sequence[str]]) -> str:
+    rendered = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return f"{{{rendered}}}" if rendered else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+# Facilitator reasons are codes like "invalid_exact_evm_payload_signature",
+# anything else (free text, details after a colon) is counted as "other" so
+# the failure series stay bounded.
+_REASON_CODE = re.compile(r"[a-z][a-z0-9_]{0,63}")
+
+
+def _reason_code(reason: Optional[str]) -> str:
+    if not reason:
+        return "unknown"
+    code = reason.split(":", 1)[0].strip()
+    return code if _REASON_CODE.fullmatch(code) else "other"
+
+
+# Spans recorded in x402_stage_duration_seconds, by span name
+_STAGES = {
+    "x402.requirements": "requirements",
+    "x402.decode": "decode",
+    "x402.verify": "verify",
+    "x402.handler": "handler",
+    "x402.settle": "settle",
+    "x402.paywall": "paywall",
+}
+
+
+class MetricsExporter(Exporter):
+    """Instrumentation exporter feeding a MetricsRegistry."""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+    def on_span_end(self, span: Span) -> None:
+        stage = _STAGES.get(span.name)
+        if stage is not None and span.duration is not None:
+            self.registry.stage_duration.observe(
+                span.duration, stage=stage, route=span.attributes.get("route", "")
+            )
+
+    def count(self, name: str, value: float, attributes: Attributes) -> None:
+        registry = self.registry
+        if name == "x402.revenue":
+            registry.payments.inc(**attributes)
+            registry.revenue.inc(value, **attributes)
+        elif name == "x402.settle.result":
+            registry.settlements.inc(value, **attributes)
+            if attributes.get("outcome") != "success":
+                registry.failures.inc(
+                    value,
+                    stage="settle",
+                    reason=_reason_code(
+                        attributes.get("reason") or attributes.get("outcome")
+                    ),
+                )
+        elif name == "x402.verify.result":
+            if not attributes.get("valid"):
+                registry.failures.inc(
+                    value, stage="verify", reason=_reason_code(attributes.get("reason"))
+                )
+        elif name == "x402.payment_required":
+            registry.payment_required.inc(value, **attributes)
+        elif name == "x402.decode.rejected":
+            registry.rejected_headers.inc(value, **attributes)
+        elif name == "x402.decode.rejected_bytes":
+            registry.rejected_header_bytes.inc(value, **attributes)
+        elif name == "x402.admission.rejected":
+            registry.admission_rejected.inc(value, **attributes)
+        elif name == "x402.session.redeemed":
+            registry.session_calls.inc(value, **attributes)
+
+
+def enable_metrics(
+    multiprocess_dir: Optional[str] = None,
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> MetricsRegistry:
+    """Start collecting metrics from the x402 middlewares.
+
+    The metrics exporter is added next to any instrumentation exporter that
+    is already installed.
+
+    Args:
+        multiprocess_dir: Optional directory for per-process metric files,
+            required to aggregate metrics across gunicorn workers. Defaults
+            to $PROMETHEUS_MULTIPROC_DIR if set.
+        buckets: Histogram bucket upper bounds in seconds
+
+    Returns:
+        The MetricsRegistry to render from a `/metrics` endpoint
+    """
+    registry = MetricsRegistry(multiprocess_dir, buckets)
+    exporter: Exporter = MetricsExporter(registry)
+    current = instrumentation.get_exporter()
+    if current is not None:
+        exporter = CompositeExporter(current, exporter)
+    instrumentation.set_exporter(exporter)
+    return registry
@@ -0,0 +1,132 @@
+"""Nonce sources for payment authorizations.
+
+Every signed payment needs a fresh 32 byte nonce. `NonceSource` reads random
+bytes from the OS in batches and slices nonces off the batch, so a payer
+makes one `os.urandom` call per `batch_size` payments instead of one per
+payment. Nonces are handed out as bytes, ready for EIP-712 signing.
+
+`CounterNonceSource` produces deterministic nonces instead:
+
+    payer address (20 bytes) | instance (4 bytes) | counter (8 bytes)
+
+The instance tag is random per process and the counter starts at the current
+time in nanoseconds, so nonces keep increasing across restarts and processes
+paying from the same wallet do not collide. Servers can then index a payer's
+nonces by (instance, counter) with `parse_counter_nonce` rather than as
+opaque random values. For `upto` payments, consecutive counters also fall in
+the same Permit2 nonce bitmap word.
+
+Sources are thread-safe and start over in a forked child, which must not
+hand out its parent's nonces.
+"""
+
+import os
+import threading
+import time
+import weakref
+from typing import Optional, Union
+
+NONCE_SIZE = 32
+
+# Nonces generated per `os.urandom` call
+NONCE_BATCH_SIZE = 256
+
+_ADDRESS_SIZE = 20
+_INSTANCE_SIZE = 4
+_COUNTER_SIZE = NONCE_SIZE - _ADDRESS_SIZE - _INSTANCE_SIZE
+
+
+class NonceSource:
+    """Random 32 byte nonces, generated in batches."""
+
+    def __init__(self, batch_size: int = NONCE_BATCH_SIZE):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.batch_size = batch_size
+        self._reset()
+        _sources.add(self)
+
+    def _reset(self) -> None:
+        self._lock = threading.Lock()
+        self._pool = b""
+        self._offset = 0
+
+    def next(self) -> bytes:
+        """A nonce no other call returns"""
+        with self._lock:
+            offset = self._offset
+            if offset >= len(self._pool):
+                self._pool = os.urandom(NONCE_SIZE * self.batch_size)
+                offset = 0
+            self._offset = offset + NONCE_SIZE
+            return self._pool[offset : offset + NONCE_SIZE]
+
+
+class CounterNonceSource(NonceSource):
+    """Nonces made of the payer's address, a per-process instance tag and a
+    monotonic counter.
+
+    Args:
+        address: Address of the paying wallet
+    """
+
+    def __init__(self, address: str):
+        prefix = bytes.fromhex(address.removeprefix("0x"))
+        if len(prefix) != _ADDRESS_SIZE:
+            raise ValueError(f"Invalid address: {address!r}")
+        self.prefix = prefix
+        super().__init__()
+
+    def _reset(self) -> None:
+        self._lock = threading.Lock()
+        self._instance = os.urandom(_INSTANCE_SIZE)
+        self._counter = time.time_ns()
+
+    def next(self) -> bytes:
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        return self.prefix + self._instance + counter.to_bytes(_COUNTER_SIZE, "big")
+
+
+def parse_counter_nonce(
+    nonce: Union[bytes, str], payer: str
+) -> Optional[tuple[int, int]]:
+    """The (instance, counter) of a CounterNonceSource nonce, or None if
+    `nonce` was not made by one for `payer`.
+
+    Args:
+        nonce: Nonce as bytes, a 0x-prefixed hex string (`exact`) or a
+            decimal string (`upto`)
+        payer: Address the payment is from
+    """
+    try:
+        if isinstance(nonce, str):
+            value = int(nonce, 16) if nonce.startswith(("0x", "0X")) else int(nonce, 10)
+            nonce = value.to_bytes(NONCE_SIZE, "big")
+        prefix = bytes.fromhex(payer.removeprefix("0x"))
+    except (ValueError, OverflowError):
+        return None
+    if len(nonce) != NONCE_SIZE or nonce[:_ADDRESS_SIZE] != prefix:
+        return None
+    instance = int.from_bytes(nonce[_ADDRESS_SIZE:-_COUNTER_SIZE], "big")
+    return instance, int.from_bytes(nonce[-_COUNTER_SIZE:], "big")
+
+
+_sources: "weakref.WeakSet[NonceSource]" = weakref.WeakSet()
+
+
+def _reset_after_fork() -> None:
+    for source in list(_sources):
+        source._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+_default_source = NonceSource()
+
+
+def random_nonce() -> bytes:
+    """A random 32 byte nonce from the shared NonceSource"""
+    return _default_source.next()
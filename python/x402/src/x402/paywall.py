@@ -3,7 +3,6 @@ from typing import Dict, Any, List, Optional
 
 from x402.types import PaymentRequirements, PaywallConfig
 from x402.common import x402_VERSION
-from x402.template import PAYWALL_TEMPLATE
 
 
 def is_browser_request(headers: Dict[str, Any]) -> bool:
@@ -114,6 +113,9 @@ def get_paywall_html(
     Returns:
         Complete HTML with injected payment data
     """
+    # The template is several megabytes, load it on the first paywall render
+    from x402.template import PAYWALL_TEMPLATE
+
     return inject_payment_data(
         PAYWALL_TEMPLATE, error, payment_requirements, paywall_config
     )
@@ -0,0 +1,211 @@
+from dataclasses import dataclass
+from decimal import (
+    ROUND_CEILING,
+    ROUND_DOWN,
+    ROUND_FLOOR,
+    ROUND_HALF_EVEN,
+    ROUND_HALF_UP,
+    ROUND_UP,
+    Decimal,
+    InvalidOperation,
+)
+from functools import lru_cache
+from typing import Iterable, Literal, Optional, Union
+
+from x402.chains import TokenInfo, TokenRegistry, get_token_registry
+from x402.types import Price, TokenAmount
+
+RoundingMode = Literal["down", "up", "half_up", "half_even", "floor", "ceiling"]
+
+_ROUNDING_MODES = {
+    "down": ROUND_DOWN,
+    "up": ROUND_UP,
+    "half_up": ROUND_HALF_UP,
+    "half_even": ROUND_HALF_EVEN,
+    "floor": ROUND_FLOOR,
+    "ceiling": ROUND_CEILING,
+}
+
+# Maximum number of distinct (price, network, asset) combinations kept compiled
+PRICE_CACHE_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class CompiledPrice:
+    """A price resolved to atomic units of a specific asset on a specific network.
+
+    Attributes:
+        max_amount_required: Amount in atomic units, encoded as a string
+        asset_address: Contract address of the asset
+        eip712_name: EIP-712 domain name of the asset
+        eip712_version: EIP-712 domain version of the asset
+    """
+
+    max_amount_required: str
+    asset_address: str
+    eip712_name: str
+    eip712_version: str
+
+    @property
+    def eip712_domain(self) -> dict[str, str]:
+        # Return a fresh dict every time, compiled prices are shared through the cache
+        return {"name": self.eip712_name, "version": self.eip712_version}
+
+    def as_tuple(self) -> tuple[str, str, dict[str, str]]:
+        """Return the `(max_amount_required, asset_address, eip712_domain)` tuple
+        produced by `process_price_to_atomic_amount`"""
+        return self.max_amount_required, self.asset_address, self.eip712_domain
+
+
+def _normalize_money(amount: Union[str, int, float]) -> str:
+    if isinstance(amount, bool):
+        raise ValueError(f"Invalid money amount: {amount!r}")
+    if isinstance(amount, float):
+        # repr() is the shortest string that round-trips, so 0.001 * 3 becomes
+        # "0.003" rather than the binary expansion 0.003000000000000000062...
+        return repr(amount)
+    if isinstance(amount, int):
+        return str(amount)
+    amount = amount.strip()
+    if amount.startswith("$"):
+        amount = amount[1:]
+    return amount.replace("_", "")
+
+
+def to_atomic_units(
+    amount: Union[str, int, float], decimals: int, rounding: RoundingMode = "down"
+) -> int:
+    """Scale a human readable amount (e.g. "$0.001") to integer atomic units.
+
+    The amount is parsed as an exact decimal and shifted by `decimals` places, so
+    no binary floating point is involved. Amounts with more precision than the
+    token supports are rounded with the given rounding mode; "down" truncates
+    towards zero.
+
+    Raises:
+        ValueError: If the amount is not a finite, non-negative number or the
+            rounding mode is unknown
+    """
+    if rounding not in _ROUNDING_MODES:
+        raise ValueError(
+            f"Unknown rounding mode: {rounding}. Must be one of: {tuple(_ROUNDING_MODES)}"
+        )
+    try:
+        value = Decimal(_normalize_money(amount))
+    except InvalidOperation:
+        raise ValueError(f"Invalid money amount: {amount!r}")
+    if not value.is_finite() or value < 0:
+        raise ValueError(f"Invalid money amount: {amount!r}")
+
+    return int(value.scaleb(decimals).to_integral_value(_ROUNDING_MODES[rounding]))
+
+
+def price_key(price: Price) -> tuple:
+    """Hashable cache key for a Price (TokenAmount models are not hashable)"""
+    if isinstance(price, TokenAmount):
+        return (
+            "token",
+            price.amount,
+            price.asset.address,
+            price.asset.eip712.name,
+            price.asset.eip712.version,
+        )
+    if isinstance(price, (str, int, float)) and not isinstance(price, bool):
+        return ("money", _normalize_money(price))
+    raise ValueError(f"Invalid price type: {type(price)}")
+
+
+def _resolve_token(
+    registry: TokenRegistry, network: str, asset: Optional[str]
+) -> TokenInfo:
+    chain_id = registry.chain_id(network)
+    if asset is None:
+        return registry.get_by_symbol(chain_id, "usdc")
+    return registry.get(chain_id, asset)
+
+
+@lru_cache(maxsize=PRICE_CACHE_SIZE)
+def _compile(
+    key: tuple,
+    network: str,
+    asset: Optional[str],
+    rounding: RoundingMode,
+    registry: TokenRegistry,
+) -> CompiledPrice:
+    if key[0] == "token":
+        _, amount, address, name, version = key
+        return CompiledPrice(amount, address, name, version)
+
+    token = _resolve_token(registry, network, asset)
+    return CompiledPrice(
+        str(to_atomic_units(key[1], token.decimals, rounding)),
+        token.address,
+        token.name,
+        token.version,
+    )
+
+
+def compile_price(
+    price: Price,
+    network: str,
+    asset: Optional[str] = None,
+    rounding: RoundingMode = "down",
+) -> CompiledPrice:
+    """Resolve a Price to atomic units, memoized per (price, network, asset).
+
+    Args:
+        price: Either Money (USD string/int/float) or TokenAmount
+        network: Network identifier
+        asset: Optional token address to denominate Money prices in. Defaults to
+            the network's USDC. Ignored for TokenAmount prices.
+        rounding: How to round Money amounts with more precision than the token
+
+    Returns:
+        CompiledPrice for the given price
+
+    Raises:
+        ValueError: If the price, network or asset is invalid
+    """
+    # The registry is part of the key so registering new tokens never serves
+    # stale entries
+    return _compile(price_key(price), network, asset, rounding, get_token_registry())
+
+
+def price_many(
+    prices: Iterable[Price],
+    network: str,
+    asset: Optional[str] = None,
+    rounding: RoundingMode = "down",
+) -> list[CompiledPrice]:
+    """Compile many prices for the same network and asset at once.
+
+    Useful for building tiered price tables: the token is resolved once and each
+    Money amount only costs a decimal scale.
+
+    Raises:
+        ValueError: If any price is invalid
+    """
+    registry = get_token_registry()
+    token: Optional[TokenInfo] = None
+    compiled = []
+    for price in prices:
+        key = price_key(price)
+        if key[0] == "token":
+            compiled.append(_compile(key, network, asset, rounding, registry))
+            continue
+        if token is None:
+            token = _resolve_token(registry, network, asset)
+        compiled.append(
+            CompiledPrice(
+                str(to_atomic_units(key[1], token.decimals, rounding)),
+                token.address,
+                token.name,
+                token.version,
+            )
+        )
+    return compiled
+
+
+def clear_price_cache() -> None:
+    """Drop all memoized compiled prices"""
+    _compile.cache_clear()
@@ -0,0 +1,206 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Union, cast
+
+from typing_extensions import TypedDict
+
+from x402 import instrumentation
+from x402.common import x402_VERSION
+from x402.pricing import price_key, compile_price
+from x402.schemes import RequirementsIndex
+from x402.types import (
+    HTTPInputSchema,
+    PaymentPayload,
+    PaymentRequirements,
+    Price,
+    SupportedNetworks,
+)
+
+# A price can be fixed, or computed from the incoming request
+PriceCallable = Callable[[Any], Price]
+PriceTierKeyCallable = Callable[[Any], Hashable]
+DynamicPrice = Union[Price, PriceCallable]
+
+
+class PaymentOption(TypedDict):
+    """Another network and price a route accepts, e.g. USDC on Base next to
+    the route's Base Sepolia price"""
+
+    network: str
+    price: DynamicPrice
+
+
+# Maximum number of (tier, resource, method) combinations kept per route
+REQUIREMENTS_CACHE_SIZE = 1024
+
+# Maximum number of distinct error messages rendered per cached entry
+_MAX_CACHED_BODIES = 16
+
+
+class PaymentRequirementsEntry:
+    """Payment requirements for one tier/resource, with pre-rendered 402 bodies
+    and an index to match payments against them."""
+
+    __slots__ = ("requirements", "accepts", "index", "_json_bodies")
+
+    def __init__(self, requirements: list[PaymentRequirements]):
+        self.requirements = requirements
+        self.accepts = [req.model_dump(by_alias=True) for req in requirements]
+        self.index = RequirementsIndex(requirements)
+        self._json_bodies: dict[str, bytes] = {}
+
+    def match(self, payment: PaymentPayload) -> Optional[PaymentRequirements]:
+        """The requirements `payment` pays for, if any"""
+        return self.index.match(payment)
+
+    def json_body(self, error: str) -> bytes:
+        """Render the JSON 402 body, memoized per error message."""
+        body = self._json_bodies.get(error)
+        if body is None:
+            body = json.dumps(
+                {"x402Version": x402_VERSION, "accepts": self.accepts, "error": error},
+                separators=(",", ":"),
+            ).encode("utf-8")
+            if len(self._json_bodies) < _MAX_CACHED_BODIES:
+                self._json_bodies[error] = body
+        return body
+
+
+class PaymentRequirementsCache:
+    """Builds and caches the payment requirements for a middleware route.
+
+    Requirements only depend on the price, the resource URL and the request
+    method, so they are built once per combination and reused. For dynamic
+    prices, `price_tier_key` maps a request to a tier; the price callable is
+    only invoked the first time a tier is seen. Without a tier key the price
+    callable runs on every request and its result is used as the tier.
+
+    `options` adds further (network, price) pairs: each entry then holds one
+    requirement per option, `price` on `network` first, and matches payments
+    on any of them through its index.
+    """
+
+    def __init__(
+        self,
+        price: DynamicPrice,
+        pay_to_address: str,
+        network: str,
+        description: str = "",
+        mime_type: str = "",
+        max_deadline_seconds: int = 60,
+        input_schema: Optional[HTTPInputSchema] = None,
+        output_schema: Optional[Any] = None,
+        discoverable: Optional[bool] = True,
+        price_tier_key: Optional[PriceTierKeyCallable] = None,
+        maxsize: int = REQUIREMENTS_CACHE_SIZE,
+        scheme: str = "exact",
+        extra: Optional[dict[str, Any]] = None,
+        options: Optional[list[PaymentOption]] = None,
+    ):
+        self.price = price
+        self.pay_to_address = pay_to_address
+        self.network = network
+        self.description = description
+        self.mime_type = mime_type
+        self.max_deadline_seconds = max_deadline_seconds
+        self.input_schema = input_schema.model_dump() if input_schema else {}
+        self.output_schema = output_schema
+        self.discoverable = discoverable if discoverable is not None else True
+        self.price_tier_key = price_tier_key
+        self.maxsize = maxsize
+        self.scheme = scheme
+        self.extra = extra or {}
+        self.options: list[PaymentOption] = [
+            {"network": network, "price": price},
+            *(options or ()),
+        ]
+        self._dynamic = any(callable(option["price"]) for option in self.options)
+
+        self._entries: OrderedDict[Hashable, PaymentRequirementsEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Validate static prices up front so misconfiguration fails at startup
+        for option in self.options:
+            if not callable(option["price"]):
+                compile_price(option["price"], option["network"])
+
+    def _prices(self, request: Any) -> list[Price]:
+        return [
+            cast(PriceCallable, option["price"])(request)
+            if callable(option["price"])
+            else option["price"]
+            for option in self.options
+        ]
+
+    def _build(self, prices: list[Price], resource_url: str, method: str):
+        requirements = []
+        for option, price in zip(self.options, prices):
+            compiled = compile_price(price, option["network"])
+            requirements.append(
+                PaymentRequirements(
+                    scheme=self.scheme,
+                    network=cast(SupportedNetworks, option["network"]),
+                    asset=compiled.asset_address,
+                    max_amount_required=compiled.max_amount_required,
+                    resource=resource_url,
+                    description=self.description,
+                    mime_type=self.mime_type,
+                    pay_to=self.pay_to_address,
+                    max_timeout_seconds=self.max_deadline_seconds,
+                    # TODO: Rename output_schema to request_structure
+                    output_schema={
+                        "input": {
+                            "type": "http",
+                            "method": method,
+                            "discoverable": self.discoverable,
+                            **self.input_schema,
+                        },
+                        "output": self.output_schema,
+                    },
+                    extra={**compiled.eip712_domain, **self.extra},
+                )
+            )
+        return PaymentRequirementsEntry(requirements)
+
+    def get(
+        self, request: Any, resource_url: str, method: str
+    ) -> PaymentRequirementsEntry:
+        """Get the payment requirements for a request.
+
+        Args:
+            request: The framework request, passed to price callables
+            resource_url: URL of the resource being paid for
+            method: Upper-cased HTTP method of the request
+
+        Returns:
+            Cached PaymentRequirementsEntry for the request
+        """
+        prices: Optional[list[Price]] = None
+        if not self._dynamic:
+            tier: Hashable = None
+        elif self.price_tier_key is not None:
+            tier = self.price_tier_key(request)
+        else:
+            prices = self._prices(request)
+            tier = tuple(price_key(price) for price in prices)
+
+        key = (tier, resource_url, method)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            instrumentation.count("x402.requirements.cache", hit=True)
+            return entry
+
+        instrumentation.count("x402.requirements.cache", hit=False)
+        if prices is None:
+            prices = self._prices(request)
+        entry = self._build(prices, resource_url, method)
+
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
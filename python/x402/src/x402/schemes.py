@@ -0,0 +1,298 @@
+"""Registry of payment schemes.
+
+A scheme plugs into the SDK everything that depends on its payload: the
+payload model, how clients sign it, how it is matched to requirements, how a
+LocalFacilitator verifies and settles it, and how much it transfers. The SDK
+ships `exact` (x402.exact) and `upto` (x402.upto); others can be added with
+`register_scheme`, without changes to the middlewares or clients:
+
+    class MyScheme(Scheme):
+        name = "my-scheme"
+        payload_type = MyPaymentPayload
+
+        def create_payment_header(self, account, requirements, x402_version, **kwargs):
+            ...
+
+        async def verify_locally(self, payment, requirements, chain, now):
+            ...
+
+        async def settle_locally(self, payment, requirements, chain):
+            ...
+
+    register_scheme(MyScheme())
+
+A scheme missing one of these methods cannot be instantiated.
+"""
+
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Hashable, Iterable, Iterator, Optional
+
+from x402.types import (
+    ExactPaymentPayload,
+    PaymentPayload,
+    PaymentRequirements,
+    SchemePayload,
+    UnsupportedSchemeException,
+)
+
+if TYPE_CHECKING:
+    from eth_account import Account
+
+# Seconds an authorization must stay valid after verification, roughly the
+# time needed to get the settlement transaction mined
+VALID_BEFORE_MARGIN = 6
+
+
+class Scheme(ABC):
+    """A payment scheme.
+
+    Attributes:
+        name: Scheme name, as in `PaymentRequirements.scheme`
+        payload_type: Model of the scheme's `PaymentPayload.payload`
+        reusable: Whether one signed payload can pay for several requests, so
+            clients should keep it for the following ones
+    """
+
+    name: str
+    payload_type: type[SchemePayload]
+    reusable: bool = False
+
+    @abstractmethod
+    def create_payment_header(
+        self,
+        account: "Account",
+        requirements: PaymentRequirements,
+        x402_version: int,
+        **kwargs: Any,
+    ) -> str:
+        """Sign a payment for the requirements and encode it as an X-PAYMENT
+        header"""
+
+    def payment_asset(self, payment: PaymentPayload) -> Optional[str]:
+        """Asset a payment transfers, used to match it to requirements, or
+        None if the payload does not name it"""
+        return None
+
+    def matches(
+        self, payment: PaymentPayload, requirements: PaymentRequirements
+    ) -> bool:
+        """Whether `payment` was made for `requirements`. Only asked when
+        `payment_asset` is None and several requirements share the payment's
+        scheme and network, e.g. two tokens on one chain."""
+        return True
+
+    def payer(self, payment: PaymentPayload) -> Optional[str]:
+        """Address paying with `payment`, or None if the payload does not
+        name one. Defaults to the payload's `authorization.from`."""
+        return _authorization_field(payment, "from_")
+
+    def sticky_key(self, payment: PaymentPayload) -> Hashable:
+        """Identifies `payment`, so that its verification and settlement go
+        to the same facilitator. Defaults to the payload's
+        `authorization.nonce`, or a digest of the payload."""
+        nonce = _authorization_field(payment, "nonce")
+        return nonce if nonce is not None else payload_digest(payment)
+
+    @abstractmethod
+    async def verify_locally(
+        self,
+        payment: PaymentPayload,
+        requirements: PaymentRequirements,
+        chain: Any,
+        now: int,
+    ) -> Optional[str]:
+        """Verify a payment for a LocalFacilitator against its ChainBackend.
+
+        Returns:
+            The reason the payment is invalid, or None if it is valid
+        """
+
+    @abstractmethod
+    async def settle_locally(
+        self, payment: PaymentPayload, requirements: PaymentRequirements, chain: Any
+    ) -> str:
+        """Submit a verified payment through a ChainBackend and return its
+        transaction hash.
+
+        Raises:
+            ValueError: If the chain rejects the transfer
+        """
+
+    def settled_amount(
+        self, payment: PaymentPayload, requirements: PaymentRequirements
+    ) -> int:
+        """Atomic units transferred when settling `payment` for `requirements`"""
+        return int(requirements.max_amount_required)
+
+
+class SchemeRegistry:
+    """Immutable index of schemes by name.
+
+    Like TokenRegistry, registries are never mutated in place: `with_schemes`
+    returns a new registry, so one can be shared between threads and looked
+    up without locking.
+    """
+
+    def __init__(self, schemes: Iterable[Scheme] = ()):
+        self._schemes = MappingProxyType({scheme.name: scheme for scheme in schemes})
+
+    def with_schemes(self, *schemes: Scheme) -> "SchemeRegistry":
+        """Return a new registry with the given schemes added (or replaced)."""
+        return SchemeRegistry([*self, *schemes])
+
+    def get(self, name: Optional[str]) -> Optional[Scheme]:
+        """The scheme registered under `name`, if any"""
+        return self._schemes.get(name) if name is not None else None
+
+    def require(self, name: str) -> Scheme:
+        """The scheme registered under `name`
+
+        Raises:
+            UnsupportedSchemeException: If no such scheme is registered
+        """
+        scheme = self._schemes.get(name)
+        if scheme is None:
+            raise UnsupportedSchemeException(f"Unsupported payment scheme: {name}")
+        return scheme
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._schemes
+
+    def __iter__(self) -> Iterator[Scheme]:
+        return iter(self._schemes.values())
+
+    def __len__(self) -> int:
+        return len(self._schemes)
+
+
+class RequirementsIndex:
+    """Payment requirements indexed by (scheme, network, asset).
+
+    Built once per list of requirements, so matching a payment costs the
+    same however many schemes, networks and assets a route accepts. When
+    several requirements share a key the first one wins. Payments whose
+    scheme cannot tell their asset match the requirements for their scheme
+    and network; if there are several, the first the scheme `matches`.
+    """
+
+    __slots__ = ("_by_asset", "_by_network")
+
+    def __init__(self, requirements: Iterable[PaymentRequirements]):
+        by_asset: dict[tuple[str, str, str], PaymentRequirements] = {}
+        by_network: dict[tuple[str, str], list[PaymentRequirements]] = {}
+        for req in requirements:
+            key = (req.scheme, req.network, req.asset.lower())
+            if key not in by_asset:
+                by_asset[key] = req
+                by_network.setdefault((req.scheme, req.network), []).append(req)
+        self._by_asset = by_asset
+        self._by_network = by_network
+
+    def match(self, payment: PaymentPayload) -> Optional[PaymentRequirements]:
+        """The requirements `payment` pays for, if any"""
+        scheme = get_scheme_registry().get(payment.scheme)
+        asset = scheme.payment_asset(payment) if scheme is not None else None
+        if asset is not None:
+            return self._by_asset.get((payment.scheme, payment.network, asset.lower()))
+        candidates = self._by_network.get((payment.scheme, payment.network))
+        if not candidates:
+            return None
+        if len(candidates) > 1 and scheme is not None:
+            for req in candidates:
+                if scheme.matches(payment, req):
+                    return req
+        # Verification reports why it does not pay for any
+        return candidates[0]
+
+
+_registry: Optional[SchemeRegistry] = None
+_lock = threading.Lock()
+
+
+def get_scheme_registry() -> SchemeRegistry:
+    """Get the scheme registry used by the SDK"""
+    global _registry
+    registry = _registry
+    if registry is None:
+        # The built-in schemes import this module, load them on first use
+        from x402.exact import ExactScheme
+        from x402.upto import UptoScheme
+
+        with _lock:
+            if _registry is None:
+                _registry = SchemeRegistry([ExactScheme(), UptoScheme()])
+            registry = _registry
+    return registry
+
+
+def set_scheme_registry(registry: SchemeRegistry) -> None:
+    """Replace the scheme registry used by the SDK"""
+    global _registry
+    with _lock:
+        _registry = registry
+
+
+def register_scheme(scheme: Scheme) -> None:
+    """Add a scheme, or replace the one with the same name"""
+    registry = get_scheme_registry()
+    with _lock:
+        global _registry
+        _registry = (_registry or registry).with_schemes(scheme)
+
+
+def get_scheme(name: Optional[str]) -> Optional[Scheme]:
+    """The scheme registered under `name`, if any"""
+    return get_scheme_registry().get(name)
+
+
+def require_scheme(name: str) -> Scheme:
+    """The scheme registered under `name`
+
+    Raises:
+        UnsupportedSchemeException: If no such scheme is registered
+    """
+    return get_scheme_registry().require(name)
+
+
+def payload_type(name: Optional[str]) -> type[SchemePayload]:
+    """Payload model of a scheme, `exact`'s for unknown schemes"""
+    scheme = get_scheme(name)
+    return scheme.payload_type if scheme is not None else ExactPaymentPayload
+
+
+def _authorization_field(payment: PaymentPayload, name: str) -> Optional[str]:
+    authorization = getattr(payment.payload, "authorization", None)
+    value = getattr(authorization, name, None)
+    return value if isinstance(value, str) else None
+
+
+def payload_digest(payment: PaymentPayload) -> str:
+    """SHA-256 of a payment's payload, for payloads without a nonce"""
+    return hashlib.sha256(payment.payload.model_dump_json().encode()).hexdigest()
+
+
+def payment_payer(payment: PaymentPayload) -> Optional[str]:
+    """Address paying with `payment`, if the payload names one"""
+    scheme = get_scheme(payment.scheme)
+    if scheme is None:
+        return _authorization_field(payment, "from_")
+    return scheme.payer(payment)
+
+
+def payment_sticky_key(payment: PaymentPayload) -> Hashable:
+    """Identifies `payment` for facilitator affinity, see `Scheme.sticky_key`"""
+    scheme = get_scheme(payment.scheme)
+    if scheme is None:
+        return (payment.network, payload_digest(payment))
+    return (payment.network, scheme.sticky_key(payment))
+
+
+def settled_amount(payment: PaymentPayload, requirements: PaymentRequirements) -> int:
+    """Atomic units transferred when settling `payment`, for revenue counts"""
+    scheme = get_scheme(payment.scheme)
+    if scheme is None:
+        return int(requirements.max_amount_required)
+    return scheme.settled_amount(payment, requirements)
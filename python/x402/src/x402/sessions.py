@@ -0,0 +1,293 @@
+"""Prepaid sessions: pay once, then make several calls without settling.
+
+With a session config on a route, a successful payment buys `calls` calls.
+The paid response carries a signed session token in the X-PAYMENT-SESSION
+header. The client sends it back on the following requests, and the
+middleware checks the signature and takes one credit from a local counter,
+with no facilitator round trip. Once the credits run out or the token
+expires, the route asks for payment again.
+
+A token is `<payload>.<signature>`: the base64url encoded JSON payload and
+its HMAC-SHA256 under the server secret. The payload is readable by the
+client, which uses `paths` and `exp` to decide where to send the token.
+Credits are kept server side, in a `SessionStore`.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, NamedTuple, Optional, Protocol, Union
+
+from typing_extensions import TypedDict
+
+from x402 import instrumentation
+from x402.encoding import base64_decode_bytes, base64_encode_bytes
+
+SESSION_HEADER = "X-PAYMENT-SESSION"
+SESSION_REMAINING_HEADER = "X-PAYMENT-SESSION-REMAINING"
+DEFAULT_SESSION_TTL = 3600
+# Tokens are a few hundred bytes, reject anything much larger unread
+MAX_SESSION_TOKEN_SIZE = 2048
+# Expired sessions are dropped from memory every this many new sessions
+PRUNE_INTERVAL = 1000
+
+
+class SessionConfig(TypedDict, total=False):
+    """Configuration for prepaid sessions.
+
+    Attributes:
+        secret: HMAC key for session tokens, shared by all server processes
+        calls: Calls bought by one payment, including the paid call itself
+        ttl: Seconds a session stays valid, defaults to 1 hour
+        store: A SessionStore for the credits, defaults to a new
+            MemorySessionStore
+    """
+
+    secret: Union[str, bytes]
+    calls: int
+    ttl: int
+    # A SessionStore, typed as Any so pydantic's validate_call accepts it
+    store: Any
+
+
+class SessionStore(Protocol):
+    """Storage for the remaining credits of sessions."""
+
+    def create(self, session_id: str, credits: int, expires_at: float) -> None: ...
+
+    def consume(self, session_id: str, now: float) -> Optional[int]:
+        """Take one credit, returning the credits left, or None if the
+        session is unknown, expired or used up."""
+        ...
+
+    def restore(self, session_id: str) -> None:
+        """Give back a credit taken by `consume`."""
+        ...
+
+
+class MemorySessionStore:
+    """Session credits in process memory."""
+
+    def __init__(self):
+        self._sessions: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def create(self, session_id: str, credits: int, expires_at: float) -> None:
+        with self._lock:
+            self._sessions[session_id] = [credits, expires_at]
+            self._created += 1
+            if self._created % PRUNE_INTERVAL == 0:
+                now = time.time()
+                for key in [k for k, v in self._sessions.items() if v[1] <= now]:
+                    del self._sessions[key]
+
+    def consume(self, session_id: str, now: float) -> Optional[int]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session[0] <= 0 or session[1] <= now:
+                return None
+            session[0] -= 1
+            return int(session[0])
+
+    def restore(self, session_id: str) -> None:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session[0] += 1
+
+
+class SQLiteSessionStore:
+    """Session credits in a SQLite database shared by the processes of a server.
+
+    Args:
+        path: Database file, on a local filesystem all workers can access
+        timeout: Seconds to wait for another process' transaction
+    """
+
+    def __init__(self, path: str, timeout: float = 1.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, and new ones after a fork
+        pid = os.getpid()
+        cached = getattr(self._local, "connection", None)
+        if cached is not None and cached[0] == pid:
+            return cached[1]
+        connection = sqlite3.connect(
+            self.path, timeout=self.timeout, isolation_level=None
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS x402_sessions ("
+            "id TEXT PRIMARY KEY, remaining INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL)"
+        )
+        self._local.connection = (pid, connection)
+        return connection
+
+    def create(self, session_id: str, credits: int, expires_at: float) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "DELETE FROM x402_sessions WHERE expires_at <= ?", (time.time(),)
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO x402_sessions VALUES (?, ?, ?)",
+                (session_id, credits, expires_at),
+            )
+
+    def consume(self, session_id: str, now: float) -> Optional[int]:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            updated = connection.execute(
+                "UPDATE x402_sessions SET remaining = remaining - 1 "
+                "WHERE id = ? AND remaining > 0 AND expires_at > ?",
+                (session_id, now),
+            ).rowcount
+            row = (
+                connection.execute(
+                    "SELECT remaining FROM x402_sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+                if updated
+                else None
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return None if row is None else int(row[0])
+
+    def restore(self, session_id: str) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "UPDATE x402_sessions SET remaining = remaining + 1 WHERE id = ?",
+                (session_id,),
+            )
+
+
+def _sign(secret: bytes, payload: bytes) -> bytes:
+    return base64_encode_bytes(
+        hmac.new(secret, payload, hashlib.sha256).digest(), urlsafe=True, padding=False
+    )
+
+
+def encode_session_token(payload: dict[str, Any], secret: bytes) -> str:
+    """Sign a session token payload"""
+    encoded = base64_encode_bytes(
+        json.dumps(payload, separators=(",", ":")).encode("utf-8"),
+        urlsafe=True,
+        padding=False,
+    )
+    return (encoded + b"." + _sign(secret, encoded)).decode("ascii")
+
+
+def verify_session_token(token: str, secret: bytes) -> Optional[dict[str, Any]]:
+    """Return the payload of a session token, or None if its signature is
+    invalid"""
+    if len(token) > MAX_SESSION_TOKEN_SIZE:
+        return None
+    encoded, _, signature = token.encode("ascii", "replace").partition(b".")
+    if not hmac.compare_digest(_sign(secret, encoded), signature):
+        return None
+    return read_session_token(token)
+
+
+def read_session_token(token: str) -> Optional[dict[str, Any]]:
+    """Return the payload of a session token without verifying it, e.g. for
+    clients deciding where to send it"""
+    try:
+        payload = json.loads(
+            base64_decode_bytes(
+                token.partition(".")[0],
+                urlsafe=True,
+                max_length=MAX_SESSION_TOKEN_SIZE,
+            )
+        )
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+class SessionGrant(NamedTuple):
+    """A call paid for by a session credit."""
+
+    session_id: str
+    remaining: int
+
+
+class SessionManager:
+    """Issues and redeems the session tokens of one route.
+
+    Args:
+        config: Session configuration
+        paths: Path pattern(s) of the route, embedded in the tokens
+        clock: Returns the current time in seconds
+    """
+
+    def __init__(
+        self,
+        config: SessionConfig,
+        paths: Union[str, list[str]],
+        clock: Callable[[], float] = time.time,
+    ):
+        if not config.get("secret"):
+            raise ValueError("Session config requires a secret")
+        calls = config.get("calls", 0)
+        if calls < 2:
+            raise ValueError("Session calls must be at least 2")
+        secret = config["secret"]
+        self.secret = secret.encode("utf-8") if isinstance(secret, str) else secret
+        self.calls = calls
+        self.ttl = config.get("ttl", DEFAULT_SESSION_TTL)
+        self.store: SessionStore = config.get("store") or MemorySessionStore()
+        self.paths = paths
+        self.clock = clock
+
+    def issue(self, payer: Optional[str] = None) -> str:
+        """Start a session after a paid call, returning its token"""
+        session_id = secrets.token_urlsafe(16)
+        expires_at = int(self.clock()) + self.ttl
+        # The paid call itself used the first credit
+        self.store.create(session_id, self.calls - 1, expires_at)
+        instrumentation.count("x402.session.issued")
+        return encode_session_token(
+            {"sid": session_id, "paths": self.paths, "exp": expires_at, "payer": payer},
+            self.secret,
+        )
+
+    def redeem(self, token: Optional[str]) -> Optional[SessionGrant]:
+        """Take a credit for a call, or return None if the call has to be
+        paid for"""
+        if not token:
+            return None
+        now = self.clock()
+        payload = verify_session_token(token, self.secret)
+        if payload is None:
+            outcome = "invalid"
+        elif payload.get("paths") != self.paths:
+            # A session bought for another route
+            outcome = "invalid"
+        elif not isinstance(payload.get("exp"), int) or payload["exp"] <= now:
+            outcome = "expired"
+        else:
+            remaining = self.store.consume(str(payload.get("sid")), now)
+            if remaining is not None:
+                instrumentation.count("x402.session.redeemed", outcome="success")
+                return SessionGrant(str(payload["sid"]), remaining)
+            outcome = "exhausted"
+        instrumentation.count("x402.session.redeemed", outcome=outcome)
+        return None
+
+    def restore(self, grant: SessionGrant) -> None:
+        """Refund the credit of a call whose handler failed"""
+        self.store.restore(grant.session_id)
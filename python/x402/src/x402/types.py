@@ -2,12 +2,12 @@ from __future__ import annotations
 
 from datetime import datetime
 from enum import Enum
-from typing import Any, Optional, Union, Dict, Literal, List
+from typing import Any, Callable, Optional, Union, Dict, Literal, List
 from typing_extensions import (
     TypedDict,
 )  # use `typing_extensions.TypedDict` instead of `typing.TypedDict` on Python < 3.12
 
-from pydantic import BaseModel, ConfigDict, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, SerializeAsAny, field_validator
 from pydantic.alias_generators import to_camel
 
 from x402.networks import SupportedNetworks
@@ -89,7 +89,7 @@ class EIP712Domain(BaseModel):
 
 
 # Price can be either Money (USD string) or TokenAmount
-Money = Union[str, int]  # e.g., "$0.01", 0.01, "0.001"
+Money = Union[str, int, float]  # e.g., "$0.01", 0.01, "0.001"
 Price = Union[Money, TokenAmount]
 
 
@@ -136,8 +136,13 @@ class x402PaymentRequiredResponse(BaseModel):
     )
 
 
-class ExactPaymentPayload(BaseModel):
+class SchemePayload(BaseModel):
+    """Base class of the scheme specific `payload` of a PaymentPayload"""
+
     signature: str
+
+
+class ExactPaymentPayload(SchemePayload):
     authorization: EIP3009Authorization
 
 
@@ -164,6 +169,41 @@ class EIP3009Authorization(BaseModel):
         return v
 
 
+class UptoPaymentPayload(SchemePayload):
+    authorization: UptoAuthorization
+
+
+class UptoAuthorization(BaseModel):
+    """A Permit2 witness transfer of at most `max_value`, signed by `from`.
+
+    `spender` may transfer any amount up to `max_value` of `token` to `to`,
+    once, between `valid_after` and `valid_before`.
+    """
+
+    from_: str = Field(alias="from")
+    to: str
+    spender: str
+    token: str
+    max_value: str
+    valid_after: str
+    valid_before: str
+    nonce: str
+
+    model_config = ConfigDict(
+        alias_generator=to_camel,
+        populate_by_name=True,
+        from_attributes=True,
+    )
+
+    @field_validator("max_value", "nonce")
+    def validate_integer(cls, v):
+        try:
+            int(v)
+        except ValueError:
+            raise ValueError("max_value and nonce must be integers encoded as strings")
+        return v
+
+
 class VerifyResponse(BaseModel):
     is_valid: bool = Field(alias="isValid")
     invalid_reason: Optional[str] = Field(None, alias="invalidReason")
@@ -190,15 +230,16 @@ class SettleResponse(BaseModel):
     )
 
 
-# Union of payloads for each scheme
-SchemePayloads = ExactPaymentPayload
+# Union of payloads for each built-in scheme
+SchemePayloads = Union[ExactPaymentPayload, UptoPaymentPayload]
 
 
 class PaymentPayload(BaseModel):
     x402_version: int
     scheme: str
     network: str
-    payload: SchemePayloads
+    # Validated as the payload type registered for `scheme`, see x402.schemes
+    payload: SerializeAsAny[SchemePayload]
 
     model_config = ConfigDict(
         alias_generator=to_camel,
@@ -206,6 +247,19 @@ class PaymentPayload(BaseModel):
         from_attributes=True,
     )
 
+    @field_validator("payload", mode="before")
+    def validate_payload(cls, v, info):
+        if isinstance(v, SchemePayload):
+            return v
+        from x402.schemes import payload_type
+
+        return payload_type(info.data.get("scheme")).model_validate(v)
+
+
+# Called when a speculatively settled payment must be refunded because the
+# handler did not produce a successful response. May return an awaitable.
+RefundHook = Callable[[PaymentPayload, PaymentRequirements, SettleResponse], Any]
+
 
 class X402Headers(BaseModel):
     x_payment: str
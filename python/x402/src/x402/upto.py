@@ -0,0 +1,299 @@
+"""The `upto` scheme: pay for metered usage, up to a signed ceiling.
+
+The client signs a Permit2 witness transfer (`permitWitnessTransferFrom`)
+allowing the facilitator's `spender` address to move at most `maxValue` of
+the asset to `payTo`, once. `maxAmountRequired` in the requirements is the
+most a single request can cost. The server meters what each request actually
+uses and settles the total consumed amount later, so one authorization can
+pay for several requests until its ceiling or deadline is reached.
+
+Payers approve the Permit2 contract on the token once, beforehand.
+"""
+
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Literal, Optional, Union
+
+from x402.chains import get_chain_id
+from x402.exact import encode_payment, recover_signer
+from x402.nonces import random_nonce
+from x402.schemes import VALID_BEFORE_MARGIN, Scheme
+from x402.types import (
+    PaymentPayload,
+    PaymentRequirements,
+    UptoAuthorization,
+    UptoPaymentPayload,
+)
+
+if TYPE_CHECKING:
+    from eth_account import Account
+
+# Canonical Permit2 deployment, at the same address on every EVM chain
+PERMIT2_ADDRESS = "0x000000000022D473030F116dDEE9F6B43aC78BA3"
+
+ReserveResult = Literal["reserved", "unknown", "conflict", "exhausted"]
+
+
+def permit_witness_typed_data(
+    network: str, authorization: UptoAuthorization
+) -> dict[str, Any]:
+    """Build the EIP-712 typed data of the Permit2 witness transfer an upto
+    authorization stands for"""
+    return {
+        "types": {
+            "PermitWitnessTransferFrom": [
+                {"name": "permitted", "type": "TokenPermissions"},
+                {"name": "spender", "type": "address"},
+                {"name": "nonce", "type": "uint256"},
+                {"name": "deadline", "type": "uint256"},
+                {"name": "witness", "type": "UptoWitness"},
+            ],
+            "TokenPermissions": [
+                {"name": "token", "type": "address"},
+                {"name": "amount", "type": "uint256"},
+            ],
+            "UptoWitness": [
+                {"name": "to", "type": "address"},
+                {"name": "validAfter", "type": "uint256"},
+            ],
+        },
+        "primaryType": "PermitWitnessTransferFrom",
+        "domain": {
+            "name": "Permit2",
+            "chainId": int(get_chain_id(network)),
+            "verifyingContract": PERMIT2_ADDRESS,
+        },
+        "message": {
+            "permitted": {
+                "token": authorization.token,
+                "amount": int(authorization.max_value),
+            },
+            "spender": authorization.spender,
+            "nonce": int(authorization.nonce),
+            "deadline": int(authorization.valid_before),
+            "witness": {
+                "to": authorization.to,
+                "validAfter": int(authorization.valid_after),
+            },
+        },
+    }
+
+
+class UptoScheme(Scheme):
+    """Pays metered usage with a Permit2 witness transfer of up to a ceiling."""
+
+    name = "upto"
+    payload_type = UptoPaymentPayload
+    reusable = True
+
+    def create_payment_header(
+        self,
+        account: "Account",
+        requirements: PaymentRequirements,
+        x402_version: int,
+        max_value: Optional[int] = None,
+        nonce: Optional[Union[bytes, str]] = None,
+        **kwargs: Any,
+    ) -> str:
+        """Sign an authorization of up to `max_value`.
+
+        Args:
+            max_value: Ceiling in atomic units, at least `max_amount_required`.
+                A higher ceiling lets the authorization pay for more requests.
+            nonce: 32 byte Permit2 nonce, as bytes or hex encoded. Random by
+                default.
+        """
+        spender = (requirements.extra or {}).get("spender")
+        if not spender:
+            raise ValueError("upto payment requirements must include extra.spender")
+        if nonce is None:
+            nonce = random_nonce()
+        if isinstance(nonce, str):
+            nonce = bytes.fromhex(nonce.removeprefix("0x"))
+        ceiling = max(int(requirements.max_amount_required), max_value or 0)
+        now = int(time.time())
+        authorization = UptoAuthorization(
+            from_=account.address,
+            to=requirements.pay_to,
+            spender=spender,
+            token=requirements.asset,
+            max_value=str(ceiling),
+            valid_after=str(now - 60),  # 60 seconds before
+            valid_before=str(now + requirements.max_timeout_seconds),
+            nonce=str(int.from_bytes(nonce, "big")),
+        )
+        typed_data = permit_witness_typed_data(requirements.network, authorization)
+        signed_message = account.sign_typed_data(
+            domain_data=typed_data["domain"],
+            message_types=typed_data["types"],
+            message_data=typed_data["message"],
+        )
+        signature = signed_message.signature.hex()
+        if not signature.startswith("0x"):
+            signature = f"0x{signature}"
+
+        return encode_payment(
+            {
+                "x402Version": x402_version,
+                "scheme": self.name,
+                "network": requirements.network,
+                "payload": UptoPaymentPayload(
+                    signature=signature, authorization=authorization
+                ).model_dump(by_alias=True),
+            }
+        )
+
+    def payment_asset(self, payment: PaymentPayload) -> Optional[str]:
+        return payment.payload.authorization.token  # type: ignore[attr-defined]
+
+    async def verify_locally(
+        self,
+        payment: PaymentPayload,
+        requirements: PaymentRequirements,
+        chain: Any,
+        now: int,
+    ) -> Optional[str]:
+        """Verify the authorization covers `max_amount_required`"""
+        authorization = payment.payload.authorization  # type: ignore[attr-defined]
+        payer = authorization.from_
+
+        try:
+            typed_data = permit_witness_typed_data(payment.network, authorization)
+            signer = recover_signer(typed_data, payment.payload.signature)
+        except Exception:
+            return "invalid_upto_evm_payload_signature"
+        if signer.lower() != payer.lower():
+            return "invalid_upto_evm_payload_signature"
+
+        spender = (requirements.extra or {}).get("spender", "")
+        if authorization.spender.lower() != spender.lower():
+            return "invalid_upto_evm_payload_spender_mismatch"
+        if authorization.token.lower() != requirements.asset.lower():
+            return "invalid_upto_evm_payload_asset_mismatch"
+        if authorization.to.lower() != requirements.pay_to.lower():
+            return "invalid_upto_evm_payload_recipient_mismatch"
+
+        if int(authorization.valid_before) < now + VALID_BEFORE_MARGIN:
+            return "invalid_upto_evm_payload_authorization_valid_before"
+        if int(authorization.valid_after) > now:
+            return "invalid_upto_evm_payload_authorization_valid_after"
+
+        amount = int(requirements.max_amount_required)
+        if int(authorization.max_value) < amount:
+            return "invalid_upto_evm_payload_authorization_value"
+
+        network = requirements.network
+        if await chain.permit2_nonce_used(network, payer, authorization.nonce):
+            return "invalid_upto_evm_payload_authorization_nonce"
+        if await chain.balance_of(network, authorization.token, payer) < amount:
+            return "insufficient_funds"
+        return None
+
+    async def settle_locally(
+        self, payment: PaymentPayload, requirements: PaymentRequirements, chain: Any
+    ) -> str:
+        # The requirements of an upto payment carry the consumed amount
+        return await chain.permit_witness_transfer(
+            requirements.network,
+            payment.payload.authorization,  # type: ignore[attr-defined]
+            int(requirements.max_amount_required),
+            payment.payload.signature,
+        )
+
+
+class _Budget:
+    __slots__ = (
+        "payload",
+        "max_value",
+        "valid_before",
+        "consumed",
+        "reserved",
+        "closed",
+    )
+
+    def __init__(self, payload: Any, max_value: int, valid_before: int):
+        # The verified signed payload, the only one the budget accepts
+        self.payload = payload
+        self.max_value = max_value
+        self.valid_before = valid_before
+        self.consumed = 0
+        self.reserved = 0
+        self.closed = False
+
+
+class UptoTracker:
+    """Tracks how much of each verified upto authorization has been used.
+
+    A request reserves the most it can cost before running and is charged
+    what it used afterwards, so concurrent requests on one authorization
+    never exceed its ceiling. Only the exact signed payload that was
+    verified can reserve: a payload reusing its nonce with another
+    signature or authorization gets "conflict" and must be verified.
+    Thread-safe.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._budgets: dict[tuple[str, str, str], _Budget] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(payment: PaymentPayload) -> tuple[str, str, str]:
+        authorization = payment.payload.authorization  # type: ignore[attr-defined]
+        return payment.network, authorization.from_.lower(), authorization.nonce
+
+    def open(self, payment: PaymentPayload) -> None:
+        """Start tracking a verified authorization"""
+        authorization = payment.payload.authorization  # type: ignore[attr-defined]
+        now = self.clock()
+        with self._lock:
+            # Authorizations past their deadline can no longer be settled
+            for key in [k for k, b in self._budgets.items() if b.valid_before <= now]:
+                del self._budgets[key]
+            self._budgets.setdefault(
+                self._key(payment),
+                _Budget(
+                    payment.payload,
+                    int(authorization.max_value),
+                    int(authorization.valid_before),
+                ),
+            )
+
+    def reserve(self, payment: PaymentPayload, amount: int) -> ReserveResult:
+        """Reserve `amount` for a request paid by `payment`"""
+        with self._lock:
+            budget = self._budgets.get(self._key(payment))
+            if budget is None:
+                return "unknown"
+            if budget.payload != payment.payload:
+                return "conflict"
+            if (
+                budget.closed
+                or budget.valid_before <= self.clock()
+                or budget.consumed + budget.reserved + amount > budget.max_value
+            ):
+                return "exhausted"
+            budget.reserved += amount
+            return "reserved"
+
+    def charge(self, payment: PaymentPayload, reserved: int, cost: int) -> int:
+        """Replace a reservation by the actual cost of the request, returning
+        the total consumed"""
+        with self._lock:
+            budget = self._budgets.get(self._key(payment))
+            if budget is None:
+                return 0
+            budget.reserved -= reserved
+            budget.consumed += min(cost, reserved)
+            return budget.consumed
+
+    def release(self, payment: PaymentPayload, reserved: int) -> None:
+        """Drop the reservation of a request that is not charged"""
+        self.charge(payment, reserved, 0)
+
+    def close(self, payment: PaymentPayload) -> None:
+        """Stop accepting an authorization, e.g. once it is being settled"""
+        with self._lock:
+            budget = self._budgets.get(self._key(payment))
+            if budget is not None:
+                budget.closed = True
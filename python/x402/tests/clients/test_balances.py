@@ -0,0 +1,176 @@
+import json
+import threading
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+from eth_account import Account
+
+from x402.clients.balances import (
+    BalanceTracker,
+    InMemoryBalances,
+    JsonRpcBalanceProvider,
+)
+from x402.clients.base import InsufficientFundsError, PaymentError, x402Client
+from x402.clients.httpx import x402_payment_hooks
+from x402.types import PaymentRequirements, x402PaymentRequiredResponse
+
+USDC = "0x036CbD53842c5426634e7929541eC2318f3dCF7e"
+
+
+@pytest.fixture
+def account():
+    return Account.create()
+
+
+@pytest.fixture
+def requirements():
+    return PaymentRequirements(
+        scheme="exact",
+        network="base-sepolia",
+        asset=USDC,
+        pay_to="0x1111111111111111111111111111111111111111",
+        max_amount_required="400",
+        resource="https://example.com",
+        description="",
+        max_timeout_seconds=60,
+        mime_type="",
+        extra={"name": "USDC", "version": "2"},
+    )
+
+
+def test_tracker_holds_and_reconciles(account, requirements):
+    provider = InMemoryBalances()
+    provider.set("base-sepolia", USDC, account.address, 1000)
+    now = [0.0]
+    tracker = BalanceTracker(provider, ttl=10, clock=lambda: now[0])
+    owner = account.address
+
+    tracker.hold(owner, requirements)
+    tracker.hold(owner, requirements)
+    assert tracker.available(owner, requirements) == 200
+    # Two payments in flight leave too little for a third
+    with pytest.raises(InsufficientFundsError):
+        tracker.hold(owner, requirements)
+    assert provider.reads == 1
+
+    # A rejected payment is released, an accepted one deducted
+    tracker.settle(owner, requirements, succeeded=False)
+    tracker.settle(owner, requirements, succeeded=True)
+    assert tracker.available(owner, requirements) == 600
+
+    # Expired balances are read again
+    provider.set("base-sepolia", USDC, owner, 50)
+    now[0] = 11.0
+    assert tracker.available(owner, requirements) == 50
+    assert provider.reads == 2
+
+
+def test_provider_errors_do_not_block_payments(requirements):
+    class FailingProvider:
+        def balance_of(self, network, asset, owner):
+            raise httpx.ConnectError("unreachable")
+
+    tracker = BalanceTracker(FailingProvider())
+    tracker.hold("0x2222222222222222222222222222222222222222", requirements)
+
+
+def test_client_fails_before_signing(account, requirements, monkeypatch):
+    provider = InMemoryBalances()
+    provider.set("base-sepolia", USDC, account.address, 500)
+    client = x402Client(account, balance_tracker=BalanceTracker(provider))
+
+    client.create_payment_header(requirements, 1)
+    signed = []
+    monkeypatch.setattr(account, "sign_typed_data", lambda *a, **k: signed.append(1))
+    with pytest.raises(InsufficientFundsError):
+        client.create_payment_header(requirements, 1)
+    assert signed == []
+
+    # The server rejected the first payment, so its amount is available again
+    client.record_payment(requirements, False, 0.1)
+    monkeypatch.undo()
+    client.create_payment_header(requirements, 1)
+
+
+def payment_required(requirements):
+    response = httpx.Response(402, request=httpx.Request("GET", "https://example.com"))
+    response._content = json.dumps(
+        x402PaymentRequiredResponse(
+            x402_version=1, accepts=[requirements], error=""
+        ).model_dump(by_alias=True)
+    ).encode()
+    return response
+
+
+async def test_httpx_hooks_read_balances_off_the_event_loop(account, requirements):
+    threads = []
+
+    class Provider(InMemoryBalances):
+        def balance_of(self, network, asset, owner):
+            threads.append(threading.current_thread())
+            return 1000
+
+    hooks = x402_payment_hooks(account, balance_tracker=BalanceTracker(Provider()))
+    sender = AsyncMock()
+    sender.__aenter__.return_value = sender
+    sender.send.return_value = httpx.Response(200)
+    with patch("x402.clients.httpx.AsyncClient", return_value=sender):
+        response = await hooks["response"][0](payment_required(requirements))
+
+    assert response.status_code == 200
+    assert threads and threads[0] is not threading.main_thread()
+
+
+async def test_failed_payments_release_their_hold(account, requirements, monkeypatch):
+    provider = InMemoryBalances()
+    provider.set("base-sepolia", USDC, account.address, 500)
+    tracker = BalanceTracker(provider)
+    hooks = x402_payment_hooks(account, balance_tracker=tracker)
+    sender = AsyncMock()
+    sender.__aenter__.return_value = sender
+    sender.send.side_effect = httpx.ReadTimeout("timed out")
+
+    # Each attempt would otherwise hold 400 of the 500 until the TTL expires
+    for _ in range(2):
+        with patch("x402.clients.httpx.AsyncClient", return_value=sender):
+            with pytest.raises(PaymentError):
+                await hooks["response"][0](payment_required(requirements))
+        assert tracker.available(account.address, requirements) == 500
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("signer unavailable")
+
+    monkeypatch.setattr(account, "sign_typed_data", fail)
+    with pytest.raises(RuntimeError):
+        x402Client(account, balance_tracker=tracker).create_payment_header(
+            requirements, 1
+        )
+    assert tracker.available(account.address, requirements) == 500
+
+
+def test_json_rpc_provider_calls_balance_of(monkeypatch):
+    calls = []
+
+    def post(url, json, timeout):
+        calls.append((url, json))
+        return httpx.Response(
+            200,
+            json={"jsonrpc": "2.0", "id": 1, "result": hex(1234)},
+            request=httpx.Request("POST", url),
+        )
+
+    monkeypatch.setattr(httpx, "post", post)
+    provider = JsonRpcBalanceProvider({"base": "https://rpc.example.com"})
+    owner = "0x2222222222222222222222222222222222222222"
+    assert provider.balance_of("base", USDC, owner) == 1234
+
+    [(url, body)] = calls
+    assert url == "https://rpc.example.com"
+    assert body["method"] == "eth_call"
+    call = body["params"][0]
+    assert call["to"] == USDC
+    assert call["data"] == "0x70a08231" + "00" * 12 + "22" * 20
+
+    with pytest.raises(ValueError):
+        provider.balance_of("avalanche", USDC, owner)
@@ -12,6 +12,7 @@ from x402.clients.requests import (
 from x402.clients.base import (
     PaymentError,
 )
+from x402.sessions import SESSION_HEADER, SESSION_REMAINING_HEADER, SessionManager
 from x402.types import PaymentRequirements, x402PaymentRequiredResponse
 
 
@@ -308,3 +309,26 @@ def test_x402_requests(account):
         adapter.client.select_payment_requirements
         != adapter.client.__class__.select_payment_requirements
     )
+
+
+def test_adapter_sends_session_token(adapter):
+    token = SessionManager({"secret": "s", "calls": 2}, "/api/*").issue()
+    granted = Response()
+    granted.status_code = 200
+    granted.headers[SESSION_HEADER] = token
+    used_up = Response()
+    used_up.status_code = 200
+    used_up.headers[SESSION_REMAINING_HEADER] = "0"
+
+    first = PreparedRequest()
+    first.prepare("GET", "https://example.com/api/a")
+    with patch("requests.adapters.HTTPAdapter.send", return_value=granted):
+        adapter.send(first)
+    assert SESSION_HEADER not in first.headers
+
+    second = PreparedRequest()
+    second.prepare("GET", "https://example.com/api/b")
+    with patch("requests.adapters.HTTPAdapter.send", return_value=used_up):
+        adapter.send(second)
+    assert second.headers[SESSION_HEADER] == token
+    assert adapter.client.sessions.get("https://example.com/api/b") is None
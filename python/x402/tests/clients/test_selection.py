@@ -0,0 +1,132 @@
+import base64
+import json
+
+import pytest
+from eth_account import Account
+
+from x402.clients.balances import BalanceTracker, InMemoryBalances
+from x402.clients.base import (
+    InsufficientFundsError,
+    PaymentAmountExceededError,
+    x402Client,
+)
+from x402.clients.selection import CostAwareSelector, PaymentStats
+from x402.types import PaymentRequirements
+
+BASE_USDC = "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913"
+AVALANCHE_USDC = "0xB97EF9Ef8734C71904D8002F8b6Bc66Dd9c48a6E"
+
+
+def make_requirements(network, asset, amount, resource="https://example.com/a"):
+    return PaymentRequirements(
+        scheme="exact",
+        network=network,
+        asset=asset,
+        pay_to="0x1111111111111111111111111111111111111111",
+        max_amount_required=str(amount),
+        resource=resource,
+        description="",
+        max_timeout_seconds=60,
+        mime_type="",
+    )
+
+
+@pytest.fixture
+def accepts():
+    return [
+        make_requirements("base", BASE_USDC, 20000),
+        make_requirements("avalanche", AVALANCHE_USDC, 10000),
+    ]
+
+
+def test_selects_lowest_expected_cost(accepts):
+    assert CostAwareSelector()(accepts).network == "avalanche"
+
+    # 0.01 USDC cheaper, but 0.05 more in fees
+    selector = CostAwareSelector({"network_costs": {"avalanche": 0.05}})
+    assert selector(accepts).network == "base"
+
+    # Slow settlement outweighs the price difference
+    selector = CostAwareSelector({"latency_cost": 0.01})
+    selector.stats.record_payment("avalanche", 5.0, succeeded=True)
+    selector.stats.record_payment("base", 0.5, succeeded=True)
+    assert selector(accepts).network == "base"
+
+
+def test_filters_and_max_value(accepts):
+    selector = CostAwareSelector()
+    assert selector(accepts, network_filter="base").network == "base"
+    assert selector(accepts, max_value=15000).network == "avalanche"
+    with pytest.raises(PaymentAmountExceededError):
+        selector(accepts, max_value=5000)
+
+
+def test_decisions_are_cached_per_resource(accepts, monkeypatch):
+    now = [0.0]
+    selector = CostAwareSelector({"decision_ttl": 10}, clock=lambda: now[0])
+    calls = []
+    cost = selector.cost
+    monkeypatch.setattr(
+        selector, "cost", lambda requirements: calls.append(1) or cost(requirements)
+    )
+
+    assert selector(accepts).network == "avalanche"
+    assert selector(accepts).network == "avalanche"
+    assert len(calls) == 2
+
+    # A known balance too low for the cheapest entry invalidates the decision
+    selector.stats.record_balance("avalanche", AVALANCHE_USDC, 5000)
+    assert selector(accepts).network == "base"
+    assert len(calls) == 4
+
+    # Other resources are scored on their own
+    other = [make_requirements("base", BASE_USDC, 1, "https://example.com/b")]
+    assert selector(other) is other[0]
+
+    now[0] = 11.0
+    selector(accepts)
+    assert len(calls) == 7
+
+
+def test_unaffordable_entries_are_a_last_resort(accepts):
+    stats = PaymentStats()
+    stats.record_balance("base", BASE_USDC, 0)
+    stats.record_balance("avalanche", AVALANCHE_USDC, 0)
+    assert CostAwareSelector(stats=stats)(accepts).network == "avalanche"
+
+
+def test_client_feeds_receipts_to_selector_stats(accepts):
+    selector = CostAwareSelector()
+    client = x402Client(Account.create(), payment_requirements_selector=selector)
+    assert client.payment_stats is selector.stats
+
+    receipt = base64.b64encode(
+        json.dumps({"success": False, "network": "avalanche"}).encode()
+    ).decode()
+    client.record_payment(accepts[1], True, 1.5, receipt)
+    assert selector.stats.failure_rate("avalanche") == 1.0
+    assert selector.stats.latency("avalanche") == 1.5
+
+    # Without stats nothing is recorded
+    x402Client(Account.create()).record_payment(accepts[0], True, 1.0)
+
+
+def test_client_feeds_tracked_balances_to_selector(accepts):
+    account = Account.create()
+    provider = InMemoryBalances()
+    provider.set("base", BASE_USDC, account.address, 100000)
+    provider.set("avalanche", AVALANCHE_USDC, account.address, 5000)
+    selector = CostAwareSelector()
+    client = x402Client(
+        account,
+        payment_requirements_selector=selector,
+        balance_tracker=BalanceTracker(provider),
+    )
+
+    # The cheapest entry is chosen until the wallet is found unable to pay it
+    chosen = client.select_payment_requirements(accepts)
+    assert chosen.network == "avalanche"
+    with pytest.raises(InsufficientFundsError):
+        client.create_payment_header(chosen, 1)
+    assert selector.stats.balance("avalanche", AVALANCHE_USDC) == 5000
+    assert client.select_payment_requirements(accepts).network == "base"
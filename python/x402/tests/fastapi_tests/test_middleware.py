@@ -1,7 +1,23 @@
+import asyncio
+import base64
+import json
+
+import pytest
+from eth_account import Account
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.testclient import TestClient
-from x402.fastapi.middleware import require_payment
-from x402.types import PaywallConfig
+from x402.clients.base import decode_x_payment_response
+from x402.clients.base import x402Client
+from x402.facilitator import FacilitatorClient
+from x402.local_facilitator import LocalFacilitator
+from x402.fastapi.middleware import PaymentMiddleware, require_payment
+from x402.types import (
+    PaymentRequirements,
+    PaywallConfig,
+    SettleResponse,
+    VerifyResponse,
+)
 
 
 async def test_endpoint():
@@ -529,3 +545,427 @@ def test_payment_amount_conversion():
     html_content = response.text
     # $0.001 should be converted to 0.001 in the display
     assert '"amount": 0.001' in html_content
+
+
+def test_middleware_dynamic_price():
+    app = FastAPI()
+    app.get("/test")(test_endpoint)
+
+    def price(request: Request):
+        return f"${int(request.query_params.get('units', '1')) * 0.001}"
+
+    app.middleware("http")(
+        require_payment(
+            price=price,
+            pay_to_address="0x1111111111111111111111111111111111111111",
+            path="/test",
+            network="base-sepolia",
+            price_tier_key=lambda request: request.query_params.get("units", "1"),
+        )
+    )
+
+    client = TestClient(app)
+    response = client.get("/test?units=3")
+    assert response.status_code == 402
+    assert response.json()["accepts"][0]["maxAmountRequired"] == "3000"
+
+    response = client.get("/test")
+    assert response.status_code == 402
+    assert response.json()["accepts"][0]["maxAmountRequired"] == "1000"
+
+
+def payment_header(network: str = "base-sepolia") -> str:
+    return base64.b64encode(
+        json.dumps(
+            {
+                "x402Version": 1,
+                "scheme": "exact",
+                "network": network,
+                "payload": {
+                    "signature": "0x" + "ab" * 65,
+                    "authorization": {
+                        "from": "0x2222222222222222222222222222222222222222",
+                        "to": "0x1111111111111111111111111111111111111111",
+                        "value": "1000000",
+                        "validAfter": "0",
+                        "validBefore": "9999999999",
+                        "nonce": "0x" + "00" * 32,
+                    },
+                },
+            }
+        ).encode("utf-8")
+    ).decode("utf-8")
+
+
+@pytest.fixture
+def facilitator(monkeypatch):
+    calls = {"verify": 0, "settle": 0}
+
+    async def verify(self, payment, requirements):
+        calls["verify"] += 1
+        return VerifyResponse(is_valid=True, payer=payment.payload.authorization.from_)
+
+    async def settle(self, payment, requirements):
+        calls["settle"] += 1
+        return SettleResponse(
+            success=True, transaction="0xabc", network=payment.network
+        )
+
+    monkeypatch.setattr(FacilitatorClient, "verify", verify)
+    monkeypatch.setattr(FacilitatorClient, "settle", settle)
+    return calls
+
+
+def create_streaming_app(**kwargs):
+    app = FastAPI()
+
+    @app.get("/stream")
+    async def stream():
+        async def tokens():
+            for token in ["hello", " ", "world"]:
+                yield f"data: {token}\n\n"
+
+        return StreamingResponse(tokens(), media_type="text/event-stream")
+
+    @app.get("/sized")
+    async def sized():
+        return Response("data: hello\n\n", media_type="text/event-stream")
+
+    @app.get("/json")
+    async def json_endpoint():
+        return {"message": "success"}
+
+    app.middleware("http")(
+        require_payment(
+            price="$1.00",
+            pay_to_address="0x1111111111111111111111111111111111111111",
+            network="base-sepolia",
+            stream_settlement=True,
+            **kwargs,
+        )
+    )
+    return app
+
+
+def test_stream_settlement_sse_event(facilitator):
+    client = TestClient(create_streaming_app())
+
+    response = client.get("/stream", headers={"X-PAYMENT": payment_header()})
+
+    assert response.status_code == 200
+    assert "X-PAYMENT-RESPONSE" not in response.headers
+    body = response.text
+    assert body.startswith("data: hello\n\ndata:  \n\ndata: world\n\n")
+    event = body.split("data: world\n\n", 1)[1]
+    assert event.startswith("event: x402-payment-response\ndata: ")
+    receipt = decode_x_payment_response(event.split("data: ", 1)[1].strip())
+    assert receipt["success"] is True
+    assert receipt["transaction"] == "0xabc"
+    assert facilitator["settle"] == 1
+
+
+@pytest.mark.parametrize("middleware", ["require_payment", "asgi"])
+def test_stream_settlement_drops_content_length(facilitator, middleware):
+    if middleware == "asgi":
+        app = create_asgi_app(stream_settlement=True)
+    else:
+        app = create_streaming_app()
+    client = TestClient(app)
+
+    # The handler's Content-Length does not count the receipt event
+    response = client.get("/sized", headers={"X-PAYMENT": payment_header()})
+    assert response.status_code == 200
+    assert "content-length" not in response.headers
+    body = response.text
+    assert body.startswith("data: hello\n\nevent: x402-payment-response\ndata: ")
+    assert facilitator["settle"] == 1
+
+
+async def test_stream_settlement_trailers(facilitator):
+    app = create_streaming_app()
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/json",
+        "raw_path": b"/json",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"x-payment", payment_header().encode()),
+        ],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+        "extensions": {"http.response.trailers": {}},
+    }
+    await app(scope, receive, send)
+
+    start = messages[0]
+    assert start["type"] == "http.response.start"
+    assert start["trailers"] is True
+    assert (b"x-payment-response", b"") not in start["headers"]
+    assert (b"trailer", b"X-PAYMENT-RESPONSE") in start["headers"]
+
+    trailers = messages[-1]
+    assert trailers["type"] == "http.response.trailers"
+    [(name, value)] = trailers["headers"]
+    assert name == b"x-payment-response"
+    assert decode_x_payment_response(value.decode())["transaction"] == "0xabc"
+
+
+def create_speculative_app(refunds, status_code=200):
+    app = FastAPI()
+    events = []
+
+    @app.get("/resource")
+    async def resource():
+        events.append("handler")
+        # Give the speculative settlement a chance to start
+        await asyncio.sleep(0.01)
+        return JSONResponse({"message": "done"}, status_code=status_code)
+
+    async def refund_hook(payment, requirements, settle_response):
+        refunds.append(settle_response.transaction)
+
+    app.middleware("http")(
+        require_payment(
+            price="$1.00",
+            pay_to_address="0x1111111111111111111111111111111111111111",
+            network="base-sepolia",
+            speculative_settle=True,
+            refund_hook=refund_hook,
+        )
+    )
+    return app, events
+
+
+def test_speculative_settle_runs_concurrently(facilitator, monkeypatch):
+    refunds = []
+    app, events = create_speculative_app(refunds)
+    settle = FacilitatorClient.settle
+
+    async def tracking_settle(self, payment, requirements):
+        events.append("settle")
+        return await settle(self, payment, requirements)
+
+    monkeypatch.setattr(FacilitatorClient, "settle", tracking_settle)
+
+    response = TestClient(app).get("/resource", headers={"X-PAYMENT": payment_header()})
+
+    assert response.status_code == 200
+    assert "settle" in events and "handler" in events
+    assert decode_x_payment_response(response.headers["X-PAYMENT-RESPONSE"])["success"]
+    assert refunds == []
+
+
+def test_speculative_settle_refunds_failed_handler(facilitator):
+    refunds = []
+    app, _ = create_speculative_app(refunds, status_code=500)
+
+    response = TestClient(app).get("/resource", headers={"X-PAYMENT": payment_header()})
+
+    # The handler's response is kept, with the receipt for the settled payment
+    assert response.status_code == 500
+    assert response.json() == {"message": "done"}
+    assert "X-PAYMENT-RESPONSE" in response.headers
+    assert refunds == ["0xabc"]
+    assert facilitator["settle"] == 1
+
+
+def create_asgi_app(**kwargs):
+    app = FastAPI()
+
+    @app.get("/paid")
+    async def paid(request: Request):
+        return {"payer_network": request.state.payment_details.network}
+
+    @app.get("/free")
+    async def free():
+        return {"message": "free"}
+
+    @app.get("/stream")
+    async def stream():
+        async def tokens():
+            yield "data: hello\n\n"
+
+        return StreamingResponse(tokens(), media_type="text/event-stream")
+
+    @app.get("/sized")
+    async def sized():
+        return Response("data: hello\n\n", media_type="text/event-stream")
+
+    app.add_middleware(
+        PaymentMiddleware,
+        price="$1.00",
+        pay_to_address="0x1111111111111111111111111111111111111111",
+        path=["/paid", "/stream", "/sized"],
+        network="base-sepolia",
+        **kwargs,
+    )
+    return app
+
+
+def test_asgi_middleware_passes_through_unmatched_paths(facilitator):
+    client = TestClient(create_asgi_app())
+
+    response = client.get("/free")
+    assert response.status_code == 200
+    assert response.json() == {"message": "free"}
+    assert facilitator == {"verify": 0, "settle": 0}
+
+
+def test_asgi_middleware_requires_payment():
+    client = TestClient(create_asgi_app())
+
+    response = client.get("/paid")
+    assert response.status_code == 402
+    assert response.json()["error"] == "No X-PAYMENT header provided"
+    assert response.json()["accepts"][0]["maxAmountRequired"] == "1000000"
+
+
+def test_asgi_middleware_settles_paid_request(facilitator):
+    client = TestClient(create_asgi_app())
+
+    response = client.get("/paid", headers={"X-PAYMENT": payment_header()})
+    assert response.status_code == 200
+    assert response.json() == {"payer_network": "base-sepolia"}
+    receipt = decode_x_payment_response(response.headers["X-PAYMENT-RESPONSE"])
+    assert receipt["transaction"] == "0xabc"
+    assert facilitator == {"verify": 1, "settle": 1}
+
+
+def test_asgi_middleware_settle_failure_returns_402(facilitator, monkeypatch):
+    async def settle(self, payment, requirements):
+        return SettleResponse(success=False, error_reason="insufficient_funds")
+
+    monkeypatch.setattr(FacilitatorClient, "settle", settle)
+    client = TestClient(create_asgi_app())
+
+    response = client.get("/paid", headers={"X-PAYMENT": payment_header()})
+    assert response.status_code == 402
+    assert response.json()["error"] == "Settle failed: insufficient_funds"
+
+
+def test_asgi_middleware_stream_settlement(facilitator):
+    client = TestClient(create_asgi_app(stream_settlement=True))
+
+    response = client.get("/stream", headers={"X-PAYMENT": payment_header()})
+    assert response.status_code == 200
+    body = response.text
+    assert body.startswith("data: hello\n\nevent: x402-payment-response\ndata: ")
+    assert "X-PAYMENT-RESPONSE" not in response.headers
+
+
+def test_asgi_middleware_validates_options():
+    with pytest.raises(ValueError, match="Unsupported network"):
+        PaymentMiddleware(
+            FastAPI(),
+            price="$1.00",
+            pay_to_address="0x1111111111111111111111111111111111111111",
+            network="not-a-network",
+        )
+
+
+def test_local_facilitator_end_to_end():
+    account = Account.create()
+    local = LocalFacilitator()
+    local.chain.mint(
+        "base-sepolia",
+        "0x036CbD53842c5426634e7929541eC2318f3dCF7e",
+        account.address,
+        2_000_000,
+    )
+    app = FastAPI()
+    app.get("/test")(test_endpoint)
+    app.middleware("http")(
+        require_payment(
+            price="$1.00",
+            pay_to_address="0x1111111111111111111111111111111111111111",
+            network="base-sepolia",
+            facilitator=local,
+        )
+    )
+    client = TestClient(app)
+
+    payment_required = client.get("/test").json()
+    requirements = x402Client(account).select_payment_requirements(
+        [PaymentRequirements(**r) for r in payment_required["accepts"]]
+    )
+    header = x402Client(account).create_payment_header(requirements, 1)
+
+    response = client.get("/test", headers={"X-PAYMENT": header})
+    assert response.status_code == 200
+    receipt = decode_x_payment_response(response.headers["X-PAYMENT-RESPONSE"])
+    assert receipt["success"]
+    assert receipt["payer"] == account.address
+
+    # Replaying the same payment is rejected
+    response = client.get("/test", headers={"X-PAYMENT": header})
+    assert response.status_code == 402
+
+
+def test_options_accept_payment_on_any_network():
+    account = Account.create()
+    local = LocalFacilitator()
+    app = FastAPI()
+    app.get("/test")(test_endpoint)
+    app.add_middleware(
+        PaymentMiddleware,
+        price="$1.00",
+        pay_to_address="0x1111111111111111111111111111111111111111",
+        network="base-sepolia",
+        options=[{"network": "base", "price": "$0.50"}],
+        facilitator=local,
+    )
+    client = TestClient(app)
+
+    accepts = client.get("/test").json()["accepts"]
+    assert [(r["network"], r["maxAmountRequired"]) for r in accepts] == [
+        ("base-sepolia", "1000000"),
+        ("base", "500000"),
+    ]
+    mainnet = PaymentRequirements(**accepts[1])
+    local.chain.mint("base", mainnet.asset, account.address, 500_000)
+    header = x402Client(account).create_payment_header(mainnet, 1)
+
+    response = client.get("/test", headers={"X-PAYMENT": header})
+    assert response.status_code == 200
+    receipt = decode_x_payment_response(response.headers["X-PAYMENT-RESPONSE"])
+    assert receipt["network"] == "base"
+
+    with pytest.raises(ValueError, match="Unsupported network"):
+        require_payment(
+            price="$1.00",
+            pay_to_address="0x1111111111111111111111111111111111111111",
+            options=[{"network": "not-a-network", "price": "$1.00"}],
+        )
+
+
+def test_oversized_payment_header_rejected_before_verify(facilitator):
+    app = FastAPI()
+    app.get("/test")(test_endpoint)
+    app.middleware("http")(
+        require_payment(
+            price="$1.00",
+            pay_to_address="0x1111111111111111111111111111111111111111",
+            max_payment_header_size=256,
+        )
+    )
+    client = TestClient(app)
+
+    response = client.get("/test", headers={"X-PAYMENT": payment_header()})
+
+    assert response.status_code == 402
+    assert response.json()["error"] == "Invalid payment header format"
+    assert facilitator["verify"] == 0
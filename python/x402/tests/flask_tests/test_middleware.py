@@ -1,5 +1,14 @@
+import base64
+import json
+import threading
+
+import pytest
 from flask import Flask, g
+from x402.clients.base import decode_x_payment_response
+from x402.facilitator import FacilitatorClient
+from x402.flask import middleware as flask_middleware
 from x402.flask.middleware import PaymentMiddleware
+from x402.types import SettleResponse, VerifyResponse
 
 
 def create_app_with_middleware(configs):
@@ -358,3 +367,180 @@ def test_payment_amount_conversion():
         html_content = resp.get_data(as_text=True)
         # $0.001 should be converted to 0.001 in the display
         assert '"amount": 0.001' in html_content
+
+
+def test_dynamic_price():
+    app = create_app_with_middleware(
+        [
+            {
+                "price": lambda request: "$2" if request.args.get("pro") else "$1",
+                "pay_to_address": "0x1",
+                "path": "/protected",
+                "network": "base-sepolia",
+            }
+        ]
+    )
+    with app.test_client() as client:
+        resp = client.get("/protected")
+        assert resp.status_code == 402
+        assert resp.json["accepts"][0]["maxAmountRequired"] == "1000000"
+        assert resp.headers["Content-Length"] == str(len(resp.data))
+
+        resp = client.get("/protected?pro=1")
+        assert resp.json["accepts"][0]["maxAmountRequired"] == "2000000"
+
+
+def payment_header(network: str = "base-sepolia") -> str:
+    return base64.b64encode(
+        json.dumps(
+            {
+                "x402Version": 1,
+                "scheme": "exact",
+                "network": network,
+                "payload": {
+                    "signature": "0x" + "ab" * 65,
+                    "authorization": {
+                        "from": "0x2222222222222222222222222222222222222222",
+                        "to": "0x1111111111111111111111111111111111111111",
+                        "value": "1000000",
+                        "validAfter": "0",
+                        "validBefore": "9999999999",
+                        "nonce": "0x" + "00" * 32,
+                    },
+                },
+            }
+        ).encode("utf-8")
+    ).decode("utf-8")
+
+
+@pytest.fixture
+def facilitator(monkeypatch):
+    calls = {"verify": 0, "settle": 0}
+
+    async def verify(self, payment, requirements):
+        calls["verify"] += 1
+        return VerifyResponse(is_valid=True, payer=payment.payload.authorization.from_)
+
+    async def settle(self, payment, requirements):
+        calls["settle"] += 1
+        return SettleResponse(
+            success=True, transaction="0xabc", network=payment.network
+        )
+
+    monkeypatch.setattr(FacilitatorClient, "verify", verify)
+    monkeypatch.setattr(FacilitatorClient, "settle", settle)
+    return calls
+
+
+def test_paid_request_settles(facilitator):
+    app = create_app_with_middleware(
+        [
+            {
+                "price": "$1.00",
+                "pay_to_address": "0x1111111111111111111111111111111111111111",
+                "path": "/protected",
+                "network": "base-sepolia",
+            }
+        ]
+    )
+    with app.test_client() as client:
+        resp = client.get("/protected", headers={"X-PAYMENT": payment_header()})
+        assert resp.status_code == 200
+        assert decode_x_payment_response(resp.headers["X-PAYMENT-RESPONSE"])["success"]
+        assert facilitator == {"verify": 1, "settle": 1}
+
+
+def test_speculative_settle_refunds_failed_handler(facilitator):
+    refunds = []
+    app = Flask(__name__)
+
+    @app.route("/protected")
+    def protected():
+        return {"error": "boom"}, 500
+
+    middleware = PaymentMiddleware(app)
+    middleware.add(
+        price="$1.00",
+        pay_to_address="0x1111111111111111111111111111111111111111",
+        path="/protected",
+        network="base-sepolia",
+        speculative_settle=True,
+        refund_hook=lambda payment, requirements, settle_response: refunds.append(
+            settle_response.transaction
+        ),
+    )
+    with app.test_client() as client:
+        resp = client.get("/protected", headers={"X-PAYMENT": payment_header()})
+        assert resp.status_code == 500
+        assert "X-PAYMENT-RESPONSE" in resp.headers
+        assert refunds == ["0xabc"]
+        assert facilitator["settle"] == 1
+
+
+def test_deeply_nested_payment_header_rejected_before_verify(facilitator):
+    app = create_app_with_middleware(
+        [
+            {
+                "price": "$1.00",
+                "pay_to_address": "0x1111111111111111111111111111111111111111",
+                "path": "/protected",
+                "max_payment_header_depth": 2,
+            }
+        ]
+    )
+    with app.test_client() as client:
+        resp = client.get("/protected", headers={"X-PAYMENT": payment_header()})
+        assert resp.status_code == 402
+        assert "nests deeper than 2 levels" in resp.get_json()["error"]
+        assert facilitator["verify"] == 0
+
+
+def test_options_listed_in_accepts():
+    app = create_app_with_middleware(
+        [
+            {
+                "price": "$1.00",
+                "pay_to_address": "0x1",
+                "path": "/protected",
+                "network": "base-sepolia",
+                "options": [{"network": "base", "price": "$0.50"}],
+            }
+        ]
+    )
+    with app.test_client() as client:
+        resp = client.get("/protected")
+        assert resp.status_code == 402
+        assert [r["network"] for r in resp.json["accepts"]] == ["base-sepolia", "base"]
+
+    with pytest.raises(ValueError, match="Unsupported network"):
+        create_app_with_middleware(
+            [
+                {
+                    "price": "$1.00",
+                    "pay_to_address": "0x1",
+                    "options": [{"network": "not-a-network", "price": "$1.00"}],
+                }
+            ]
+        )
+
+
+def test_settle_executor_created_once(monkeypatch):
+    registered = []
+    monkeypatch.setattr(flask_middleware, "_settle_executor", None)
+    monkeypatch.setattr(flask_middleware.atexit, "register", registered.append)
+    barrier = threading.Barrier(8)
+    executors = []
+
+    def get():
+        barrier.wait()
+        executors.append(flask_middleware._get_settle_executor())
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(map(id, executors))) == 1
+    assert registered == [executors[0].shutdown]
+    executors[0].shutdown()
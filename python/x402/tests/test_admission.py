@@ -0,0 +1,195 @@
+import base64
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from flask import Flask
+
+from x402.admission import (
+    AdmissionController,
+    MemoryBackend,
+    SQLiteBackend,
+)
+from x402.facilitator import FacilitatorClient
+from x402.fastapi.middleware import require_payment
+from x402.flask.middleware import PaymentMiddleware
+from x402.types import VerifyResponse
+
+PAYER = "0x2222222222222222222222222222222222222222"
+PAY_TO = "0x1111111111111111111111111111111111111111"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def payment_header(payer: str = PAYER) -> str:
+    payment = {
+        "x402Version": 1,
+        "scheme": "exact",
+        "network": "base-sepolia",
+        "payload": {
+            "signature": "0x" + "ab" * 65,
+            "authorization": {
+                "from": payer,
+                "to": PAY_TO,
+                "value": "1000000",
+                "validAfter": "0",
+                "validBefore": "9999999999",
+                "nonce": "0x" + "00" * 32,
+            },
+        },
+    }
+    return base64.b64encode(json.dumps(payment).encode("utf-8")).decode("ascii")
+
+
+@pytest.fixture
+def verify_calls(monkeypatch):
+    calls = []
+
+    async def verify(self, payment, requirements):
+        calls.append(payment)
+        return VerifyResponse(
+            is_valid=False, invalid_reason="insufficient_funds", payer=PAYER
+        )
+
+    monkeypatch.setattr(FacilitatorClient, "verify", verify)
+    return calls
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_token_bucket(backend, tmp_path):
+    backend = (
+        MemoryBackend() if backend == "memory" else SQLiteBackend(tmp_path / "b.db")
+    )
+    assert backend.take("k", rate=2, burst=2, now=0) == 0
+    assert backend.take("k", rate=2, burst=2, now=0) == 0
+    assert backend.take("k", rate=2, burst=2, now=0) == pytest.approx(0.5)
+    assert backend.take("k", rate=2, burst=2, now=0.25) == pytest.approx(0.25)
+    assert backend.take("k", rate=2, burst=2, now=0.5) == 0
+    # Other keys are independent and refills are capped at the burst
+    assert backend.take("other", rate=2, burst=2, now=0.5) == 0
+    assert backend.take("k", rate=2, burst=2, now=100) == 0
+    assert backend.take("k", rate=2, burst=2, now=100) == 0
+    assert backend.take("k", rate=2, burst=2, now=100) > 0
+
+
+def test_memory_backend_is_bounded():
+    backend = MemoryBackend(shards=1, max_keys=2)
+    for key in ("a", "b", "c"):
+        backend.take(key, rate=1, burst=1, now=0)
+    # "a" was evicted and starts over with a full bucket
+    assert backend.take("a", rate=1, burst=1, now=0) == 0
+    assert backend.take("c", rate=1, burst=1, now=0) > 0
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    path = tmp_path / "buckets.db"
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+    assert first.take("payer:a", rate=1, burst=1, now=0) == 0
+    assert second.take("payer:a", rate=1, burst=1, now=0) > 0
+
+
+def test_controller_limits_payers_and_ips():
+    clock = FakeClock()
+    controller = AdmissionController(
+        {"payer_rate": 1, "payer_burst": 2, "ip_rate": 10, "ip_burst": 4},
+        clock=clock,
+    )
+
+    assert controller.admit(PAYER, "10.0.0.1") is None
+    # Payer addresses are case-insensitive
+    assert controller.admit(PAYER.upper().replace("0X", "0x"), "10.0.0.1") is None
+    rejection = controller.admit(PAYER, "10.0.0.1")
+    assert rejection.reason == "payer"
+    assert rejection.retry_after_header == "1"
+
+    # Rejected attempts still use IP tokens, one is left for any payer
+    assert controller.admit("0x3", "10.0.0.1") is None
+    assert controller.admit("0x4", "10.0.0.1").reason == "ip"
+    assert controller.admit("0x4", "10.0.0.2") is None
+
+    clock.now += 1
+    assert controller.admit(PAYER, "10.0.0.3") is None
+
+
+def test_controller_limits_concurrency():
+    controller = AdmissionController({"max_concurrent_verifies": 1, "payer_rate": 1})
+    assert controller.admit(PAYER, None) is None
+    assert controller.admit("0x3", None).reason == "concurrency"
+    controller.release()
+    # A rate limited attempt does not keep its slot
+    assert controller.admit(PAYER, None).reason == "payer"
+    assert controller.in_flight == 0
+
+
+def test_controller_admits_when_backend_fails():
+    class BrokenBackend:
+        def take(self, key, rate, burst, now):
+            raise OSError("database is locked")
+
+    controller = AdmissionController({"payer_rate": 1, "backend": BrokenBackend()})
+    assert controller.admit(PAYER, None) is None
+    assert controller.admit(PAYER, None) is None
+
+
+def test_controller_validates_config():
+    with pytest.raises(ValueError):
+        AdmissionController({"payer_rate": 0})
+    with pytest.raises(ValueError):
+        AdmissionController({"max_concurrent_verifies": 0})
+
+
+def test_fastapi_rejects_before_verify(verify_calls):
+    app = FastAPI()
+
+    @app.get("/paid")
+    async def paid():
+        return {"ok": True}
+
+    app.middleware("http")(
+        require_payment(
+            price="$0.01",
+            pay_to_address=PAY_TO,
+            admission={"payer_rate": 0.5, "payer_burst": 1},
+        )
+    )
+    client = TestClient(app)
+
+    assert (
+        client.get("/paid", headers={"X-PAYMENT": payment_header()}).status_code == 402
+    )
+    response = client.get("/paid", headers={"X-PAYMENT": payment_header()})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    assert response.json() == {"error": "Too many payment attempts"}
+    assert len(verify_calls) == 1
+
+
+def test_flask_rejects_before_verify(verify_calls):
+    app = Flask(__name__)
+
+    @app.route("/paid")
+    def paid():
+        return {"ok": True}
+
+    PaymentMiddleware(app).add(
+        price="$0.01",
+        pay_to_address=PAY_TO,
+        admission={"ip_rate": 1, "max_concurrent_verifies": 4},
+    )
+    client = app.test_client()
+
+    assert (
+        client.get("/paid", headers={"X-PAYMENT": payment_header()}).status_code == 402
+    )
+    response = client.get("/paid", headers={"X-PAYMENT": payment_header("0x3")})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert response.headers["Content-Length"] == str(len(response.data))
+    assert len(verify_calls) == 1
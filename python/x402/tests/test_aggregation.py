@@ -0,0 +1,316 @@
+import base64
+import json
+import os
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from flask import Flask
+
+from x402.aggregation import (
+    PaymentAggregator,
+    PaymentLedger,
+    PendingPayment,
+    payment_id,
+    read_ledger,
+)
+from x402.fastapi.middleware import require_payment
+from x402.flask.middleware import PaymentMiddleware
+from x402.types import (
+    PaymentPayload,
+    PaymentRequirements,
+    SettleResponse,
+    VerifyResponse,
+)
+
+PAYER = "0x2222222222222222222222222222222222222222"
+PAY_TO = "0x1111111111111111111111111111111111111111"
+NOW = 1000.0
+
+
+def make_payment(nonce: int, valid_before: int = 9999999999) -> dict:
+    return {
+        "x402Version": 1,
+        "scheme": "exact",
+        "network": "base-sepolia",
+        "payload": {
+            "signature": "0x" + "ab" * 65,
+            "authorization": {
+                "from": PAYER,
+                "to": PAY_TO,
+                "value": "100",
+                "validAfter": "0",
+                "validBefore": str(valid_before),
+                "nonce": "0x" + f"{nonce:064x}",
+            },
+        },
+    }
+
+
+def payment_header(nonce: int) -> str:
+    return base64.b64encode(json.dumps(make_payment(nonce)).encode()).decode()
+
+
+REQUIREMENTS = PaymentRequirements(
+    scheme="exact",
+    network="base-sepolia",
+    max_amount_required="100",
+    resource="https://example.com/paid",
+    description="",
+    mime_type="",
+    pay_to=PAY_TO,
+    max_timeout_seconds=60,
+    asset="0x036CbD53842c5426634e7929541eC2318f3dCF7e",
+)
+
+
+class FakeFacilitator:
+    def __init__(self, failures: int = 0):
+        self.settled: list[str] = []
+        self.failures = failures
+
+    async def verify(self, payment, requirements):
+        return VerifyResponse(is_valid=True, payer=PAYER)
+
+    async def settle(self, payment, requirements):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("facilitator down")
+        self.settled.append(payment.payload.authorization.nonce)
+        return SettleResponse(success=True, transaction="0x01", payer=PAYER)
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def aggregators():
+    created = []
+    yield created
+    for aggregator in created:
+        aggregator.close()
+
+
+def make_aggregator(aggregators, facilitator, directory, **config):
+    aggregator = PaymentAggregator(
+        {"directory": str(directory), **config}, facilitator, clock=lambda: NOW
+    )
+    aggregators.append(aggregator)
+    return aggregator
+
+
+def test_settles_earliest_deadline_first(aggregators, tmp_path):
+    facilitator = FakeFacilitator()
+    aggregator = make_aggregator(
+        aggregators, facilitator, tmp_path, max_concurrent_settles=1
+    )
+    for nonce, valid_before in [(1, 5000), (2, 3000), (3, 4000)]:
+        payment = PaymentPayload(**make_payment(nonce, valid_before))
+        assert aggregator.record(payment, REQUIREMENTS)
+    assert facilitator.settled == []
+
+    aggregator.settle_all()
+    assert [int(nonce, 16) for nonce in facilitator.settled] == [2, 3, 1]
+    assert aggregator.pending_count == 0
+
+
+def test_batch_size_and_deadline_trigger_settlement(aggregators, tmp_path):
+    facilitator = FakeFacilitator()
+    aggregator = make_aggregator(
+        aggregators, facilitator, tmp_path, batch_size=2, settle_margin=10
+    )
+    aggregator.record(PaymentPayload(**make_payment(1)), REQUIREMENTS)
+    time.sleep(0.05)
+    assert facilitator.settled == []
+    aggregator.record(PaymentPayload(**make_payment(2)), REQUIREMENTS)
+    wait_for(lambda: len(facilitator.settled) == 2)
+
+    # Due within the margin of its validBefore
+    aggregator.record(PaymentPayload(**make_payment(3, int(NOW) + 5)), REQUIREMENTS)
+    wait_for(lambda: len(facilitator.settled) == 3)
+
+
+def test_rejects_pending_duplicates(aggregators, tmp_path):
+    aggregator = make_aggregator(aggregators, FakeFacilitator(), tmp_path)
+    payment = PaymentPayload(**make_payment(1))
+    assert aggregator.record(payment, REQUIREMENTS)
+    assert not aggregator.record(payment, REQUIREMENTS)
+    assert aggregator.cancel(payment)
+    assert not aggregator.cancel(payment)
+    assert aggregator.record(payment, REQUIREMENTS)
+
+
+def test_retries_failed_settlements(aggregators, tmp_path, monkeypatch):
+    monkeypatch.setattr("x402.aggregation.RETRY_DELAY", 0.01)
+    facilitator = FakeFacilitator(failures=1)
+    aggregator = make_aggregator(aggregators, facilitator, tmp_path, batch_size=1)
+    aggregator.record(PaymentPayload(**make_payment(1)), REQUIREMENTS)
+    wait_for(lambda: len(facilitator.settled) == 1)
+    assert aggregator.pending_count == 0
+
+
+def test_ledger_survives_restart(aggregators, tmp_path):
+    first = make_aggregator(aggregators, FakeFacilitator(), tmp_path)
+    for nonce in (1, 2, 3):
+        first.record(PaymentPayload(**make_payment(nonce)), REQUIREMENTS)
+    first.cancel(PaymentPayload(**make_payment(2)))
+    first.close()
+
+    (path,) = tmp_path.glob("ledger-*.log")
+    with open(path, "ab") as f:
+        f.write(b'{"op":"add","id":')  # torn by a crash
+    pending = read_ledger(str(path))
+    assert sorted(p.payment.payload.authorization.nonce[-1] for p in pending) == [
+        "1",
+        "3",
+    ]
+
+    # The next aggregator adopts the payments of the dead one
+    facilitator = FakeFacilitator()
+    second = make_aggregator(aggregators, facilitator, tmp_path)
+    second.record(PaymentPayload(**make_payment(4)), REQUIREMENTS)
+    assert second.pending_count == 3
+    assert not os.path.exists(path)
+    second.settle_all()
+    assert len(facilitator.settled) == 3
+
+
+async def test_settle_all_async(aggregators, tmp_path):
+    facilitator = FakeFacilitator()
+    aggregator = make_aggregator(aggregators, facilitator, tmp_path)
+    for nonce in (1, 2):
+        aggregator.record(PaymentPayload(**make_payment(nonce)), REQUIREMENTS)
+
+    await aggregator.settle_all_async()
+    assert len(facilitator.settled) == 2
+    assert aggregator.pending_count == 0
+
+
+def pending_payment(nonce: int) -> PendingPayment:
+    payment = PaymentPayload(**make_payment(nonce))
+    return PendingPayment(payment_id(payment), payment, REQUIREMENTS, NOW, NOW)
+
+
+def line(record: dict) -> bytes:
+    return json.dumps(record).encode() + b"\n"
+
+
+def test_ledger_rewrite_keeps_records_appended_meanwhile(tmp_path):
+    path = str(tmp_path / "ledger-1.log")
+    ledger = PaymentLedger(path)
+    first, second = pending_payment(1), pending_payment(2)
+    ledger.append(line({"op": "done", "id": "settled"}))
+    since = ledger.size()
+    # Recorded while the snapshot is being written
+    ledger.append(
+        line(
+            {
+                "op": "add",
+                "id": second.id,
+                "payment": second.payment.model_dump(by_alias=True),
+                "requirements": second.requirements.model_dump(by_alias=True),
+                "deadline": NOW,
+                "recorded_at": NOW,
+            }
+        )
+    )
+
+    ledger.rewrite([first], since)
+    ledger.append(line({"op": "done", "id": first.id}))
+    ledger.close()
+
+    assert [p.id for p in read_ledger(path)] == [second.id]
+    assert not os.path.exists(path + ".tmp")
+    with open(path, "rb") as f:
+        assert len(f.readlines()) == 3
+
+
+def test_compacts_ledger(aggregators, tmp_path, monkeypatch):
+    monkeypatch.setattr("x402.aggregation.COMPACT_THRESHOLD", 0)
+    aggregator = make_aggregator(aggregators, FakeFacilitator(), tmp_path)
+    for nonce in (1, 2, 3):
+        aggregator.record(PaymentPayload(**make_payment(nonce)), REQUIREMENTS)
+    aggregator.settle_all()
+    aggregator.record(PaymentPayload(**make_payment(4)), REQUIREMENTS)
+    aggregator.close()
+
+    (path,) = tmp_path.glob("ledger-*.log")
+    with open(path, "rb") as f:
+        assert len(f.readlines()) == 1
+    assert [
+        p.payment.payload.authorization.nonce[-1] for p in read_ledger(str(path))
+    ] == ["4"]
+
+
+def test_fastapi_grants_access_before_settling(tmp_path):
+    facilitator = FakeFacilitator()
+    app = FastAPI()
+
+    @app.get("/paid")
+    async def paid():
+        return {"ok": True}
+
+    app.middleware("http")(
+        require_payment(
+            price="$0.0001",
+            pay_to_address=PAY_TO,
+            facilitator=facilitator,
+            aggregation={"directory": str(tmp_path), "max_delay": 0.05},
+        )
+    )
+    client = TestClient(app)
+
+    response = client.get("/paid", headers={"X-PAYMENT": payment_header(1)})
+    assert response.status_code == 200
+    assert "X-PAYMENT-RESPONSE" not in response.headers
+
+    replay = client.get("/paid", headers={"X-PAYMENT": payment_header(1)})
+    assert replay.status_code == 402
+    assert replay.json()["error"] == "Payment already used"
+
+    wait_for(lambda: len(facilitator.settled) == 1)
+
+
+def test_flask_cancels_failed_requests(tmp_path):
+    facilitator = FakeFacilitator()
+    app = Flask(__name__)
+
+    @app.route("/paid")
+    def paid():
+        return {"ok": True}
+
+    @app.route("/broken")
+    def broken():
+        return {"ok": False}, 500
+
+    PaymentMiddleware(app).add(
+        price="$0.0001",
+        pay_to_address=PAY_TO,
+        facilitator=facilitator,
+        aggregation={"directory": str(tmp_path), "max_delay": 0.05},
+    )
+    client = app.test_client()
+
+    failed = client.get("/broken", headers={"X-PAYMENT": payment_header(1)})
+    assert failed.status_code == 500
+    response = client.get("/paid", headers={"X-PAYMENT": payment_header(2)})
+    assert response.status_code == 200
+    assert "X-PAYMENT-RESPONSE" not in response.headers
+
+    wait_for(lambda: len(facilitator.settled) == 1)
+    assert int(facilitator.settled[0], 16) == 2
+
+
+def test_rejects_speculative_settle(tmp_path):
+    with pytest.raises(ValueError, match="speculative_settle"):
+        require_payment(
+            price="$0.01",
+            pay_to_address=PAY_TO,
+            speculative_settle=True,
+            aggregation={"directory": str(tmp_path)},
+        )
@@ -0,0 +1,173 @@
+import json
+
+import pytest
+
+from x402.chains import (
+    DEFAULT_TOKEN_REGISTRY,
+    TokenInfo,
+    TokenRegistry,
+    get_chain_id,
+    get_default_token_address,
+    get_token_decimals,
+    get_token_name,
+    get_token_registry,
+    get_token_version,
+    load_token_registry,
+    register_network,
+    register_token,
+    set_token_registry,
+)
+
+BASE_SEPOLIA_USDC = "0x036CbD53842c5426634e7929541eC2318f3dCF7e"
+CUSTOM_TOKEN = "0x1234567890123456789012345678901234567890"
+
+
+@pytest.fixture(autouse=True)
+def restore_registry():
+    registry = get_token_registry()
+    yield
+    set_token_registry(registry)
+
+
+def test_lookup_by_address():
+    token = DEFAULT_TOKEN_REGISTRY.get("84532", BASE_SEPOLIA_USDC)
+    assert token == TokenInfo(
+        chain_id="84532",
+        address=BASE_SEPOLIA_USDC,
+        symbol="usdc",
+        name="USDC",
+        decimals=6,
+        version="2",
+    )
+
+    # Addresses are matched regardless of case
+    assert DEFAULT_TOKEN_REGISTRY.get(84532, BASE_SEPOLIA_USDC.lower()) is token
+
+    assert DEFAULT_TOKEN_REGISTRY.find("84532", CUSTOM_TOKEN) is None
+    assert DEFAULT_TOKEN_REGISTRY.find("84532", "not-an-address") is None
+    with pytest.raises(ValueError, match="Token not found"):
+        DEFAULT_TOKEN_REGISTRY.get("84532", CUSTOM_TOKEN)
+
+
+def test_lookup_by_symbol():
+    token = DEFAULT_TOKEN_REGISTRY.get_by_symbol("8453", "USDC")
+    assert token.address == "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913"
+    assert token.name == "USD Coin"
+
+    with pytest.raises(ValueError, match="Token type 'dai' not found"):
+        DEFAULT_TOKEN_REGISTRY.get_by_symbol("8453", "dai")
+
+
+def test_token_info_is_frozen():
+    token = DEFAULT_TOKEN_REGISTRY.get("84532", BASE_SEPOLIA_USDC)
+    with pytest.raises(AttributeError):
+        token.decimals = 18  # type: ignore[misc]
+
+
+def test_with_tokens_returns_new_registry():
+    token = TokenInfo.from_dict(
+        "84532",
+        {
+            "human_name": "TEST",
+            "address": CUSTOM_TOKEN.lower(),
+            "name": "Test Token",
+            "decimals": 18,
+            "version": "1",
+        },
+    )
+    registry = DEFAULT_TOKEN_REGISTRY.with_tokens(token)
+
+    assert registry.get("84532", CUSTOM_TOKEN) is token
+    assert registry.get_by_symbol("84532", "test") is token
+    assert token.address == CUSTOM_TOKEN
+    assert len(registry) == len(DEFAULT_TOKEN_REGISTRY) + 1
+    assert DEFAULT_TOKEN_REGISTRY.find("84532", CUSTOM_TOKEN) is None
+
+
+def test_chain_id_lookup():
+    assert DEFAULT_TOKEN_REGISTRY.chain_id("base") == "8453"
+    assert DEFAULT_TOKEN_REGISTRY.chain_id("1337") == "1337"
+    with pytest.raises(ValueError, match="Unsupported network"):
+        DEFAULT_TOKEN_REGISTRY.chain_id("unknown")
+
+
+def test_module_helpers_use_active_registry():
+    assert get_token_name("84532", BASE_SEPOLIA_USDC) == "USDC"
+    assert get_token_version("84532", BASE_SEPOLIA_USDC) == "2"
+    assert get_token_decimals("84532", BASE_SEPOLIA_USDC) == 6
+    assert get_default_token_address("84532") == BASE_SEPOLIA_USDC
+
+    register_network("my-chain", 1337)
+    register_token(
+        1337,
+        CUSTOM_TOKEN,
+        name="My Dollar",
+        decimals=2,
+        version="1",
+        symbol="usdc",
+    )
+
+    assert get_chain_id("my-chain") == "1337"
+    assert get_default_token_address("1337") == CUSTOM_TOKEN
+    assert get_token_decimals("1337", CUSTOM_TOKEN) == 2
+
+
+def test_load_json_registry(tmp_path):
+    path = tmp_path / "tokens.json"
+    path.write_text(
+        json.dumps(
+            {
+                "networks": {"my-chain": "1337"},
+                "tokens": {
+                    "1337": [
+                        {
+                            "human_name": "usdc",
+                            "address": CUSTOM_TOKEN,
+                            "name": "My Dollar",
+                            "decimals": 6,
+                            "version": "1",
+                        }
+                    ]
+                },
+            }
+        )
+    )
+
+    registry = load_token_registry(path)
+
+    assert registry is get_token_registry()
+    assert registry.chain_id("my-chain") == "1337"
+    assert registry.get("1337", CUSTOM_TOKEN).name == "My Dollar"
+    # Built-in tokens are still available
+    assert registry.get("84532", BASE_SEPOLIA_USDC).name == "USDC"
+
+
+def test_load_toml_registry(tmp_path):
+    try:
+        import tomllib  # noqa: F401
+    except ImportError:
+        pytest.importorskip("tomli")
+    path = tmp_path / "tokens.toml"
+    path.write_text(
+        f"""
+[networks]
+my-chain = "1337"
+
+[[tokens.1337]]
+human_name = "usdc"
+address = "{CUSTOM_TOKEN}"
+name = "My Dollar"
+decimals = 6
+version = "1"
+"""
+    )
+
+    registry = TokenRegistry.from_file(path)
+
+    assert registry.chain_id("my-chain") == "1337"
+    assert registry.get_by_symbol("1337", "usdc").address == CUSTOM_TOKEN
+
+
+def test_missing_token_field():
+    with pytest.raises(ValueError, match="missing field"):
+        TokenRegistry.from_dict({"tokens": {"1": [{"address": CUSTOM_TOKEN}]}})
@@ -0,0 +1,109 @@
+import base64
+import json
+
+import pytest
+
+from x402 import instrumentation
+from x402.decoding import PaymentHeaderDecoder, PaymentHeaderError, json_depth_exceeds
+from x402.instrumentation import InMemoryExporter
+
+PAYMENT = {
+    "x402Version": 1,
+    "scheme": "exact",
+    "network": "base-sepolia",
+    "payload": {
+        "signature": "0x" + "ab" * 65,
+        "authorization": {
+            "from": "0x2222222222222222222222222222222222222222",
+            "to": "0x1111111111111111111111111111111111111111",
+            "value": "1000000",
+            "validAfter": "0",
+            "validBefore": "9999999999",
+            "nonce": "0x" + "00" * 32,
+        },
+    },
+}
+
+
+def encode(value) -> str:
+    if not isinstance(value, bytes):
+        value = json.dumps(value).encode("utf-8")
+    return base64.b64encode(value).decode("ascii")
+
+
+@pytest.fixture
+def exporter():
+    exporter = InMemoryExporter()
+    instrumentation.set_exporter(exporter)
+    yield exporter
+    instrumentation.set_exporter(None)
+
+
+def test_decodes_valid_header():
+    payment = PaymentHeaderDecoder().decode(encode(PAYMENT))
+    assert payment.network == "base-sepolia"
+    assert payment.payload.authorization.value == "1000000"
+
+
+@pytest.mark.parametrize(
+    "header,reason",
+    [
+        ("A" * 9000, "too_large"),
+        ("not base64!", "invalid_base64"),
+        (encode({"a": [[[[[[[[[1]]]]]]]]]}), "too_deep"),
+        (encode(b"{not json"), "invalid_json"),
+        (encode(b"\xff\xfe"), "invalid_json"),
+        (encode([PAYMENT]), "invalid_payload"),
+        (encode({"scheme": "exact"}), "invalid_payload"),
+    ],
+)
+def test_rejections(header, reason):
+    with pytest.raises(PaymentHeaderError) as e:
+        PaymentHeaderDecoder().decode(header)
+    assert e.value.reason == reason
+
+
+def test_configurable_limits():
+    header = encode(PAYMENT)
+    with pytest.raises(PaymentHeaderError, match="maximum is 100"):
+        PaymentHeaderDecoder(max_size=100).decode(header)
+    with pytest.raises(PaymentHeaderError, match="deeper than 2"):
+        PaymentHeaderDecoder(max_depth=2).decode(header)
+    assert PaymentHeaderDecoder(max_depth=3).decode(header).scheme == "exact"
+    with pytest.raises(ValueError):
+        PaymentHeaderDecoder(max_size=0)
+
+
+def test_json_depth_ignores_brackets_in_strings():
+    assert not json_depth_exceeds(b'{"a": "[[[[{{{{"}', 1)
+    assert not json_depth_exceeds(b'{"a": "\\"[[[["}', 1)
+    assert not json_depth_exceeds(b'{"a\\\\": ["b"]}', 2)
+    assert json_depth_exceeds(b'{"a\\\\": [["b"]]}', 2)
+    assert json_depth_exceeds(b"[" * 10_000, 8)
+
+
+def test_rejected_headers_are_not_parsed_twice(exporter, monkeypatch):
+    decoder = PaymentHeaderDecoder(rejected_cache_size=1)
+    bad = encode({"scheme": "exact"})
+    other = encode(b"{not json")
+
+    with pytest.raises(PaymentHeaderError):
+        decoder.decode(bad)
+
+    def fail(header):
+        raise AssertionError("parsed a rejected header again")
+
+    monkeypatch.setattr(decoder, "_decode", fail)
+    with pytest.raises(PaymentHeaderError) as e:
+        decoder.decode(bad)
+    assert e.value.reason == "invalid_payload"
+    assert exporter.total("x402.decode.rejected", cached=True) == 1
+    assert exporter.total("x402.decode.rejected_bytes", reason="invalid_payload") == (
+        2 * len(bad)
+    )
+
+    # The cache is bounded
+    monkeypatch.undo()
+    with pytest.raises(PaymentHeaderError):
+        decoder.decode(other)
+    assert len(decoder._rejected) == 1
@@ -1,5 +1,10 @@
 import pytest
-from x402.encoding import safe_base64_encode, safe_base64_decode
+from x402.encoding import (
+    base64_decode_bytes,
+    base64_encode_bytes,
+    safe_base64_decode,
+    safe_base64_encode,
+)
 
 
 def test_safe_base64_encode():
@@ -79,3 +84,40 @@ def test_encode_decode_roundtrip():
         assert decoded == test_bytes.decode("utf-8"), (
             f"Roundtrip failed for bytes: {test_bytes}"
         )
+
+
+def test_base64_encode_bytes():
+    assert base64_encode_bytes(b"hello") == b"aGVsbG8="
+    assert base64_encode_bytes(memoryview(b"hello")[1:]) == b"ZWxsbw=="
+    assert base64_encode_bytes(bytearray(b"\xff\xfe\xfd")) == b"//79"
+    assert base64_encode_bytes(b"\xff\xfe\xfd", urlsafe=True) == b"__79"
+    assert base64_encode_bytes(b"hello", urlsafe=True, padding=False) == b"aGVsbG8"
+
+
+def test_base64_decode_bytes():
+    assert base64_decode_bytes("aGVsbG8=") == b"hello"
+    assert base64_decode_bytes(b"aGVsbG8=") == b"hello"
+    assert base64_decode_bytes(memoryview(b"xxaGVsbG8=")[2:]) == b"hello"
+    assert base64_decode_bytes("//79") == b"\xff\xfe\xfd"
+    assert base64_decode_bytes("__79", urlsafe=True) == b"\xff\xfe\xfd"
+    assert base64_decode_bytes(b"aGVsbG8", urlsafe=True) == b"hello"
+
+    with pytest.raises(ValueError):
+        base64_decode_bytes("aGVsbG8")
+    with pytest.raises(ValueError):
+        base64_decode_bytes("aGVsbG8=世界")
+
+
+def test_base64_decode_bytes_max_length():
+    assert base64_decode_bytes("aGVsbG8=", max_length=8) == b"hello"
+    with pytest.raises(ValueError, match="maximum is 4"):
+        base64_decode_bytes("aGVsbG8=", max_length=4)
+    with pytest.raises(ValueError, match="maximum is 4"):
+        base64_decode_bytes(b"aGVsbG8", urlsafe=True, max_length=4)
+
+
+def test_bytes_roundtrip():
+    for data in [b"", b"\x00", b"\xfb\xff", bytes(range(256))]:
+        for urlsafe in (False, True):
+            encoded = base64_encode_bytes(data, urlsafe=urlsafe, padding=not urlsafe)
+            assert base64_decode_bytes(encoded, urlsafe=urlsafe) == data
@@ -0,0 +1,566 @@
+import asyncio
+import base64
+import json
+
+import httpx
+import pytest
+
+from x402 import facilitator as facilitator_module
+from x402.facilitator import (
+    CircuitBreaker,
+    FacilitatorClient,
+    FacilitatorError,
+    FacilitatorPool,
+    FacilitatorRequestError,
+    FacilitatorUnavailableError,
+    HeaderCache,
+    clear_facilitator_pools,
+    get_facilitator_pool,
+)
+from x402.types import (
+    EIP3009Authorization,
+    ExactPaymentPayload,
+    PaymentPayload,
+    PaymentRequirements,
+)
+
+PRIMARY = "https://primary.example"
+BACKUP = "https://backup.example"
+
+VALID = {"isValid": True, "payer": "0x" + "2" * 40}
+
+
+def make_payment():
+    authorization = EIP3009Authorization(
+        **{
+            "from": "0x" + "2" * 40,
+            "to": "0x" + "1" * 40,
+            "value": "1000000",
+            "validAfter": "0",
+            "validBefore": "9999999999",
+            "nonce": "0x" + "0" * 64,
+        }
+    )
+    payment = PaymentPayload(
+        x402_version=1,
+        scheme="exact",
+        network="base-sepolia",
+        payload=ExactPaymentPayload(
+            signature="0x" + "0" * 130, authorization=authorization
+        ),
+    )
+    requirements = PaymentRequirements(
+        scheme="exact",
+        network="base-sepolia",
+        max_amount_required="1000000",
+        resource="https://example.com/api",
+        description="",
+        mime_type="",
+        pay_to="0x" + "1" * 40,
+        max_timeout_seconds=60,
+        asset="0x036CbD53842c5426634e7929541eC2318f3dCF7e",
+    )
+    return payment, requirements
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools():
+    clear_facilitator_pools()
+    yield
+    clear_facilitator_pools()
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    """Route the facilitator's httpx clients through a handler keyed by host."""
+    handlers = {}
+    calls = []
+
+    async def handler(request: httpx.Request):
+        base = f"{request.url.scheme}://{request.url.host}"
+        calls.append((base, request.url.path))
+        return await handlers[base](request)
+
+    real_client = httpx.AsyncClient
+
+    def client_factory(**kwargs):
+        return real_client(transport=httpx.MockTransport(handler), **kwargs)
+
+    monkeypatch.setattr(facilitator_module.httpx, "AsyncClient", client_factory)
+    return handlers, calls
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_circuit_breaker_opens_and_probes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10, clock=clock)
+
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    clock.now = 10
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    # Only one probe at a time
+    assert not breaker.allow_request()
+
+    # A failed probe re-opens the circuit
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    clock.now = 20
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_circuit_breaker_release_cancelled_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=1, clock=clock)
+    breaker.record_failure()
+    clock.now = 1
+    assert breaker.allow_request()
+    breaker.release()
+    assert breaker.allow_request()
+
+
+def test_invalid_extra_url():
+    with pytest.raises(ValueError, match="Invalid URL"):
+        FacilitatorClient({"url": PRIMARY, "urls": ["backup.example"]})
+
+
+async def test_server_error_raises_facilitator_error(transport):
+    handlers, _ = transport
+
+    async def broken(request):
+        return httpx.Response(502, text="<html>bad gateway</html>")
+
+    handlers[PRIMARY] = broken
+    client = FacilitatorClient({"url": PRIMARY})
+
+    with pytest.raises(FacilitatorError, match="502"):
+        await client.verify(*make_payment())
+
+
+async def test_invalid_json_raises_facilitator_error(transport):
+    handlers, _ = transport
+
+    async def not_json(request):
+        return httpx.Response(200, text="not json")
+
+    handlers[PRIMARY] = not_json
+    client = FacilitatorClient({"url": PRIMARY})
+
+    with pytest.raises(FacilitatorError, match="invalid JSON"):
+        await client.settle(*make_payment())
+
+
+async def test_timeout_opens_circuit(transport):
+    handlers, calls = transport
+
+    async def slow(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    handlers[PRIMARY] = slow
+    client = FacilitatorClient(
+        {
+            "url": PRIMARY,
+            "timeouts": {"verify": 0.01},
+            "circuit_breaker": {"failure_threshold": 2, "recovery_timeout": 60},
+        }
+    )
+    assert client.timeouts["verify"] == 0.01
+    assert client.timeouts["settle"] == 30.0
+
+    for _ in range(2):
+        with pytest.raises(FacilitatorUnavailableError):
+            await client.verify(*make_payment())
+    assert len(calls) == 2
+
+    # Open circuit fails fast without touching the network
+    with pytest.raises(FacilitatorUnavailableError, match="Circuit open"):
+        await client.verify(*make_payment())
+    assert len(calls) == 2
+
+
+async def test_failover_to_backup(transport):
+    handlers, calls = transport
+
+    async def down(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    async def ok(request):
+        return httpx.Response(200, json={"success": True, "transaction": "0xabc"})
+
+    handlers[PRIMARY] = down
+    handlers[BACKUP] = ok
+    client = FacilitatorClient({"url": PRIMARY, "urls": [BACKUP], "routing": "ordered"})
+
+    response = await client.settle(*make_payment())
+    assert response.success
+    assert calls == [(PRIMARY, "/settle"), (BACKUP, "/settle")]
+
+
+async def test_settle_does_not_fail_over_once_sent(transport):
+    handlers, calls = transport
+
+    async def timeout(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    async def ok(request):
+        return httpx.Response(200, json={"success": True, "transaction": "0xabc"})
+
+    handlers[PRIMARY] = timeout
+    handlers[BACKUP] = ok
+    client = FacilitatorClient({"url": PRIMARY, "urls": [BACKUP], "routing": "ordered"})
+
+    # The primary may have submitted the payment, so it is not sent again
+    with pytest.raises(FacilitatorRequestError):
+        await client.settle(*make_payment())
+    assert calls == [(PRIMARY, "/settle")]
+
+    # Verification is safe to repeat
+    async def valid(request):
+        return httpx.Response(200, json=VALID)
+
+    handlers[BACKUP] = valid
+    calls.clear()
+    assert (await client.verify(*make_payment())).is_valid
+    assert calls == [(PRIMARY, "/verify"), (BACKUP, "/verify")]
+
+
+async def test_server_error_fails_over_verify_and_list_only(transport):
+    handlers, calls = transport
+
+    async def broken(request):
+        return httpx.Response(503, text="unavailable")
+
+    async def ok(request):
+        if request.url.path == "/verify":
+            return httpx.Response(200, json=VALID)
+        if request.url.path == "/discovery/resources":
+            return httpx.Response(
+                200,
+                json={
+                    "x402Version": 1,
+                    "items": [],
+                    "pagination": {"limit": 10, "offset": 0, "total": 0},
+                },
+            )
+        return httpx.Response(200, json={"success": True, "transaction": "0xabc"})
+
+    handlers[PRIMARY] = broken
+    handlers[BACKUP] = ok
+    client = FacilitatorClient({"url": PRIMARY, "urls": [BACKUP], "routing": "ordered"})
+
+    assert (await client.verify(*make_payment())).is_valid
+    assert (await client.list()).items == []
+    assert calls == [
+        (PRIMARY, "/verify"),
+        (BACKUP, "/verify"),
+        (PRIMARY, "/discovery/resources"),
+        (BACKUP, "/discovery/resources"),
+    ]
+
+    # The primary may have acted on the settlement before failing
+    clear_facilitator_pools()
+    client = FacilitatorClient({"url": PRIMARY, "urls": [BACKUP], "routing": "ordered"})
+    calls.clear()
+    with pytest.raises(FacilitatorRequestError, match="503"):
+        await client.settle(*make_payment())
+    assert calls == [(PRIMARY, "/settle")]
+
+
+async def test_hedged_verify_first_good_answer_wins(transport):
+    handlers, calls = transport
+    primary_cancelled = asyncio.Event()
+
+    async def slow(request):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            primary_cancelled.set()
+            raise
+
+    async def fast(request):
+        return httpx.Response(200, json=VALID)
+
+    handlers[PRIMARY] = slow
+    handlers[BACKUP] = fast
+    client = FacilitatorClient(
+        {
+            "url": PRIMARY,
+            "urls": [BACKUP],
+            "routing": "ordered",
+            "hedge_verify": True,
+            "hedge_delay": 0.01,
+        }
+    )
+
+    response = await asyncio.wait_for(client.verify(*make_payment()), 1)
+    assert response.is_valid
+    assert [url for url, _ in calls] == [PRIMARY, BACKUP]
+    await asyncio.wait_for(primary_cancelled.wait(), 1)
+
+
+async def test_hedged_verify_skips_open_circuit(transport):
+    handlers, calls = transport
+
+    async def ok(request):
+        return httpx.Response(200, json=VALID)
+
+    handlers[BACKUP] = ok
+    client = FacilitatorClient({"url": PRIMARY, "urls": [BACKUP], "hedge_verify": True})
+    for _ in range(client.breakers[PRIMARY].failure_threshold):
+        client.breakers[PRIMARY].record_failure()
+
+    response = await client.verify(*make_payment())
+    assert response.is_valid
+    assert calls == [(BACKUP, "/verify")]
+
+
+def test_pool_shared_between_clients():
+    a = FacilitatorClient({"url": PRIMARY, "urls": [BACKUP]})
+    b = FacilitatorClient({"url": PRIMARY + "/", "urls": [BACKUP]})
+    c = FacilitatorClient({"url": PRIMARY})
+
+    assert a.pool is b.pool
+    assert a.pool is not c.pool
+    assert a.pool is get_facilitator_pool([PRIMARY, BACKUP])
+
+
+def test_pool_unknown_routing():
+    with pytest.raises(ValueError, match="Unknown routing strategy"):
+        FacilitatorPool([PRIMARY], routing="random")  # type: ignore
+
+
+def test_pool_prefers_low_latency():
+    pool = FacilitatorPool([PRIMARY, BACKUP], routing="ewma")
+    for url, latency in ((PRIMARY, 0.5), (BACKUP, 0.05)):
+        pool.started(url)
+        pool.finished(url, latency)
+    assert pool.candidates() == [BACKUP, PRIMARY]
+
+    # Latency is a moving average, one fast sample does not flip the order
+    pool.started(PRIMARY)
+    pool.finished(PRIMARY, 0.01)
+    assert pool[PRIMARY].latency == pytest.approx(0.353)
+    assert pool.candidates() == [BACKUP, PRIMARY]
+
+    # In-flight requests count against a replica
+    for _ in range(10):
+        pool.started(BACKUP)
+    assert pool.candidates() == [PRIMARY, BACKUP]
+
+
+def test_pool_sticky_and_open_circuit():
+    pool = FacilitatorPool(
+        [PRIMARY, BACKUP], routing="ordered", circuit_breaker={"failure_threshold": 1}
+    )
+    pool.bind("nonce", BACKUP)
+    assert pool.candidates("nonce") == [BACKUP, PRIMARY]
+    assert pool.candidates("other") == [PRIMARY, BACKUP]
+
+    pool[BACKUP].breaker.record_failure()
+    assert pool.candidates("nonce") == [PRIMARY]
+
+    pool[PRIMARY].breaker.record_failure()
+    with pytest.raises(FacilitatorUnavailableError):
+        pool.candidates()
+
+
+async def test_verify_and_settle_stick_to_one_replica(transport):
+    handlers, calls = transport
+
+    async def ok(request):
+        if request.url.path == "/verify":
+            return httpx.Response(200, json=VALID)
+        return httpx.Response(200, json={"success": True, "transaction": "0xabc"})
+
+    handlers[PRIMARY] = ok
+    handlers[BACKUP] = ok
+    client = FacilitatorClient({"url": PRIMARY, "urls": [BACKUP]})
+    payment, requirements = make_payment()
+
+    await client.verify(payment, requirements)
+    verified_by = calls[-1][0]
+    # Make the other replica look much better
+    other = BACKUP if verified_by == PRIMARY else PRIMARY
+    client.pool[verified_by].latency = 10.0
+    client.pool[other].latency = 0.001
+
+    await client.settle(payment, requirements)
+    assert calls[-1] == (verified_by, "/settle")
+    assert client.pool._sticky == {}
+
+
+def test_check_health(monkeypatch):
+    def handler(request: httpx.Request):
+        status = 200 if request.url.host == "primary.example" else 503
+        return httpx.Response(status)
+
+    real_client = httpx.Client
+    monkeypatch.setattr(
+        facilitator_module.httpx,
+        "Client",
+        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs),
+    )
+    pool = FacilitatorPool([PRIMARY, BACKUP], circuit_breaker={"failure_threshold": 1})
+
+    assert pool.check_health() == {PRIMARY: True, BACKUP: False}
+    assert pool.candidates() == [PRIMARY]
+
+
+def make_jwt(exp):
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).rstrip(b"=")
+    return f"Bearer eyJhbGciOiJFUzI1NiJ9.{payload.decode()}.c2ln"
+
+
+async def test_header_cache_uses_jwt_expiry():
+    clock = FakeClock()
+    calls = []
+
+    async def create_headers():
+        calls.append(clock.now)
+        token = make_jwt(clock.now + 120)
+        return {"verify": {"Authorization": token}, "settle": {}}
+
+    cache = HeaderCache(create_headers, ttl=5, refresh_margin=0, clock=clock)
+    first = await cache.get()
+    clock.now = 100
+    assert await cache.get() is first
+    assert calls == [0]
+
+    clock.now = 120
+    assert await cache.get() is not first
+    assert calls == [0, 120]
+
+
+async def test_header_cache_ttl_without_jwt():
+    clock = FakeClock()
+    calls = []
+
+    async def create_headers():
+        calls.append(clock.now)
+        return {"verify": {"X-Api-Key": "secret"}}
+
+    cache = HeaderCache(create_headers, ttl=5, refresh_margin=0, clock=clock)
+    await cache.get()
+    clock.now = 4
+    await cache.get()
+    clock.now = 5
+    await cache.get()
+    assert calls == [0, 5]
+
+    cache.invalidate()
+    await cache.get()
+    assert calls == [0, 5, 5]
+
+
+async def test_header_cache_single_flight():
+    calls = 0
+    release = asyncio.Event()
+
+    async def create_headers():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return {"verify": {"Authorization": "token"}}
+
+    cache = HeaderCache(create_headers)
+    waiters = [asyncio.ensure_future(cache.get()) for _ in range(10)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters)
+
+    assert calls == 1
+    assert all(r is results[0] for r in results)
+
+
+async def test_header_cache_refreshes_in_background():
+    clock = FakeClock()
+    release = asyncio.Event()
+    calls = []
+    loops = []
+
+    async def create_headers():
+        calls.append(clock.now)
+        loops.append(asyncio.get_running_loop())
+        if len(calls) > 1:
+            await release.wait()
+        return {"verify": {"Authorization": str(len(calls))}}
+
+    cache = HeaderCache(create_headers, ttl=60, refresh_margin=10, clock=clock)
+    await cache.get()
+
+    # Inside the refresh margin the cached headers are served immediately,
+    # and a single refresh runs on the caller's loop
+    clock.now = 55
+    for _ in range(3):
+        assert (await cache.get())["verify"]["Authorization"] == "1"
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.sleep(0.01)
+
+    assert (await cache.get())["verify"]["Authorization"] == "2"
+    assert calls == [0, 55]
+    assert loops == [asyncio.get_running_loop()] * 2
+
+
+def test_header_cache_recovers_from_closed_loop():
+    clock = FakeClock()
+    calls = []
+
+    async def create_headers():
+        calls.append(clock.now)
+        await asyncio.sleep(0.01)
+        return {"verify": {"Authorization": str(len(calls))}}
+
+    cache = HeaderCache(create_headers, ttl=60, refresh_margin=10, clock=clock)
+    asyncio.run(cache.get())
+
+    # The loop closes before the background refresh finishes
+    clock.now = 55
+    assert asyncio.run(cache.get())["verify"]["Authorization"] == "1"
+
+    clock.now = 61
+    assert asyncio.run(cache.get())["verify"]["Authorization"] == "3"
+    assert calls == [0, 55, 61]
+
+
+async def test_client_caches_headers(transport):
+    handlers, _ = transport
+    seen = []
+    created = 0
+
+    async def ok(request):
+        seen.append(request.headers.get("authorization"))
+        return httpx.Response(200, json=VALID)
+
+    async def create_headers():
+        nonlocal created
+        created += 1
+        return {"verify": {"Authorization": f"token-{created}"}}
+
+    handlers[PRIMARY] = ok
+    client = FacilitatorClient(
+        {"url": PRIMARY, "create_headers": create_headers, "cache_headers": True}
+    )
+    for _ in range(3):
+        await client.verify(*make_payment())
+
+    assert created == 1
+    assert seen == ["token-1"] * 3
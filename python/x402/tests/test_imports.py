@@ -0,0 +1,52 @@
+import subprocess
+import sys
+
+import pytest
+
+# Heavy modules that must only load when the feature needing them is used
+DEFERRED = ["eth_account", "eth_utils", "x402.template", "requests"]
+
+
+def loaded_modules(statement: str) -> set[str]:
+    # A fresh interpreter, since this test session has imported everything
+    code = f"import sys\n{statement}\nprint('\\n'.join(sys.modules))"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return set(output.split())
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "import x402",
+        "import x402.clients",
+        "import x402.exact",
+        "import x402.clients.httpx",
+        "import x402.fastapi.middleware",
+        "import x402.flask.middleware",
+    ],
+)
+def test_heavy_imports_are_deferred(statement):
+    assert loaded_modules(statement).isdisjoint(DEFERRED)
+
+
+def test_import_x402_is_minimal():
+    modules = loaded_modules("import x402")
+    assert not {m for m in modules if m.startswith("x402.")}
+    assert "pydantic" not in modules
+
+
+def test_lazy_attributes():
+    import x402
+    import x402.clients
+    from x402.clients.base import x402Client
+    from x402.types import PaymentRequirements
+
+    assert x402.PaymentRequirements is PaymentRequirements
+    assert x402.clients.x402Client is x402Client
+    assert "x402HttpxClient" in dir(x402.clients)
+    with pytest.raises(AttributeError):
+        x402.not_a_module
+    with pytest.raises(AttributeError):
+        x402.clients.not_a_client
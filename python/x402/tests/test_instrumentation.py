@@ -0,0 +1,192 @@
+from contextlib import contextmanager
+
+import pytest
+from eth_account import Account
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from flask import Flask
+
+from x402 import instrumentation
+from x402.clients.base import x402Client
+from x402.fastapi.middleware import require_payment
+from x402.flask.middleware import PaymentMiddleware
+from x402.instrumentation import CompositeExporter, InMemoryExporter
+from x402.local_facilitator import LocalFacilitator
+from x402.types import PaymentRequirements
+
+USDC = "0x036CbD53842c5426634e7929541eC2318f3dCF7e"
+PAY_TO = "0x1111111111111111111111111111111111111111"
+
+PAID_REQUEST_SPANS = [
+    "x402.requirements",
+    "x402.decode",
+    "x402.verify",
+    "x402.handler",
+    "x402.settle",
+]
+
+
+@pytest.fixture
+def exporter():
+    exporter = InMemoryExporter()
+    instrumentation.set_exporter(exporter)
+    yield exporter
+    instrumentation.set_exporter(None)
+
+
+@pytest.fixture
+def local_facilitator():
+    return LocalFacilitator()
+
+
+def test_disabled_by_default():
+    assert not instrumentation.enabled()
+    with instrumentation.span("x402.verify", network="base") as span:
+        span.set_attribute("valid", True)
+    instrumentation.count("x402.payment_required")
+
+
+def test_in_memory_exporter(exporter):
+    with instrumentation.span("x402.verify", network="base") as span:
+        span.set_attribute("valid", True)
+    with pytest.raises(RuntimeError):
+        with instrumentation.span("x402.settle"):
+            raise RuntimeError("boom")
+    instrumentation.count("x402.settle.result", outcome="success")
+    instrumentation.count("x402.settle.result", 2, outcome="failure")
+
+    verify, settle = exporter.spans
+    assert verify.attributes == {"network": "base", "valid": True}
+    assert verify.duration is not None and verify.error is None
+    assert isinstance(settle.error, RuntimeError)
+    assert exporter.total("x402.settle.result") == 3
+    assert exporter.total("x402.settle.result", outcome="failure") == 2
+
+
+def test_composite_exporter(exporter):
+    other = InMemoryExporter()
+    instrumentation.set_exporter(CompositeExporter(exporter, other))
+
+    with instrumentation.span("x402.verify") as span:
+        span.set_attribute("valid", False)
+    instrumentation.count("x402.payment_required")
+
+    for e in (exporter, other):
+        assert e.span_names() == ["x402.verify"]
+        assert e.spans[0].attributes["valid"] is False
+        assert e.total("x402.payment_required") == 1
+
+    # Spans already started are ended if a later exporter fails to start one
+    class FailingExporter(InMemoryExporter):
+        @contextmanager
+        def span(self, name, attributes):
+            raise RuntimeError("exporter down")
+            yield
+
+    instrumentation.set_exporter(CompositeExporter(other, FailingExporter()))
+    with pytest.raises(RuntimeError):
+        with instrumentation.span("x402.settle"):
+            pass
+    assert other.span_names() == ["x402.verify", "x402.settle"]
+    assert isinstance(other.spans[1].error, RuntimeError)
+
+
+def test_opentelemetry_exporter():
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+
+    spans = InMemorySpanExporter()
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(SimpleSpanProcessor(spans))
+    reader = InMemoryMetricReader()
+
+    instrumentation.set_exporter(
+        instrumentation.OpenTelemetryExporter(
+            tracer_provider, MeterProvider(metric_readers=[reader])
+        )
+    )
+    try:
+        with instrumentation.span("x402.settle", network="base", reason=None) as span:
+            span.set_attribute("success", True)
+        instrumentation.count("x402.settle.result", outcome="success")
+    finally:
+        instrumentation.set_exporter(None)
+
+    (finished,) = spans.get_finished_spans()
+    assert finished.name == "x402.settle"
+    assert dict(finished.attributes) == {"network": "base", "success": True}
+    metric = reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics[0]
+    assert metric.name == "x402.settle.result"
+    assert metric.data.data_points[0].value == 1
+
+
+def test_fastapi_paid_request(exporter, local_facilitator):
+    app = FastAPI()
+
+    @app.get("/paid")
+    async def paid():
+        return {"ok": True}
+
+    app.middleware("http")(
+        require_payment(
+            price="$0.01",
+            pay_to_address=PAY_TO,
+            facilitator=local_facilitator,
+        )
+    )
+    client = TestClient(app)
+
+    accepts = client.get("/paid").json()["accepts"]
+    account = Account.create()
+    local_facilitator.chain.mint("base-sepolia", USDC, account.address, 10**6)
+    header = x402Client(account).create_payment_header(
+        PaymentRequirements(**accepts[0]), 1
+    )
+    exporter.spans.clear()
+
+    assert client.get("/paid", headers={"X-PAYMENT": header}).status_code == 200
+    assert exporter.span_names() == PAID_REQUEST_SPANS
+    assert exporter.total("x402.payment_required", reason="missing_header") == 1
+    assert exporter.total("x402.verify.result", valid=True) == 1
+    assert exporter.total("x402.settle.result", outcome="success") == 1
+    assert exporter.total("x402.requirements.cache", hit=False) == 1
+    assert exporter.total("x402.requirements.cache", hit=True) == 1
+    assert exporter.total("x402.client.payments") == 1
+
+
+def test_flask_paid_request(exporter, local_facilitator):
+    app = Flask(__name__)
+
+    @app.route("/paid")
+    def paid():
+        return {"ok": True}
+
+    PaymentMiddleware(app).add(
+        price="$0.01",
+        pay_to_address=PAY_TO,
+        facilitator=local_facilitator,
+    )
+    client = app.test_client()
+
+    accepts = client.get("/paid").get_json()["accepts"]
+    account = Account.create()
+    header = x402Client(account).create_payment_header(
+        PaymentRequirements(**accepts[0]), 1
+    )
+    exporter.spans.clear()
+
+    # Unfunded account
+    assert client.get("/paid", headers={"X-PAYMENT": header}).status_code == 402
+    assert exporter.total("x402.verify.result", reason="insufficient_funds") == 1
+
+    local_facilitator.chain.mint("base-sepolia", USDC, account.address, 10**6)
+    exporter.spans.clear()
+    assert client.get("/paid", headers={"X-PAYMENT": header}).status_code == 200
+    assert exporter.span_names() == PAID_REQUEST_SPANS
+    assert exporter.total("x402.settle.result", outcome="success") == 1
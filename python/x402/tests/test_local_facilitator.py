@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+from eth_account import Account
+
+from x402.clients.base import x402Client
+from x402.exact import decode_payment
+from x402.local_facilitator import InMemoryChain, LocalFacilitator
+from x402.types import PaymentPayload, PaymentRequirements
+
+USDC = "0x036CbD53842c5426634e7929541eC2318f3dCF7e"
+PAY_TO = "0x1111111111111111111111111111111111111111"
+
+
+@pytest.fixture
+def account():
+    return Account.create()
+
+
+@pytest.fixture
+def requirements():
+    return PaymentRequirements(
+        scheme="exact",
+        network="base-sepolia",
+        asset=USDC,
+        pay_to=PAY_TO,
+        max_amount_required="10000",
+        resource="https://example.com/paid",
+        description="test",
+        max_timeout_seconds=300,
+        mime_type="application/json",
+        output_schema={
+            "input": {"type": "http", "method": "GET", "discoverable": True}
+        },
+        extra={"name": "USDC", "version": "2"},
+    )
+
+
+@pytest.fixture
+def chain(account):
+    chain = InMemoryChain()
+    chain.mint("base-sepolia", USDC, account.address, 25000)
+    return chain
+
+
+@pytest.fixture
+def facilitator(chain):
+    return LocalFacilitator(chain)
+
+
+def sign(account, requirements):
+    header = x402Client(account).create_payment_header(requirements, 1)
+    return PaymentPayload(**decode_payment(header))
+
+
+async def test_verify_and_settle(facilitator, chain, account, requirements):
+    payment = sign(account, requirements)
+
+    verify_response = await facilitator.verify(payment, requirements)
+    assert verify_response.is_valid
+    assert verify_response.payer == account.address
+
+    settle_response = await facilitator.settle(payment, requirements)
+    assert settle_response.success
+    assert settle_response.transaction == chain.transactions[0]
+    assert await chain.balance_of("base-sepolia", USDC, account.address) == 15000
+    assert await chain.balance_of("base-sepolia", USDC, PAY_TO) == 10000
+
+    # The nonce is spent
+    verify_response = await facilitator.verify(payment, requirements)
+    assert verify_response.invalid_reason == (
+        "invalid_exact_evm_payload_authorization_nonce"
+    )
+    assert not (await facilitator.settle(payment, requirements)).success
+
+
+async def test_concurrent_settle_only_succeeds_once(facilitator, account, requirements):
+    payment = sign(account, requirements)
+    responses = await asyncio.gather(
+        *(facilitator.settle(payment, requirements) for _ in range(5))
+    )
+    assert sum(r.success for r in responses) == 1
+
+
+async def test_verify_rejects_bad_signature(facilitator, account, requirements):
+    payment = sign(account, requirements)
+    payment.payload.authorization.value = "20000"
+
+    response = await facilitator.verify(payment, requirements)
+    assert not response.is_valid
+    assert response.invalid_reason == "invalid_exact_evm_payload_signature"
+
+
+async def test_verify_rejects_other_signer(facilitator, account, requirements):
+    payment = sign(Account.create(), requirements)
+    payment.payload.authorization.from_ = account.address
+
+    response = await facilitator.verify(payment, requirements)
+    assert response.invalid_reason == "invalid_exact_evm_payload_signature"
+
+
+async def test_verify_checks_requirements(facilitator, account, requirements):
+    payment = sign(account, requirements)
+
+    other_recipient = requirements.model_copy(update={"pay_to": "0x" + "3" * 40})
+    response = await facilitator.verify(payment, other_recipient)
+    assert response.invalid_reason == "invalid_exact_evm_payload_recipient_mismatch"
+
+    more_expensive = requirements.model_copy(update={"max_amount_required": "20000"})
+    payment = sign(account, requirements)
+    response = await facilitator.verify(payment, more_expensive)
+    assert response.invalid_reason == "invalid_exact_evm_payload_authorization_value"
+
+
+async def test_verify_checks_balance(facilitator, requirements):
+    broke = Account.create()
+    response = await facilitator.verify(sign(broke, requirements), requirements)
+    assert response.invalid_reason == "insufficient_funds"
+
+
+async def test_verify_checks_expiry(chain, account, requirements):
+    payment = sign(account, requirements)
+    valid_before = int(payment.payload.authorization.valid_before)
+    facilitator = LocalFacilitator(chain, clock=lambda: valid_before)
+
+    response = await facilitator.verify(payment, requirements)
+    assert response.invalid_reason == (
+        "invalid_exact_evm_payload_authorization_valid_before"
+    )
+
+
+async def test_list_settled_resources(facilitator, account, requirements):
+    assert (await facilitator.list()).items == []
+
+    await facilitator.settle(sign(account, requirements), requirements)
+    response = await facilitator.list()
+    assert [item.resource for item in response.items] == [requirements.resource]
+    assert response.pagination.total == 1
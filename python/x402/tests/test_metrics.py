@@ -0,0 +1,196 @@
+import os
+
+import pytest
+from eth_account import Account
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from flask import Flask
+
+from x402 import instrumentation
+from x402.clients.base import x402Client
+from x402.fastapi.metrics import metrics_endpoint
+from x402.fastapi.middleware import require_payment
+from x402.flask.metrics import metrics_view
+from x402.flask.middleware import PaymentMiddleware
+from x402.instrumentation import CompositeExporter, InMemoryExporter
+from x402.local_facilitator import LocalFacilitator
+from x402.metrics import (
+    CONTENT_TYPE,
+    MetricsExporter,
+    MetricsRegistry,
+    MmapStore,
+    enable_metrics,
+)
+from x402.types import PaymentRequirements
+
+USDC = "0x036CbD53842c5426634e7929541eC2318f3dCF7e"
+PAY_TO = "0x1111111111111111111111111111111111111111"
+
+
+@pytest.fixture(autouse=True)
+def reset_exporter():
+    yield
+    instrumentation.set_exporter(None)
+
+
+def test_counter_and_histogram_rendering():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.failures.inc(stage="verify", reason='bad "sig"\n')
+    registry.failures.inc(2, stage="verify", reason='bad "sig"\n')
+    registry.stage_duration.observe(0.05, stage="verify", route="/paid")
+    registry.stage_duration.observe(0.5, stage="verify", route="/paid")
+    registry.stage_duration.observe(5, stage="verify", route="/paid")
+
+    text = registry.render()
+    assert "# TYPE x402_failures_total counter" in text
+    assert 'x402_failures_total{reason="bad \\"sig\\"\\n",stage="verify"} 3' in text
+    assert "# TYPE x402_stage_duration_seconds histogram" in text
+    labels = 'route="/paid",stage="verify"'
+    assert f'x402_stage_duration_seconds_bucket{{{labels},le="0.1"}} 1' in text
+    assert f'x402_stage_duration_seconds_bucket{{{labels},le="1"}} 2' in text
+    assert f'x402_stage_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in text
+    assert f"x402_stage_duration_seconds_sum{{{labels}}} 5.55" in text
+    assert f"x402_stage_duration_seconds_count{{{labels}}} 3" in text
+
+
+def test_exporter_maps_instrumentation():
+    registry = MetricsRegistry()
+    instrumentation.set_exporter(MetricsExporter(registry))
+
+    with instrumentation.span("x402.verify", route="/paid"):
+        pass
+    with instrumentation.span("x402.client.sign"):
+        pass
+    instrumentation.count("x402.verify.result", valid=False, reason="expired")
+    instrumentation.count("x402.settle.result", route="/paid", outcome="error")
+    instrumentation.count(
+        "x402.settle.result",
+        route="/paid",
+        outcome="failure",
+        reason="invalid_transaction_state: nonce 0x12 already used",
+    )
+    instrumentation.count("x402.verify.result", valid=False, reason="Bad sig for 0x12")
+    instrumentation.count(
+        "x402.revenue", 1000, route="/paid", network="base", asset=USDC
+    )
+
+    text = registry.render()
+    assert 'x402_stage_duration_seconds_count{route="/paid",stage="verify"} 1' in text
+    assert "client" not in text
+    assert 'x402_failures_total{reason="expired",stage="verify"} 1' in text
+    assert 'x402_failures_total{reason="error",stage="settle"} 1' in text
+    assert (
+        'x402_failures_total{reason="invalid_transaction_state",stage="settle"} 1'
+        in text
+    )
+    assert 'x402_failures_total{reason="other",stage="verify"} 1' in text
+    assert 'x402_settlements_total{outcome="error",route="/paid"} 1' in text
+    assert f'x402_revenue_atomic_units_total{{asset="{USDC}",' in text
+    assert 'network="base",route="/paid"} 1000' in text
+
+
+def test_enable_metrics_keeps_existing_exporter():
+    existing = InMemoryExporter()
+    instrumentation.set_exporter(existing)
+
+    registry = enable_metrics()
+    instrumentation.count("x402.payment_required", route="/paid", reason="missing")
+
+    assert isinstance(instrumentation.get_exporter(), CompositeExporter)
+    assert existing.total("x402.payment_required") == 1
+    assert (
+        'x402_payment_required_total{reason="missing",route="/paid"} 1'
+        in registry.render()
+    )
+
+
+def test_mmap_store_aggregates_processes(tmp_path):
+    registry = MetricsRegistry(multiprocess_dir=str(tmp_path))
+    assert isinstance(registry.store, MmapStore)
+    registry.failures.inc(stage="verify", reason="expired")
+
+    # Another worker writing to the same directory
+    pid = os.fork()
+    if pid == 0:
+        try:
+            registry.failures.inc(4, stage="verify", reason="expired")
+            for i in range(2000):
+                registry.failures.inc(stage="settle", reason=f"reason-{i}")
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+    assert len(os.listdir(tmp_path)) == 2
+    text = MetricsRegistry(multiprocess_dir=str(tmp_path)).render()
+    assert 'x402_failures_total{reason="expired",stage="verify"} 5' in text
+    assert 'x402_failures_total{reason="reason-1999",stage="settle"} 1' in text
+
+
+def test_fastapi_metrics_endpoint():
+    registry = enable_metrics()
+    facilitator = LocalFacilitator()
+    app = FastAPI()
+
+    @app.get("/paid")
+    async def paid():
+        return {"ok": True}
+
+    app.get("/metrics")(metrics_endpoint(registry))
+    app.middleware("http")(
+        require_payment(
+            path="/paid",
+            price="$0.01",
+            pay_to_address=PAY_TO,
+            facilitator=facilitator,
+        )
+    )
+    client = TestClient(app)
+
+    accepts = client.get("/paid").json()["accepts"]
+    account = Account.create()
+    facilitator.chain.mint("base-sepolia", USDC, account.address, 10**6)
+    header = x402Client(account).create_payment_header(
+        PaymentRequirements(**accepts[0]), 1
+    )
+    assert client.get("/paid", headers={"X-PAYMENT": header}).status_code == 200
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"] == CONTENT_TYPE
+    labels = f'asset="{USDC}",network="base-sepolia",route="/paid"'
+    assert f"x402_payments_total{{{labels}}} 1" in response.text
+    assert f"x402_revenue_atomic_units_total{{{labels}}} 10000" in response.text
+    assert 'x402_settlements_total{outcome="success",route="/paid"} 1' in response.text
+    assert (
+        'x402_stage_duration_seconds_count{route="/paid",stage="settle"} 1'
+        in response.text
+    )
+
+
+def test_flask_metrics_view():
+    registry = enable_metrics()
+    app = Flask(__name__)
+
+    @app.route("/paid")
+    def paid():
+        return {"ok": True}
+
+    app.add_url_rule("/metrics", view_func=metrics_view(registry))
+    PaymentMiddleware(app).add(
+        path="/paid",
+        price="$0.01",
+        pay_to_address=PAY_TO,
+        facilitator=LocalFacilitator(),
+    )
+    client = app.test_client()
+
+    assert client.get("/paid").status_code == 402
+    assert client.get("/paid", headers={"X-PAYMENT": "not base64"}).status_code == 402
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type == CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    assert (
+        'x402_payment_required_total{reason="missing_header",route="/paid"} 1' in text
+    )
+    assert 'x402_payment_required_total{reason="bad_header",route="/paid"} 1' in text
+    assert "not base64" not in text
@@ -0,0 +1,111 @@
+import os
+import threading
+
+import pytest
+from eth_account import Account
+
+from x402.clients.base import x402Client
+from x402.exact import decode_payment
+from x402.nonces import (
+    CounterNonceSource,
+    NonceSource,
+    parse_counter_nonce,
+    random_nonce,
+)
+from x402.types import PaymentPayload, PaymentRequirements
+
+USDC = "0x036CbD53842c5426634e7929541eC2318f3dCF7e"
+
+
+def make_requirements(scheme):
+    return PaymentRequirements(
+        scheme=scheme,
+        network="base-sepolia",
+        asset=USDC,
+        pay_to="0x1111111111111111111111111111111111111111",
+        max_amount_required="100",
+        resource="https://example.com",
+        description="",
+        max_timeout_seconds=60,
+        mime_type="",
+        extra={
+            "name": "USDC",
+            "version": "2",
+            "spender": "0x3333333333333333333333333333333333333333",
+        },
+    )
+
+
+def test_batched_nonces_are_unique(monkeypatch):
+    reads = []
+    urandom = os.urandom
+    monkeypatch.setattr(os, "urandom", lambda n: reads.append(n) or urandom(n))
+    source = NonceSource(batch_size=8)
+
+    nonces = [source.next() for _ in range(20)]
+    assert all(isinstance(nonce, bytes) and len(nonce) == 32 for nonce in nonces)
+    assert len(set(nonces)) == 20
+    assert reads == [256, 256, 256]
+    assert random_nonce() != random_nonce()
+
+
+def test_nonces_are_unique_across_threads():
+    source = NonceSource(batch_size=4)
+    nonces = []
+
+    def take():
+        nonces.extend(source.next() for _ in range(100))
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(nonces)) == 800
+
+
+def test_counter_nonces():
+    payer = Account.create().address
+    source = CounterNonceSource(payer)
+    first, second = source.next(), source.next()
+    assert first[:20] == bytes.fromhex(payer[2:])
+
+    instance, counter = parse_counter_nonce(first, payer)
+    assert parse_counter_nonce("0x" + second.hex(), payer) == (instance, counter + 1)
+    # Another process paying from the same wallet gets another instance
+    assert parse_counter_nonce(CounterNonceSource(payer).next(), payer)[0] != instance
+
+    other = Account.create().address
+    assert parse_counter_nonce(first, other) is None
+    assert parse_counter_nonce(random_nonce(), payer) is None
+    assert parse_counter_nonce("not a nonce", payer) is None
+
+    with pytest.raises(ValueError):
+        CounterNonceSource("0x1234")
+
+
+@pytest.mark.parametrize("scheme", ["exact", "upto"])
+def test_client_signs_with_nonce_source(scheme):
+    account = Account.create()
+    client = x402Client(account, nonce_source=CounterNonceSource(account.address))
+    header = client.create_payment_header(make_requirements(scheme), 1)
+
+    payment = PaymentPayload(**decode_payment(header))
+    nonce = payment.payload.authorization.nonce
+    assert parse_counter_nonce(nonce, account.address) is not None
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_forked_child_does_not_reuse_parent_nonces():
+    source = NonceSource()
+    source.next()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_fd, source.next())
+        os._exit(0)
+    os.close(write_fd)
+    child_nonce = os.read(read_fd, 32)
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    assert child_nonce != source.next()
@@ -0,0 +1,106 @@
+import pytest
+
+from x402.chains import get_token_registry, register_token, set_token_registry
+from x402.pricing import (
+    CompiledPrice,
+    clear_price_cache,
+    compile_price,
+    price_many,
+    to_atomic_units,
+)
+from x402.types import EIP712Domain, TokenAmount, TokenAsset
+
+BASE_SEPOLIA_USDC = "0x036CbD53842c5426634e7929541eC2318f3dCF7e"
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    registry = get_token_registry()
+    clear_price_cache()
+    yield
+    set_token_registry(registry)
+    clear_price_cache()
+
+
+def test_to_atomic_units_exact():
+    assert to_atomic_units("$1.12", 6) == 1120000
+    assert to_atomic_units("0.000001", 6) == 1
+    assert to_atomic_units(2, 6) == 2000000
+    assert to_atomic_units("1_000", 2) == 100000
+    assert to_atomic_units("1e-3", 6) == 1000
+    # Floats are converted through their shortest repr, not their binary value
+    assert to_atomic_units(0.001 * 3, 6) == 3000
+    assert to_atomic_units(0.1 + 0.2, 18) == 300000000000000040
+
+
+def test_to_atomic_units_rounding():
+    assert to_atomic_units("0.0000015", 6) == 1
+    assert to_atomic_units("0.0000015", 6, rounding="up") == 2
+    assert to_atomic_units("0.0000015", 6, rounding="half_up") == 2
+    assert to_atomic_units("0.0000025", 6, rounding="half_even") == 2
+    assert to_atomic_units("0.0000025", 6, rounding="ceiling") == 3
+
+    with pytest.raises(ValueError, match="Unknown rounding mode"):
+        to_atomic_units("1", 6, rounding="nearest")  # type: ignore[arg-type]
+
+
+@pytest.mark.parametrize("amount", ["abc", "-1", "NaN", "Infinity", "", True])
+def test_to_atomic_units_invalid(amount):
+    with pytest.raises(ValueError, match="Invalid money amount"):
+        to_atomic_units(amount, 6)
+
+
+def test_compile_price_money():
+    compiled = compile_price("$0.01", "base-sepolia")
+    assert compiled == CompiledPrice("10000", BASE_SEPOLIA_USDC, "USDC", "2")
+    assert compiled.eip712_domain == {"name": "USDC", "version": "2"}
+
+    # Mutating the returned domain does not corrupt the cached entry
+    compiled.eip712_domain["name"] = "changed"
+    assert compile_price("$0.01", "base-sepolia").eip712_name == "USDC"
+
+
+def test_compile_price_is_memoized():
+    first = compile_price("$0.01", "base-sepolia")
+    assert compile_price("0.01", "base-sepolia") is first
+    assert compile_price("$0.01", "base") is not first
+
+
+def test_compile_price_token_amount():
+    price = TokenAmount(
+        amount="1000",
+        asset=TokenAsset(
+            address="0x1234567890123456789012345678901234567890",
+            decimals=18,
+            eip712=EIP712Domain(name="TestToken", version="1"),
+        ),
+    )
+    compiled = compile_price(price, "base-sepolia")
+    assert compiled.as_tuple() == (
+        "1000",
+        "0x1234567890123456789012345678901234567890",
+        {"name": "TestToken", "version": "1"},
+    )
+
+
+def test_compile_price_custom_asset():
+    address = "0x1234567890123456789012345678901234567890"
+    before = compile_price("$1", "base-sepolia")
+    register_token(
+        84532, address, name="Cents", decimals=2, version="1", symbol="cents"
+    )
+
+    compiled = compile_price("$1", "base-sepolia", asset=address)
+    assert compiled.max_amount_required == "100"
+    assert compiled.asset_address == address
+    # Registering a token does not change the default asset
+    assert compile_price("$1", "base-sepolia") == before
+
+
+def test_price_many():
+    compiled = price_many(["$0.001", "$0.01", 1], "base-sepolia")
+    assert [c.max_amount_required for c in compiled] == ["1000", "10000", "1000000"]
+    assert {c.asset_address for c in compiled} == {BASE_SEPOLIA_USDC}
+
+    with pytest.raises(ValueError):
+        price_many(["$0.001", "bogus"], "base-sepolia")
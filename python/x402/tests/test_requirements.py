@@ -0,0 +1,146 @@
+import json
+
+import pytest
+
+from x402.requirements import PaymentRequirementsCache
+from x402.types import EIP712Domain, TokenAmount, TokenAsset
+
+PAY_TO = "0x1111111111111111111111111111111111111111"
+
+
+def make_cache(**kwargs):
+    defaults = {
+        "price": "$0.01",
+        "pay_to_address": PAY_TO,
+        "network": "base-sepolia",
+        "description": "Test payment",
+    }
+    return PaymentRequirementsCache(**{**defaults, **kwargs})
+
+
+def test_static_price_is_cached_per_resource():
+    cache = make_cache()
+
+    entry = cache.get(None, "https://example.com/a", "GET")
+    assert cache.get(None, "https://example.com/a", "GET") is entry
+    assert cache.get(None, "https://example.com/b", "GET") is not entry
+
+    [requirements] = entry.requirements
+    assert requirements.max_amount_required == "10000"
+    assert requirements.resource == "https://example.com/a"
+    assert requirements.extra == {"name": "USDC", "version": "2"}
+    assert requirements.output_schema["input"]["method"] == "GET"
+
+
+def test_invalid_static_price_fails_early():
+    with pytest.raises(ValueError):
+        make_cache(price="not a price")
+
+
+def test_callable_price_without_tier_key():
+    calls = []
+
+    def price(request):
+        calls.append(request)
+        return f"${request['units'] * 0.001}"
+
+    cache = make_cache(price=price)
+
+    first = cache.get({"units": 3}, "https://example.com", "GET")
+    assert first.requirements[0].max_amount_required == "3000"
+    assert cache.get({"units": 3}, "https://example.com", "GET") is first
+    assert (
+        cache.get({"units": 5}, "https://example.com", "GET")
+        .requirements[0]
+        .max_amount_required
+        == "5000"
+    )
+    # The price callable runs for every request when there is no tier key
+    assert len(calls) == 3
+
+
+def test_callable_price_with_tier_key():
+    calls = []
+
+    def price(request):
+        calls.append(request)
+        return "$1" if request["plan"] == "pro" else "$0.10"
+
+    cache = make_cache(price=price, price_tier_key=lambda request: request["plan"])
+
+    pro = cache.get({"plan": "pro"}, "https://example.com", "GET")
+    assert cache.get({"plan": "pro"}, "https://example.com", "GET") is pro
+    basic = cache.get({"plan": "basic"}, "https://example.com", "GET")
+
+    assert pro.requirements[0].max_amount_required == "1000000"
+    assert basic.requirements[0].max_amount_required == "100000"
+    # The price callable only runs once per tier
+    assert len(calls) == 2
+
+
+def test_token_amount_price_callable():
+    price = TokenAmount(
+        amount="42",
+        asset=TokenAsset(
+            address="0x1234567890123456789012345678901234567890",
+            decimals=18,
+            eip712=EIP712Domain(name="TestToken", version="1"),
+        ),
+    )
+    cache = make_cache(price=lambda request: price)
+    entry = cache.get(None, "https://example.com", "POST")
+    assert entry.requirements[0].max_amount_required == "42"
+    assert cache.get(None, "https://example.com", "POST") is entry
+
+
+def test_cache_is_bounded():
+    cache = make_cache(maxsize=2)
+    first = cache.get(None, "https://example.com/1", "GET")
+    cache.get(None, "https://example.com/2", "GET")
+    cache.get(None, "https://example.com/3", "GET")
+    assert cache.get(None, "https://example.com/1", "GET") is not first
+
+
+def test_json_body():
+    entry = make_cache().get(None, "https://example.com", "GET")
+
+    body = entry.json_body("No X-PAYMENT header provided")
+    assert entry.json_body("No X-PAYMENT header provided") is body
+
+    data = json.loads(body)
+    assert data["x402Version"] == 1
+    assert data["error"] == "No X-PAYMENT header provided"
+    assert data["accepts"][0]["maxAmountRequired"] == "10000"
+    assert data["accepts"][0]["payTo"] == PAY_TO
+
+
+def test_options_add_requirements_per_network():
+    cache = make_cache(
+        options=[
+            {"network": "base", "price": "$0.02"},
+            {"network": "avalanche-fuji", "price": lambda request: request["price"]},
+        ],
+        price_tier_key=lambda request: request["price"],
+    )
+    entry = cache.get({"price": "$0.03"}, "https://example.com", "GET")
+    assert cache.get({"price": "$0.03"}, "https://example.com", "GET") is entry
+
+    testnet, mainnet, fuji = entry.requirements
+    assert [r.network for r in entry.requirements] == [
+        "base-sepolia",
+        "base",
+        "avalanche-fuji",
+    ]
+    assert mainnet.max_amount_required == "20000"
+    assert fuji.max_amount_required == "30000"
+    assert testnet.asset != mainnet.asset
+    assert [a["network"] for a in entry.accepts] == [
+        "base-sepolia",
+        "base",
+        "avalanche-fuji",
+    ]
+
+
+def test_invalid_option_price_fails_early():
+    with pytest.raises(ValueError):
+        make_cache(options=[{"network": "base", "price": "not a price"}])
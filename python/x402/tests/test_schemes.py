@@ -0,0 +1,297 @@
+import httpx
+import pytest
+from eth_account import Account
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from x402.clients.base import x402Client
+from x402 import facilitator as facilitator_module
+from x402.common import find_matching_payment_requirements
+from x402.exact import ExactScheme
+from x402.facilitator import FacilitatorClient
+from x402.fastapi.middleware import PaymentMiddleware
+from x402.local_facilitator import InMemoryChain, LocalFacilitator
+from x402.requirements import PaymentRequirementsEntry
+from x402.schemes import (
+    RequirementsIndex,
+    Scheme,
+    SchemeRegistry,
+    get_scheme_registry,
+    payment_payer,
+    payment_sticky_key,
+    register_scheme,
+    require_scheme,
+    set_scheme_registry,
+)
+from x402.types import (
+    EIP3009Authorization,
+    EIP712Domain,
+    PaymentPayload,
+    PaymentRequirements,
+    SchemePayload,
+    TokenAmount,
+    TokenAsset,
+    UnsupportedSchemeException,
+    x402PaymentRequiredResponse,
+)
+
+PAYER = "0x2222222222222222222222222222222222222222"
+PAY_TO = "0x1111111111111111111111111111111111111111"
+USDC = "0x036CbD53842c5426634e7929541eC2318f3dCF7e"
+OTHER_TOKEN = "0x4444444444444444444444444444444444444444"
+
+
+class VoucherPayload(SchemePayload):
+    authorization: EIP3009Authorization
+    voucher: str
+
+
+class VoucherScheme(Scheme):
+    name = "voucher"
+    payload_type = VoucherPayload
+
+    def create_payment_header(self, account, requirements, x402_version, **kwargs):
+        return "voucher"
+
+    async def verify_locally(self, payment, requirements, chain, now):
+        return None if payment.payload.voucher == "valid" else "invalid_voucher"
+
+    async def settle_locally(self, payment, requirements, chain):
+        return "0xvoucher"
+
+
+@pytest.fixture
+def voucher_scheme():
+    registry = get_scheme_registry()
+    register_scheme(VoucherScheme())
+    yield
+    set_scheme_registry(registry)
+
+
+def make_requirements(scheme="exact", network="base-sepolia", asset=USDC):
+    return PaymentRequirements(
+        scheme=scheme,
+        network=network,
+        max_amount_required="100",
+        resource="https://example.com/paid",
+        description="",
+        mime_type="",
+        pay_to=PAY_TO,
+        max_timeout_seconds=60,
+        asset=asset,
+        extra={"spender": PAY_TO},
+    )
+
+
+def make_payment(scheme="exact", network="base-sepolia", **payload):
+    authorization = {
+        "from": PAYER,
+        "to": PAY_TO,
+        "value": "100",
+        "validAfter": "0",
+        "validBefore": "9999999999",
+        "nonce": "0x" + "00" * 32,
+    }
+    if scheme == "upto":
+        authorization = {
+            "from": PAYER,
+            "to": PAY_TO,
+            "spender": PAY_TO,
+            "token": payload.pop("token", USDC),
+            "maxValue": "100",
+            "validAfter": "0",
+            "validBefore": "9999999999",
+            "nonce": "1",
+        }
+    return PaymentPayload(
+        x402_version=1,
+        scheme=scheme,
+        network=network,
+        payload={"signature": "0x", "authorization": authorization, **payload},
+    )
+
+
+def test_registry_is_immutable():
+    registry = SchemeRegistry([ExactScheme()])
+    extended = registry.with_schemes(VoucherScheme())
+    assert "voucher" not in registry
+    assert extended.get("voucher").name == "voucher"
+    assert len(extended) == 2
+    with pytest.raises(UnsupportedSchemeException):
+        registry.require("voucher")
+
+
+def test_incomplete_scheme_cannot_be_registered():
+    class UnsettledScheme(Scheme):
+        name = "unsettled"
+        payload_type = VoucherPayload
+
+        def create_payment_header(self, account, requirements, x402_version, **kwargs):
+            return "unsettled"
+
+        async def verify_locally(self, payment, requirements, chain, now):
+            return None
+
+    with pytest.raises(TypeError, match="settle_locally"):
+        register_scheme(UnsettledScheme())
+
+
+def test_registered_scheme_validates_its_payload(voucher_scheme):
+    payment = make_payment("voucher", voucher="valid")
+    assert isinstance(payment.payload, VoucherPayload)
+    assert payment_payer(payment) == PAYER
+    assert require_scheme("voucher").payload_type is VoucherPayload
+
+
+async def test_local_facilitator_dispatches_to_scheme(voucher_scheme):
+    facilitator = LocalFacilitator()
+    requirements = make_requirements("voucher")
+
+    verify_response = await facilitator.verify(
+        make_payment("voucher", voucher="forged"), requirements
+    )
+    assert verify_response.invalid_reason == "invalid_voucher"
+
+    settle_response = await facilitator.settle(
+        make_payment("voucher", voucher="valid"), requirements
+    )
+    assert settle_response.transaction == "0xvoucher"
+
+
+class TicketPayload(SchemePayload):
+    ticket: str
+
+
+class TicketScheme(VoucherScheme):
+    """A scheme whose payload has no authorization"""
+
+    name = "ticket"
+    payload_type = TicketPayload
+
+    async def verify_locally(self, payment, requirements, chain, now):
+        return None
+
+
+async def test_scheme_without_authorization(monkeypatch):
+    registry = get_scheme_registry()
+    register_scheme(TicketScheme())
+    try:
+        payment = PaymentPayload(
+            x402_version=1,
+            scheme="ticket",
+            network="base-sepolia",
+            payload={"signature": "0x", "ticket": "abc"},
+        )
+        requirements = make_requirements("ticket")
+        other = payment.model_copy(
+            update={"payload": TicketPayload(signature="0x", ticket="def")}
+        )
+        assert payment_payer(payment) is None
+        assert payment_sticky_key(payment) == payment_sticky_key(payment.model_copy())
+        assert payment_sticky_key(payment) != payment_sticky_key(other)
+
+        verify_response = await LocalFacilitator().verify(payment, requirements)
+        assert verify_response.is_valid and verify_response.payer is None
+
+        async def handler(request):
+            if request.url.path == "/verify":
+                return httpx.Response(200, json={"isValid": True, "payer": None})
+            return httpx.Response(200, json={"success": True, "transaction": "0x1"})
+
+        client_factory = httpx.AsyncClient
+        monkeypatch.setattr(
+            facilitator_module.httpx,
+            "AsyncClient",
+            lambda **kwargs: client_factory(
+                transport=httpx.MockTransport(handler), **kwargs
+            ),
+        )
+        client = FacilitatorClient({"url": "https://facilitator.example"})
+        assert (await client.verify(payment, requirements)).is_valid
+        assert (await client.settle(payment, requirements)).success
+    finally:
+        set_scheme_registry(registry)
+
+
+async def test_local_facilitator_rejects_unregistered_scheme():
+    facilitator = LocalFacilitator()
+    payment = make_payment("exact")
+    requirements = make_requirements("exact")
+    payment.scheme = requirements.scheme = "unknown"
+
+    verify_response = await facilitator.verify(payment, requirements)
+    assert verify_response.invalid_reason == "invalid_scheme"
+
+
+def test_index_matches_scheme_network_and_asset():
+    base = make_requirements("upto", "base")
+    other_asset = make_requirements("upto", "base", OTHER_TOKEN)
+    sepolia = make_requirements("exact", "base-sepolia")
+    index = RequirementsIndex([base, other_asset, sepolia])
+
+    assert index.match(make_payment("upto", "base")) is base
+    assert index.match(make_payment("upto", "base", token=OTHER_TOKEN)) is other_asset
+    assert index.match(make_payment("upto", "base", token=PAY_TO)) is None
+    # Exact payloads do not name their asset
+    assert index.match(make_payment("exact", "base-sepolia")) is sepolia
+    assert index.match(make_payment("exact", "base")) is None
+
+
+def token_price(address, name):
+    return TokenAmount(
+        amount="100",
+        asset=TokenAsset(
+            address=address,
+            decimals=6,
+            eip712=EIP712Domain(name=name, version="2"),
+        ),
+    )
+
+
+def test_exact_payment_for_second_asset_on_a_network():
+    account = Account.create()
+    chain = InMemoryChain()
+    chain.mint("base-sepolia", OTHER_TOKEN, account.address, 1000)
+    app = FastAPI()
+
+    @app.get("/paid")
+    async def paid():
+        return {"ok": True}
+
+    app.add_middleware(
+        PaymentMiddleware,
+        price=token_price(USDC, "USDC"),
+        pay_to_address=PAY_TO,
+        path="/paid",
+        network="base-sepolia",
+        options=[
+            {"network": "base-sepolia", "price": token_price(OTHER_TOKEN, "Other")}
+        ],
+        facilitator=LocalFacilitator(chain),
+    )
+    client = TestClient(app)
+
+    accepts = x402PaymentRequiredResponse(**client.get("/paid").json()).accepts
+    assert [r.asset for r in accepts] == [USDC, OTHER_TOKEN]
+    # Exact payloads do not name their token, the signature's domain does
+    header = x402Client(account).create_payment_header(accepts[1], 1)
+    response = client.get("/paid", headers={"X-PAYMENT": header})
+    assert response.status_code == 200
+    assert chain.transactions
+    assert (
+        client.get(
+            "/paid",
+            headers={
+                "X-PAYMENT": x402Client(account).create_payment_header(accepts[0], 1)
+            },
+        ).json()["error"]
+        == "Invalid payment: insufficient_funds"
+    )
+
+
+def test_entry_and_common_helper_use_the_index():
+    requirements = [make_requirements("exact", "base"), make_requirements()]
+    entry = PaymentRequirementsEntry(requirements)
+    payment = make_payment("exact", "base-sepolia")
+    assert entry.match(payment) is requirements[1]
+    assert find_matching_payment_requirements(requirements, payment) is requirements[1]
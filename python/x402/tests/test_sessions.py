@@ -0,0 +1,267 @@
+import base64
+import json
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from flask import Flask
+
+from x402.clients.sessions import SessionTokens
+from x402.facilitator import FacilitatorClient
+from x402.fastapi.middleware import PaymentMiddleware as ASGIPaymentMiddleware
+from x402.fastapi.middleware import require_payment
+from x402.flask.middleware import PaymentMiddleware
+from x402.sessions import (
+    SESSION_HEADER,
+    SESSION_REMAINING_HEADER,
+    MemorySessionStore,
+    SessionManager,
+    SQLiteSessionStore,
+    encode_session_token,
+    read_session_token,
+    verify_session_token,
+)
+from x402.types import SettleResponse, VerifyResponse
+
+PAYER = "0x2222222222222222222222222222222222222222"
+PAY_TO = "0x1111111111111111111111111111111111111111"
+SECRET = "test-secret"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def payment_header() -> str:
+    payment = {
+        "x402Version": 1,
+        "scheme": "exact",
+        "network": "base-sepolia",
+        "payload": {
+            "signature": "0x" + "ab" * 65,
+            "authorization": {
+                "from": PAYER,
+                "to": PAY_TO,
+                "value": "10000",
+                "validAfter": "0",
+                "validBefore": "9999999999",
+                "nonce": "0x" + "00" * 32,
+            },
+        },
+    }
+    return base64.b64encode(json.dumps(payment).encode("utf-8")).decode("ascii")
+
+
+@pytest.fixture
+def facilitator_calls(monkeypatch):
+    calls = []
+
+    async def verify(self, payment, requirements):
+        calls.append("verify")
+        return VerifyResponse(is_valid=True, payer=PAYER)
+
+    async def settle(self, payment, requirements):
+        calls.append("settle")
+        return SettleResponse(
+            success=True, transaction="0x01", network="base-sepolia", payer=PAYER
+        )
+
+    monkeypatch.setattr(FacilitatorClient, "verify", verify)
+    monkeypatch.setattr(FacilitatorClient, "settle", settle)
+    return calls
+
+
+def test_token_signature():
+    token = encode_session_token({"sid": "a", "exp": 5}, b"key")
+    assert verify_session_token(token, b"key") == {"sid": "a", "exp": 5}
+    assert verify_session_token(token, b"other") is None
+    assert read_session_token(token) == {"sid": "a", "exp": 5}
+
+    payload, signature = token.split(".")
+    forged = encode_session_token({"sid": "b", "exp": 5}, b"key").split(".")[0]
+    assert verify_session_token(f"{forged}.{signature}", b"key") is None
+    assert verify_session_token(payload, b"key") is None
+    assert verify_session_token("x" * 4096, b"key") is None
+    assert read_session_token("not a token") is None
+
+
+@pytest.mark.parametrize("store", ["memory", "sqlite"])
+def test_session_store(store, tmp_path):
+    if store == "memory":
+        sessions = MemorySessionStore()
+    else:
+        sessions = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    sessions.create("a", 2, expires_at=100)
+
+    assert sessions.consume("a", now=10) == 1
+    assert sessions.consume("a", now=10) == 0
+    assert sessions.consume("a", now=10) is None
+    sessions.restore("a")
+    assert sessions.consume("a", now=10) == 0
+    assert sessions.consume("missing", now=10) is None
+
+    sessions.create("b", 2, expires_at=100)
+    assert sessions.consume("b", now=100) is None
+
+
+def test_manager_redeems_until_exhausted_or_expired():
+    clock = FakeClock()
+    manager = SessionManager({"secret": SECRET, "calls": 3, "ttl": 60}, "/paid", clock)
+    token = manager.issue(PAYER)
+    assert read_session_token(token)["paths"] == "/paid"
+
+    assert manager.redeem(token).remaining == 1
+    grant = manager.redeem(token)
+    assert grant.remaining == 0
+    assert manager.redeem(token) is None
+    manager.restore(grant)
+    assert manager.redeem(token) is not None
+
+    token = manager.issue(PAYER)
+    clock.now += 60
+    assert manager.redeem(token) is None
+    assert manager.redeem(None) is None
+
+
+def test_manager_rejects_other_routes():
+    store = MemorySessionStore()
+    config = {"secret": SECRET, "calls": 3, "store": store}
+    token = SessionManager(config, "/cheap").issue()
+    assert SessionManager(config, "/expensive").redeem(token) is None
+    assert SessionManager(config, "/cheap").redeem(token) is not None
+
+
+def test_manager_validates_config():
+    with pytest.raises(ValueError, match="secret"):
+        SessionManager({"calls": 3}, "/paid")
+    with pytest.raises(ValueError, match="at least 2"):
+        SessionManager({"secret": SECRET, "calls": 1}, "/paid")
+
+
+def test_fastapi_session(facilitator_calls):
+    app = FastAPI()
+
+    @app.get("/paid")
+    async def paid():
+        return {"ok": True}
+
+    app.middleware("http")(
+        require_payment(
+            price="$0.01",
+            pay_to_address=PAY_TO,
+            path="/paid",
+            session={"secret": SECRET, "calls": 3},
+        )
+    )
+    client = TestClient(app)
+
+    response = client.get("/paid", headers={"X-PAYMENT": payment_header()})
+    assert response.status_code == 200
+    token = response.headers[SESSION_HEADER]
+    assert facilitator_calls == ["verify", "settle"]
+
+    for remaining in ("1", "0"):
+        response = client.get("/paid", headers={SESSION_HEADER: token})
+        assert response.status_code == 200
+        assert response.headers[SESSION_REMAINING_HEADER] == remaining
+    assert facilitator_calls == ["verify", "settle"]
+
+    assert client.get("/paid", headers={SESSION_HEADER: token}).status_code == 402
+
+
+def test_asgi_session_refunds_failed_calls(facilitator_calls):
+    app = FastAPI()
+
+    @app.get("/paid")
+    async def paid(fail: bool = False):
+        if fail:
+            raise HTTPException(status_code=500)
+        return {"ok": True}
+
+    app.add_middleware(
+        ASGIPaymentMiddleware,
+        price="$0.01",
+        pay_to_address=PAY_TO,
+        path="/paid",
+        session={"secret": SECRET, "calls": 2},
+    )
+    client = TestClient(app)
+
+    token = client.get("/paid", headers={"X-PAYMENT": payment_header()}).headers[
+        SESSION_HEADER
+    ]
+    failed = client.get("/paid?fail=1", headers={SESSION_HEADER: token})
+    assert failed.status_code == 500
+    assert SESSION_REMAINING_HEADER not in failed.headers
+
+    response = client.get("/paid", headers={SESSION_HEADER: token})
+    assert response.headers[SESSION_REMAINING_HEADER] == "0"
+    assert client.get("/paid", headers={SESSION_HEADER: token}).status_code == 402
+
+
+@pytest.mark.parametrize("install", ["require_payment", "asgi"])
+def test_session_rejects_stream_settlement(install):
+    kwargs = {
+        "price": "$0.01",
+        "pay_to_address": PAY_TO,
+        "session": {"secret": SECRET, "calls": 3},
+        "stream_settlement": True,
+    }
+    with pytest.raises(ValueError, match="stream_settlement"):
+        if install == "asgi":
+            ASGIPaymentMiddleware(FastAPI(), **kwargs)
+        else:
+            require_payment(**kwargs)
+
+
+def test_flask_session(facilitator_calls):
+    app = Flask(__name__)
+
+    @app.route("/paid")
+    def paid():
+        return {"ok": True}
+
+    PaymentMiddleware(app).add(
+        price="$0.01",
+        pay_to_address=PAY_TO,
+        path="/paid",
+        session={"secret": SECRET, "calls": 2},
+    )
+    client = app.test_client()
+
+    response = client.get("/paid", headers={"X-PAYMENT": payment_header()})
+    assert response.status_code == 200
+    token = response.headers[SESSION_HEADER]
+
+    response = client.get("/paid", headers={SESSION_HEADER: token})
+    assert response.status_code == 200
+    assert response.headers[SESSION_REMAINING_HEADER] == "0"
+    assert client.get("/paid", headers={SESSION_HEADER: token}).status_code == 402
+    assert facilitator_calls == ["verify", "settle"]
+
+
+def test_client_session_tokens():
+    clock = FakeClock()
+    manager = SessionManager({"secret": SECRET, "calls": 2, "ttl": 60}, "/api/*")
+    tokens = SessionTokens(clock)
+    token = manager.issue()
+    tokens.add("https://example.com/api/a", token)
+
+    assert tokens.get("https://example.com/api/b?x=1") == token
+    assert tokens.get("https://example.com/other") is None
+    assert tokens.get("https://other.example.com/api/b") is None
+
+    # A new session for the same route replaces the old one
+    replacement = manager.issue()
+    tokens.add("https://example.com/api/a", replacement)
+    assert tokens.get("https://example.com/api/b") == replacement
+    tokens.discard("https://example.com/api/a", replacement)
+    assert tokens.get("https://example.com/api/b") is None
+
+    tokens.add("https://example.com/api/a", manager.issue())
+    clock.now = manager.clock() + 60
+    assert tokens.get("https://example.com/api/a") is None
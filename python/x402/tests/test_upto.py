@@ -0,0 +1,323 @@
+import time
+
+import pytest
+from eth_account import Account
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from flask import Flask, g, request as flask_request
+
+from x402.clients.base import x402Client
+from x402.exact import decode_payment, encode_payment
+from x402.fastapi.middleware import PaymentMiddleware, require_payment
+from x402.flask.middleware import PaymentMiddleware as FlaskPaymentMiddleware
+from x402.local_facilitator import InMemoryChain, LocalFacilitator
+from x402.metering import UsageMeter
+from x402.types import PaymentPayload, PaymentRequirements, UptoPaymentPayload
+from x402.upto import UptoTracker
+
+USDC = "0x036CbD53842c5426634e7929541eC2318f3dCF7e"
+PAY_TO = "0x1111111111111111111111111111111111111111"
+SPENDER = "0x3333333333333333333333333333333333333333"
+# "$0.01" is the most a request costs, 10000 atomic units
+METERING = {"spender": SPENDER, "minimum": 100, "per_unit": 10}
+
+
+@pytest.fixture
+def account():
+    return Account.create()
+
+
+@pytest.fixture
+def requirements():
+    return PaymentRequirements(
+        scheme="upto",
+        network="base-sepolia",
+        asset=USDC,
+        pay_to=PAY_TO,
+        max_amount_required="10000",
+        resource="https://example.com/paid",
+        description="",
+        max_timeout_seconds=300,
+        mime_type="",
+        extra={"spender": SPENDER},
+    )
+
+
+@pytest.fixture
+def chain(account):
+    chain = InMemoryChain()
+    chain.mint("base-sepolia", USDC, account.address, 100000)
+    return chain
+
+
+def sign(account, requirements, upto_ceiling=None) -> str:
+    return x402Client(account, upto_ceiling=upto_ceiling).create_payment_header(
+        requirements, 1
+    )
+
+
+async def test_local_facilitator_settles_consumed_amount(chain, account, requirements):
+    facilitator = LocalFacilitator(chain)
+    payment = PaymentPayload(**decode_payment(sign(account, requirements, 50000)))
+    assert isinstance(payment.payload, UptoPaymentPayload)
+    assert payment.payload.authorization.max_value == "50000"
+
+    assert (await facilitator.verify(payment, requirements)).is_valid
+    consumed = requirements.model_copy(update={"max_amount_required": "1234"})
+    assert (await facilitator.settle(payment, consumed)).success
+    assert await chain.balance_of("base-sepolia", USDC, PAY_TO) == 1234
+
+    # The Permit2 nonce is spent
+    verify_response = await facilitator.verify(payment, requirements)
+    assert verify_response.invalid_reason == (
+        "invalid_upto_evm_payload_authorization_nonce"
+    )
+
+
+async def test_local_facilitator_checks_spender_and_ceiling(
+    chain, account, requirements
+):
+    facilitator = LocalFacilitator(chain)
+    payment = PaymentPayload(**decode_payment(sign(account, requirements)))
+
+    other_spender = requirements.model_copy(update={"extra": {"spender": PAY_TO}})
+    verify_response = await facilitator.verify(payment, other_spender)
+    assert verify_response.invalid_reason == (
+        "invalid_upto_evm_payload_spender_mismatch"
+    )
+
+    above_ceiling = requirements.model_copy(update={"max_amount_required": "10001"})
+    consumed = await facilitator.settle(payment, above_ceiling)
+    assert consumed.error_reason == "invalid_upto_evm_payload_authorization_value"
+
+
+def test_tracker_reserves_within_ceiling(account, requirements):
+    tracker = UptoTracker()
+    payment = PaymentPayload(**decode_payment(sign(account, requirements, 25000)))
+    assert tracker.reserve(payment, 10000) == "unknown"
+
+    tracker.open(payment)
+    assert tracker.reserve(payment, 10000) == "reserved"
+    assert tracker.reserve(payment, 10000) == "reserved"
+    # Concurrent requests cannot reserve past the ceiling
+    assert tracker.reserve(payment, 10000) == "exhausted"
+
+    assert tracker.charge(payment, 10000, 3000) == 3000
+    tracker.release(payment, 10000)
+    assert tracker.reserve(payment, 10000) == "reserved"
+    assert tracker.charge(payment, 10000, 50000) == 13000
+
+    tracker.close(payment)
+    assert tracker.reserve(payment, 1) == "exhausted"
+
+
+def forge(header: str) -> str:
+    """The same authorization with a zeroed signature"""
+    payload = decode_payment(header)
+    payload["payload"]["signature"] = "0x" + "00" * 65
+    return encode_payment(payload)
+
+
+def test_tracker_only_accepts_verified_payload(account, requirements):
+    tracker = UptoTracker()
+    header = sign(account, requirements, 25000)
+    payment = PaymentPayload(**decode_payment(header))
+    tracker.open(payment)
+
+    forged = PaymentPayload(**decode_payment(forge(header)))
+    assert tracker.reserve(forged, 10000) == "conflict"
+    assert tracker.reserve(payment, 10000) == "reserved"
+
+
+def test_meter_cost_is_rounded_up_and_capped():
+    meter = UsageMeter(clock=lambda: 0.0)
+    meter.add(2.5)
+    meter.bytes = 3
+    config = {"minimum": 1, "per_unit": 1, "per_byte": 0.1}
+    assert meter.cost(config, 100) == 4
+    assert meter.cost(config, 3) == 3
+
+
+def test_metering_requires_spender():
+    with pytest.raises(ValueError, match="spender"):
+        require_payment(price="$0.01", pay_to_address=PAY_TO, metering={})
+    with pytest.raises(ValueError, match="combined"):
+        require_payment(
+            price="$0.01",
+            pay_to_address=PAY_TO,
+            metering=METERING,
+            speculative_settle=True,
+        )
+
+
+def paid_to(chain) -> int:
+    return chain._balances.get(("base-sepolia", USDC.lower(), PAY_TO.lower()), 0)
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("use_asgi", [False, True])
+def test_fastapi_meters_reused_authorization(chain, account, use_asgi):
+    app = FastAPI()
+
+    @app.get("/complete")
+    async def complete(request: Request, tokens: int = 0):
+        request.state.x402_meter.add(tokens)
+        return {"tokens": tokens}
+
+    options = dict(
+        price="$0.01",
+        pay_to_address=PAY_TO,
+        path="/complete",
+        facilitator=LocalFacilitator(chain),
+        metering=METERING,
+        aggregation={"max_delay": 0.2},
+    )
+    if use_asgi:
+        app.add_middleware(PaymentMiddleware, **options)
+    else:
+        app.middleware("http")(require_payment(**options))
+    client = TestClient(app)
+
+    response = client.get("/complete")
+    assert response.status_code == 402
+    accepts = response.json()["accepts"]
+    assert accepts[0]["scheme"] == "upto"
+    assert accepts[0]["extra"]["spender"] == SPENDER
+    header = sign(account, PaymentRequirements(**accepts[0]), 25000)
+
+    for tokens in (5, 20):
+        response = client.get(
+            "/complete", params={"tokens": tokens}, headers={"X-PAYMENT": header}
+        )
+        assert response.status_code == 200
+        assert "X-PAYMENT-RESPONSE" not in response.headers
+
+    # One settlement for both requests: 2 * 100 + 25 * 10
+    wait_for(lambda: paid_to(chain) == 450)
+
+    # A settled authorization is not accepted again
+    response = client.get("/complete", headers={"X-PAYMENT": header})
+    assert response.status_code == 402
+    assert response.json()["error"] == "Payment authorization exhausted"
+
+
+def test_flask_meters_reused_authorization(chain, account):
+    app = Flask(__name__)
+
+    @app.route("/complete")
+    def complete():
+        g.x402_meter.add(int(flask_request.args.get("tokens", 0)))
+        return {"ok": True}
+
+    @app.route("/failing")
+    def failing():
+        g.x402_meter.add(1000)
+        return {"error": "failed"}, 500
+
+    FlaskPaymentMiddleware(app).add(
+        price="$0.01",
+        pay_to_address=PAY_TO,
+        path=["/complete", "/failing"],
+        facilitator=LocalFacilitator(chain),
+        metering=METERING,
+        aggregation={"max_delay": 0.2},
+    )
+    client = app.test_client()
+
+    response = client.get("/complete")
+    assert response.status_code == 402
+    requirements = PaymentRequirements(**response.get_json()["accepts"][0])
+    header = sign(account, requirements, 25000)
+
+    # WSGI servers close the body once sent, which charges the usage
+    for path, status in [
+        ("/complete?tokens=3", 200),
+        ("/failing", 500),
+        ("/complete?tokens=7", 200),
+    ]:
+        response = client.get(path, headers={"X-PAYMENT": header})
+        assert response.status_code == status
+        response.close()
+
+    # The failed request is not charged: 2 * 100 + 10 * 10
+    wait_for(lambda: paid_to(chain) == 300)
+
+
+def test_max_value_only_caps_the_payment(account, requirements):
+    # A spending cap does not raise the signed ceiling
+    header = x402Client(account, max_value=50000).create_payment_header(requirements, 1)
+    payment = PaymentPayload(**decode_payment(header))
+    assert payment.payload.authorization.max_value == "10000"
+
+    with pytest.raises(ValueError, match="upto_ceiling"):
+        x402Client(account, max_value=10000, upto_ceiling=50000)
+
+
+def test_client_reuses_accepted_authorization(account, requirements):
+    client = x402Client(account, upto_ceiling=25000)
+    header = client.create_payment_header(requirements, 1)
+    url = "https://example.com/paid?q=1"
+
+    client.keep_authorization(url, requirements, header)
+    assert client.authorizations.get("https://example.com/paid") == header
+    assert client.authorizations.get("https://example.com/other") is None
+
+    client.authorizations.discard(url, header)
+    assert client.authorizations.get(url) is None
+
+    # Exact payments pay for one request only
+    exact = requirements.model_copy(update={"scheme": "exact"})
+    client.keep_authorization(url, exact, "header")
+    assert client.authorizations.get(url) is None
+
+
+@pytest.mark.parametrize("framework", ["fastapi", "flask"])
+def test_forged_signature_on_open_authorization_is_rejected(chain, account, framework):
+    options = dict(
+        price="$0.01",
+        pay_to_address=PAY_TO,
+        path="/complete",
+        facilitator=LocalFacilitator(chain),
+        metering=METERING,
+        aggregation={"max_delay": 0.2},
+    )
+    if framework == "fastapi":
+        app = FastAPI()
+
+        @app.get("/complete")
+        async def complete(request: Request):
+            request.state.x402_meter.add(5)
+            return {"ok": True}
+
+        app.add_middleware(PaymentMiddleware, **options)
+        client = TestClient(app)
+        accepts = client.get("/complete").json()["accepts"]
+    else:
+        flask_app = Flask(__name__)
+
+        @flask_app.route("/complete")
+        def flask_complete():
+            g.x402_meter.add(5)
+            return {"ok": True}
+
+        FlaskPaymentMiddleware(flask_app).add(**options)
+        client = flask_app.test_client()
+        accepts = client.get("/complete").get_json()["accepts"]
+
+    header = sign(account, PaymentRequirements(**accepts[0]), 25000)
+    response = client.get("/complete", headers={"X-PAYMENT": header})
+    assert response.status_code == 200
+    response.close()
+
+    response = client.get("/complete", headers={"X-PAYMENT": forge(header)})
+    assert response.status_code == 402
+    response.close()
+
+    # The verified payment still settles what it consumed: 100 + 5 * 10
+    wait_for(lambda: paid_to(chain) == 150)